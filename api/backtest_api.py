@@ -6,22 +6,34 @@
 """
 
 import os
+import json
+import time
 import concurrent.futures
 import copy
 from functools import partial
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime, timedelta
 
 import polars as pl
 from fastapi import HTTPException, Request, Form, File, UploadFile
 from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
 from core.utils import Utils
 from config.trading_config import TradingConfig
 from strategies.dynamic_strategy import DynamicStrategy
+from strategies.trade_ledger import format_trade_frame
+from strategies.portfolio_engine import PortfolioBacktestEngine
+from strategies.process_executor import run_backtests_in_processes, default_worker_count
+from strategies.parameter_sweep import ParameterSweep
+from strategies.walk_forward import WalkForwardRunner
+from core.job_manager import job_manager, BacktestJob, JobCancelledError
+from core.result_cache import result_cache, stock_result_cache, make_cache_key, stock_cache_keys
+from core.downsampling import downsample_curve
 from api.cache_api import CacheAPI
+from api.chart_api import ChartAPI
 from api.excel_api import ExcelAPI
 
 def print_log(message: str):
@@ -68,15 +80,28 @@ def combine_backtest_results(results: List, initial_capital: float) -> Dict[str,
             "charts": []
         }
     
-    # 合併交易記錄
+    # 合併交易記錄：結果帶有欄式帳本 DataFrame 時直接整批串接（沒有交易的結果不帶 trade_frame，略過即可）
+    trade_frame = None
+    if all(isinstance(result, dict) and (result.get('trade_frame') is not None or not result.get('trade_records'))
+           for result in results):
+        trade_frames = [result['trade_frame'] for result in results if result.get('trade_frame') is not None]
+        if trade_frames:
+            trade_frame = pl.concat(trade_frames, how="vertical_relaxed")
+    
     all_trades = []
-    for result in results:
-        all_trades.extend(result['trade_records'])
+    if trade_frame is None:
+        for result in results:
+            all_trades.extend(result['trade_records'])
         
     # 計算總體統計
-    total_trades = len(all_trades)
+    total_trades = len(trade_frame) if trade_frame is not None else len(all_trades)
+    if trade_frame is not None:
+        net_profit_loss = trade_frame["net_profit_loss"].fill_null(0.0)
+        winning_trades = int((net_profit_loss > 0).sum())
+        losing_trades = int((net_profit_loss < 0).sum())
+        total_profit_loss = float(net_profit_loss.sum())
     # 檢查交易記錄是物件還是字典
-    if all_trades and hasattr(all_trades[0], 'net_profit_loss'):
+    elif all_trades and hasattr(all_trades[0], 'net_profit_loss'):
         # 如果是物件，使用屬性存取
         winning_trades = len([t for t in all_trades if t.net_profit_loss > 0])
         losing_trades = len([t for t in all_trades if t.net_profit_loss < 0])
@@ -128,6 +153,7 @@ def combine_backtest_results(results: List, initial_capital: float) -> Dict[str,
         "max_drawdown_rate": max_drawdown_rate,
         "sharpe_ratio": sharpe_ratio,
         "trade_records": all_trades,
+        "trade_frame": trade_frame,
         "equity_curve": all_equity_curves[0] if all_equity_curves else [initial_capital],
         "dates": all_dates[0] if all_dates else [datetime.now()],
         "charts": results[0]['charts'] if results else []
@@ -149,7 +175,106 @@ class BacktestAPI:
         end_year: Optional[str],
         request: Request
     ):
-        """執行回測"""
+        """執行回測（資料準備在事件迴圈中，回測本身在執行緒池中執行，不阻塞其他請求）"""
+        context = await BacktestAPI.prepare_backtest(
+            excel_file, strategy_id, stock_source, price_source, initial_capital,
+            manual_stock_ids, start_date, end_date, start_year, end_year, request
+        )
+        return await run_in_threadpool(BacktestAPI.run_backtest, context)
+
+    @staticmethod
+    async def submit_backtest_job(
+        excel_file: Optional[UploadFile],
+        strategy_id: str,
+        stock_source: str,
+        price_source: str,
+        initial_capital: float,
+        manual_stock_ids: Optional[str],
+        start_date: Optional[str],
+        end_date: Optional[str],
+        start_year: Optional[str],
+        end_year: Optional[str],
+        request: Request
+    ):
+        """提交背景回測工作，立即回傳 job_id（進度以 /api/jobs/{job_id}/events 串流）"""
+        context = await BacktestAPI.prepare_backtest(
+            excel_file, strategy_id, stock_source, price_source, initial_capital,
+            manual_stock_ids, start_date, end_date, start_year, end_year, request
+        )
+        job = job_manager.submit("backtest", lambda job: BacktestAPI.run_backtest(context, job))
+        return {"success": True, "job_id": job.job_id, "status": job.status}
+
+    @staticmethod
+    async def submit_parameter_sweep(
+        excel_file: Optional[UploadFile],
+        strategy_id: str,
+        stock_source: str,
+        price_source: str,
+        initial_capital: float,
+        manual_stock_ids: Optional[str],
+        start_date: Optional[str],
+        end_date: Optional[str],
+        start_year: Optional[str],
+        end_year: Optional[str],
+        sweep_config: str,
+        request: Request
+    ):
+        """
+        提交參數掃描背景工作
+
+        資料載入與策略編譯只做一次，sweep_config 為 JSON：
+        {"parameters": {名稱: [候選值] 或 {"min","max","step"}}, "method": "grid"|"random",
+         "n_samples", "seed", "target", "patience", "min_trades", "indicators", "max_workers"}
+        """
+        try:
+            config = json.loads(sweep_config) if sweep_config else {}
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"掃描設定格式錯誤: {e}")
+        context = await BacktestAPI.prepare_backtest(
+            excel_file, strategy_id, stock_source, price_source, initial_capital,
+            manual_stock_ids, start_date, end_date, start_year, end_year, request
+        )
+        try:
+            sweep = ParameterSweep.from_config(context["strategy_instance"], context["strategy_params"], config)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        print_log(f"submit_parameter_sweep:{sweep.method} 掃描 {len(sweep.combinations)} 組參數")
+        job = job_manager.submit("parameter_sweep", lambda job: BacktestAPI.run_parameter_sweep(context, sweep, job))
+        return {"success": True, "job_id": job.job_id, "status": job.status, "combinations": len(sweep.combinations)}
+
+    @staticmethod
+    def run_parameter_sweep(context: Dict[str, Any], sweep: ParameterSweep, job: BacktestJob = None) -> Dict[str, Any]:
+        """執行參數掃描（同步，需在執行緒中呼叫）"""
+        started_at = time.perf_counter()
+        result = sweep.run(
+            context["stock_data"],
+            context["parameters"].get("excel_data"),
+            context["initial_capital"],
+            progress=job.report if job else None
+        )
+        elapsed_seconds = time.perf_counter() - started_at
+        print_log(f"run_parameter_sweep:完成 {result['evaluated']}/{result['total_combinations']} 組，耗時 {elapsed_seconds:.3f} 秒")
+        result.update({
+            "success": True,
+            "execution": {"mode": "sweep", "workers": sweep.max_workers, "elapsed_seconds": elapsed_seconds}
+        })
+        return result
+
+    @staticmethod
+    async def prepare_backtest(
+        excel_file: Optional[UploadFile],
+        strategy_id: str,
+        stock_source: str,
+        price_source: str,
+        initial_capital: float,
+        manual_stock_ids: Optional[str],
+        start_date: Optional[str],
+        end_date: Optional[str],
+        start_year: Optional[str],
+        end_year: Optional[str],
+        request: Request
+    ) -> Dict[str, Any]:
+        """解析表單、建立策略並載入股價資料，回傳 run_backtest 所需的執行內容"""
         try:            
             # 從表單資料中收集策略參數
             form_data = await request.form()
@@ -354,145 +479,313 @@ class BacktestAPI:
             if stock_data is None or stock_data.is_empty():
                 raise HTTPException(status_code=400, detail="沒有有效的股票資料")
             
-            # 按股票分組執行回測
-            results = []
-            stock_groups = stock_data.group_by("stock_id")
-            def process_single_stock(stock_id, group_data, strategy_id, strategy_params, initial_capital):
-                """處理單一股票的回測"""
+            return {
+                "strategy_id": strategy_id,
+                "strategy_params": strategy_params,
+                "strategy_instance": strategy_instance,
+                "strategy_manager": strategy_manager,
+                "parameters": parameters,
+                "stock_data": stock_data,
+                "initial_capital": initial_capital
+            }
+        
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @staticmethod
+    def _load_cached_stock_results(strategy_instance, strategy_params: Dict[str, Any], stock_data: pl.DataFrame,
+                                   excel_data: Optional[pl.DataFrame], initial_capital: float):
+        """
+        取得逐股快取結果（增量回測）
+
+        Returns:
+            (逐股快取鍵值, 命中的逐股結果, 需要重跑的股價資料；全部命中時為 None)
+        """
+        # 執行方式（執行緒/行程、worker 數量）不影響逐股結果，不列入鍵值，兩種模式可共用快取
+        result_params = {
+            name: value for name, value in strategy_params.items() if name not in ("execution_mode", "max_workers")
+        }
+        stock_keys = stock_cache_keys(
+            "stock_backtest",
+            strategy_instance.strategy_code,
+            {"strategy_params": result_params, "initial_capital": initial_capital},
+            stock_data,
+            excel_data
+        )
+        cached_results = []
+        dirty_ids = []
+        for stock_id, key in stock_keys.items():
+            cached = stock_result_cache.get(key)
+            if cached is None:
+                dirty_ids.append(stock_id)
+            else:
+                cached_results.append(cached)
+        if cached_results:
+            print_log(f"execute_backtest:{len(cached_results)} 檔股票使用快取結果，{len(dirty_ids)} 檔重新回測")
+        if not dirty_ids:
+            return stock_keys, cached_results, None
+        if not cached_results:
+            return stock_keys, cached_results, stock_data
+        dirty_data = pl.concat(list(Utils.partition_by_stock(stock_data, dirty_ids).values()))
+        return stock_keys, cached_results, dirty_data
+
+    @staticmethod
+    def _store_stock_results(stock_keys: Dict[str, str], results: List[Dict[str, Any]]) -> None:
+        """將新回測的逐股結果寫入快取"""
+        for result in results:
+            key = stock_keys.get(str(result.get("stock_id")))
+            if key:
+                stock_result_cache.set(key, result)
+
+    @staticmethod
+    def run_backtest(context: Dict[str, Any], job: BacktestJob = None) -> Dict[str, Any]:
+        """
+        執行回測並轉換為前端格式（同步，需在執行緒中呼叫）
+
+        Args:
+            context: prepare_backtest 回傳的執行內容
+            job: 背景工作；提供時每完成一檔股票回報進度，工作被取消時停止
+        """
+        strategy_id = context["strategy_id"]
+        strategy_params = context["strategy_params"]
+        strategy_instance = context["strategy_instance"]
+        strategy_manager = context["strategy_manager"]
+        parameters = context["parameters"]
+        stock_data = context["stock_data"]
+        initial_capital = context["initial_capital"]
+        try:
+            # 相同策略程式碼、參數與輸入資料的重複回測直接回傳快取結果
+            result_key = make_cache_key(
+                "backtest",
+                strategy_instance.strategy_code,
+                {"strategy_params": strategy_params, "initial_capital": initial_capital},
+                stock_data,
+                parameters.get("excel_data")
+            )
+            cached_response = result_cache.get(result_key)
+            if cached_response is not None:
+                print_log(f"execute_backtest:使用快取結果 {result_key[:12]}")
+                if job:
+                    job.report(1, total=1, trades=cached_response.get("summary", {}).get("total_trades", 0), message="使用快取結果")
+                return {**cached_response, "from_cache": True}
+            execution_mode = strategy_params.get("execution_mode") or "isolated"
+            configured_workers = int(strategy_params.get("max_workers") or 0)
+            started_at = time.perf_counter()
+            cached_results = []
+            if execution_mode == "portfolio":
+                # 投資組合模式：所有股票共用資金，單次橫截面回測
                 try:
-                    # 建立策略實例（每個股票獨立），確保參數獨立
-                    strategy_instance = create_strategy(strategy_id, copy.deepcopy(strategy_params), strategy_manager)
-                    try:
-                        # 取得股票名稱
-                        stock_name = group_data['stock_name'][0]
-                    except Exception as e:
-                        # 如果沒有股票名稱，使用股票代碼
-                        stock_name = stock_id
-                        
-                    # 執行回測
-                    strategy_instance.run_backtest(
-                        group_data, 
+                    signals = strategy_instance.calculate_universe_signals(stock_data, parameters.get("excel_data"))
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                engine = PortfolioBacktestEngine.from_parameters(initial_capital, strategy_instance.parameters)
+                if job:
+                    job.report(0, message="投資組合回測中")
+                combined_result = engine.run(signals, strategy_instance.strategy_name)
+                results = [combined_result]
+                max_workers = 1
+                if job:
+                    job.report(1, total=1, trades=combined_result.get("total_trades", 0))
+            elif execution_mode == "process":
+                # 行程池模式：逐股回測分散到多個子行程（是否比執行緒池快取決於核心數，見 process_executor）
+                max_workers = configured_workers or default_worker_count()
+                stock_keys, cached_results, dirty_data = BacktestAPI._load_cached_stock_results(
+                    strategy_instance, strategy_params, stock_data, parameters.get("excel_data"), initial_capital
+                )
+                results = []
+                if dirty_data is not None:
+                    results = run_backtests_in_processes(
+                        dirty_data,
                         parameters.get("excel_data"),
-                        initial_capital, 
-                        stock_id,  # 使用實際的股票代碼
-                        f"{stock_name}"  # 使用實際的股票名稱
+                        strategy_instance.strategy_code,
+                        strategy_instance.custom_strategy_name,
+                        strategy_params,
+                        initial_capital,
+                        max_workers,
+                        progress=job.report if job else None
                     )
+                    BacktestAPI._store_stock_results(stock_keys, results)
+                results.extend(cached_results)
+                combined_result = combine_backtest_results(results, initial_capital)
+            elif execution_mode == "walk_forward":
+                # 滾動視窗模式：指標只算一次，各視窗樣本內/樣本外平行回測，交易明細為樣本外交易
+                try:
+                    runner = WalkForwardRunner.from_parameters(strategy_instance, strategy_params)
+                    walk_forward = runner.run(
+                        stock_data,
+                        parameters.get("excel_data"),
+                        initial_capital,
+                        progress=job.report if job else None
+                    )
+                except ValueError as e:
+                    raise HTTPException(status_code=400, detail=str(e))
+                max_workers = runner.max_workers
+                results = walk_forward.pop("out_of_sample_results")
+                combined_result = combine_backtest_results(results, initial_capital)
+            else:
+                # 按股票分組執行回測：輸入未變動的股票直接使用逐股快取，只重跑有變動的股票
+                stock_keys, cached_results, dirty_data = BacktestAPI._load_cached_stock_results(
+                    strategy_instance, strategy_params, stock_data, parameters.get("excel_data"), initial_capital
+                )
+                results = []
+                stock_groups = Utils.partition_by_stock(dirty_data).items() if dirty_data is not None else []
+                def process_single_stock(stock_id, group_data, strategy_id, strategy_params, initial_capital):
+                    """處理單一股票的回測"""
+                    try:
+                        # 建立策略實例（每個股票獨立），確保參數獨立
+                        strategy_instance = create_strategy(strategy_id, copy.deepcopy(strategy_params), strategy_manager)
+                        try:
+                            # 取得股票名稱
+                            stock_name = group_data['stock_name'][0]
+                        except Exception as e:
+                            # 如果沒有股票名稱，使用股票代碼
+                            stock_name = stock_id
+                        
+                        # 執行回測
+                        strategy_instance.run_backtest(
+                            group_data, 
+                            parameters.get("excel_data"),
+                            initial_capital, 
+                            stock_id,  # 使用實際的股票代碼
+                            f"{stock_name}"  # 使用實際的股票名稱
+                        )
                     
-                    # 取得結果
-                    result = strategy_instance.get_strategy_result(initial_capital)
+                        # 取得結果
+                        result = strategy_instance.get_strategy_result(initial_capital)
+                        result["stock_id"] = stock_id
 
-                    return result
+                        return result
                     
-                except Exception as e:
-                    print_log(f"execute_backtest:股票 {stock_id} 回測失敗: {e}")
-                    return None
+                    except Exception as e:
+                        print_log(f"execute_backtest:股票 {stock_id} 回測失敗: {e}")
+                        return None
                     
-            # 準備並行處理的任務
-            tasks = []
-            for stock_id, group_data in stock_groups:
-                task = partial(
-                    process_single_stock,
-                    stock_id=stock_id,
-                    group_data=group_data,
-                    strategy_id=strategy_id,
-                    strategy_params=strategy_params,
-                    initial_capital=initial_capital
-                )
-                tasks.append(task)
+                # 準備並行處理的任務
+                tasks = []
+                for stock_id, group_data in stock_groups:
+                    task = partial(
+                        process_single_stock,
+                        stock_id=stock_id,
+                        group_data=group_data,
+                        strategy_id=strategy_id,
+                        strategy_params=strategy_params,
+                        initial_capital=initial_capital
+                    )
+                    tasks.append(task)
             
-            # 使用線程池執行並行處理
-            max_workers = min(len(tasks), 10)  # 最多10個線程，避免過度並行
+                # 使用線程池執行並行處理
+                max_workers = max(1, min(len(tasks), configured_workers or 10))  # 預設最多10個線程，避免過度並行
             
-            results = []
-            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-                # 提交所有任務
-                future_to_stock = {executor.submit(task): task for task in tasks}
+                results = []
+                completed_count = 0
+                trade_count = 0
+                with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    # 提交所有任務
+                    future_to_stock = {executor.submit(task): task for task in tasks}
                 
-                # 收集結果
-                for future in concurrent.futures.as_completed(future_to_stock):
-                    try:
-                        result = future.result()
-                        if result is not None:
-                            results.append(result)
-                    except Exception as e:
-                        print_log(f"execute_backtest:任務執行失敗: {e}")
-            
-            # 合併結果
-            combined_result = combine_backtest_results(results, initial_capital)
-            # 轉換為前端需要的格式
-            trades = []
-            for trade_record in combined_result.get("trade_records", []):
-                # 檢查 trade_record 是物件還是字典
-                if hasattr(trade_record, 'entry_date'):
-                    # 如果是物件，使用屬性存取
-                    trades.append({
-                        "position_id": trade_record.position_id,
-                        "entry_date": trade_record.entry_date.strftime("%Y-%m-%d") if hasattr(trade_record.entry_date, 'strftime') else str(trade_record.entry_date),
-                        "exit_date": trade_record.exit_date.strftime("%Y-%m-%d") if hasattr(trade_record.exit_date, 'strftime') else str(trade_record.exit_date),
-                        "stock_id": trade_record.stock_id,
-                        "stock_name": trade_record.stock_name,
-                        "trade_direction": trade_record.trade_direction,
-                        "entry_price": trade_record.entry_price,
-                        "exit_price": trade_record.exit_price,
-                        "shares": trade_record.shares,
-                        "profit_loss": trade_record.profit_loss,
-                        "profit_loss_rate": trade_record.profit_loss_rate,
-                        "commission": trade_record.commission,
-                        "securities_tax": trade_record.securities_tax,
-                        "net_profit_loss": trade_record.net_profit_loss,
-                        "holding_days": trade_record.holding_days,
-                        "exit_reason": trade_record.exit_reason,
-                        "current_price": trade_record.current_price,
-                        "unrealized_profit_loss": trade_record.unrealized_profit_loss,
-                        "unrealized_profit_loss_rate": trade_record.unrealized_profit_loss_rate,
-                        "current_date": trade_record.current_date.strftime("%Y-%m-%d") if hasattr(trade_record.current_date, 'strftime') else str(trade_record.current_date),
-                        "exit_price_type": trade_record.exit_price_type,
-                        "current_entry_price": trade_record.current_entry_price,
-                        "current_exit_price": trade_record.current_exit_price,
-                        "current_profit_loss": trade_record.current_profit_loss,
-                        "current_profit_loss_rate": trade_record.current_profit_loss_rate,
-                        "take_profit_price": trade_record.take_profit_price,
-                        "stop_loss_price": trade_record.stop_loss_price,
-                        "open_price": trade_record.open_price,
-                        "high_price": trade_record.high_price,
-                        "low_price": trade_record.low_price,
-                        "close_price": trade_record.close_price
-                    })
-                else:
-                    # 如果是字典，使用鍵值存取
-                    trades.append({
-                        "position_id": trade_record.get("position_id", ""),
-                        "entry_date": trade_record.get("entry_date", ""),
-                        "exit_date": trade_record.get("exit_date", ""),
-                        "stock_id": trade_record.get("stock_id", ""),
-                        "stock_name": trade_record.get("stock_name", ""),
-                        "trade_direction": trade_record.get("trade_direction", 1),
-                        "entry_price": trade_record.get("entry_price", 0),
-                        "exit_price": trade_record.get("exit_price", 0),
-                        "shares": trade_record.get("shares", 0),
-                        "profit_loss": trade_record.get("profit_loss", 0),
-                        "profit_loss_rate": trade_record.get("profit_loss_rate", 0),
-                        "commission": trade_record.get("commission", 0),
-                        "securities_tax": trade_record.get("securities_tax", 0),
-                        "net_profit_loss": trade_record.get("net_profit_loss", 0),
-                        "holding_days": trade_record.get("holding_days", 0),
-                        "exit_reason": trade_record.get("exit_reason", ""),
-                        "current_price": trade_record.get("current_price", 0),
-                        "unrealized_profit_loss": trade_record.get("unrealized_profit_loss", 0),
-                        "unrealized_profit_loss_rate": trade_record.get("unrealized_profit_loss_rate", 0),
-                        "current_date": trade_record.get("current_date", ""),
-                        "exit_price_type": trade_record.get("exit_price_type", ""),
-                        "current_entry_price": trade_record.get("current_entry_price", 0),
-                        "current_exit_price": trade_record.get("current_exit_price", 0),
-                        "current_profit_loss": trade_record.get("current_profit_loss", 0),
-                        "current_profit_loss_rate": trade_record.get("current_profit_loss_rate", 0),
-                        "take_profit_price": trade_record.get("take_profit_price", 0),
-                        "stop_loss_price": trade_record.get("stop_loss_price", 0),
-                        "open_price": trade_record.get("open_price", 0),
-                        "high_price": trade_record.get("high_price", 0),
-                        "low_price": trade_record.get("low_price", 0),
-                        "close_price": trade_record.get("close_price", 0)
-                    })
+                    # 收集結果
+                    for future in concurrent.futures.as_completed(future_to_stock):
+                        try:
+                            result = future.result()
+                            if result is not None:
+                                results.append(result)
+                                trade_count += result.get("total_trades", 0)
+                        except Exception as e:
+                            print_log(f"execute_backtest:任務執行失敗: {e}")
+                        completed_count += 1
+                        if job:
+                            try:
+                                job.report(completed_count, total=len(tasks), trades=trade_count)
+                            except JobCancelledError:
+                                # 取消尚未開始的股票，執行中的股票完成後即結束
+                                for pending in future_to_stock:
+                                    pending.cancel()
+                                raise
+            
+                BacktestAPI._store_stock_results(stock_keys, results)
+                results.extend(cached_results)
+                # 合併結果
+                combined_result = combine_backtest_results(results, initial_capital)
+            elapsed_seconds = time.perf_counter() - started_at
+            print_log(f"execute_backtest:{execution_mode} 模式，{max_workers} 個 worker，回測耗時 {elapsed_seconds:.3f} 秒")
+            # 轉換為前端需要的格式：欄式帳本直接批次格式化
+            trade_frame = combined_result.get("trade_frame")
+            if trade_frame is not None:
+                trades = format_trade_frame(trade_frame).to_dicts()
+            else:
+                trades = []
+                for trade_record in combined_result.get("trade_records", []):
+                    # 檢查 trade_record 是物件還是字典
+                    if hasattr(trade_record, 'entry_date'):
+                        # 如果是物件，使用屬性存取
+                        trades.append({
+                            "position_id": trade_record.position_id,
+                            "entry_date": trade_record.entry_date.strftime("%Y-%m-%d") if hasattr(trade_record.entry_date, 'strftime') else str(trade_record.entry_date),
+                            "exit_date": trade_record.exit_date.strftime("%Y-%m-%d") if hasattr(trade_record.exit_date, 'strftime') else str(trade_record.exit_date),
+                            "stock_id": trade_record.stock_id,
+                            "stock_name": trade_record.stock_name,
+                            "trade_direction": trade_record.trade_direction,
+                            "entry_price": trade_record.entry_price,
+                            "exit_price": trade_record.exit_price,
+                            "shares": trade_record.shares,
+                            "profit_loss": trade_record.profit_loss,
+                            "profit_loss_rate": trade_record.profit_loss_rate,
+                            "commission": trade_record.commission,
+                            "securities_tax": trade_record.securities_tax,
+                            "net_profit_loss": trade_record.net_profit_loss,
+                            "holding_days": trade_record.holding_days,
+                            "exit_reason": trade_record.exit_reason,
+                            "current_price": trade_record.current_price,
+                            "unrealized_profit_loss": trade_record.unrealized_profit_loss,
+                            "unrealized_profit_loss_rate": trade_record.unrealized_profit_loss_rate,
+                            "current_date": trade_record.current_date.strftime("%Y-%m-%d") if hasattr(trade_record.current_date, 'strftime') else str(trade_record.current_date),
+                            "exit_price_type": trade_record.exit_price_type,
+                            "current_entry_price": trade_record.current_entry_price,
+                            "current_exit_price": trade_record.current_exit_price,
+                            "current_profit_loss": trade_record.current_profit_loss,
+                            "current_profit_loss_rate": trade_record.current_profit_loss_rate,
+                            "take_profit_price": trade_record.take_profit_price,
+                            "stop_loss_price": trade_record.stop_loss_price,
+                            "open_price": trade_record.open_price,
+                            "high_price": trade_record.high_price,
+                            "low_price": trade_record.low_price,
+                            "close_price": trade_record.close_price
+                        })
+                    else:
+                        # 如果是字典，使用鍵值存取
+                        trades.append({
+                            "position_id": trade_record.get("position_id", ""),
+                            "entry_date": trade_record.get("entry_date", ""),
+                            "exit_date": trade_record.get("exit_date", ""),
+                            "stock_id": trade_record.get("stock_id", ""),
+                            "stock_name": trade_record.get("stock_name", ""),
+                            "trade_direction": trade_record.get("trade_direction", 1),
+                            "entry_price": trade_record.get("entry_price", 0),
+                            "exit_price": trade_record.get("exit_price", 0),
+                            "shares": trade_record.get("shares", 0),
+                            "profit_loss": trade_record.get("profit_loss", 0),
+                            "profit_loss_rate": trade_record.get("profit_loss_rate", 0),
+                            "commission": trade_record.get("commission", 0),
+                            "securities_tax": trade_record.get("securities_tax", 0),
+                            "net_profit_loss": trade_record.get("net_profit_loss", 0),
+                            "holding_days": trade_record.get("holding_days", 0),
+                            "exit_reason": trade_record.get("exit_reason", ""),
+                            "current_price": trade_record.get("current_price", 0),
+                            "unrealized_profit_loss": trade_record.get("unrealized_profit_loss", 0),
+                            "unrealized_profit_loss_rate": trade_record.get("unrealized_profit_loss_rate", 0),
+                            "current_date": trade_record.get("current_date", ""),
+                            "exit_price_type": trade_record.get("exit_price_type", ""),
+                            "current_entry_price": trade_record.get("current_entry_price", 0),
+                            "current_exit_price": trade_record.get("current_exit_price", 0),
+                            "current_profit_loss": trade_record.get("current_profit_loss", 0),
+                            "current_profit_loss_rate": trade_record.get("current_profit_loss_rate", 0),
+                            "take_profit_price": trade_record.get("take_profit_price", 0),
+                            "stop_loss_price": trade_record.get("stop_loss_price", 0),
+                            "open_price": trade_record.get("open_price", 0),
+                            "high_price": trade_record.get("high_price", 0),
+                            "low_price": trade_record.get("low_price", 0),
+                            "close_price": trade_record.get("close_price", 0)
+                        })
             
             # 處理持有部位資料
             holding_positions = []
@@ -609,7 +902,17 @@ class BacktestAPI:
                                     "close_price": position.get("close_price", 0)
                                 })
             
-            return {
+            # 日曆彙總表（日/月/年/星期）只聚合一次，隨回測結果保存，圖表資料由此取得
+            calendar_rollup = None
+            if trades:
+                try:
+                    calendar_rollup = ChartAPI.rollup_payload(ChartAPI.build_calendar_rollup(
+                        ChartAPI.prepare_trade_frame(trade_frame if trade_frame is not None else trades)
+                    ))
+                except Exception as e:
+                    print_log(f"execute_backtest:日曆彙總表建立失敗 {e}")
+            
+            response = {
                 "success": True,
                 "summary": {
                     "total_trades": combined_result.get("total_trades", 0),
@@ -620,12 +923,106 @@ class BacktestAPI:
                     "total_profit_rate": combined_result.get("total_profit_loss_rate", 0.0)
                 },
                 "trades": trades,
-                "holding_positions": holding_positions
+                "holding_positions": holding_positions,
+                "calendar_rollup": calendar_rollup,
+                "execution": {
+                    "mode": execution_mode,
+                    "workers": max_workers,
+                    "elapsed_seconds": elapsed_seconds,
+                    "cached_stocks": len(cached_results)
+                }
             }
+            if execution_mode == "portfolio":
+                # 投資組合模式額外回傳依日期對齊的權益曲線與風險指標
+                response["summary"].update({
+                    "max_drawdown": combined_result.get("max_drawdown", 0.0),
+                    "max_drawdown_rate": combined_result.get("max_drawdown_rate", 0.0),
+                    "sharpe_ratio": combined_result.get("sharpe_ratio", 0.0),
+                    "final_equity": combined_result.get("final_equity", initial_capital)
+                })
+                dates = combined_result.get("dates", [])
+                values = combined_result.get("equity_curve", [])
+            else:
+                # 逐股模式沒有依日期對齊的組合權益，以初始資金加上依出場日累積的已實現淨損益表示
+                dates, values = BacktestAPI._realized_equity_curve(
+                    trade_frame if trade_frame is not None else trades, initial_capital
+                )
+                if execution_mode == "walk_forward":
+                    response["walk_forward"] = walk_forward
+            response["equity_curve"] = BacktestAPI._store_equity_curve(result_key, dates, values)
+            response["from_cache"] = False
+            result_cache.set(result_key, response)
+            return response
             
+        except JobCancelledError:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
     
+    @staticmethod
+    def _realized_equity_curve(trades, initial_capital: float) -> Tuple[List[str], List[float]]:
+        """
+        已實現權益曲線：依出場日加總淨損益後累積，加上初始資金
+
+        Args:
+            trades: 交易帳本的 DataFrame，或交易記錄字典列表
+            initial_capital: 初始資金
+
+        Returns:
+            Tuple[List[str], List[float]]: (出場日 YYYY-MM-DD, 當日收盤後的權益)
+        """
+        frame = trades if isinstance(trades, pl.DataFrame) else pl.DataFrame(trades)
+        if frame.is_empty() or "exit_date" not in frame.columns or "net_profit_loss" not in frame.columns:
+            return [], []
+        daily = (
+            frame.lazy()
+            .select(
+                pl.col("exit_date").cast(pl.Utf8).str.slice(0, 10).alias("date"),
+                pl.col("net_profit_loss").cast(pl.Float64).fill_null(0.0)
+            )
+            .filter(pl.col("date").is_not_null() & (pl.col("date") != ""))
+            .group_by("date")
+            .agg(pl.col("net_profit_loss").sum())
+            .sort("date")
+            .collect()
+        )
+        return daily["date"].to_list(), (daily["net_profit_loss"].cum_sum() + initial_capital).to_list()
+
+    @staticmethod
+    def _store_equity_curve(result_key: str, dates: List, values: List[float]) -> Dict[str, Any]:
+        """
+        完整權益曲線存入結果快取，回傳降採樣後的版本（附 result_key，前端縮放時以 /api/backtest/equity-curve 取得區間資料）
+        """
+        equity_curve = {
+            "dates": [d.strftime("%Y-%m-%d") if hasattr(d, "strftime") else str(d) for d in dates],
+            "values": list(values)
+        }
+        result_cache.set(f"{result_key}:equity_curve", equity_curve)
+        return {**downsample_curve(equity_curve["dates"], equity_curve["values"]), "result_key": result_key}
+
+    @staticmethod
+    async def get_equity_curve(result_key: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                               max_points: Optional[int] = None):
+        """
+        取得完整權益曲線的區間資料（回測結果中的 equity_curve 為降採樣後的版本）
+
+        Args:
+            result_key: 回測結果的 equity_curve.result_key
+            start_date / end_date: 區間（YYYY-MM-DD，可省略）
+            max_points: 點數上限（預設 CHART_MAX_POINTS，0 為完整解析度）
+        """
+        equity_curve = result_cache.get(f"{result_key}:equity_curve")
+        if equity_curve is None:
+            raise HTTPException(status_code=404, detail="權益曲線已過期，請重新執行回測")
+        points = [
+            (day, value) for day, value in zip(equity_curve["dates"], equity_curve["values"])
+            if (not start_date or day >= start_date[:10]) and (not end_date or day <= end_date[:10])
+        ]
+        return {
+            "success": True,
+            "equity_curve": downsample_curve([day for day, _ in points], [value for _, value in points], max_points)
+        }
+
     @staticmethod
     async def export_backtest_excel(request: Request):
         """匯出回測結果為Excel"""
@@ -11,6 +11,9 @@ from typing import Dict, List, Any
 from fastapi import HTTPException, Request
 
 from core.cache_manager import cache_manager
+from core.chart_cache import chart_cache
+from core.indicator_cache import indicator_cache
+from core.resampler import resample_cache
 
 def print_log(message: str):
     """日誌輸出"""
@@ -24,6 +27,9 @@ class CacheAPI:
         """取得快取資訊"""
         try:
             info = cache_manager.get_cache_info()
+            info["indicator_cache"] = indicator_cache.info()
+            info["resample_cache"] = resample_cache.info()
+            info["chart_cache"] = chart_cache.info()
             return {"status": "success", "info": info}
         except Exception as e:
             print_log(f"get_cache_info error: {e}")
@@ -64,6 +70,19 @@ class CacheAPI:
             data = await request.json()
             cache_type = data.get("cache_type", "all")
             
+            # 技術指標、重取樣與圖表快取只在記憶體中
+            if cache_type in ("all", "indicators"):
+                indicator_cache.clear()
+                if cache_type == "indicators":
+                    return {"status": "success", "message": "快取清理成功 (indicators)"}
+            if cache_type in ("all", "resample"):
+                resample_cache.clear()
+                if cache_type == "resample":
+                    return {"status": "success", "message": "快取清理成功 (resample)"}
+            if cache_type in ("all", "charts"):
+                chart_cache.clear()
+                if cache_type == "charts":
+                    return {"status": "success", "message": "快取清理成功 (charts)"}
             success = cache_manager.clear_cache(cache_type)
             
             if success:
@@ -5,21 +5,153 @@
 包含回測圖表生成等功能
 """
 
+import asyncio
+import io
 import os
-from typing import Dict, List, Any
-from datetime import datetime
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+from datetime import date, datetime
 
 import polars as pl
 from fastapi import HTTPException, Request
+from fastapi.responses import Response
 import plotly.graph_objects as go
+import plotly.io as pio
 from plotly.subplots import make_subplots
 
+from core.chart_cache import chart_cache
+from core.downsampling import DEFAULT_MAX_POINTS, downsample_frame
+from core.result_cache import fingerprint_frame
 from core.utils import Utils
 
 def print_log(message: str):
     """日誌輸出"""
     print(f"********** chart_api.py - {message}")
 
+# 交易記錄欄位 -> 圖表使用的中文欄位
+TRADE_COLUMN_MAPPING = {
+    'entry_date': '年月日',
+    'exit_date': '出場日期',
+    'stock_id': '證券代碼',
+    'stock_name': '證券名稱',
+    'profit_loss': '報酬',
+    'net_profit_loss': '淨損益',
+    'profit': '損益',
+    'shares': '股數',
+    'entry_price': '進場價',
+    'exit_price': '出場價',
+    'buy_amount': '買入金額',
+    'sell_amount': '賣出金額',
+    'commission': '手續費',
+    'securities_tax': '證交稅',
+    'holding_days': '持有天數',
+    'exit_reason': '出場原因',
+    'exit_status': '出場狀態',
+    'trade_direction': '交易方向',
+    'current_price': '當前價格',
+    'unrealized_profit_loss': '未實現損益',
+    'unrealized_profit_loss_rate': '未實現損益率',
+    'current_date': '當前日期',
+    'exit_price_type': '出場價類型',
+    'current_entry_price': '當前進場價',
+    'current_exit_price': '當前出場價',
+    'current_profit_loss': '當前損益',
+    'current_profit_loss_rate': '當前損益率',
+    'take_profit_price': '停利價',
+    'stop_loss_price': '停損價',
+    'open_price': '開盤價',
+    'high_price': '最高價',
+    'low_price': '最低價',
+    'close_price': '收盤價',
+    '明日開盤': '明日開盤價'
+}
+
+# 回測結果頁面預設產生的圖表 {圖表類型: 標題}
+BACKTEST_CHARTS = {
+    "drawdown_merge": "回撤分析圖",
+    "heatmap": "月損益熱力圖",
+    "monthly_return_heatmap": "月收益率熱力圖",
+    "win_rate_heatmap": "月勝率熱力圖"
+}
+
+# 可產生的圖表類型 {圖表類型: 標題}
+CHART_TITLES = {
+    "drawdown": "回落圖",
+    **BACKTEST_CHARTS,
+    "yearly_return_heatmap": "年度損益圖",
+    "trading_days_heatmap": "月交易天數熱力圖",
+    "trading_stocks_heatmap": "月交易股票數熱力圖",
+    "weekday_analysis_charts": "星期分析圖"
+}
+
+# 圖表執行緒池大小；LAZY_BACKTEST_CHARTS 為 1 時回測結果不含圖表 HTML，開啟圖表時才產生
+CHART_RENDER_WORKERS = int(os.environ.get("CHART_RENDER_WORKERS", "4"))
+LAZY_BACKTEST_CHARTS = os.environ.get("LAZY_BACKTEST_CHARTS", "0") == "1"
+
+# 各股回落圖每個子圖至少保留的點數
+MIN_SUBPLOT_POINTS = 200
+
+# get_chart_data 可取得的資料序列（compute_chart_tables 的輸出）
+CHART_DATA_SERIES = ("drawdown", "monthly", "yearly", "weekday", "summary")
+
+# 日曆彙總表的鍵值欄位與型別；各層級只使用部分鍵值，其餘為 null
+ROLLUP_KEY_TYPES = {"date": pl.Date, "year": pl.Int32, "month": pl.Int8, "weekday": pl.Int8}
+ROLLUP_LEVELS = {
+    "day": ("date", "year", "month", "weekday"),
+    "month": ("year", "month"),
+    "year": ("year",),
+    "weekday": ("weekday",),
+    "all": (),
+}
+ROLLUP_COLUMNS = ("level", *ROLLUP_KEY_TYPES, "profit", "trades", "wins", "stocks", "days",
+                  "entry_bp_sum", "entry_bp_count", "exit_bp_sum", "exit_bp_count")
+
+# 圖表 HTML 不內嵌 plotly.js（頁面已由 /assets/plotly.min.js 載入一次）
+HTML_OPTIONS = {"full_html": False, "include_plotlyjs": False, "config": {'responsive': True, 'displayModeBar': False}}
+
+_render_executor: Optional[ThreadPoolExecutor] = None
+_render_futures: Dict[Tuple[str, str], Future] = {}
+_render_lock = threading.Lock()
+
+
+def _get_render_executor() -> ThreadPoolExecutor:
+    """取得共用的圖表執行緒池"""
+    global _render_executor
+    if _render_executor is None:
+        _render_executor = ThreadPoolExecutor(max_workers=CHART_RENDER_WORKERS, thread_name_prefix="chart")
+    return _render_executor
+
+
+def shutdown_render_executor() -> None:
+    """關閉圖表執行緒池（應用程式結束時呼叫）"""
+    global _render_executor
+    with _render_lock:
+        if _render_executor is not None:
+            _render_executor.shutdown(wait=False, cancel_futures=True)
+        _render_executor = None
+        _render_futures.clear()
+
+
+def _parse_date(value) -> Optional[date]:
+    """請求中的日期參數（可含時間部分）轉為 date"""
+    if not value:
+        return None
+    return date.fromisoformat(str(value)[:10])
+
+
+def _render_and_cache(df: Optional[pl.DataFrame], fingerprint: str, chart_type: str,
+                      tables: Optional[Dict[str, pl.DataFrame]] = None) -> str:
+    """於執行緒池中產生圖表並寫入快取"""
+    try:
+        html = ChartAPI.render_chart(df, chart_type, tables)
+        chart_cache.set(fingerprint, chart_type, html)
+        return html
+    finally:
+        with _render_lock:
+            _render_futures.pop((fingerprint, chart_type), None)
+
+
 class ChartAPI:
     """圖表API類別"""
     
@@ -31,103 +163,444 @@ class ChartAPI:
             chart_type = data.get("chart_type", "")
             trade_records = data.get("trade_records", [])
             
-            if not trade_records:
+            if trade_records is None or len(trade_records) == 0:
                 raise HTTPException(status_code=400, detail="沒有交易記錄可生成圖表")
             
-            # 轉換為DataFrame並標準化欄位名稱
-            df = pl.DataFrame(trade_records)
-            
-            # 標準化欄位名稱 - 避免重複欄位名稱
-            column_mapping = {
-                'entry_date': '年月日',
-                'exit_date': '出場日期',
-                'stock_id': '證券代碼',
-                'stock_name': '證券名稱',
-                'profit_loss': '報酬',
-                'net_profit_loss': '淨損益',
-                'profit': '損益',
-                'shares': '股數',
-                'entry_price': '進場價',
-                'exit_price': '出場價',
-                'buy_amount': '買入金額',
-                'sell_amount': '賣出金額',
-                'commission': '手續費',
-                'securities_tax': '證交稅',
-                'holding_days': '持有天數',
-                'exit_reason': '出場原因',
-                'exit_status': '出場狀態',
-                'trade_direction': '交易方向',
-                'current_price': '當前價格',
-                'unrealized_profit_loss': '未實現損益',
-                'unrealized_profit_loss_rate': '未實現損益率',
-                'current_date': '當前日期',
-                'exit_price_type': '出場價類型',
-                'current_entry_price': '當前進場價',
-                'current_exit_price': '當前出場價',
-                'current_profit_loss': '當前損益',
-                'current_profit_loss_rate': '當前損益率',
-                'take_profit_price': '停利價',
-                'stop_loss_price': '停損價',
-                'open_price': '開盤價',
-                'high_price': '最高價',
-                'low_price': '最低價',
-                'close_price': '收盤價',
-                '明日開盤': '明日開盤價'
+            df = ChartAPI.prepare_trade_frame(trade_records)
+            chart_html = await asyncio.wrap_future(ChartAPI.submit_chart(df, fingerprint_frame(df), chart_type))
+            
+            return {
+                "success": True,
+                "chart_html": chart_html
             }
             
-            # 重命名欄位
-            for old_name, new_name in column_mapping.items():
-                if old_name in df.columns:
-                    df = df.rename({old_name: new_name})
-            
-            # 統一損益欄位名稱 - 優先使用 '報酬'，如果沒有則使用其他損益欄位
-            if '報酬' not in df.columns:
-                if '淨損益' in df.columns:
-                    df = df.rename({'淨損益': '報酬'})
-                elif '損益' in df.columns:
-                    df = df.rename({'損益': '報酬'})
-                elif 'profit_loss' in df.columns:
-                    df = df.rename({'profit_loss': '報酬'})
-                elif 'net_profit_loss' in df.columns:
-                    df = df.rename({'net_profit_loss': '報酬'})
-                elif 'profit' in df.columns:
-                    df = df.rename({'profit': '報酬'})
-            
-            # 確保有報酬欄位
-            if '報酬' not in df.columns:
-                raise HTTPException(status_code=400, detail="找不到損益欄位，請確保資料包含 profit_loss、net_profit_loss 或 profit 欄位")
+        except HTTPException:
+            raise
+        except Exception as e:
+            print_log(f"generate_charts error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    @staticmethod
+    async def get_chart_data(request: Request):
+        """
+        一次取得所有圖表的資料序列（回落、月/年熱力圖、勝率、星期分析），由前端 chart_renderer.js 繪圖
+        
+        請求參數：
+            trade_records: 交易記錄
+            calendar_rollup: 回測結果的日曆彙總表（提供時取代 trade_records，不必重新聚合交易記錄）
+            series: 要回傳的序列（預設全部，見 CHART_DATA_SERIES）
+            format: "json"（預設，欄式 JSON）或 "arrow"（Arrow IPC，需指定單一 series）
+            max_points: 回落序列點數上限（預設 CHART_MAX_POINTS，0 為完整解析度）
+            start_date / end_date: 回落序列的區間（前端縮放時依可見範圍重新取得）
+        """
+        try:
+            data = await request.json()
+            trade_records = data.get("trade_records", [])
+            calendar_rollup = data.get("calendar_rollup")
+            output_format = data.get("format", "json")
+            series = data.get("series") or list(CHART_DATA_SERIES)
+            if isinstance(series, str):
+                series = [series]
             
-            # 根據圖表類型生成不同的圖表
-            if chart_type == "drawdown":
-                chart_html = ChartAPI._create_drawdown_chart(df)
-            elif chart_type == "drawdown_merge":
-                chart_html = ChartAPI._create_drawdown_chart_merge(df)
-            elif chart_type == "heatmap":
-                chart_html = ChartAPI._create_heatmap(df)
-            elif chart_type == "monthly_return_heatmap":
-                chart_html = ChartAPI._create_monthly_return_heatmap(df)
-            elif chart_type == "yearly_return_heatmap":
-                chart_html = ChartAPI._create_yearly_return_heatmap(df)
-            elif chart_type == "trading_days_heatmap":
-                chart_html = ChartAPI._create_trading_days_heatmap(df)
-            elif chart_type == "trading_stocks_heatmap":
-                chart_html = ChartAPI._create_trading_stocks_heatmap(df)
-            elif chart_type == "win_rate_heatmap":
-                chart_html = ChartAPI._create_win_rate_heatmap(df)
-            elif chart_type == "weekday_analysis_charts":
-                chart_html = ChartAPI._create_weekday_analysis_charts(df)
+            if not calendar_rollup and (trade_records is None or len(trade_records) == 0):
+                raise HTTPException(status_code=400, detail="沒有交易記錄可生成圖表")
+            unknown = [name for name in series if name not in CHART_DATA_SERIES]
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"不支援的圖表序列: {', '.join(unknown)}")
+            if output_format not in ("json", "arrow"):
+                raise HTTPException(status_code=400, detail=f"不支援的輸出格式: {output_format}")
+            if output_format == "arrow" and len(series) != 1:
+                raise HTTPException(status_code=400, detail="Arrow 格式一次只能取得一個序列")
+            
+            if calendar_rollup:
+                rollup = ChartAPI.load_calendar_rollup(calendar_rollup)
             else:
-                raise HTTPException(status_code=400, detail=f"不支援的圖表類型: {chart_type}")
+                rollup = ChartAPI.build_calendar_rollup(ChartAPI.prepare_trade_frame(trade_records))
+            if rollup.is_empty():
+                raise HTTPException(status_code=400, detail="沒有交易記錄可生成圖表")
+            tables = ChartAPI.compute_chart_tables(
+                max_points=data.get("max_points"),
+                start_date=_parse_date(data.get("start_date")),
+                end_date=_parse_date(data.get("end_date")),
+                rollup=rollup
+            )
+            if output_format == "arrow":
+                buffer = io.BytesIO()
+                tables[series[0]].write_ipc(buffer)
+                return Response(content=buffer.getvalue(), media_type="application/vnd.apache.arrow.file")
             
             return {
                 "success": True,
-                "chart_html": chart_html
+                "chart_data": ChartAPI.chart_data_payload({name: tables[name] for name in series})
             }
             
+        except HTTPException:
+            raise
         except Exception as e:
-            print_log(f"generate_charts error: {e}")
+            print_log(f"get_chart_data error: {e}")
             raise HTTPException(status_code=500, detail=str(e))
     
+    @staticmethod
+    def prepare_trade_frame(trade_records) -> pl.DataFrame:
+        """
+        交易記錄轉為圖表使用的 DataFrame：欄位改為中文名稱、統一損益欄位為「報酬」、年月日轉為日期
+        
+        Args:
+            trade_records: 交易記錄（字典列表，或交易帳本的 DataFrame）
+        """
+        df = trade_records if isinstance(trade_records, pl.DataFrame) else pl.DataFrame(trade_records)
+        
+        # 一次重命名（目標欄位已存在時保留原欄位，避免重複欄位名稱）
+        df = df.rename({
+            old_name: new_name for old_name, new_name in TRADE_COLUMN_MAPPING.items()
+            if old_name in df.columns and new_name not in df.columns
+        })
+        
+        # 統一損益欄位名稱 - 優先使用 '報酬'，如果沒有則使用淨損益、損益
+        if '報酬' not in df.columns:
+            fallback = next((name for name in ('淨損益', '損益') if name in df.columns), None)
+            if fallback is None:
+                raise HTTPException(status_code=400, detail="找不到損益欄位，請確保資料包含 profit_loss、net_profit_loss 或 profit 欄位")
+            df = df.rename({fallback: '報酬'})
+        
+        # 年月日統一為日期型別（字串可含時間部分）
+        if '年月日' in df.columns and df.schema['年月日'] != pl.Date:
+            if df.schema['年月日'] == pl.Utf8:
+                df = df.with_columns(pl.col('年月日').str.slice(0, 10).str.to_date())
+            else:
+                df = df.with_columns(pl.col('年月日').cast(pl.Date))
+        return df
+    
+    @staticmethod
+    def render_chart(df: Optional[pl.DataFrame], chart_type: str,
+                     tables: Optional[Dict[str, pl.DataFrame]] = None) -> str:
+        """
+        依圖表類型產生圖表 HTML
+        
+        Args:
+            df: prepare_trade_frame 的結果（各股回落圖需要；其餘圖表只讀取 tables）
+            chart_type: 圖表類型
+            tables: compute_chart_tables 的結果，未提供時由 df 計算
+        """
+        if chart_type == "drawdown":
+            if df is None:
+                raise HTTPException(status_code=400, detail="各股回落圖需要交易記錄")
+            return ChartAPI._create_drawdown_chart(df)
+        builders = {
+            "drawdown_merge": ChartAPI._create_drawdown_chart_merge,
+            "heatmap": ChartAPI._create_heatmap,
+            "monthly_return_heatmap": ChartAPI._create_monthly_return_heatmap,
+            "yearly_return_heatmap": ChartAPI._create_yearly_return_heatmap,
+            "trading_days_heatmap": ChartAPI._create_trading_days_heatmap,
+            "trading_stocks_heatmap": ChartAPI._create_trading_stocks_heatmap,
+            "win_rate_heatmap": ChartAPI._create_win_rate_heatmap,
+            "weekday_analysis_charts": ChartAPI._create_weekday_analysis_charts,
+        }
+        if chart_type not in builders:
+            raise HTTPException(status_code=400, detail=f"不支援的圖表類型: {chart_type}")
+        if tables is None:
+            tables = ChartAPI.compute_chart_tables(df)
+        return builders[chart_type](tables)
+    
+    @staticmethod
+    def submit_chart(df: Optional[pl.DataFrame], fingerprint: str, chart_type: str,
+                     tables: Optional[Dict[str, pl.DataFrame]] = None) -> Future:
+        """
+        交由圖表執行緒池產生圖表（已快取時直接回傳結果，同一圖表同時只產生一次）
+        
+        Args:
+            df: prepare_trade_frame 的結果
+            fingerprint: df 的內容指紋（fingerprint_frame）
+            chart_type: 圖表類型
+            tables: compute_chart_tables 的結果（多個圖表共用同一份，不必各自重新聚合）
+        """
+        if chart_type not in CHART_TITLES:
+            raise HTTPException(status_code=400, detail=f"不支援的圖表類型: {chart_type}")
+        html = chart_cache.get(fingerprint, chart_type)
+        if html is not None:
+            future = Future()
+            future.set_result(html)
+            return future
+        key = (fingerprint, chart_type)
+        with _render_lock:
+            future = _render_futures.get(key)
+            if future is None:
+                future = _get_render_executor().submit(_render_and_cache, df, fingerprint, chart_type, tables)
+                _render_futures[key] = future
+        return future
+    
+    @staticmethod
+    async def render_backtest_charts(trade_records, lazy: Optional[bool] = None,
+                                     rollup: Optional[pl.DataFrame] = None) -> List[Dict[str, Any]]:
+        """
+        產生回測結果頁面的主要圖表（BACKTEST_CHARTS）
+        
+        交易記錄只轉換一次、日曆彙總表只聚合一次，各圖表在執行緒池平行產生，結果依「交易記錄指紋 + 圖表類型」快取
+        
+        Args:
+            trade_records: 交易記錄（字典列表，或交易帳本的 DataFrame）
+            lazy: 延遲產生（None 時使用 LAZY_BACKTEST_CHARTS）；延遲時只回傳 chart_key，
+                  前端開啟圖表時再以 /api/backtest/charts/{chart_key}/{chart_type} 取得
+            rollup: 回測結果已建立的日曆彙總表（build_calendar_rollup），未提供時由交易記錄建立
+        
+        Returns:
+            List[Dict]: [{id, title, html, type[, lazy, chart_key]}]，單一圖表失敗時略過
+        """
+        df = ChartAPI.prepare_trade_frame(trade_records)
+        fingerprint = fingerprint_frame(df)
+        if rollup is None:
+            rollup = ChartAPI.build_calendar_rollup(df)
+        if LAZY_BACKTEST_CHARTS if lazy is None else lazy:
+            chart_cache.set_frame(fingerprint, df, rollup)
+            return [
+                {"id": chart_type, "title": title, "html": "", "type": chart_type, "lazy": True, "chart_key": fingerprint}
+                for chart_type, title in BACKTEST_CHARTS.items()
+            ]
+        
+        tables = ChartAPI.compute_chart_tables(rollup=rollup)
+        futures = {chart_type: ChartAPI.submit_chart(df, fingerprint, chart_type, tables) for chart_type in BACKTEST_CHARTS}
+        results = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures.values()), return_exceptions=True)
+        charts = []
+        for (chart_type, title), result in zip(BACKTEST_CHARTS.items(), results):
+            if isinstance(result, Exception):
+                print_log(f"生成圖表 {chart_type} 失敗: {result}")
+                continue
+            charts.append({"id": chart_type, "title": title, "html": result, "type": chart_type})
+        return charts
+    
+    @staticmethod
+    def lazy_charts_requested(request: Request, data: Optional[dict] = None) -> Optional[bool]:
+        """讀取請求的 lazy_charts 參數（JSON 內容或查詢字串），未指定時回傳 None"""
+        value = (data or {}).get("lazy_charts")
+        if value is None:
+            value = request.query_params.get("lazy_charts") if hasattr(request, "query_params") else None
+        if value is None:
+            return None
+        return str(value).lower() in ("1", "true", "yes")
+    
+    @staticmethod
+    async def get_backtest_chart(chart_key: str, chart_type: str):
+        """取得延遲產生的回測圖表（render_backtest_charts 的 chart_key）"""
+        try:
+            html = chart_cache.get(chart_key, chart_type)
+            if html is None:
+                df = chart_cache.get_frame(chart_key)
+                if df is None:
+                    raise HTTPException(status_code=404, detail="圖表資料已過期，請重新執行回測")
+                rollup = chart_cache.get_rollup(chart_key)
+                tables = ChartAPI.compute_chart_tables(df, rollup=rollup) if chart_type != "drawdown" else None
+                html = await asyncio.wrap_future(ChartAPI.submit_chart(df, chart_key, chart_type, tables))
+            return {
+                "success": True,
+                "chart_html": html
+            }
+        except HTTPException:
+            raise
+        except Exception as e:
+            print_log(f"get_backtest_chart error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
+    @staticmethod
+    def build_calendar_rollup(df: pl.DataFrame) -> pl.DataFrame:
+        """
+        建立日曆彙總表（每次回測只計算一次，隨回測結果保存，所有圖表與摘要由此取得）
+        
+        衍生欄位（日期、年、月、星期、是否獲利、單筆收益率）只計算一次，
+        各層級（日、月、年、星期、全部）的列合併後以單一 group_by 聚合
+        
+        Args:
+            df: prepare_trade_frame 的結果
+        
+        Returns:
+            pl.DataFrame: ROLLUP_COLUMNS
+                level: day / month / year / weekday / all（未使用的鍵值欄位為 null）
+                date、year、month、weekday（1=星期一）: 鍵值
+                profit（損益合計）、trades（筆數）、wins（獲利筆數）、stocks（股票數）、days（交易天數）
+                entry_bp_sum / entry_bp_count: 以進場價計算的單筆收益率（bp）合計與有效筆數
+                exit_bp_sum / exit_bp_count: 以出場基準價（當沖為明日開盤價）× 股數計算的單筆收益率（bp）合計與有效筆數
+        """
+        exit_column = "明日開盤價" if "明日開盤價" in df.columns else "出場價"
+        has_shares = "股數" in df.columns and exit_column in df.columns
+        entry_return = (
+            pl.when(pl.col(exit_column).is_not_null() & (pl.col("股數") > 0) & (pl.col("進場價") > 0))
+            .then(pl.col("報酬") / pl.col("進場價") * 10000)
+            if has_shares and "進場價" in df.columns else pl.lit(None, dtype=pl.Float64)
+        )
+        exit_return = (
+            pl.when((pl.col(exit_column) > 0) & (pl.col("股數") > 0))
+            .then(pl.col("報酬") / (pl.col(exit_column) * pl.col("股數")) * 10000)
+            if has_shares else pl.lit(None, dtype=pl.Float64)
+        )
+        stock = pl.col("證券代碼") if "證券代碼" in df.columns else pl.lit(None, dtype=pl.Utf8)
+        
+        base = df.lazy().select(
+            pl.col("年月日").alias("date"),
+            pl.col("年月日").dt.year().cast(pl.Int32).alias("year"),
+            pl.col("年月日").dt.month().cast(pl.Int8).alias("month"),
+            pl.col("年月日").dt.weekday().cast(pl.Int8).alias("weekday"),
+            stock.cast(pl.Utf8).alias("stock_id"),
+            pl.col("報酬").cast(pl.Float64).alias("profit"),
+            (pl.col("報酬") > 0).cast(pl.Int64).alias("win"),
+            entry_return.cast(pl.Float64).alias("entry_bp"),
+            exit_return.cast(pl.Float64).alias("exit_bp"),
+        ).cache()
+        
+        levels = [
+            base.select(
+                pl.lit(level).alias("level"),
+                *[(pl.col(key) if key in keys else pl.lit(None, dtype=dtype)).alias(key)
+                  for key, dtype in ROLLUP_KEY_TYPES.items()],
+                pl.col("date").alias("trade_date"),
+                "stock_id", "profit", "win", "entry_bp", "exit_bp",
+            )
+            for level, keys in ROLLUP_LEVELS.items()
+        ]
+        return (
+            pl.concat(levels)
+            .group_by(["level", *ROLLUP_KEY_TYPES])
+            .agg(
+                pl.col("profit").sum(),
+                pl.count().alias("trades"),
+                pl.col("win").sum().alias("wins"),
+                pl.col("stock_id").n_unique().alias("stocks"),
+                pl.col("trade_date").n_unique().alias("days"),
+                pl.col("entry_bp").sum().alias("entry_bp_sum"),
+                pl.col("entry_bp").is_not_null().sum().alias("entry_bp_count"),
+                pl.col("exit_bp").sum().alias("exit_bp_sum"),
+                pl.col("exit_bp").is_not_null().sum().alias("exit_bp_count"),
+            )
+            .sort(["level", *ROLLUP_KEY_TYPES], nulls_last=True)
+            .select(ROLLUP_COLUMNS)
+            .collect()
+        )
+    
+    @staticmethod
+    def rollup_payload(rollup: pl.DataFrame) -> Dict[str, list]:
+        """日曆彙總表轉為欄式 JSON（隨回測結果回傳，可再傳給 get_chart_data 取代交易記錄；數值不四捨五入，累積損益不產生誤差）"""
+        return rollup.with_columns(pl.col("date").cast(pl.Utf8)).to_dict(as_series=False)
+    
+    @staticmethod
+    def load_calendar_rollup(payload: Dict[str, list]) -> pl.DataFrame:
+        """由 rollup_payload 的欄式 JSON 還原日曆彙總表"""
+        missing = [column for column in ROLLUP_COLUMNS if column not in payload]
+        if missing:
+            raise HTTPException(status_code=400, detail=f"日曆彙總表缺少欄位: {', '.join(missing)}")
+        return pl.DataFrame({column: payload[column] for column in ROLLUP_COLUMNS}).with_columns(
+            pl.col("date").cast(pl.Utf8).str.to_date(),
+            *[pl.col(key).cast(dtype) for key, dtype in ROLLUP_KEY_TYPES.items() if key != "date"],
+            pl.col("profit", "entry_bp_sum", "exit_bp_sum").cast(pl.Float64),
+        )
+    
+    @staticmethod
+    def compute_chart_tables(df: Optional[pl.DataFrame] = None, max_points: Optional[int] = None,
+                             start_date: Optional[date] = None, end_date: Optional[date] = None,
+                             rollup: Optional[pl.DataFrame] = None) -> Dict[str, pl.DataFrame]:
+        """
+        由日曆彙總表計算所有圖表的資料表（不再掃描交易記錄）
+        
+        Args:
+            df: prepare_trade_frame 的結果（未提供 rollup 時以此建立日曆彙總表）
+            max_points: 回落序列的點數上限（LTTB 降採樣），None 使用 CHART_MAX_POINTS，0 表示不取樣
+            start_date / end_date: 回落序列的顯示區間（累積損益仍以完整歷史計算，供前端縮放時取得完整解析度）
+            rollup: build_calendar_rollup 的結果
+        
+        Returns:
+            Dict[str, pl.DataFrame]:
+                drawdown: date、profit（每日損益）、cum_profit（累積損益）、drawdown（距前高回落）
+                monthly: year、month、profit、trades、win_rate（%）、return_bp（單筆收益率平均）、trading_days、trading_stocks
+                yearly: year、profit
+                weekday: weekday（1=星期一）、trades、return_bp、win_rate（%）
+                summary: trades、profit、win_rate、weekday_win_rate（%，僅星期一至五）、days（回落序列取樣前的天數）
+        """
+        if rollup is None:
+            rollup = ChartAPI.build_calendar_rollup(df)
+        rows = rollup.lazy()
+        level = lambda name: rows.filter(pl.col("level") == name)
+        win_rate = lambda digits: (pl.col("wins") / pl.col("trades") * 100).round(digits).alias("win_rate")
+        
+        drawdown = (
+            level("day").select("date", "profit")
+            .sort("date")
+            .with_columns(pl.col("profit").cum_sum().alias("cum_profit"))
+            .with_columns((pl.col("cum_profit") - pl.col("cum_profit").cum_max()).alias("drawdown"))
+        )
+        monthly = level("month").select(
+            "year", "month", "profit", "trades", win_rate(0),
+            pl.when(pl.col("entry_bp_count") > 0).then(pl.col("entry_bp_sum") / pl.col("entry_bp_count")).alias("return_bp"),
+            pl.col("days").alias("trading_days"),
+            pl.col("stocks").alias("trading_stocks"),
+        ).sort(["year", "month"])
+        yearly = level("year").select("year", "profit").sort("year")
+        workdays = level("weekday").filter(pl.col("weekday") <= 5)
+        weekday = workdays.select(
+            "weekday", "trades",
+            pl.when(pl.col("exit_bp_count") > 0).then(pl.col("exit_bp_sum") / pl.col("exit_bp_count"))
+            .fill_nan(None).round(0).alias("return_bp"),
+            win_rate(2),
+        ).sort("weekday")
+        summary = level("all").select("trades", "profit", win_rate(2), "days").join(
+            workdays.select(
+                pl.when(pl.col("trades").sum() > 0)
+                .then((pl.col("wins").sum() / pl.col("trades").sum() * 100).round(2))
+                .alias("weekday_win_rate")
+            ), how="cross"
+        )
+        
+        tables = dict(zip(CHART_DATA_SERIES, pl.collect_all([drawdown, monthly, yearly, weekday, summary])))
+        
+        drawdown = tables["drawdown"]
+        if start_date is not None:
+            drawdown = drawdown.filter(pl.col("date") >= start_date)
+        if end_date is not None:
+            drawdown = drawdown.filter(pl.col("date") <= end_date)
+        tables["drawdown"] = downsample_frame(drawdown, "date", ["cum_profit", "drawdown"], max_points)
+        return tables
+    
+    @staticmethod
+    def chart_data_payload(tables: Dict[str, pl.DataFrame]) -> Dict[str, Dict[str, list]]:
+        """圖表資料表轉為欄式 JSON（{序列: {欄位: 值列表}}），浮點數四捨五入、日期為 ISO 字串"""
+        payload = {}
+        for name, table in tables.items():
+            table = table.with_columns(
+                [pl.col(column).round(2) for column, dtype in table.schema.items() if dtype == pl.Float64] +
+                [pl.col(column).cast(pl.Utf8) for column, dtype in table.schema.items() if dtype == pl.Date]
+            )
+            payload[name] = table.to_dict(as_series=False)
+        return payload
+    
+    @staticmethod
+    def _plotly_template() -> dict:
+        """目前預設的 plotly 版面樣板（直接組 figure 字典時使用，外觀與 go.Figure 相同）"""
+        return pio.templates[pio.templates.default].to_plotly_json()
+    
+    @staticmethod
+    def _drawdown_frame(df: pl.DataFrame, by_stock: bool = False) -> pl.DataFrame:
+        """
+        計算每日損益、累積損益與回落（距歷史高點）
+        
+        Args:
+            df: prepare_trade_frame 的結果
+            by_stock: 是否依證券代碼分別計算（一次 group_by，累積值以 over 分股計算）
+        
+        Returns:
+            pl.DataFrame: [證券代碼,] 年月日、日報酬、累積報酬、高點、回落、新高點，依 [證券代碼,] 年月日 排序
+        """
+        keys = ["證券代碼", "年月日"] if by_stock else ["年月日"]
+        over = (lambda expr: expr.over("證券代碼")) if by_stock else (lambda expr: expr)
+        return (
+            df.lazy()
+            .group_by(keys)
+            .agg(pl.col("報酬").cast(pl.Float64).sum().alias("日報酬"))
+            .sort(keys)
+            .with_columns(over(pl.col("日報酬").cum_sum()).alias("累積報酬"))
+            .with_columns(over(pl.col("累積報酬").cum_max()).alias("高點"))
+            .with_columns(
+                (pl.col("累積報酬") - pl.col("高點")).alias("回落"),
+                (pl.col("累積報酬") == pl.col("高點")).alias("新高點")
+            )
+            .collect()
+        )
+    
     @staticmethod
     def _create_drawdown_chart(df: pl.DataFrame) -> str:
         """創建回落圖（每檔股票分開）"""
@@ -135,119 +608,73 @@ class ChartAPI:
             if df.is_empty():
                 return "<p>沒有可顯示的結果資料。</p>"
             
-            # 處理日期與報酬欄
-            df = df.with_columns([
-                pl.col("年月日").cast(pl.Date),
-                pl.col("報酬").cast(pl.Float64)
-            ]).sort(["證券代碼", "年月日"])
-            
-            # 取得所有股票代碼
-            stock_ids = df["證券代碼"].unique().to_list()
-            
-            fig = make_subplots(rows=len(stock_ids), cols=1, shared_xaxes=True, vertical_spacing=0.04,
-                                subplot_titles=[f"{sid} 回落圖" for sid in stock_ids],
-                                row_heights=[1/len(stock_ids)]*len(stock_ids))
-            
-            for idx, sid in enumerate(stock_ids):
-                sdf = df.filter(pl.col("證券代碼") == sid)
-                daily_returns = (
-                    sdf.group_by("年月日")
-                    .agg(pl.col("報酬").sum().alias("日報酬"))
-                    .sort("年月日")
-                )
-                daily_returns = daily_returns.with_columns([
-                    pl.col("日報酬").cum_sum().alias("累積報酬")
-                ])
-                cum_profit = daily_returns["累積報酬"].to_list()
-                max_so_far = []
-                drawdown = []
-                high_marks = []
-                max_val = float('-inf')
-                for val in cum_profit:
-                    max_val = max(max_val, val)
-                    max_so_far.append(max_val)
-                    drawdown.append(val - max_val)
-                    high_marks.append(val == max_val)
-                daily_returns = daily_returns.with_columns([
-                    pl.Series("高點", max_so_far),
-                    pl.Series("回落", drawdown),
-                    pl.Series("新高點", high_marks)
-                ])
+            # 一次計算所有股票的回落，再依股票切分（不逐檔篩選）
+            per_stock = ChartAPI._drawdown_frame(df, by_stock=True).partition_by("證券代碼", maintain_order=True)
+            rows = len(per_stock)
+            
+            # 股票多時縮小每列高度；子圖間距以固定像素換算，不會超過 plotly 上限 1/(rows-1)
+            height = (350 if rows <= 10 else 220) * rows
+            spacing = min(0.04, 60 / height)
+            row_domain = (1 - spacing * (rows - 1)) / rows
+            
+            # 子圖數量多時 make_subplots / add_trace 的物件驗證成本很高，直接組成 figure 字典（共用 x 軸）
+            data, annotations = [], []
+            layout = {
+                "template": ChartAPI._plotly_template(),
+                "height": height,
+                "title": {"text": "各股績效與回落圖"},
+                "plot_bgcolor": "white",
+                "paper_bgcolor": "white",
+                "legend": {"orientation": "h", "yanchor": "top", "y": 1.02, "xanchor": "center", "x": 0.5},
+                "font": {"color": "black"},
+                "margin": {"t": 60, "b": 40, "l": 40, "r": 40},
+            }
+            # 每個子圖的點數上限隨股票數減少（至少 MIN_SUBPLOT_POINTS 點）
+            subplot_points = max(MIN_SUBPLOT_POINTS, DEFAULT_MAX_POINTS // rows)
+            for idx, daily_returns in enumerate(per_stock):
+                sid = daily_returns["證券代碼"][0]
+                daily_returns = downsample_frame(daily_returns, "年月日", ["累積報酬", "回落"], subplot_points)
+                suffix = "" if idx == 0 else str(idx + 1)
+                top = 1 - idx * (row_domain + spacing)
+                layout[f"xaxis{suffix}"] = {"anchor": f"y{suffix}", "domain": [0, 1], "showticklabels": idx == rows - 1,
+                                            **({"matches": "x"} if idx else {})}
+                layout[f"yaxis{suffix}"] = {"anchor": f"x{suffix}", "domain": [max(0, top - row_domain), top]}
+                annotations.append({"text": f"{sid} 回落圖", "x": 0.5, "y": top, "xref": "paper", "yref": "paper",
+                                    "xanchor": "center", "yanchor": "bottom", "showarrow": False, "font": {"size": 16}})
+                dates = daily_returns["年月日"].cast(pl.Utf8).to_list()
                 # 畫累積損益
-                fig.add_trace(go.Scatter(
-                    x=daily_returns["年月日"].to_list(),
-                    y=daily_returns["累積報酬"].to_list(),
-                    mode='lines+markers', name=f'{sid} 累積損益',
-                    line=dict(color='blue')
-                ), row=idx+1, col=1)
+                data.append({"type": "scatter", "x": dates, "y": daily_returns["累積報酬"].to_list(),
+                             "mode": "lines+markers", "name": f"{sid} 累積損益", "line": {"color": "blue"},
+                             "xaxis": f"x{suffix}", "yaxis": f"y{suffix}"})
                 # 畫最大回落
-                fig.add_trace(go.Bar(
-                    x=daily_returns["年月日"].to_list(),
-                    y=daily_returns["回落"].to_list(),
-                    name=f'{sid} 最大回落', marker_color='red', opacity=0.5
-                ), row=idx+1, col=1)
-            
-            fig.update_layout(
-                height=350*len(stock_ids),
-                title='各股績效與回落圖',
-                plot_bgcolor='white',
-                paper_bgcolor='white',
-                legend=dict(orientation='h', yanchor='top', y=1.02, xanchor='center', x=0.5),
-                font=dict(color='black'),
-                margin=dict(t=60, b=40, l=40, r=40)
-            )
-            return fig.to_html(full_html=False, config={'responsive': True, 'displayModeBar': False})
+                data.append({"type": "bar", "x": dates, "y": daily_returns["回落"].to_list(),
+                             "name": f"{sid} 最大回落", "marker": {"color": "red"}, "opacity": 0.5,
+                             "xaxis": f"x{suffix}", "yaxis": f"y{suffix}"})
+            layout["annotations"] = annotations
+            return pio.to_html({"data": data, "layout": layout}, validate=False, **HTML_OPTIONS)
         except Exception as e:
             return f"<p>創建回落圖時發生錯誤: {str(e)}</p>"
     
     @staticmethod
-    def _create_drawdown_chart_merge(df: pl.DataFrame) -> str:
+    def _create_drawdown_chart_merge(tables: Dict[str, pl.DataFrame]) -> str:
         """合併所有股票的回落圖（組合績效）"""
         try:
-            if df.is_empty():
+            # 合併所有股票的每日報酬（compute_chart_tables 已以 LTTB 降採樣，保留轉折點與最大回落）
+            daily_returns = tables["drawdown"]
+            if daily_returns.is_empty():
                 return "<p>沒有可顯示的結果資料。</p>"
             
-            df = df.with_columns([
-                pl.col("年月日").cast(pl.Date),
-                pl.col("報酬").cast(pl.Float64)
-            ]).sort("年月日")
-            
-            # 合併所有股票的每日報酬
-            daily_returns = (
-                df.group_by("年月日")
-                .agg(pl.col("報酬").sum().alias("日報酬"))
-                .sort("年月日")
-            )
-            daily_returns = daily_returns.with_columns([
-                pl.col("日報酬").cum_sum().alias("累積報酬")
-            ])
-            cum_profit = daily_returns["累積報酬"].to_list()
-            max_so_far = []
-            drawdown = []
-            high_marks = []
-            max_val = float('-inf')
-            for val in cum_profit:
-                max_val = max(max_val, val)
-                max_so_far.append(max_val)
-                drawdown.append(val - max_val)
-                high_marks.append(val == max_val)
-            daily_returns = daily_returns.with_columns([
-                pl.Series("高點", max_so_far),
-                pl.Series("回落", drawdown),
-                pl.Series("新高點", high_marks)
-            ])
-            
             # 畫圖
             fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.02,
                                 row_heights=[0.7, 0.3], subplot_titles=["累積損益", "最大回落"])
             fig.add_trace(go.Scatter(
-                x=daily_returns["年月日"].to_list(),
-                y=daily_returns["累積報酬"].to_list(),
+                x=daily_returns["date"].to_list(),
+                y=daily_returns["cum_profit"].to_list(),
                 mode='lines+markers', name='累積損益', line=dict(color='blue')
             ), row=1, col=1)
             fig.add_trace(go.Bar(
-                x=daily_returns["年月日"].to_list(),
-                y=daily_returns["回落"].to_list(),
+                x=daily_returns["date"].to_list(),
+                y=daily_returns["drawdown"].to_list(),
                 name='最大回落', marker_color='red'
             ), row=2, col=1)
             fig.update_layout(
@@ -255,37 +682,36 @@ class ChartAPI:
                 legend=dict(orientation='h', yanchor='top', y=1.02, xanchor='center', x=0.5),
                 font=dict(color='black'), margin=dict(t=60, b=40, l=40, r=40)
             )
-            return fig.to_html(full_html=False, config={'responsive': True, 'displayModeBar': False})
+            return fig.to_html(**HTML_OPTIONS)
         except Exception as e:
             return f"<p>創建合併回落圖時發生錯誤: {str(e)}</p>"
     
     @staticmethod
-    def _create_heatmap(df: pl.DataFrame) -> str:
+    def _month_pivot(monthly: pl.DataFrame, value: str):
+        """
+        月資料表轉為「年 × 月」矩陣（年份新到舊，沒有資料的月份為 0）
+        
+        Returns:
+            tuple: (years, month_cols, z)
+        """
+        pivot_table = (
+            monthly.filter(pl.col(value).is_not_null())
+            .pivot(values=value, index="year", columns="month")
+            .fill_null(0).fill_nan(0)
+            .sort("year", descending=True)
+        )
+        month_cols = sorted([col for col in pivot_table.columns if col != "year"], key=int)
+        return pivot_table["year"].to_list(), month_cols, pivot_table.select(month_cols).to_numpy()
+    
+    @staticmethod
+    def _create_heatmap(tables: Dict[str, pl.DataFrame]) -> str:
         """月實際損益熱力圖（萬元）"""
         try:
-            if df.is_empty():
+            if tables["monthly"].is_empty():
                 return "<p>沒有資料產生熱力圖。</p>"
             
-            # 確保年月日欄位是日期類型
-            df = df.with_columns([
-                pl.col("年月日").cast(pl.Date).alias("年月日")
-            ])
-            
-            # 提取年份和月份
-            df = df.with_columns([
-                pl.col("年月日").dt.year().alias("年"),
-                pl.col("年月日").dt.month().alias("月")
-            ])
-            
-            pivot_table = df.group_by(["年", "月"]).agg([
-                pl.col("報酬").sum().alias("報酬")
-            ]).pivot(values="報酬", index="年", columns="月").fill_nan(0)
-            
-            month_cols = sorted([col for col in pivot_table.columns if isinstance(col, int) or (isinstance(col, str) and col.isdigit())], key=int)
-            # 按年份降序排序（新到舊）
-            pivot_table = pivot_table.sort("年", descending=True)
-            years = pivot_table["年"].to_list()
-            z = pivot_table.select(month_cols).to_numpy() / 10000  # 單位：萬元
+            years, month_cols, z = ChartAPI._month_pivot(tables["monthly"], "profit")
+            z = z / 10000  # 單位：萬元
             text = [[f"{v:.2f}" if v != 0 else "" for v in row] for row in z]
             
             min_value = z.min()
@@ -327,49 +753,19 @@ class ChartAPI:
                 paper_bgcolor='white'
             )
             
-            return fig.to_html(full_html=False, config={'responsive': True, 'displayModeBar': False})
+            return fig.to_html(**HTML_OPTIONS)
         except Exception as e:
             return f"<p>創建熱力圖時發生錯誤: {str(e)}</p>"
     
     @staticmethod
-    def _create_monthly_return_heatmap(df: pl.DataFrame) -> str:
+    def _create_monthly_return_heatmap(tables: Dict[str, pl.DataFrame]) -> str:
         """月平均收益率熱力圖（bp）— 使用單筆損益計算"""
         try:
-            if df.is_empty():
+            # 只保留有有效交易（有出場基準價且股數 > 0）的月份
+            if tables["monthly"].filter(pl.col("return_bp").is_not_null()).is_empty():
                 return "<p>沒有資料產生熱力圖。</p>"
             
-            # 確保年月日欄位是日期類型
-            df = df.with_columns([
-                pl.col("年月日").cast(pl.Date).alias("年月日")
-            ])
-            
-            # 提取年份和月份
-            df = df.with_columns([
-                pl.col("年月日").dt.year().alias("年"),
-                pl.col("年月日").dt.month().alias("月"),
-                ((pl.col("報酬") / pl.col("進場價")) * 10000).alias("單筆收益率bp")
-            ])
-            
-            # 過濾有效交易
-            if "明日開盤價" in df.columns:
-                df = df.filter(pl.col("明日開盤價").is_not_null() & (pl.col("股數") > 0))
-            else:
-                df = df.filter(pl.col("出場價").is_not_null() & (pl.col("股數") > 0))
-                
-            grouped = df.group_by(["年", "月"]).agg([
-                pl.col("單筆收益率bp").mean().alias("月平均bp"),
-                pl.count().alias("交易筆數")
-            ]).filter(pl.col("交易筆數") > 0)
-            
-            pivot_table = grouped.pivot(
-                values="月平均bp", index="年", columns="月"
-            ).fill_nan(0)
-            
-            month_cols = sorted([col for col in pivot_table.columns if col != "年"], key=int)
-            # 按年份降序排序（新到舊）
-            pivot_table = pivot_table.sort("年", descending=True)
-            years = pivot_table["年"].to_list()
-            z = pivot_table.select(month_cols).to_numpy()
+            years, month_cols, z = ChartAPI._month_pivot(tables["monthly"], "return_bp")
             text = [[f"{v:.0f}" if v != 0 else "" for v in row] for row in z]
             
             min_value, max_value = float(z.min()), float(z.max())
@@ -410,34 +806,22 @@ class ChartAPI:
                 paper_bgcolor='white'
             )
             
-            return fig.to_html(full_html=False, config={'responsive': True, 'displayModeBar': False})
+            return fig.to_html(**HTML_OPTIONS)
         except Exception as e:
             return f"<p>創建月收益率熱力圖時發生錯誤: {str(e)}</p>"
     
     @staticmethod
-    def _create_yearly_return_heatmap(df: pl.DataFrame) -> str:
+    def _create_yearly_return_heatmap(tables: Dict[str, pl.DataFrame]) -> str:
         """年平均收益率熱力圖（bp）"""
         try:
-            if df.is_empty():
+            if tables["yearly"].is_empty():
                 return "<p>沒有資料產生圖表。</p>"
             
-            # 確保年月日欄位是日期類型
-            df = df.with_columns([
-                pl.col("年月日").cast(pl.Date).alias("年月日")
-            ])
-            
-            # 提取年份
-            df = df.with_columns([
-                pl.col("年月日").dt.year().alias("年"),
-            ])
+            # 年度總損益，按年份降序排序
+            df_yearly = tables["yearly"].sort("year", descending=True)
             
-            # 按年加總損益，按年份降序排序
-            df_yearly = df.group_by("年").agg(
-                pl.col("報酬").sum().alias("總損益")
-            ).sort("年", descending=True)
-            
-            years = df_yearly["年"].to_list()
-            profits = (df_yearly["總損益"] / 10000).to_numpy()  # 單位轉成萬元
+            years = df_yearly["year"].to_list()
+            profits = (df_yearly["profit"] / 10000).to_numpy()  # 單位轉成萬元
             
             # 創建柱狀圖
             fig = go.Figure(data=[
@@ -490,48 +874,19 @@ class ChartAPI:
                 line_width=1
             )
             
-            return fig.to_html(full_html=False, config={'responsive': True, 'displayModeBar': False})
+            return fig.to_html(**HTML_OPTIONS)
         except Exception as e:
             return f"<p>創建年度損益圖表時發生錯誤: {str(e)}</p>"
     
     @staticmethod
-    def _create_trading_days_heatmap(df: pl.DataFrame) -> str:
+    def _create_trading_days_heatmap(tables: Dict[str, pl.DataFrame]) -> str:
         """月交易次數(天)熱力圖"""
         try:
-            if df.is_empty():
+            if tables["monthly"].is_empty():
                 return "<p>沒有資料產生熱力圖。</p>"
             
-            # 確保年月日欄位是日期類型
-            df = df.with_columns([
-                pl.col("年月日").cast(pl.Date).alias("年月日")
-            ])
-            
-            # 添加年份和月份列
-            df = df.with_columns([
-                pl.col("年月日").dt.year().alias("年"),
-                pl.col("年月日").dt.month().alias("月")
-            ])
-            
-            # 計算每個月的交易天數
-            trading_days = df.group_by(["年", "月"]).agg(
-                pl.n_unique("年月日").alias("交易天數")
-            ).sort(["年", "月"])
-            
-            # 創建樞紐表
-            pivot_table = trading_days.pivot(
-                values="交易天數",
-                index="年",
-                columns="月"
-            ).fill_null(0)
-            
-            # 獲取年份和月份
-            # 按年份降序排序（新到舊）
-            pivot_table = pivot_table.sort("年", descending=True)
-            years = pivot_table["年"].to_list()
-            month_cols = sorted([col for col in pivot_table.columns if isinstance(col, int) or (isinstance(col, str) and str(col).isdigit())], key=int)
-            
-            # 準備熱力圖數據
-            z = pivot_table.select(month_cols).to_numpy()
+            # 每個月的交易天數
+            years, month_cols, z = ChartAPI._month_pivot(tables["monthly"], "trading_days")
             text = [[f"{int(v)}" if v != 0 else "0" for v in row] for row in z]
             
             # 創建熱力圖
@@ -571,46 +926,19 @@ class ChartAPI:
                 paper_bgcolor='white'
             )
             
-            return fig.to_html(full_html=False, config={'responsive': True, 'displayModeBar': False})
+            return fig.to_html(**HTML_OPTIONS)
         except Exception as e:
             return f"<p>創建月交易次數熱力圖時發生錯誤: {str(e)}</p>"
     
     @staticmethod
-    def _create_trading_stocks_heatmap(df: pl.DataFrame) -> str:
+    def _create_trading_stocks_heatmap(tables: Dict[str, pl.DataFrame]) -> str:
         """月交易次數(隻)熱力圖"""
         try:
-            if df.is_empty():
+            if tables["monthly"].is_empty():
                 return "<p>沒有資料產生熱力圖。</p>"
             
-            # 確保年月日欄位是日期類型
-            df = df.with_columns([
-                pl.col("年月日").cast(pl.Date).alias("年月日")
-            ])
-            
-            # 添加年份和月份列
-            df = df.with_columns([
-                pl.col("年月日").dt.year().alias("年"),
-                pl.col("年月日").dt.month().alias("月")
-            ])
-            
-            # 計算每個年月的交易總筆數
-            trading_days = df.group_by(["年", "月"]).agg(
-                pl.col("證券代碼").n_unique().alias("交易股票數")
-            ).sort(["年", "月"])  # 按年和月排序
-            
-            # 創建透視表
-            pivot_table = trading_days.pivot(
-                values="交易股票數",
-                index="年",
-                columns="月"
-            ).fill_null(0)
-            
-            # 按年份降序排序（新到舊）
-            pivot_table = pivot_table.sort("年", descending=True)
-            years = pivot_table["年"].to_list()
-            month_cols = sorted([col for col in pivot_table.columns if isinstance(col, int) or (isinstance(col, str) and str(col).isdigit())], key=int)
-            
-            z = pivot_table.select(month_cols).to_numpy()
+            # 每個月的交易股票數
+            years, month_cols, z = ChartAPI._month_pivot(tables["monthly"], "trading_stocks")
             text = [[f"{int(v)}" if v != 0 else "0" for v in row] for row in z]
             
             fig = go.Figure(data=go.Heatmap(
@@ -649,52 +977,19 @@ class ChartAPI:
                 paper_bgcolor='white'
             )
             
-            return fig.to_html(full_html=False, config={'responsive': True, 'displayModeBar': False})
+            return fig.to_html(**HTML_OPTIONS)
         except Exception as e:
             return f"<p>創建月交易次數熱力圖時發生錯誤: {str(e)}</p>"
     
     @staticmethod
-    def _create_win_rate_heatmap(df: pl.DataFrame) -> str:
+    def _create_win_rate_heatmap(tables: Dict[str, pl.DataFrame]) -> str:
         """月勝率熱力圖"""
         try:
-            if df.is_empty():
+            if tables["monthly"].is_empty():
                 return "<p>沒有資料產生熱力圖。</p>"
             
-            # 確保年月日欄位是日期類型
-            df = df.with_columns([
-                pl.col("年月日").cast(pl.Date).alias("年月日")
-            ])
-            
-            # 添加年份和月份列
-            df = df.with_columns([
-                pl.col("年月日").dt.year().alias("年"),
-                pl.col("年月日").dt.month().alias("月"),
-                (pl.col("報酬") > 0).cast(pl.Int64).alias("是否獲利")  # 計算是否獲利
-            ])
-            
-            # 計算每月的勝率
-            win_rates = df.group_by(["年", "月"]).agg([
-                (pl.col("是否獲利").mean() * 100).round(0).alias("勝率"),  # 計算勝率並轉換為百分比
-                pl.col("年月日").count().alias("交易次數")  # 計算交易次數
-            ]).filter(
-                pl.col("交易次數") > 0  # 只保留有交易的月份
-            ).sort(["年", "月"])
-            
-            # 創建樞紐表
-            pivot_table = win_rates.pivot(
-                values="勝率",
-                index="年",
-                columns="月"
-            ).fill_null(0)
-            
-            # 獲取年份和月份
-            # 按年份降序排序（新到舊）
-            pivot_table = pivot_table.sort("年", descending=True)
-            years = pivot_table["年"].to_list()
-            month_cols = sorted([col for col in pivot_table.columns if isinstance(col, int) or (isinstance(col, str) and str(col).isdigit())], key=int)
-            
-            # 準備熱力圖數據
-            z = pivot_table.select(month_cols).to_numpy()
+            # 每月的勝率（%）
+            years, month_cols, z = ChartAPI._month_pivot(tables["monthly"], "win_rate")
             text = [[f"{int(v)}%" if v != 0 else "0%" for v in row] for row in z]
             
             # 創建熱力圖
@@ -735,60 +1030,27 @@ class ChartAPI:
                 paper_bgcolor='white'
             )
             
-            return fig.to_html(full_html=False, config={'responsive': True, 'displayModeBar': False})
+            return fig.to_html(**HTML_OPTIONS)
         except Exception as e:
             return f"<p>創建月度勝率熱力圖時發生錯誤: {str(e)}</p>"
     
     @staticmethod
-    def _create_weekday_analysis_charts(df: pl.DataFrame) -> str:
+    def _create_weekday_analysis_charts(tables: Dict[str, pl.DataFrame]) -> str:
         """月週期收益率圖：分析各星期交易次數、平均收益(bp)、勝率(%)"""
         try:
-            if df.is_empty():
-                return "<p>沒有資料產生圖表。</p>"
-            
-            # 確保年月日欄位是日期類型
-            df = df.with_columns([
-                pl.col("年月日").cast(pl.Date).alias("年月日")
-            ])
-            
-            # 資料預處理
-            df = df.with_columns([
-                pl.col("年月日").dt.weekday().alias("星期"),  # 0=星期一
-                (pl.col("報酬") > 0).cast(pl.Int64).alias("是否獲利")
-            ])
-            
-            df = df.filter(pl.col("星期") <= 5)  # 保留星期一至五
-            
-            # 統計每星期績效
-            if "明日開盤價" in df.columns:
-                # Day Trading 使用明日開盤價
-                weekday_df = df.group_by("星期").agg([
-                    pl.col("年月日").count().alias("交易次數"),
-                    pl.when((pl.col("明日開盤價") > 0) & (pl.col("股數") > 0))
-                    .then((pl.col("報酬") / (pl.col("明日開盤價") * pl.col("股數"))) * 10000)
-                    .otherwise(None).mean().fill_nan(None).round(0).alias("收益率bp"),
-                    (pl.col("是否獲利").mean() * 100).round(2).alias("勝率")
-                ]).sort("星期")
-            else:
-                # Swing Trading 和 BookBuilding Announcement 使用出場價
-                weekday_df = df.group_by("星期").agg([
-                    pl.col("年月日").count().alias("交易次數"),
-                    pl.when((pl.col("出場價") > 0) & (pl.col("股數") > 0))
-                    .then((pl.col("報酬") / (pl.col("出場價") * pl.col("股數"))) * 10000)
-                    .otherwise(None).mean().fill_nan(None).round(0).alias("收益率bp"),
-                    (pl.col("是否獲利").mean() * 100).round(2).alias("勝率")
-                ]).sort("星期")
-            
+            # 星期一至五的交易次數、收益率（bp）與勝率
+            weekday_df = tables["weekday"]
             if weekday_df.is_empty():
                 return "<p>資料不足以繪製星期分析圖。</p>"
             
-            avg_win_rate = df.select((pl.col("是否獲利").mean() * 100).round(2)).item()
+            avg_win_rate = tables["summary"]["weekday_win_rate"][0]
             
-            # 對應星期中文名
-            day_names = ['星期一', '星期二', '星期三', '星期四', '星期五']
-            trades = weekday_df["交易次數"].to_list()
-            returns = weekday_df["收益率bp"].to_list()
-            win_rates = weekday_df["勝率"].to_list()
+            # 對應星期中文名（1=星期一）
+            names = ['星期一', '星期二', '星期三', '星期四', '星期五']
+            day_names = [names[day - 1] for day in weekday_df["weekday"].to_list()]
+            trades = weekday_df["trades"].to_list()
+            returns = [value or 0 for value in weekday_df["return_bp"].to_list()]
+            win_rates = weekday_df["win_rate"].to_list()
             
             # 建立圖表
             fig = make_subplots(
@@ -823,7 +1085,7 @@ class ChartAPI:
             # 加上平均勝率參考線
             fig.add_trace(go.Scatter(
                 x=day_names,
-                y=[avg_win_rate] * 5,
+                y=[avg_win_rate] * len(day_names),
                 mode='lines',
                 line=dict(color='red', width=2, dash='dash'),
                 name=f'平均勝率 ({avg_win_rate:.1f}%)'
@@ -869,6 +1131,6 @@ class ChartAPI:
                 paper_bgcolor='white'
             )
             
-            return fig.to_html(full_html=False, config={'responsive': True, 'displayModeBar': False})
+            return fig.to_html(**HTML_OPTIONS)
         except Exception as e:
             return f"<p>創建星期分析圖表時發生錯誤: {str(e)}</p>" 
\ No newline at end of file
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+背景工作API模組
+包含背景工作查詢、取消與進度串流（SSE）功能
+"""
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from core.job_manager import job_manager
+
+def print_log(message: str):
+    """日誌輸出"""
+    print(f"********** job_api.py - {message}")
+
+class JobAPI:
+    """背景工作API類別"""
+
+    @staticmethod
+    async def list_jobs():
+        """列出所有背景工作（不含結果）"""
+        return {"success": True, "jobs": [job.to_dict() for job in job_manager.list_jobs()]}
+
+    @staticmethod
+    async def get_job(job_id: str):
+        """取得背景工作狀態，完成時一併回傳結果"""
+        job = job_manager.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"工作不存在: {job_id}")
+        return {"success": True, "job": job.to_dict(include_result=True)}
+
+    @staticmethod
+    async def cancel_job(job_id: str):
+        """取消背景工作"""
+        job = job_manager.cancel(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail=f"工作不存在: {job_id}")
+        print_log(f"取消工作: {job_id}")
+        return {"success": True, "job": job.to_dict()}
+
+    @staticmethod
+    async def stream_job_events(job_id: str):
+        """以 Server-Sent Events 串流背景工作進度"""
+        if job_manager.get(job_id) is None:
+            raise HTTPException(status_code=404, detail=f"工作不存在: {job_id}")
+        return StreamingResponse(
+            job_manager.stream(job_id),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
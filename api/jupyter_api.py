@@ -38,6 +38,7 @@ from fastapi.responses import JSONResponse
 from core.utils import Utils
 from core.price_utils import PriceUtils
 from core.technical_indicators import generate_indicators
+from core.resampler import align_timeframes, resample_bars
 from strategies.base_strategy import TradeRecord, HoldingPosition
 from strategies.dynamic_strategy import DynamicStrategy
 from config.trading_config import TradingConfig
@@ -389,6 +390,8 @@ class JupyterAPI:
             'TradeRecord': TradeRecord,
             'HoldingPosition': HoldingPosition,
             'generate_indicators': generate_indicators,
+            'resample_bars': resample_bars,
+            'align_timeframes': align_timeframes,
             'DynamicStrategy': DynamicStrategy,
             'TradingConfig': TradingConfig,
             
@@ -1089,12 +1092,15 @@ class JupyterAPI:
                     import concurrent.futures
                     from concurrent.futures import ThreadPoolExecutor, as_completed
                     
+                    # 一次切分各股票資料（零複製 slice），取代逐股 filter 整份資料
+                    stock_partitions = Utils.partition_by_stock(stock_data, stock_ids)
+                    
                     with ThreadPoolExecutor(max_workers=min(len(stock_ids), 4)) as executor:
                         # 提交所有任務
                         future_to_stock = {}
                         for stock_id in stock_ids:
-                            # 過濾該股票的資料
-                            stock_excel_data = stock_data.filter(pl.col("stock_id") == stock_id)
+                            # 取得該股票的資料
+                            stock_excel_data = stock_partitions[stock_id]
                             
                             if len(stock_excel_data) == 0:
                                 print_log(f"股票 {stock_id} 沒有資料，跳過")
@@ -1139,27 +1145,18 @@ class JupyterAPI:
 
             # 生成圖表
             charts = []
+            calendar_rollup = None
             trade_records = result.get("trade_records", [])
             if trade_records and len(trade_records) > 0:
                 try:
                     # 準備交易記錄資料（轉換為字典格式，和傳統編輯器一致）
                     trade_records = []
                     if hasattr(strategy_instance, 'trade_records') and strategy_instance.trade_records:
-                        for trade in strategy_instance.trade_records:
-                            trade_records.append({
-                                "entry_date": trade.entry_date.isoformat() if hasattr(trade.entry_date, 'isoformat') else str(trade.entry_date),
-                                "exit_date": trade.exit_date.isoformat() if hasattr(trade.exit_date, 'isoformat') else str(trade.exit_date),
-                                "stock_id": trade.stock_id,
-                                "stock_name": trade.stock_name,
-                                "entry_price": trade.entry_price,
-                                "exit_price": trade.exit_price,
-                                "shares": trade.shares,
-                                "profit_loss": trade.profit_loss,
-                                "profit_loss_rate": trade.profit_loss_rate,
-                                "net_profit_loss": trade.net_profit_loss,
-                                "holding_days": trade.holding_days,
-                                "exit_reason": trade.exit_reason
-                            })
+                        # 由欄式帳本批次轉換（ISO 日期格式）
+                        trade_records = strategy_instance.trade_records.to_dicts(
+                            columns=["entry_date", "exit_date", "stock_id", "stock_name", "entry_price", "exit_price", "shares", "profit_loss", "profit_loss_rate", "net_profit_loss", "holding_days", "exit_reason"],
+                            date_format=None
+                        )
                     
                     # 強制轉換 trade_records 為 list of dict（和傳統編輯器一致）
                     if isinstance(trade_records, pl.DataFrame):
@@ -1173,39 +1170,14 @@ class JupyterAPI:
                     
                     from api.chart_api import ChartAPI
 
-                    # 生成各種圖表
-                    chart_types = ["drawdown_merge", "heatmap", "monthly_return_heatmap", "win_rate_heatmap"]
-                    chart_titles = {
-                        "drawdown_merge": "回撤分析圖",
-                        "heatmap": "月損益熱力圖", 
-                        "monthly_return_heatmap": "月收益率熱力圖",
-                        "win_rate_heatmap": "月勝率熱力圖"
-                    }
-
-                    for chart_type in chart_types:
-                        try:
-                            # 創建對應的請求物件
-                            class MockChartRequest:
-                                async def json(self):
-                                    return {
-                                        "chart_type": chart_type,
-                                        "trade_records": trade_records
-                                    }
-
-                            chart_result = await ChartAPI.generate_charts(MockChartRequest())
-
-                            if chart_result.get("success"):
-                                charts.append({
-                                    "id": chart_type,
-                                    "title": chart_titles.get(chart_type, f"圖表 {chart_type}"),
-                                    "html": chart_result.get("chart_html", ""),
-                                    "type": chart_type
-                                })
-                                print_log(f"成功生成圖表: {chart_type}")
-                            else:
-                                print_log(f"圖表生成失敗: {chart_type}")
-                        except Exception as chart_error:
-                            print_log(f"生成圖表 {chart_type} 失敗: {chart_error}")
+                    # 交易帳本只轉換一次、日曆彙總表只聚合一次，圖表與回測結果共用
+                    trade_frame = ChartAPI.prepare_trade_frame(strategy_instance.trade_records.to_frame())
+                    rollup = ChartAPI.build_calendar_rollup(trade_frame)
+                    calendar_rollup = ChartAPI.rollup_payload(rollup)
+                    charts = await ChartAPI.render_backtest_charts(
+                        trade_frame, lazy=ChartAPI.lazy_charts_requested(request, data), rollup=rollup
+                    )
+                    print_log(f"成功生成圖表: {', '.join(chart['type'] for chart in charts)}")
                 except Exception as e:
                     print_log(f"圖表生成失敗: {e}")
             
@@ -1228,6 +1200,7 @@ class JupyterAPI:
                         "total_return": result.get("total_profit_loss_rate", 0)  # 使用總損益率作為總報酬率
                     },
                     "charts": charts,
+                    "calendar_rollup": calendar_rollup,
                     "result_df": None,  # 暫時設為 None，因為 DynamicStrategy 沒有這個欄位
                     "strategy_info": {
                         "strategy_name": result.get("strategy_name", "Jupyter 編輯器策略"),
@@ -7,10 +7,16 @@
 
 import os
 import shutil
+from datetime import datetime, timedelta
 from typing import Dict, List, Any
+import polars as pl
 from fastapi import HTTPException, Request, File, UploadFile
 
+from api.cache_api import CacheAPI
+from api.stock_api import StockAPI
+from core.screener import to_excel_frame, to_stock_list
 from core.stock_list_manager import StockListManager
+from core.utils import Utils
 
 def print_log(message: str):
     """日誌輸出"""
@@ -123,17 +129,73 @@ class StockListAPI:
             print_log(f"import_stocks_from_excel error: {e}")
             raise HTTPException(status_code=500, detail=str(e))
     
+    @staticmethod
+    async def _load_screening_data(data: Dict[str, Any]) -> pl.DataFrame:
+        """
+        載入選股用的全市場股價資料
+
+        有 cache_file 時使用快取檔案；否則向股價 API 取得全部（或指定）股票，
+        起始日期往前多取 lookback_days 天供技術指標計算
+        """
+        cache_file = data.get("cache_file")
+        if cache_file:
+            price_data = await CacheAPI.get_cache_data(cache_file)
+        else:
+            end_date = data.get("end_date") or datetime.now().strftime("%Y-%m-%d")
+            start_date = data.get("start_date") or end_date
+            fetch_start = (datetime.strptime(start_date, "%Y-%m-%d") -
+                           timedelta(days=int(data.get("lookback_days", 120)))).strftime("%Y-%m-%d")
+            async with StockAPI() as stock_api:
+                stock_info_df = await stock_api.get_stock_info()
+                stock_ids = data.get("stock_ids") or stock_info_df["stock_id"].to_list()
+                price_data = await stock_api.get_stock_price(stock_ids, fetch_start, end_date, stock_info_df=stock_info_df)
+        if price_data is None or price_data.is_empty():
+            raise HTTPException(status_code=400, detail="查無股價資料")
+
+        price_data = Utils.standardize_columns(price_data, ["stock_id", "date", "open", "high", "low", "close"])
+        # 技術指標的量能欄位名稱為 trading_volume
+        if "trading_volume" not in price_data.columns:
+            for column in ("Trading_Volume", "volume"):
+                if column in price_data.columns:
+                    price_data = price_data.with_columns(pl.col(column).alias("trading_volume"))
+                    break
+        return price_data
+
     @staticmethod
     async def apply_stock_conditions(request: Request):
-        """套用選股條件"""
+        """
+        套用選股條件
+
+        請求內容：
+            conditions: 選股條件（格式見 core/screener.py）
+            scope: "latest"（最新日期，預設）或 "all"（整段期間每日清單）
+            start_date / end_date: 篩選日期範圍
+            cache_file / stock_ids / lookback_days: 股價資料來源
+
+        回傳 stocks（選股列表格式）；scope="all" 時另回傳 excel_data（stock_id、date，可作為回測股票來源）
+        """
         try:
             data = await request.json()
             conditions = data.get("conditions", [])
+            scope = data.get("scope", "latest")
             
+            price_data = await StockListAPI._load_screening_data(data)
             stock_list_manager = request.app.state.stock_list_manager
-            stocks = stock_list_manager.apply_stock_conditions(conditions)
+            result = stock_list_manager.screen_stocks(
+                conditions, price_data, scope, data.get("start_date"), data.get("end_date")
+            )
             
-            return {"status": "success", "stocks": stocks}
+            response = {"status": "success", "stocks": to_stock_list(result), "count": len(result)}
+            if scope == "all":
+                response["excel_data"] = to_excel_frame(result).with_columns(
+                    pl.col("date").cast(pl.Utf8)
+                ).to_dicts()
+            return response
+        except HTTPException:
+            raise
+        except ValueError as e:
+            print_log(f"apply_stock_conditions error: {e}")
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
             print_log(f"apply_stock_conditions error: {e}")
             raise HTTPException(status_code=500, detail=str(e))
@@ -26,6 +26,8 @@ from core.utils import Utils
 from strategies.dynamic_strategy import DynamicStrategy
 from strategies.base_strategy import HoldingPosition, TradeRecord
 from core.price_utils import PriceUtils
+from core.job_manager import BacktestJob, JobCancelledError, job_manager
+from core.result_cache import result_cache, make_cache_key
 
 # 程式碼格式化相關
 try:
@@ -325,9 +327,15 @@ class StrategyAPI:
         code: str,
         strategy_table: str,
         excel_file: Optional[UploadFile],
-        request: Request
+        request: Request,
+        job: BacktestJob = None
     ):
-        """測試自定義策略"""
+        """
+        測試自定義策略
+
+        Args:
+            job: 背景工作；提供時每完成一檔股票回報進度（完成股票數、累計交易筆數），工作被取消時停止
+        """
         try:
             # 自動修復 stock_data.row() 調用，確保加上 named=True 參數，且不重複
             def fix_named_true(m):
@@ -552,7 +560,15 @@ class StrategyAPI:
                                                     pl.col(col).cast(pl.Float64, strict=False)
                                                 ])
                                                                                                 
-                                if len(test_stock_data) > 0:
+                                # 相同程式碼、參數與輸入資料的重複測試直接回傳快取結果（含圖表），不重跑回測
+                                result_key = make_cache_key("strategy_test", code, merged_parameters, test_stock_data, excel_pl_df)
+                                cached_results = result_cache.get(result_key)
+                                if cached_results is not None:
+                                    print_log(f"test_custom_strategy: 使用快取結果 {result_key[:12]}")
+                                    backtest_results = {**cached_results, "from_cache": True}
+                                    if job:
+                                        job.report(1, total=1, trades=cached_results.get("total_trades", 0), message="使用快取結果")
+                                elif len(test_stock_data) > 0:
                                     # 執行策略回測
                                     initial_capital = 1000000  # 100萬初始資金
                                     if hasattr(strategy_instance, 'run_backtest'):
@@ -568,6 +584,8 @@ class StrategyAPI:
                                                     "message": f"股票 {stock_id} 沒有資料"
                                                 }
                                             else:
+                                                if job:
+                                                    job.report(0, total=1)
                                                 strategy_instance.run_backtest(
                                                     stock_excel_data,  # 修正：使用該股票的資料
                                                     excel_pl_df,  # excel_pl_df 參數
@@ -575,6 +593,8 @@ class StrategyAPI:
                                                     stock_id,
                                                     f"{stock_id}股票"
                                                 )
+                                                if job:
+                                                    job.report(1, total=1, trades=len(strategy_instance.trade_records))
                                         else:
                                             # 多股票使用多執行緒處理
                                             print_log(f"使用多執行緒處理 {len(stock_ids)} 個股票")
@@ -591,13 +611,16 @@ class StrategyAPI:
                                             # 使用線程池執行多股票回測
                                             from concurrent.futures import ThreadPoolExecutor, as_completed
                                             
+                                            # 一次切分各股票資料（零複製 slice），取代逐股 filter 整份資料
+                                            stock_partitions = Utils.partition_by_stock(test_stock_data, stock_ids)
+                                            
                                             with ThreadPoolExecutor(max_workers=min(len(stock_ids), 4)) as executor:
                                                 # 提交所有任務
                                                 future_to_stock = {}
                                                 
                                                 for stock_id in stock_ids:
-                                                    # 過濾該股票的資料
-                                                    stock_excel_data = test_stock_data.filter(pl.col("stock_id") == stock_id)
+                                                    # 取得該股票的資料
+                                                    stock_excel_data = stock_partitions[stock_id]
                                                     
                                                     if len(stock_excel_data) == 0:
                                                         print_log(f"股票 {stock_id} 沒有資料，跳過")
@@ -615,13 +638,27 @@ class StrategyAPI:
 
                                                     future_to_stock[future] = stock_id
                                                 
-                                                # 收集結果
+                                                # 收集結果（每完成一檔股票回報進度）
+                                                completed_count = 0
+                                                trade_count = 0
+                                                if job:
+                                                    job.report(0, total=len(future_to_stock))
                                                 for future in as_completed(future_to_stock):
                                                     stock_id = future_to_stock[future]
                                                     try:
                                                         result = future.result()
                                                     except Exception as e:
                                                         print_log(f"股票 {stock_id} 回測失敗: {e}")
+                                                    completed_count += 1
+                                                    trade_count += len(strategy_instances[stock_id].trade_records)
+                                                    if job:
+                                                        try:
+                                                            job.report(completed_count, total=len(future_to_stock), trades=trade_count)
+                                                        except JobCancelledError:
+                                                            # 取消尚未開始的股票，執行中的股票完成後即結束
+                                                            for pending in future_to_stock:
+                                                                pending.cancel()
+                                                            raise
                                             
                                             # 合併所有策略實例的交易記錄
                                             for stock_id, instance in strategy_instances.items():
@@ -634,21 +671,11 @@ class StrategyAPI:
                                             # 準備交易記錄資料
                                             trade_records = []
                                             if hasattr(strategy_instance, 'trade_records') and strategy_instance.trade_records:
-                                                for trade in strategy_instance.trade_records:
-                                                    trade_records.append({
-                                                        "entry_date": trade.entry_date.isoformat() if hasattr(trade.entry_date, 'isoformat') else str(trade.entry_date),
-                                                        "exit_date": trade.exit_date.isoformat() if hasattr(trade.exit_date, 'isoformat') else str(trade.exit_date),
-                                                        "stock_id": trade.stock_id,
-                                                        "stock_name": trade.stock_name,
-                                                        "entry_price": trade.entry_price,
-                                                        "exit_price": trade.exit_price,
-                                                        "shares": trade.shares,
-                                                        "profit_loss": trade.profit_loss,
-                                                        "profit_loss_rate": trade.profit_loss_rate,
-                                                        "net_profit_loss": trade.net_profit_loss,
-                                                        "holding_days": trade.holding_days,
-                                                        "exit_reason": trade.exit_reason
-                                                    })
+                                                # 由欄式帳本批次轉換（ISO 日期格式）
+                                                trade_records = strategy_instance.trade_records.to_dicts(
+                                                    columns=["entry_date", "exit_date", "stock_id", "stock_name", "entry_price", "exit_price", "shares", "profit_loss", "profit_loss_rate", "net_profit_loss", "holding_days", "exit_reason"],
+                                                    date_format=None
+                                                )
                                             
                                             # 準備持有部位資料
                                             holding_positions = []
@@ -671,6 +698,7 @@ class StrategyAPI:
                                             
                                             # 生成圖表
                                             charts = []
+                                            calendar_rollup = None
                                             if trade_records and len(trade_records) > 0:
                                                 try:
                                                     # 強制轉換 trade_records 為 list of dict
@@ -684,44 +712,14 @@ class StrategyAPI:
                                                         print_log(f"trade_records 型態異常: {type(trade_records)}")
 
                                                     from api.chart_api import ChartAPI
-                                                    from fastapi import Request as FastAPIRequest
                                                     
-                                                    # 生成主要圖表類型
-                                                    chart_types = [
-                                                        "drawdown_merge",
-                                                        "heatmap", 
-                                                        "monthly_return_heatmap",
-                                                        "win_rate_heatmap"
-                                                    ]
-                                                    
-                                                    for chart_type in chart_types:
-                                                        try:
-                                                            # 創建模擬請求
-                                                            class MockChartRequest:
-                                                                async def json(self):
-                                                                    return {
-                                                                        "chart_type": chart_type,
-                                                                        "trade_records": trade_records
-                                                                    }
-                                                            
-                                                            chart_result = await ChartAPI.generate_charts(MockChartRequest())
-                                                            
-                                                            if chart_result.get("success"):
-                                                                chart_title = {
-                                                                    "drawdown_merge": "回撤分析圖",
-                                                                    "heatmap": "月損益熱力圖",
-                                                                    "monthly_return_heatmap": "月收益率熱力圖",
-                                                                    "win_rate_heatmap": "月勝率熱力圖"
-                                                                }.get(chart_type, f"圖表 {chart_type}")
-                                                                
-                                                                charts.append({
-                                                                    "id": chart_type,
-                                                                    "title": chart_title,
-                                                                    "html": chart_result.get("chart_html", ""),
-                                                                    "type": chart_type
-                                                                })
-                                                        except Exception as chart_error:
-                                                            print_log(f"生成圖表 {chart_type} 失敗: {chart_error}")
+                                                    # 交易帳本只轉換一次、日曆彙總表只聚合一次，圖表與回測結果共用
+                                                    trade_frame = ChartAPI.prepare_trade_frame(strategy_instance.trade_records.to_frame())
+                                                    rollup = ChartAPI.build_calendar_rollup(trade_frame)
+                                                    calendar_rollup = ChartAPI.rollup_payload(rollup)
+                                                    charts = await ChartAPI.render_backtest_charts(
+                                                        trade_frame, lazy=ChartAPI.lazy_charts_requested(request), rollup=rollup
+                                                    )
                                                 except Exception as e:
                                                     print_log(f"圖表生成失敗: {e}")
                                                     
@@ -740,12 +738,18 @@ class StrategyAPI:
                                                 "date_range": f"{min(dates)} 到 {max(dates)}",
                                                 "trade_records": trade_records,
                                                 "holding_positions": holding_positions,
-                                                "charts": charts
+                                                "charts": charts,
+                                                "calendar_rollup": calendar_rollup
                                             }
                                         else:
                                             backtest_results = {
                                                 "message": "無法取得回測結果"
                                             }
+                                if cached_results is None and backtest_results and "total_trades" in backtest_results:
+                                    backtest_results["from_cache"] = False
+                                    result_cache.set(result_key, backtest_results)
+                            except JobCancelledError:
+                                raise
                             except Exception as e:
                                 print_log(f"Excel 檔案處理錯誤: {e}")
                                 backtest_results = {
@@ -849,6 +853,8 @@ class StrategyAPI:
                                                 "message": f"股票 {stock_id} 沒有資料"
                                             }
                                         else:
+                                            if job:
+                                                job.report(0, total=1)
                                             strategy_instance.run_backtest(
                                                 stock_excel_data,  # 修正：使用該股票的資料
                                                 excel_pl_df,  # excel_pl_df 參數
@@ -856,6 +862,8 @@ class StrategyAPI:
                                                 stock_id,
                                                 f"{stock_id}股票"
                                             )
+                                            if job:
+                                                job.report(1, total=1, trades=len(strategy_instance.trade_records))
                                     else:
                                         # 多股票使用多執行緒處理
                                         print_log(f"使用多執行緒處理 {len(stock_ids)} 個股票")
@@ -873,12 +881,15 @@ class StrategyAPI:
                                         import concurrent.futures
                                         from concurrent.futures import ThreadPoolExecutor, as_completed
                                         
+                                        # 一次切分各股票資料（零複製 slice），取代逐股 filter 整份資料
+                                        stock_partitions = Utils.partition_by_stock(test_stock_data, stock_ids)
+                                        
                                         with ThreadPoolExecutor(max_workers=min(len(stock_ids), 4)) as executor:
                                             # 提交所有任務
                                             future_to_stock = {}
                                             for stock_id in stock_ids:
-                                                # 過濾該股票的資料
-                                                stock_excel_data = test_stock_data.filter(pl.col("stock_id") == stock_id)
+                                                # 取得該股票的資料
+                                                stock_excel_data = stock_partitions[stock_id]
                                                 
                                                 if len(stock_excel_data) == 0:
                                                     print_log(f"股票 {stock_id} 沒有資料，跳過")
@@ -895,13 +906,27 @@ class StrategyAPI:
                                                 )
                                                 future_to_stock[future] = stock_id
                                             
-                                            # 收集結果
+                                            # 收集結果（每完成一檔股票回報進度）
+                                            completed_count = 0
+                                            trade_count = 0
+                                            if job:
+                                                job.report(0, total=len(future_to_stock))
                                             for future in as_completed(future_to_stock):
                                                 stock_id = future_to_stock[future]
                                                 try:
                                                     result = future.result()
                                                 except Exception as e:
                                                     print_log(f"股票 {stock_id} 回測失敗: {e}")
+                                                completed_count += 1
+                                                trade_count += len(strategy_instances[stock_id].trade_records)
+                                                if job:
+                                                    try:
+                                                        job.report(completed_count, total=len(future_to_stock), trades=trade_count)
+                                                    except JobCancelledError:
+                                                        # 取消尚未開始的股票，執行中的股票完成後即結束
+                                                        for pending in future_to_stock:
+                                                            pending.cancel()
+                                                        raise
                                             
                                             # 合併所有策略實例的交易記錄
                                             for stock_id, instance in strategy_instances.items():
@@ -914,21 +939,11 @@ class StrategyAPI:
                                             # 準備交易記錄資料
                                             trade_records = []
                                             if hasattr(strategy_instance, 'trade_records') and strategy_instance.trade_records:
-                                                for trade in strategy_instance.trade_records:
-                                                    trade_records.append({
-                                                        "entry_date": trade.entry_date.isoformat() if hasattr(trade.entry_date, 'isoformat') else str(trade.entry_date),
-                                                        "exit_date": trade.exit_date.isoformat() if hasattr(trade.exit_date, 'isoformat') else str(trade.exit_date),
-                                                        "stock_id": trade.stock_id,
-                                                        "stock_name": trade.stock_name,
-                                                        "entry_price": trade.entry_price,
-                                                        "exit_price": trade.exit_price,
-                                                        "shares": trade.shares,
-                                                        "profit_loss": trade.profit_loss,
-                                                        "profit_loss_rate": trade.profit_loss_rate,
-                                                        "net_profit_loss": trade.net_profit_loss,
-                                                        "holding_days": trade.holding_days,
-                                                        "exit_reason": trade.exit_reason
-                                                    })
+                                                # 由欄式帳本批次轉換（ISO 日期格式）
+                                                trade_records = strategy_instance.trade_records.to_dicts(
+                                                    columns=["entry_date", "exit_date", "stock_id", "stock_name", "entry_price", "exit_price", "shares", "profit_loss", "profit_loss_rate", "net_profit_loss", "holding_days", "exit_reason"],
+                                                    date_format=None
+                                                )
                                             
                                             # 準備持有部位資料
                                             holding_positions = []
@@ -976,6 +991,8 @@ class StrategyAPI:
                         backtest_results = {
                             "message": "無法建立策略實例"
                         }
+                except JobCancelledError:
+                    raise
                 except Exception as e:
                     backtest_results = {
                         "message": f"策略執行錯誤: {str(e)}"
@@ -989,10 +1006,35 @@ class StrategyAPI:
             }
             
             return {"status": "success", "results": results}
+        except JobCancelledError:
+            raise
         except Exception as e:
             print_log(f"test_custom_strategy error: {e}")
             raise HTTPException(status_code=500, detail=str(e))
     
+    @staticmethod
+    async def submit_test_job(
+        strategy_id: str,
+        code: str,
+        strategy_table: str,
+        excel_file: Optional[UploadFile],
+        request: Request
+    ):
+        """提交背景策略測試工作，立即回傳 job_id（測試在背景執行緒中執行，不阻塞事件迴圈）"""
+        try:
+            if excel_file:
+                # 上傳檔案在請求結束後會被關閉，先讀入記憶體再交給背景工作
+                excel_content = await excel_file.read()
+                excel_file = UploadFile(file=BytesIO(excel_content), filename=excel_file.filename)
+            job = job_manager.submit_coroutine(
+                "strategy_test",
+                lambda job: StrategyAPI.test_custom_strategy(strategy_id, code, strategy_table, excel_file, request, job)
+            )
+            return {"success": True, "job_id": job.job_id, "status": job.status}
+        except Exception as e:
+            print_log(f"submit_test_job error: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+    
     @staticmethod
     async def test_custom_strategy_with_excel(
         strategy_id: str,
@@ -1267,12 +1309,15 @@ class StrategyAPI:
                                             import concurrent.futures
                                             from concurrent.futures import ThreadPoolExecutor, as_completed
                                             
+                                            # 一次切分各股票資料（零複製 slice），取代逐股 filter 整份資料
+                                            stock_partitions = Utils.partition_by_stock(test_stock_data, stock_ids)
+                                            
                                             with ThreadPoolExecutor(max_workers=min(len(stock_ids), 4)) as executor:
                                                 # 提交所有任務
                                                 future_to_stock = {}
                                                 for stock_id in stock_ids:
-                                                    # 過濾該股票的資料
-                                                    stock_excel_data = test_stock_data.filter(pl.col("stock_id") == stock_id)
+                                                    # 取得該股票的資料
+                                                    stock_excel_data = stock_partitions[stock_id]
                                                     
                                                     if len(stock_excel_data) == 0:
                                                         print_log(f"股票 {stock_id} 沒有資料，跳過")
@@ -1308,21 +1353,11 @@ class StrategyAPI:
                                             # 準備交易記錄資料
                                             trade_records = []
                                             if hasattr(strategy_instance, 'trade_records') and strategy_instance.trade_records:
-                                                for trade in strategy_instance.trade_records:
-                                                    trade_records.append({
-                                                        "entry_date": trade.entry_date.isoformat() if hasattr(trade.entry_date, 'isoformat') else str(trade.entry_date),
-                                                        "exit_date": trade.exit_date.isoformat() if hasattr(trade.exit_date, 'isoformat') else str(trade.exit_date),
-                                                        "stock_id": trade.stock_id,
-                                                        "stock_name": trade.stock_name,
-                                                        "entry_price": trade.entry_price,
-                                                        "exit_price": trade.exit_price,
-                                                        "shares": trade.shares,
-                                                        "profit_loss": trade.profit_loss,
-                                                        "profit_loss_rate": trade.profit_loss_rate,
-                                                        "net_profit_loss": trade.net_profit_loss,
-                                                        "holding_days": trade.holding_days,
-                                                        "exit_reason": trade.exit_reason
-                                                    })
+                                                # 由欄式帳本批次轉換（ISO 日期格式）
+                                                trade_records = strategy_instance.trade_records.to_dicts(
+                                                    columns=["entry_date", "exit_date", "stock_id", "stock_name", "entry_price", "exit_price", "shares", "profit_loss", "profit_loss_rate", "net_profit_loss", "holding_days", "exit_reason"],
+                                                    date_format=None
+                                                )
                                             
                                             # 準備持有部位資料
                                             holding_positions = []
@@ -1345,6 +1380,7 @@ class StrategyAPI:
                                             
                                             # 生成圖表
                                             charts = []
+                                            calendar_rollup = None
                                             if trade_records and len(trade_records) > 0:
                                                 try:
                                                     # 強制轉換 trade_records 為 list of dict
@@ -1358,44 +1394,14 @@ class StrategyAPI:
                                                         print_log(f"trade_records 型態異常: {type(trade_records)}")
 
                                                     from api.chart_api import ChartAPI
-                                                    from fastapi import Request as FastAPIRequest
-                                                    
-                                                    # 生成主要圖表類型
-                                                    chart_types = [
-                                                        "drawdown_merge",
-                                                        "heatmap", 
-                                                        "monthly_return_heatmap",
-                                                        "win_rate_heatmap"
-                                                    ]
                                                     
-                                                    for chart_type in chart_types:
-                                                        try:
-                                                            # 創建模擬請求
-                                                            class MockChartRequest:
-                                                                async def json(self):
-                                                                    return {
-                                                                        "chart_type": chart_type,
-                                                                        "trade_records": trade_records
-                                                                    }
-                                                            
-                                                            chart_result = await ChartAPI.generate_charts(MockChartRequest())
-                                                            
-                                                            if chart_result.get("success"):
-                                                                chart_title = {
-                                                                    "drawdown_merge": "回撤分析圖",
-                                                                    "heatmap": "月損益熱力圖",
-                                                                    "monthly_return_heatmap": "月收益率熱力圖",
-                                                                    "win_rate_heatmap": "月勝率熱力圖"
-                                                                }.get(chart_type, f"圖表 {chart_type}")
-                                                                
-                                                                charts.append({
-                                                                    "id": chart_type,
-                                                                    "title": chart_title,
-                                                                    "html": chart_result.get("chart_html", ""),
-                                                                    "type": chart_type
-                                                                })
-                                                        except Exception as chart_error:
-                                                            print_log(f"生成圖表 {chart_type} 失敗: {chart_error}")
+                                                    # 交易帳本只轉換一次、日曆彙總表只聚合一次，圖表與回測結果共用
+                                                    trade_frame = ChartAPI.prepare_trade_frame(strategy_instance.trade_records.to_frame())
+                                                    rollup = ChartAPI.build_calendar_rollup(trade_frame)
+                                                    calendar_rollup = ChartAPI.rollup_payload(rollup)
+                                                    charts = await ChartAPI.render_backtest_charts(
+                                                        trade_frame, lazy=ChartAPI.lazy_charts_requested(request), rollup=rollup
+                                                    )
                                                 except Exception as e:
                                                     print_log(f"圖表生成失敗: {e}")
                                             
@@ -1414,7 +1420,8 @@ class StrategyAPI:
                                                 "date_range": f"{min(dates)} 到 {max(dates)}",
                                                 "trade_records": trade_records,
                                                 "holding_positions": holding_positions,
-                                                "charts": charts
+                                                "charts": charts,
+                                                "calendar_rollup": calendar_rollup
                                             }
                                         else:
                                             backtest_results = {
@@ -70,6 +70,16 @@ class TradingConfig:
             "name": "使用漲跌停單",
             "description": "是否使用漲跌停單進行交易",
             "default": True
+        },
+        "event_driven": {
+            "name": "事件驅動回測",
+            "description": "以向量化進出場信號在事件之間跳躍回測（需定義 calculate_entry_signals，出場依出場信號、停利、停損與最大持有天數）",
+            "default": False
+        },
+        "wf_anchored": {
+            "name": "擴張視窗",
+            "description": "walk_forward 模式下樣本內起點固定在第一個交易日（否則隨視窗滾動）",
+            "default": False
         }
     }
     
@@ -137,6 +147,13 @@ class TradingConfig:
             "default": -10.0,
             "min": -50.0,
             "max": -1.0
+        },
+        "max_position_size": {
+            "name": "單一股票最大部位比例",
+            "description": "投資組合模式下單一股票部位佔總權益的上限",
+            "default": MAX_POSITION_SIZE,
+            "min": 0.01,
+            "max": 1.0
         }
     }
     
@@ -183,6 +200,41 @@ class TradingConfig:
             "default": 1,
             "min": 0,
             "max": 10
+        },
+        "max_workers": {
+            "name": "平行執行數量",
+            "description": "逐股回測的執行緒/行程數量（0 表示自動：執行緒模式最多 10 個，行程模式為 CPU 核心數）",
+            "default": 0,
+            "min": 0,
+            "max": 256
+        },
+        "max_positions": {
+            "name": "最大持有檔數",
+            "description": "投資組合模式下同時持有的最大股票檔數（0 表示不限制）",
+            "default": 0,
+            "min": 0,
+            "max": 1000
+        },
+        "wf_train_days": {
+            "name": "樣本內交易日數",
+            "description": "walk_forward 模式每個視窗的樣本內（in-sample）交易日數",
+            "default": 250,
+            "min": 1,
+            "max": 5000
+        },
+        "wf_test_days": {
+            "name": "樣本外交易日數",
+            "description": "walk_forward 模式每個視窗的樣本外（out-of-sample）交易日數",
+            "default": 60,
+            "min": 1,
+            "max": 5000
+        },
+        "wf_step_days": {
+            "name": "視窗前進日數",
+            "description": "walk_forward 模式每次視窗前進的交易日數（0 表示等於樣本外交易日數）",
+            "default": 0,
+            "min": 0,
+            "max": 5000
         }
     }
     
@@ -199,6 +251,30 @@ class TradingConfig:
             "description": "策略的描述",
             "default": "",
             "max_length": 500
+        },
+        "log_level": {
+            "name": "日誌層級",
+            "description": "回測引擎日誌層級（TRACE/DEBUG/INFO/WARNING/ERROR/OFF），空白表示使用預設值",
+            "default": "",
+            "max_length": 10
+        },
+        "execution_mode": {
+            "name": "回測模式",
+            "description": "isolated：每檔股票獨立資金回測（執行緒池）；process：同 isolated 但以行程池執行（有固定額外成本，僅多核心機器上的 CPU 密集策略可能較快）；portfolio：所有股票共用資金的投資組合回測；walk_forward：滾動視窗樣本內/樣本外回測",
+            "default": "isolated",
+            "max_length": 20
+        },
+        "rank_column": {
+            "name": "排序欄位",
+            "description": "投資組合模式下同日多檔進場時的資金分配排序欄位（由大到小），空白表示依股票代碼",
+            "default": "",
+            "max_length": 50
+        },
+        "precompute_indicators": {
+            "name": "預先計算指標",
+            "description": "walk_forward 模式在整段期間預先計算一次的 generate_indicators 指標（以逗號分隔，例如 ma_20,break_20_day_high）",
+            "default": "",
+            "max_length": 500
         }
     }
     
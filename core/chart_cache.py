@@ -0,0 +1,108 @@
+# 回測圖表快取模組
+"""
+回測圖表 HTML 快取
+
+- 以「交易記錄內容指紋 + 圖表類型」為鍵值保存已產生的圖表 HTML（記憶體 LRU，依字元數限制）
+- 延遲產生圖表時保存整理好的交易記錄 DataFrame 與日曆彙總表（依份數限制），使用者開啟圖表時再產生
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import polars as pl
+
+from core.logger import get_logger
+
+logger = get_logger("chart_cache.py")
+
+# 圖表 HTML 快取上限（字元數），預設 64MB
+MAX_CHART_CACHE_BYTES = int(os.environ.get("CHART_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# 延遲產生圖表時保留的交易記錄份數
+MAX_CHART_FRAMES = int(os.environ.get("CHART_CACHE_MAX_FRAMES", "32"))
+
+
+class ChartCache:
+    """圖表 HTML 快取（記憶體 LRU）"""
+
+    def __init__(self, max_bytes: int = MAX_CHART_CACHE_BYTES, max_frames: int = MAX_CHART_FRAMES):
+        self.max_bytes = max_bytes
+        self.max_frames = max_frames
+        self._charts: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._frames: "OrderedDict[str, Tuple[pl.DataFrame, Optional[pl.DataFrame]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint: str, chart_type: str) -> Optional[str]:
+        with self._lock:
+            key = (fingerprint, chart_type)
+            html = self._charts.get(key)
+            if html is None:
+                self.misses += 1
+                return None
+            self._charts.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def set(self, fingerprint: str, chart_type: str, html: str) -> None:
+        size = len(html)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            key = (fingerprint, chart_type)
+            previous = self._charts.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous)
+            self._charts[key] = html
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._charts:
+                _, evicted = self._charts.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def get_frame(self, fingerprint: str) -> Optional[pl.DataFrame]:
+        """取得延遲產生圖表用的交易記錄"""
+        with self._lock:
+            entry = self._frames.get(fingerprint)
+            if entry is None:
+                return None
+            self._frames.move_to_end(fingerprint)
+            return entry[0]
+
+    def get_rollup(self, fingerprint: str) -> Optional[pl.DataFrame]:
+        """取得延遲產生圖表用的日曆彙總表（未保存時回傳 None）"""
+        with self._lock:
+            entry = self._frames.get(fingerprint)
+            return entry[1] if entry is not None else None
+
+    def set_frame(self, fingerprint: str, frame: pl.DataFrame, rollup: Optional[pl.DataFrame] = None) -> None:
+        """保存延遲產生圖表用的交易記錄與日曆彙總表，超過份數上限時淘汰最久未使用的"""
+        with self._lock:
+            self._frames[fingerprint] = (frame, rollup)
+            self._frames.move_to_end(fingerprint)
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+
+    def clear(self) -> None:
+        """清除所有圖表與交易記錄"""
+        with self._lock:
+            self._charts.clear()
+            self._frames.clear()
+            self._bytes = 0
+
+    def info(self) -> dict:
+        """快取統計"""
+        return {
+            "charts": len(self._charts),
+            "frames": len(self._frames),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# 全域圖表快取
+chart_cache = ChartCache()
@@ -7,6 +7,7 @@ import os
 import polars as pl
 from config.api_config import APIConfig
 from api.stock_api import StockAPI
+from core.resampler import TIMEFRAMES, normalize_timeframe
 
 def print_log(message: str):
     print(f"********** data_provider.py - {message}")
@@ -226,45 +227,52 @@ class DataProvider:
         return df.to_dicts()
     
     def _generate_minute_price_data(self, parameters: Dict[str, Any]) -> List[Dict]:
-        """生成分K股價資料"""
+        """生成分K股價資料（先產生 1 分 K，再聚合成指定分鐘數的週期）"""
         stock_id = parameters.get('stock_id', '2330')
-        interval = int(parameters.get('interval', '1'))
+        # 純數字為任意分鐘數（如 3、10），其餘走重取樣週期名稱（如 "5m"、"1h"）
+        interval = str(parameters.get('interval', '1')).strip()
+        minutes = int(interval) if interval.isdigit() else TIMEFRAMES[normalize_timeframe(interval)][1]
+        if minutes <= 0:
+            raise ValueError(f"不支援的週期: {interval}")
         date_str = parameters.get('date', datetime.now().strftime('%Y-%m-%d'))
         
-        # 生成模擬資料
-        data = []
-        base_price = 500.0
-        
-        # 交易時間 9:00-13:30
+        # 交易時間 9:00-13:30，每分鐘一根
         start_time = datetime.strptime(f"{date_str} 09:00:00", "%Y-%m-%d %H:%M:%S")
-        end_time = datetime.strptime(f"{date_str} 13:30:00", "%Y-%m-%d %H:%M:%S")
+        count = 271
         
-        current_time = start_time
-        while current_time <= end_time:
-            # 模擬股價變動
-            change = np.random.normal(0, 0.005)  # 0.5% 標準差
-            base_price *= (1 + change)
-            
-            open_price = base_price * (1 + np.random.normal(0, 0.002))
-            high_price = max(open_price, base_price) * (1 + abs(np.random.normal(0, 0.005)))
-            low_price = min(open_price, base_price) * (1 - abs(np.random.normal(0, 0.005)))
-            close_price = base_price
-            volume = int(np.random.normal(50000, 10000))
-            
-            data.append({
-                'datetime': current_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'stock_id': stock_id,
-                'open': round(open_price, 2),
-                'high': round(high_price, 2),
-                'low': round(low_price, 2),
-                'close': round(close_price, 2),
-                'volume': volume,
-                'interval': f"{interval}分鐘"
-            })
-            
-            current_time += timedelta(minutes=interval)
+        # 生成模擬資料（向量化）
+        close_price = 500.0 * np.cumprod(1 + np.random.normal(0, 0.005, count))  # 0.5% 標準差
+        open_price = close_price * (1 + np.random.normal(0, 0.002, count))
+        high_price = np.maximum(open_price, close_price) * (1 + np.abs(np.random.normal(0, 0.005, count)))
+        low_price = np.minimum(open_price, close_price) * (1 - np.abs(np.random.normal(0, 0.005, count)))
+        minute_bars = pl.DataFrame({
+            'stock_id': stock_id,
+            'datetime': [start_time + timedelta(minutes=minute) for minute in range(count)],
+            'open': open_price,
+            'high': high_price,
+            'low': low_price,
+            'close': close_price,
+            'volume': np.random.normal(50000, 10000, count).astype(np.int64)
+        })
         
-        return data
+        # 以 09:00 為起點每 minutes 分鐘一根，與逐根產生時的時間點相同
+        bars = minute_bars.set_sorted('datetime').group_by_dynamic(
+            'datetime', every=f"{minutes}m", closed="left", label="left", start_by="datapoint"
+        ).agg(
+            pl.col('stock_id').first(),
+            pl.col('open').first(),
+            pl.col('high').max(),
+            pl.col('low').min(),
+            pl.col('close').last(),
+            pl.col('volume').sum()
+        )
+        return bars.select(
+            pl.col('datetime').dt.strftime('%Y-%m-%d %H:%M:%S'),
+            'stock_id',
+            pl.col(['open', 'high', 'low', 'close']).round(2),
+            'volume',
+            pl.lit(f"{minutes}分鐘").alias('interval')
+        ).to_dicts()
     
     async def _generate_dividend_data(self, parameters: Dict[str, Any]) -> List[Dict]:
         """生成除權息資料"""
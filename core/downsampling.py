@@ -0,0 +1,141 @@
+# 圖表序列降採樣模組
+"""
+長序列降採樣（權益曲線、累積損益等圖表序列）
+
+- lttb_indices：Largest-Triangle-Three-Buckets，保留視覺形狀（轉折點、高低點）
+- minmax_indices：每個區間保留最小值與最大值，確保極值（例如最大回落）不會被略過
+- downsample_frame：對 DataFrame 的多個數值欄位分別取樣後取聯集，回傳原始列的子集合
+點數上限預設為 CHART_MAX_POINTS（環境變數），前端縮放時可依可見區間重新取樣取得完整解析度
+"""
+
+import os
+from typing import Optional, Sequence
+
+import numpy as np
+import polars as pl
+
+# 單一圖表序列的預設點數上限
+DEFAULT_MAX_POINTS = int(os.environ.get("CHART_MAX_POINTS", "2000"))
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets 取樣
+
+    第一點與最後一點固定保留，其餘點平均分成 threshold - 2 個區間，
+    每個區間選出與「前一個選中點」及「下一個區間平均點」構成最大三角形面積的點
+
+    Returns:
+        np.ndarray: 選中點的索引（遞增）
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    # 區間 i 為 [starts[i], starts[i + 1])，最後一個區間的下一個「平均點」即最後一點
+    every = (n - 2) / (threshold - 2)
+    starts = (np.floor(np.arange(threshold - 1) * every) + 1).astype(np.int64)
+    starts[-1] = n - 1
+    counts = np.diff(starts)
+    average_x = np.append(np.add.reduceat(x[:-1], starts[:-1]) / counts, x[-1])
+    average_y = np.append(np.add.reduceat(y[:-1], starts[:-1]) / counts, y[-1])
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    selected = 0
+    for bucket in range(threshold - 2):
+        start, stop = starts[bucket], starts[bucket + 1]
+        next_x, next_y = average_x[bucket + 1], average_y[bucket + 1]
+        areas = np.abs(
+            (x[selected] - next_x) * (y[start:stop] - y[selected]) -
+            (x[selected] - x[start:stop]) * (next_y - y[selected])
+        )
+        selected = start + int(np.argmax(areas))
+        indices[bucket + 1] = selected
+    return indices
+
+
+def minmax_indices(y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    最小/最大值取樣：分成 threshold // 2 個區間，每個區間保留最小值與最大值所在點（另保留首尾點）
+
+    Returns:
+        np.ndarray: 選中點的索引（遞增、不重複）
+    """
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    y = np.asarray(y, dtype=np.float64)
+    buckets = max(1, threshold // 2 - 1)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    # 補值以 inf / -inf 取代，不會被選為最小 / 最大值
+    offsets = np.arange(buckets) * size
+    lows = offsets + np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    highs = offsets + np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    indices = np.concatenate(([0, n - 1], lows, highs))
+    return np.unique(indices[indices < n])
+
+
+def downsample_indices(x: np.ndarray, y: np.ndarray, max_points: int, method: str = "lttb") -> np.ndarray:
+    """依方法取樣，回傳選中點的索引"""
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"不支援的降採樣方法: {method}（可用：{', '.join(DOWNSAMPLE_METHODS)}）")
+    if method == "minmax":
+        return minmax_indices(y, max_points)
+    return lttb_indices(x, y, max_points)
+
+
+def downsample_frame(frame: pl.DataFrame, x_column: str, y_columns: Sequence[str],
+                     max_points: Optional[int] = None, method: str = "lttb") -> pl.DataFrame:
+    """
+    DataFrame 降採樣（列數不超過 max_points）
+
+    每個 y 欄位分得 max_points / 欄位數 的點數各自取樣，再取索引聯集，
+    例如累積損益與回落各自保留轉折點與最低點
+
+    Args:
+        frame: 依 x_column 排序的資料
+        x_column: x 軸欄位（數值或日期時間）
+        y_columns: 要保留形狀的數值欄位
+        max_points: 點數上限，None 使用 DEFAULT_MAX_POINTS，0 表示不取樣
+        method: "lttb" 或 "minmax"
+    """
+    max_points = DEFAULT_MAX_POINTS if max_points is None else int(max_points)
+    if max_points <= 0 or frame.height <= max_points:
+        return frame
+    x = frame[x_column]
+    x = (x.to_physical() if x.dtype.is_temporal() else x).cast(pl.Float64).to_numpy()
+    budget = max(3, max_points // len(y_columns))
+    indices = np.unique(np.concatenate([
+        downsample_indices(x, frame[column].cast(pl.Float64).fill_null(0.0).to_numpy(), budget, method)
+        for column in y_columns
+    ]))
+    return frame[indices]
+
+
+def downsample_curve(dates: Sequence, values: Sequence[float], max_points: Optional[int] = None,
+                     method: str = "lttb") -> dict:
+    """
+    權益曲線降採樣（以索引為 x 軸，交易日視為等距）
+
+    Returns:
+        dict: {"dates", "values", "total_points"}，total_points 為取樣前的點數
+    """
+    max_points = DEFAULT_MAX_POINTS if max_points is None else int(max_points)
+    dates, values = list(dates), list(values)
+    if max_points <= 0 or len(values) <= max_points:
+        return {"dates": dates, "values": values, "total_points": len(values)}
+    y = np.asarray(values, dtype=np.float64)
+    indices = downsample_indices(np.arange(len(y)), y, max_points, method)
+    return {
+        "dates": [dates[i] for i in indices],
+        "values": [values[i] for i in indices],
+        "total_points": len(values)
+    }
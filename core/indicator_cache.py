@@ -0,0 +1,94 @@
+# 技術指標快取模組
+"""
+技術指標欄位快取（記憶化）
+
+以「價格欄位內容指紋 + 指標名稱」為鍵值保存已計算的指標欄位（pl.Series）：
+- 指紋只涵蓋指標會用到的價格欄位（stock_id、date、close、trading_volume 等），
+  策略自行加入的欄位不影響命中
+- 命中的欄位以 with_columns 直接接回資料，Arrow 緩衝區共用不複製
+- 以欄位估計大小計算記憶體用量，超過上限時依 LRU 淘汰
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+import polars as pl
+
+from core.logger import get_logger
+from core.result_cache import fingerprint_frame
+
+logger = get_logger("indicator_cache.py")
+
+# 指標快取記憶體上限（位元組），預設 512MB
+MAX_INDICATOR_CACHE_BYTES = int(os.environ.get("INDICATOR_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+
+class IndicatorCache:
+    """技術指標欄位快取（記憶體 LRU，依位元組數限制）"""
+
+    def __init__(self, max_bytes: int = MAX_INDICATOR_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._columns: "OrderedDict[Tuple[str, str], pl.Series]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(frame: pl.DataFrame, columns: Iterable[str]) -> str:
+        """計算指標輸入欄位的內容指紋（只取存在的欄位）"""
+        return fingerprint_frame(frame.select([name for name in columns if name in frame.columns]))
+
+    def get_many(self, fingerprint: str, names: Iterable[str]) -> Dict[str, pl.Series]:
+        """取得已快取的指標欄位，回傳 {指標名稱: 欄位}（只含命中的指標）"""
+        found = {}
+        with self._lock:
+            for name in names:
+                key = (fingerprint, name)
+                series = self._columns.get(key)
+                if series is None:
+                    self.misses += 1
+                    continue
+                self._columns.move_to_end(key)
+                self.hits += 1
+                found[name] = series
+        return found
+
+    def set_many(self, fingerprint: str, columns: Dict[str, pl.Series]) -> None:
+        """寫入指標欄位，超過記憶體上限時淘汰最久未使用的欄位"""
+        with self._lock:
+            for name, series in columns.items():
+                key = (fingerprint, name)
+                previous = self._columns.pop(key, None)
+                if previous is not None:
+                    self._bytes -= previous.estimated_size()
+                size = series.estimated_size()
+                if size > self.max_bytes:
+                    continue
+                self._columns[key] = series
+                self._bytes += size
+            while self._bytes > self.max_bytes and self._columns:
+                _, evicted = self._columns.popitem(last=False)
+                self._bytes -= evicted.estimated_size()
+
+    def clear(self) -> None:
+        """清除所有快取的指標欄位"""
+        with self._lock:
+            self._columns.clear()
+            self._bytes = 0
+
+    def info(self) -> dict:
+        """快取統計"""
+        return {
+            "columns": len(self._columns),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# 全域技術指標快取
+indicator_cache = IndicatorCache()
@@ -0,0 +1,237 @@
+# 背景工作管理模組
+"""
+背景回測工作佇列
+
+提交後立即回傳 job_id，實際執行在背景執行緒池中進行，不佔用事件迴圈；
+執行中的進度（完成股票數、目前交易筆數、預估剩餘時間）可透過 SSE 串流取得，
+工作可取消，完成的結果以 job_id 快取（保留最近 MAX_FINISHED_JOBS 筆）。
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from core.logger import get_logger
+
+logger = get_logger("job_manager.py")
+
+JOB_WORKERS = int(os.environ.get("BACKTEST_JOB_WORKERS", "2"))
+MAX_FINISHED_JOBS = 50
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+
+class JobCancelledError(Exception):
+    """工作已被取消"""
+    pass
+
+
+class BacktestJob:
+    """背景工作狀態"""
+
+    def __init__(self, kind: str):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.total = 0
+        self.completed = 0
+        self.trades = 0
+        self.message = ""
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.version = 0  # 狀態每次變動加一，供 SSE 判斷是否需要推送
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        """以目前平均每檔股票耗時估計剩餘時間"""
+        if self.status != "running" or not self.started_at or self.completed <= 0 or self.total <= 0:
+            return None
+        elapsed = time.time() - self.started_at
+        return max(elapsed / self.completed * (self.total - self.completed), 0.0)
+
+    def cancel(self) -> None:
+        self._cancel_event.set()
+        with self._lock:
+            if self.status == "queued":
+                self._finish("cancelled")
+
+    def check_cancelled(self) -> None:
+        """執行中的工作呼叫此方法檢查是否被取消，被取消時拋出 JobCancelledError"""
+        if self._cancel_event.is_set():
+            raise JobCancelledError(f"工作 {self.job_id} 已取消")
+
+    def report(self, completed: int, total: int = None, trades: int = None, message: str = None) -> None:
+        """
+        回報進度（可作為執行器的進度回呼）
+
+        Args:
+            completed: 已完成的股票數
+            total: 股票總數
+            trades: 目前累計交易筆數
+            message: 進度說明
+        """
+        with self._lock:
+            self.completed = completed
+            if total is not None:
+                self.total = total
+            if trades is not None:
+                self.trades = trades
+            if message is not None:
+                self.message = message
+            self.version += 1
+        self.check_cancelled()
+
+    def _start(self) -> bool:
+        with self._lock:
+            if self.status != "queued":
+                return False
+            self.status = "running"
+            self.started_at = time.time()
+            self.version += 1
+            return True
+
+    def _finish(self, status: str, result: Any = None, error: str = None) -> None:
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+        self.version += 1
+
+    def to_dict(self, include_result: bool = False) -> Dict[str, Any]:
+        data = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "total": self.total,
+            "completed": self.completed,
+            "progress": self.completed / self.total if self.total else (1.0 if self.status == "completed" else 0.0),
+            "trades": self.trades,
+            "eta_seconds": self.eta_seconds,
+            "message": self.message,
+            "error": self.error
+        }
+        if include_result and self.status == "completed":
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    """背景工作管理器"""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_finished: int = MAX_FINISHED_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="backtest-job")
+        self._jobs: "OrderedDict[str, BacktestJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_finished = max_finished
+
+    def submit(self, kind: str, func: Callable[..., Any], *args, **kwargs) -> BacktestJob:
+        """
+        提交同步工作
+
+        Args:
+            kind: 工作類型（backtest、strategy_test 等）
+            func: 工作函數，第一個參數為 BacktestJob（用於回報進度與檢查取消）
+
+        Returns:
+            BacktestJob: 工作狀態物件
+        """
+        job = BacktestJob(kind)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._evict_finished()
+        self._executor.submit(self._run, job, func, args, kwargs)
+        return job
+
+    def submit_coroutine(self, kind: str, factory: Callable[[BacktestJob], Any]) -> BacktestJob:
+        """提交非同步工作：在背景執行緒中以獨立的事件迴圈執行 factory(job) 回傳的 coroutine"""
+        return self.submit(kind, lambda job: asyncio.run(factory(job)))
+
+    def _run(self, job: BacktestJob, func: Callable[..., Any], args, kwargs) -> None:
+        if not job._start():
+            return
+        try:
+            result = func(job, *args, **kwargs)
+            with job._lock:
+                if job.cancelled:
+                    job._finish("cancelled")
+                else:
+                    job._finish("completed", result=result)
+        except JobCancelledError:
+            with job._lock:
+                job._finish("cancelled")
+        except Exception as e:
+            detail = getattr(e, "detail", None) or str(e)
+            logger.error("工作 %s 執行失敗: %s\n%s", job.job_id, detail, traceback.format_exc().rstrip())
+            with job._lock:
+                job._finish("failed", error=str(detail))
+
+    def _evict_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - self._max_finished, 0)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[BacktestJob]:
+        return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[BacktestJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Optional[BacktestJob]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    async def stream(self, job_id: str, interval: float = 0.5) -> AsyncIterator[str]:
+        """
+        以 Server-Sent Events 格式串流工作進度
+
+        狀態有變動時推送 progress 事件，結束時推送 done 事件（含結果摘要，不含完整結果）
+        """
+        job = self.get(job_id)
+        if job is None:
+            yield f"event: error\ndata: {json.dumps({'error': '工作不存在'}, ensure_ascii=False)}\n\n"
+            return
+        last_version = -1
+        while True:
+            if job.version != last_version:
+                last_version = job.version
+                event = "done" if job.finished else "progress"
+                yield f"event: {event}\ndata: {json.dumps(job.to_dict(), ensure_ascii=False, default=str)}\n\n"
+                if job.finished:
+                    return
+            await asyncio.sleep(interval)
+
+    def shutdown(self) -> None:
+        """取消所有未完成的工作並關閉執行緒池"""
+        for job in self.list_jobs():
+            if not job.finished:
+                job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# 全域背景工作管理器
+job_manager = JobManager()
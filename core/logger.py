@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日誌模組
+提供具層級控制、延遲格式化的結構化日誌，供回測熱路徑使用
+
+使用方式：
+    logger = get_logger("dynamic_strategy.py")
+    if self._trace:                       # 熱路徑守衛，關閉時只有一次屬性查詢
+        logger.trace("should_entry index=%s", i)
+    logger.debug("出場: %s 損益: %s", stock_id, pnl, reason=reason)
+
+層級來源優先順序：
+    1. 策略參數 log_level（每次請求可調整，例如表單欄位 param-log_level=TRACE）
+    2. log_level_scope() 設定的請求範圍層級（contextvars）
+    3. 環境變數 BACKTEST_LOG_LEVEL（預設 INFO）
+"""
+
+import os
+import sys
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional, Union
+
+# 比 DEBUG 更細的追蹤層級，用於逐筆/逐根 K 棒的呼叫紀錄
+TRACE = 5
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+logging.addLevelName(TRACE, "TRACE")
+
+_LEVEL_NAMES = {
+    "TRACE": TRACE,
+    "DEBUG": DEBUG,
+    "INFO": INFO,
+    "WARNING": WARNING,
+    "WARN": WARNING,
+    "ERROR": ERROR,
+    "OFF": logging.CRITICAL + 10,
+}
+
+
+def parse_log_level(value: Union[str, int, None]) -> Optional[int]:
+    """
+    將字串或數字轉換為日誌層級
+
+    Args:
+        value: 層級名稱（TRACE/DEBUG/INFO/WARNING/ERROR/OFF）或數值
+
+    Returns:
+        Optional[int]: 日誌層級，無法解析或未指定時回傳 None
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    text = str(value).strip().upper()
+    if text.isdigit():
+        return int(text)
+    return _LEVEL_NAMES.get(text)
+
+
+_DEFAULT_LEVEL = parse_log_level(os.getenv("BACKTEST_LOG_LEVEL", "INFO")) or INFO
+
+# 請求範圍的層級覆寫（None 表示使用預設層級）
+_level_override: ContextVar[Optional[int]] = ContextVar("backtest_log_level", default=None)
+
+
+def set_default_level(level: Union[str, int]) -> None:
+    """設定全域預設日誌層級"""
+    global _DEFAULT_LEVEL
+    parsed = parse_log_level(level)
+    if parsed is not None:
+        _DEFAULT_LEVEL = parsed
+
+
+def current_level() -> int:
+    """取得目前生效的日誌層級（請求範圍覆寫優先）"""
+    override = _level_override.get()
+    return override if override is not None else _DEFAULT_LEVEL
+
+
+@contextmanager
+def log_level_scope(level: Union[str, int, None]):
+    """
+    在目前的請求範圍內暫時調整日誌層級
+
+    注意：ThreadPoolExecutor 不會自動繼承 contextvars，
+    需要在工作執行緒中生效時請改用策略參數 log_level。
+    """
+    parsed = parse_log_level(level)
+    if parsed is None:
+        yield
+        return
+    token = _level_override.set(parsed)
+    try:
+        yield
+    finally:
+        _level_override.reset(token)
+
+
+def _build_stdlib_logger() -> logging.Logger:
+    """建立底層的標準函式庫 logger，輸出格式與原本 print_log 一致"""
+    base = logging.getLogger("backtest")
+    if not base.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter("********** %(log_source)s - %(message)s"))
+        base.addHandler(handler)
+    # 層級判斷全部在 StructuredLogger 完成，底層不再過濾
+    base.setLevel(1)
+    base.propagate = False
+    return base
+
+
+_base_logger = _build_stdlib_logger()
+
+
+class StructuredLogger:
+    """具層級控制與延遲格式化的日誌器"""
+
+    __slots__ = ("source", "level", "_logger")
+
+    def __init__(self, source: str, level: Optional[int] = None):
+        self.source = source
+        self.level = level
+        self._logger = _base_logger
+
+    def bind(self, level: Union[str, int, None] = None) -> "StructuredLogger":
+        """
+        建立固定層級的日誌器
+
+        未指定層級時，以建立當下生效的層級為準（可保留請求範圍的設定到工作執行緒）
+        """
+        parsed = parse_log_level(level)
+        return StructuredLogger(self.source, parsed if parsed is not None else current_level())
+
+    @property
+    def effective_level(self) -> int:
+        return self.level if self.level is not None else current_level()
+
+    def is_enabled(self, level: int) -> bool:
+        """檢查指定層級是否會輸出，熱路徑應先以此結果作為守衛"""
+        return level >= self.effective_level
+
+    def log(self, level: int, message: str, *args: Any, **fields: Any) -> None:
+        """輸出日誌，只有在層級啟用時才進行格式化"""
+        if level < self.effective_level:
+            return
+        self._emit(level, message, args, fields)
+
+    def trace(self, message: str, *args: Any, **fields: Any) -> None:
+        if TRACE >= self.effective_level:
+            self._emit(TRACE, message, args, fields)
+
+    def debug(self, message: str, *args: Any, **fields: Any) -> None:
+        if DEBUG >= self.effective_level:
+            self._emit(DEBUG, message, args, fields)
+
+    def info(self, message: str, *args: Any, **fields: Any) -> None:
+        if INFO >= self.effective_level:
+            self._emit(INFO, message, args, fields)
+
+    def warning(self, message: str, *args: Any, **fields: Any) -> None:
+        if WARNING >= self.effective_level:
+            self._emit(WARNING, message, args, fields)
+
+    def error(self, message: str, *args: Any, **fields: Any) -> None:
+        if ERROR >= self.effective_level:
+            self._emit(ERROR, message, args, fields)
+
+    def _emit(self, level: int, message: str, args: tuple, fields: Dict[str, Any]) -> None:
+        if fields:
+            # 先完成訊息格式化再附加欄位，避免欄位內容中的 % 被當成格式字元
+            if args:
+                message = message % args
+                args = ()
+            message = message + " " + " ".join(f"{key}={value!r}" for key, value in fields.items())
+            # 已格式化完成的訊息以 "%s" 傳入，標準函式庫不會再對其中的 % 做格式化
+            self._logger.log(level, "%s", message, extra={"log_source": self.source})
+            return
+        self._logger.log(level, message, *args, extra={"log_source": self.source})
+
+
+_loggers: Dict[str, StructuredLogger] = {}
+
+
+def get_logger(source: str) -> StructuredLogger:
+    """取得指定來源（通常為檔名）的日誌器"""
+    logger = _loggers.get(source)
+    if logger is None:
+        logger = _loggers.setdefault(source, StructuredLogger(source))
+    return logger
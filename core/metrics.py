@@ -0,0 +1,205 @@
+# 績效指標模組
+"""
+向量化績效指標計算
+
+所有策略（DynamicStrategy、BookbuildingStrategy）與合併結果共用同一套計算，
+輸入為權益曲線與交易損益陣列，比率類指標一律以小數（非百分比）回傳。
+"""
+
+from typing import Any, Dict, Optional, Sequence
+import numpy as np
+import polars as pl
+
+TRADING_DAYS_PER_YEAR = 252
+DEFAULT_RISK_FREE_RATE = 0.02
+
+
+def _to_float_array(values) -> np.ndarray:
+    if values is None:
+        return np.empty(0, dtype=np.float64)
+    if isinstance(values, pl.Series):
+        return values.cast(pl.Float64).fill_null(0.0).to_numpy()
+    array = np.asarray(values, dtype=np.float64)
+    return np.nan_to_num(array, nan=0.0)
+
+
+def _to_day_array(values) -> np.ndarray:
+    if values is None:
+        return np.empty(0, dtype="datetime64[D]")
+    if isinstance(values, pl.Series):
+        if values.dtype == pl.Utf8:
+            values = values.str.to_date(strict=False)
+        return values.cast(pl.Date).to_numpy().astype("datetime64[D]")
+    return np.asarray(values, dtype="datetime64[D]")
+
+
+class PerformanceMetrics:
+    """績效指標計算類別（全部為向量化靜態方法）"""
+
+    @staticmethod
+    def drawdown(equity_curve, initial_capital: Optional[float] = None) -> Dict[str, float]:
+        """
+        以累積最大值（cummax）計算最大回撤
+
+        Args:
+            equity_curve: 權益曲線
+            initial_capital: 初始資金，提供時作為起始高點；否則以曲線第一點為起始高點
+
+        Returns:
+            Dict[str, float]: max_drawdown（金額）、max_drawdown_pct（小數，對應最大回撤金額的那一點）
+        """
+        equity = _to_float_array(equity_curve)
+        if equity.size == 0:
+            return {"max_drawdown": 0.0, "max_drawdown_pct": 0.0}
+        peak = np.maximum.accumulate(equity)
+        if initial_capital is not None:
+            peak = np.maximum(peak, initial_capital)
+        drawdown = peak - equity
+        index = int(np.argmax(drawdown))
+        max_drawdown = float(drawdown[index])
+        if max_drawdown <= 0:
+            return {"max_drawdown": 0.0, "max_drawdown_pct": 0.0}
+        max_drawdown_pct = float(drawdown[index] / peak[index]) if peak[index] > 0 else 0.0
+        return {"max_drawdown": max_drawdown, "max_drawdown_pct": max_drawdown_pct}
+
+    @staticmethod
+    def returns(equity_curve) -> np.ndarray:
+        """計算逐期報酬率（前一期權益 <= 0 的期間略過）"""
+        equity = _to_float_array(equity_curve)
+        if equity.size < 2:
+            return np.empty(0, dtype=np.float64)
+        previous = equity[:-1]
+        valid = previous > 0
+        return (equity[1:][valid] - previous[valid]) / previous[valid]
+
+    @staticmethod
+    def sharpe_ratio(returns, risk_free_rate: float = DEFAULT_RISK_FREE_RATE) -> float:
+        """年化夏普比率"""
+        returns = _to_float_array(returns)
+        if returns.size == 0:
+            return 0.0
+        excess = returns - risk_free_rate / TRADING_DAYS_PER_YEAR  # 日化無風險利率
+        std = excess.std()
+        if std == 0:
+            return 0.0
+        return float(excess.mean() / std * np.sqrt(TRADING_DAYS_PER_YEAR))
+
+    @staticmethod
+    def sortino_ratio(returns, risk_free_rate: float = DEFAULT_RISK_FREE_RATE) -> float:
+        """年化索提諾比率（僅以下檔偏差為分母）"""
+        returns = _to_float_array(returns)
+        if returns.size == 0:
+            return 0.0
+        excess = returns - risk_free_rate / TRADING_DAYS_PER_YEAR
+        downside = np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2))
+        if downside == 0:
+            return 0.0
+        return float(excess.mean() / downside * np.sqrt(TRADING_DAYS_PER_YEAR))
+
+    @staticmethod
+    def calmar_ratio(equity_curve, max_drawdown_pct: float, initial_capital: Optional[float] = None) -> float:
+        """卡瑪比率：年化報酬率 / 最大回撤率"""
+        equity = _to_float_array(equity_curve)
+        if equity.size < 2 or max_drawdown_pct <= 0:
+            return 0.0
+        start = initial_capital if initial_capital else equity[0]
+        if start <= 0 or equity[-1] <= 0:
+            return 0.0
+        years = equity.size / TRADING_DAYS_PER_YEAR
+        annual_return = (equity[-1] / start) ** (1 / years) - 1
+        return float(annual_return / max_drawdown_pct)
+
+    @staticmethod
+    def trade_statistics(net_profit_loss) -> Dict[str, Any]:
+        """
+        交易統計：勝負筆數、勝率、獲利因子、期望值
+
+        獲利因子在沒有虧損交易時無法定義，回傳 None
+        """
+        pnl = _to_float_array(net_profit_loss)
+        total_trades = int(pnl.size)
+        if total_trades == 0:
+            return {
+                "total_trades": 0, "winning_trades": 0, "losing_trades": 0, "win_rate": 0.0,
+                "total_profit_loss": 0.0, "gross_profit": 0.0, "gross_loss": 0.0,
+                "profit_factor": 0.0, "expectancy": 0.0, "average_win": 0.0, "average_loss": 0.0
+            }
+        wins = pnl > 0
+        losses = pnl < 0
+        winning_trades = int(wins.sum())
+        losing_trades = int(losses.sum())
+        gross_profit = float(pnl[wins].sum())
+        gross_loss = float(-pnl[losses].sum())
+        if gross_loss > 0:
+            profit_factor = gross_profit / gross_loss
+        else:
+            profit_factor = None if gross_profit > 0 else 0.0
+        return {
+            "total_trades": total_trades,
+            "winning_trades": winning_trades,
+            "losing_trades": losing_trades,
+            "win_rate": winning_trades / total_trades,
+            "total_profit_loss": float(pnl.sum()),
+            "gross_profit": gross_profit,
+            "gross_loss": gross_loss,
+            "profit_factor": profit_factor,
+            "expectancy": float(pnl.mean()),
+            "average_win": gross_profit / winning_trades if winning_trades else 0.0,
+            "average_loss": -gross_loss / losing_trades if losing_trades else 0.0
+        }
+
+    @staticmethod
+    def exposure(dates, entry_dates, exit_dates) -> float:
+        """
+        曝險比例：有持倉的交易日數 / 總交易日數
+
+        以 searchsorted 將每筆交易對應到日期索引，再用差分陣列一次標記持倉區間
+        """
+        bar_dates = _to_day_array(dates)
+        if bar_dates.size == 0:
+            return 0.0
+        entries = _to_day_array(entry_dates)
+        exits = _to_day_array(exit_dates)
+        if entries.size == 0:
+            return 0.0
+        bar_dates = np.unique(bar_dates)
+        valid = ~(np.isnat(entries) | np.isnat(exits))
+        start = np.searchsorted(bar_dates, entries[valid], side="left")
+        end = np.searchsorted(bar_dates, exits[valid], side="right")
+        marks = np.zeros(bar_dates.size + 1, dtype=np.int64)
+        np.add.at(marks, start, 1)
+        np.add.at(marks, end, -1)
+        in_market = np.cumsum(marks[:-1]) > 0
+        return float(in_market.mean())
+
+    @staticmethod
+    def compute(equity_curve, net_profit_loss, initial_capital: Optional[float] = None,
+                dates: Sequence = None, entry_dates=None, exit_dates=None,
+                risk_free_rate: float = DEFAULT_RISK_FREE_RATE) -> Dict[str, Any]:
+        """
+        一次計算完整的績效指標
+
+        Args:
+            equity_curve: 權益曲線
+            net_profit_loss: 每筆交易淨損益
+            initial_capital: 初始資金（回撤起始高點與報酬率基準）
+            dates: 權益曲線對應日期（計算曝險比例用）
+            entry_dates / exit_dates: 每筆交易進出場日期（計算曝險比例用）
+            risk_free_rate: 年化無風險利率
+
+        Returns:
+            Dict[str, Any]: 交易統計、最大回撤、夏普/索提諾/卡瑪比率、曝險比例（比率皆為小數）
+        """
+        metrics = PerformanceMetrics.trade_statistics(net_profit_loss)
+        drawdown = PerformanceMetrics.drawdown(equity_curve, initial_capital)
+        returns = PerformanceMetrics.returns(equity_curve)
+        metrics.update({
+            "total_profit_loss_rate": metrics["total_profit_loss"] / initial_capital if initial_capital else 0.0,
+            "max_drawdown": drawdown["max_drawdown"],
+            "max_drawdown_rate": drawdown["max_drawdown_pct"],
+            "sharpe_ratio": PerformanceMetrics.sharpe_ratio(returns, risk_free_rate),
+            "sortino_ratio": PerformanceMetrics.sortino_ratio(returns, risk_free_rate),
+            "calmar_ratio": PerformanceMetrics.calmar_ratio(equity_curve, drawdown["max_drawdown_pct"], initial_capital),
+            "exposure": PerformanceMetrics.exposure(dates, entry_dates, exit_dates) if dates is not None and len(dates) > 0 else 0.0
+        })
+        return metrics
@@ -1,13 +1,66 @@
 # 價格計算工具模組
-from typing import Tuple, Optional
+from typing import Callable, Tuple, Optional, Union
 import math
+import numpy as np
+import polars as pl
 
 def print_log(message: str):
     """日誌輸出"""
     print(f"********** price_utils.py - {message}")
 
+# 臺灣證券交易所升降單位級距：價格 < TICK_BANDS[i] 時使用 TICK_SIZES[i]，>= 最後一個級距時使用 TICK_SIZES[-1]
+TICK_BANDS = np.array([10.0, 50.0, 100.0, 500.0, 1000.0])
+TICK_SIZES = np.array([0.01, 0.05, 0.1, 0.5, 1.0, 5.0])
+
+ArrayLike = Union[np.ndarray, pl.Series, list, float]
+ExprLike = Union[str, pl.Expr]
+
+
+def _as_array(values: ArrayLike) -> np.ndarray:
+    """轉為 float64 陣列（缺值為 NaN）"""
+    if isinstance(values, pl.Series):
+        return values.cast(pl.Float64, strict=False).to_numpy()
+    return np.asarray(values, dtype=np.float64)
+
+
+def _as_expr(value: Union[ExprLike, float]) -> pl.Expr:
+    """欄位名稱轉為 pl.col，數值轉為 pl.lit"""
+    if isinstance(value, pl.Expr):
+        return value
+    if isinstance(value, str):
+        return pl.col(value)
+    return pl.lit(value)
+
+
+def _map_columns(function: Callable[..., np.ndarray], columns: list, dtype=pl.Float64) -> pl.Expr:
+    """
+    將多個欄位以 NumPy 陣列函數整欄計算（每個批次呼叫一次，不逐列回呼）
+
+    任一輸入為缺值的列輸出缺值；輸出欄位名稱沿用第一個輸入
+    """
+    def apply(struct: pl.Series) -> pl.Series:
+        fields = [struct.struct.field(f"_{i}") for i in range(len(columns))]
+        missing = np.zeros(len(struct), dtype=bool)
+        for field in fields:
+            missing |= np.asarray(field.is_null().to_numpy(), dtype=bool)
+        result = pl.Series(function(*[_as_array(field) for field in fields])).cast(dtype)
+        if missing.any():
+            result = result.scatter(np.flatnonzero(missing), None)
+        return result
+
+    return pl.struct([column.alias(f"_{i}") for i, column in enumerate(columns)]).map_batches(
+        apply, return_dtype=dtype
+    ).alias(columns[0].meta.output_name())
+
+
 class PriceUtils:
-    """價格計算工具類別"""
+    """
+    價格計算工具類別
+
+    純量函數之外另提供整欄計算的版本：
+    - *_array：NumPy 陣列版本，升降單位以 np.searchsorted 查 TICK_BANDS
+    - *_expr：Polars 運算式版本，可直接用於向量化策略的 with_columns，取代逐列呼叫純量函數的 list comprehension
+    """
     
     @staticmethod
     def get_tick_size(price: float) -> float:
@@ -227,4 +280,126 @@ class PriceUtils:
         elif trade_direction == 'short':  # 做空
             return (entry_price - exit_price) / entry_price
         else:
-            raise ValueError(f"不支援的交易方向: {trade_direction}") 
\ No newline at end of file
+            raise ValueError(f"不支援的交易方向: {trade_direction}")
+
+    # ===== 整欄計算版本（NumPy 陣列 / Polars 運算式） =====
+    @staticmethod
+    def get_tick_size_array(prices: ArrayLike) -> np.ndarray:
+        """get_tick_size 的陣列版本（以 np.searchsorted 查升降單位級距）"""
+        return TICK_SIZES[np.searchsorted(TICK_BANDS, _as_array(prices), side="right")]
+
+    @staticmethod
+    def calculate_limit_price_array(base_prices: ArrayLike, limit_percent: ArrayLike) -> np.ndarray:
+        """calculate_limit_price 的陣列版本（limit_percent 可為純量或與 base_prices 等長的陣列）"""
+        base_prices = _as_array(base_prices)
+        tick_size = PriceUtils.get_tick_size_array(base_prices)
+        limit_price = base_prices * (1 + _as_array(limit_percent) / 100)
+        # np.round 與 Python round 同為四捨六入五成雙，結果與純量版本一致
+        return np.round(limit_price / tick_size) * tick_size
+
+    @staticmethod
+    def adjust_price_to_tick_array(prices: ArrayLike) -> np.ndarray:
+        """adjust_price_to_tick 的陣列版本"""
+        prices = _as_array(prices)
+        tick_size = PriceUtils.get_tick_size_array(prices)
+        return np.round(prices / tick_size) * tick_size
+
+    @staticmethod
+    def calculate_shares_array(amount: ArrayLike, prices: ArrayLike, share_type: str = "mixed") -> np.ndarray:
+        """calculate_shares 的陣列版本（價格 <= 0 或缺值、金額 <= 0 時股數為 0）"""
+        share_type = {"整股": "whole", "零股": "fractional", "整股優先": "mixed"}.get(share_type, share_type)
+        prices = _as_array(prices)
+        amount = np.broadcast_to(_as_array(amount), prices.shape)
+        valid = np.isfinite(prices) & (prices > 0) & (amount > 0)
+        safe_price = np.where(valid, prices, 1.0)
+        if share_type == "whole":
+            shares = np.floor_divide(amount, safe_price * 1000) * 1000
+        elif share_type == "fractional":
+            shares = np.floor_divide(amount, safe_price)
+        elif share_type == "mixed":
+            shares = np.floor_divide(amount, safe_price)
+            shares = np.where(shares >= 1000, np.floor_divide(shares, 1000) * 1000, shares)
+        else:
+            raise ValueError(f"不支援的股數類型: {share_type}")
+        return np.where(valid, shares, 0.0)
+
+    @staticmethod
+    def is_limit_down_array(open_prices: ArrayLike, high: ArrayLike, low: ArrayLike, close: ArrayLike,
+                            prev_close: ArrayLike, up_limit_percentage: float = 9.0,
+                            down_limit_percentage: float = 9.0, trade_direction: str = 'long') -> np.ndarray:
+        """
+        is_limit_down 的陣列版本
+
+        Returns:
+            np.ndarray: int8 陣列，1 為一字跌停（做空為一字漲停），2 為開盤跌停但未一字跌停，0 為正常
+        """
+        open_prices, high, low, close = (_as_array(values) for values in (open_prices, high, low, close))
+        prev_close = _as_array(prev_close)
+        result = np.zeros(open_prices.shape, dtype=np.int8)
+        if trade_direction == 'long':
+            down_limit_price = PriceUtils.calculate_limit_price_array(prev_close, down_limit_percentage)
+            highest = np.maximum.reduce([open_prices, high, low, close])
+            result[(open_prices <= down_limit_price) & (high > down_limit_price)] = 2
+            result[highest <= down_limit_price] = 1
+        else:
+            up_limit_price = PriceUtils.calculate_limit_price_array(prev_close, up_limit_percentage)
+            lowest = np.minimum.reduce([open_prices, high, low, close])
+            result[(open_prices >= up_limit_price) & (high < up_limit_price)] = 2
+            result[lowest >= up_limit_price] = 1
+        return result
+
+    @staticmethod
+    def get_tick_size_expr(price: ExprLike) -> pl.Expr:
+        """get_tick_size 的 Polars 運算式版本"""
+        return _map_columns(PriceUtils.get_tick_size_array, [_as_expr(price)])
+
+    @staticmethod
+    def calculate_limit_price_expr(base_price: ExprLike, limit_percent: Union[ExprLike, float]) -> pl.Expr:
+        """
+        calculate_limit_price 的 Polars 運算式版本
+
+        範例：df.with_columns(PriceUtils.calculate_limit_price_expr("base_price", up_limit_rate).alias("up_limit_price"))
+        """
+        return _map_columns(PriceUtils.calculate_limit_price_array, [_as_expr(base_price), _as_expr(limit_percent)])
+
+    @staticmethod
+    def adjust_price_to_tick_expr(price: ExprLike) -> pl.Expr:
+        """adjust_price_to_tick 的 Polars 運算式版本"""
+        return _map_columns(PriceUtils.adjust_price_to_tick_array, [_as_expr(price)])
+
+    @staticmethod
+    def calculate_shares_expr(amount: Union[ExprLike, float], price: ExprLike, share_type: str = "mixed") -> pl.Expr:
+        """
+        calculate_shares 的 Polars 運算式版本（價格缺值時為缺值）
+
+        範例：df.with_columns(PriceUtils.calculate_shares_expr(initial_capital, "entry_price", share_type).alias("shares"))
+        """
+        return _map_columns(
+            lambda prices, amounts: PriceUtils.calculate_shares_array(amounts, prices, share_type),
+            [_as_expr(price), _as_expr(amount)],
+            dtype=pl.Int64
+        )
+
+    @staticmethod
+    def is_limit_down_expr(open_price: ExprLike = "open", high: ExprLike = "high", low: ExprLike = "low",
+                           close: ExprLike = "close", prev_close: ExprLike = None,
+                           up_limit_percentage: float = 9.0, down_limit_percentage: float = 9.0,
+                           trade_direction: str = 'long', per_stock: bool = True) -> pl.Expr:
+        """
+        is_limit_down 的 Polars 運算式版本（1 一字跌停、2 開盤跌停但未一字跌停、0 正常）
+
+        prev_close 未提供時使用 close 的前一列；per_stock 為 True 時以 over("stock_id") 取同一檔股票的前一列，
+        資料沒有 stock_id 欄位（單一股票）時請傳 per_stock=False
+        """
+        if prev_close is None:
+            prev_close = _as_expr(close).shift(1)
+            if per_stock:
+                prev_close = prev_close.over("stock_id")
+        else:
+            prev_close = _as_expr(prev_close)
+        return _map_columns(
+            lambda o, h, l, c, p: PriceUtils.is_limit_down_array(o, h, l, c, p, up_limit_percentage,
+                                                                 down_limit_percentage, trade_direction),
+            [_as_expr(open_price), _as_expr(high), _as_expr(low), _as_expr(close), prev_close],
+            dtype=pl.Int8
+        ).alias("is_limit_down")
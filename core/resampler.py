@@ -0,0 +1,246 @@
+# 多週期 K 線重取樣模組
+"""
+多週期 K 線重取樣（1 分 K → 5/15/30/60 分 K、日 K、週 K）
+
+- resample_bars 以 group_by_dynamic 依 stock_id 分股聚合：開盤取第一筆、最高/最低取極值、收盤取最後一筆、
+  成交量（volume、trading_volume、trading_money）加總
+- 聚合可組合：一次要求多個週期時，較長週期由已算好且可整除的較短週期再聚合（例如 60 分 K 由 15 分 K 產生）
+- 結果以「輸入資料內容指紋 + 週期」快取（記憶體 LRU，依位元組數限制）
+- align_timeframes 以 as-of join 將較長週期的欄位接到較短週期的每根 K 棒上，
+  只取「已收盤」的長週期 K 棒（長週期 K 棒的可用時間 = 起始時間 + 週期），不會看到未來資料
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import polars as pl
+
+from core.logger import get_logger
+from core.result_cache import fingerprint_frame
+
+logger = get_logger("resampler.py")
+
+# 週期名稱 -> (group_by_dynamic 的 every, 分鐘數)
+TIMEFRAMES: Dict[str, Tuple[str, int]] = {
+    "1m": ("1m", 1),
+    "5m": ("5m", 5),
+    "15m": ("15m", 15),
+    "30m": ("30m", 30),
+    "60m": ("1h", 60),
+    "1d": ("1d", 1440),
+    "1w": ("1w", 10080),
+}
+_ALIASES = {"1h": "60m", "d": "1d", "day": "1d", "w": "1w", "week": "1w"}
+# 需加總的成交量欄位
+VOLUME_COLUMNS = ("volume", "trading_volume", "trading_money")
+# 重取樣快取記憶體上限（位元組），預設 256MB
+MAX_RESAMPLE_CACHE_BYTES = int(os.environ.get("RESAMPLE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def normalize_timeframe(timeframe: Union[str, int]) -> str:
+    """
+    正規化週期名稱
+
+    範例：5 / "5" / "5m" -> "5m"，"1h" -> "60m"，"d" -> "1d"
+    """
+    name = str(timeframe).strip().lower()
+    if name.isdigit():
+        name = f"{name}m"
+    name = _ALIASES.get(name, name)
+    if name not in TIMEFRAMES:
+        raise ValueError(f"不支援的週期: {timeframe}（可用：{', '.join(TIMEFRAMES)}）")
+    return name
+
+
+class ResampleCache:
+    """重取樣結果快取（記憶體 LRU，依位元組數限制）"""
+
+    def __init__(self, max_bytes: int = MAX_RESAMPLE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._frames: "OrderedDict[Tuple[str, str], pl.DataFrame]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, fingerprint: str, timeframe: str) -> Optional[pl.DataFrame]:
+        with self._lock:
+            key = (fingerprint, timeframe)
+            frame = self._frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def set(self, fingerprint: str, timeframe: str, frame: pl.DataFrame) -> None:
+        size = frame.estimated_size()
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            key = (fingerprint, timeframe)
+            previous = self._frames.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.estimated_size()
+            self._frames[key] = frame
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._frames:
+                _, evicted = self._frames.popitem(last=False)
+                self._bytes -= evicted.estimated_size()
+
+    def clear(self) -> None:
+        """清除所有重取樣結果"""
+        with self._lock:
+            self._frames.clear()
+            self._bytes = 0
+
+    def info(self) -> dict:
+        """快取統計"""
+        return {
+            "frames": len(self._frames),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# 全域重取樣快取
+resample_cache = ResampleCache()
+
+
+def _prepare_bars(bars: pl.DataFrame, time_column: str) -> pl.DataFrame:
+    """時間欄位轉為 Datetime，並依 (stock_id, 時間) 排序（已排序時不排序）"""
+    if time_column not in bars.columns:
+        raise ValueError(f"缺少時間欄位: {time_column}")
+    dtype = bars.schema[time_column]
+    if dtype == pl.Utf8:
+        bars = bars.with_columns(pl.col(time_column).str.to_datetime())
+    elif dtype == pl.Date:
+        bars = bars.with_columns(pl.col(time_column).cast(pl.Datetime))
+    if "stock_id" not in bars.columns:
+        return bars if bars[time_column].is_sorted() else bars.sort(time_column)
+    new_stock = pl.col("stock_id") != pl.col("stock_id").shift(1)
+    ordered = bars.select(
+        ((pl.col(time_column) >= pl.col(time_column).shift(1)) | new_stock | new_stock.is_null()).all(),
+        new_stock.fill_null(True).sum() == pl.col("stock_id").n_unique()
+    ).row(0)
+    return bars if all(ordered) else bars.sort(["stock_id", time_column])
+
+
+def _aggregate(bars: pl.DataFrame, timeframe: str, time_column: str) -> pl.DataFrame:
+    """OHLCV 聚合（輸入需已依 (stock_id, 時間) 排序）"""
+    every, minutes = TIMEFRAMES[timeframe]
+    aggregations = [
+        pl.col(column).first() if column == "open" else
+        pl.col(column).max() if column == "high" else
+        pl.col(column).min() if column == "low" else
+        pl.col(column).last()
+        for column in ("open", "high", "low", "close") if column in bars.columns
+    ]
+    aggregations += [pl.col(column).sum() for column in VOLUME_COLUMNS if column in bars.columns]
+    by = "stock_id" if "stock_id" in bars.columns else None
+    result = bars.group_by_dynamic(
+        time_column, every=every, by=by, closed="left", label="left",
+        start_by="monday" if timeframe == "1w" else "window", check_sorted=False
+    ).agg(aggregations)
+    if minutes >= TIMEFRAMES["1d"][1]:
+        result = result.with_columns(pl.col(time_column).dt.date().alias("date"))
+    return result
+
+
+def resample_many(bars: pl.DataFrame, timeframes: Iterable[Union[str, int]], time_column: str = "datetime",
+                  use_cache: bool = True) -> Dict[str, pl.DataFrame]:
+    """
+    將 K 線重取樣為多個週期
+
+    週期由短到長計算，每個週期由「已算出且可整除的最長週期」再聚合，不必每次從 1 分 K 開始
+
+    Args:
+        bars: K 線資料（可含多檔股票），需含時間欄位與 open/high/low/close，成交量欄位可選
+        timeframes: 週期，例如 ["5m", "60m", "1d"]
+        time_column: 時間欄位名稱
+        use_cache: 是否使用重取樣快取
+
+    Returns:
+        Dict[str, pl.DataFrame]: {週期: K 線}，每個週期包含 stock_id、時間、OHLCV（日 K 以上另含 date）
+    """
+    names = sorted({normalize_timeframe(timeframe) for timeframe in timeframes}, key=lambda name: TIMEFRAMES[name][1])
+    bars = _prepare_bars(bars, time_column)
+    fingerprint = fingerprint_frame(bars) if use_cache else None
+    results: Dict[str, pl.DataFrame] = {}
+    for name in names:
+        cached = resample_cache.get(fingerprint, f"{time_column}|{name}") if use_cache else None
+        if cached is not None:
+            results[name] = cached
+            continue
+        minutes = TIMEFRAMES[name][1]
+        # 各週期的視窗都對齊整點 / 午夜（週 K 對齊週一午夜），可整除的較短週期聚合後結果相同
+        sources = [source for source in results if minutes % TIMEFRAMES[source][1] == 0]
+        frame = _aggregate(results[sources[-1]] if sources else bars, name, time_column)
+        results[name] = frame
+        if use_cache:
+            resample_cache.set(fingerprint, f"{time_column}|{name}", frame)
+    return results
+
+
+def resample_bars(bars: pl.DataFrame, timeframe: Union[str, int], time_column: str = "datetime",
+                  use_cache: bool = True) -> pl.DataFrame:
+    """
+    將 K 線重取樣為較長週期
+
+    範例：
+        bars_15m = resample_bars(minute_bars, "15m")
+        daily = resample_bars(minute_bars, "1d")
+    """
+    name = normalize_timeframe(timeframe)
+    return resample_many(bars, [name], time_column, use_cache)[name]
+
+
+def align_timeframes(base: pl.DataFrame, higher: pl.DataFrame, timeframe: Union[str, int],
+                     columns: Optional[List[str]] = None, time_column: str = "datetime") -> pl.DataFrame:
+    """
+    將較長週期的欄位以 as-of join 接到較短週期的 K 棒上（欄位名稱加上 _{週期} 後綴）
+
+    每根 K 棒只會對到「在該 K 棒開始前已收盤」的最近一根長週期 K 棒，
+    例如分 K 對日 K 時，當日盤中看到的是前一交易日的日 K 與指標
+
+    Args:
+        base: 較短週期的 K 線（交易用），需含時間欄位
+        higher: 較長週期的資料（resample_bars 的結果或含 date 欄位的日 K，可先加上指標欄位）
+        timeframe: higher 的週期，用來計算長週期 K 棒的收盤時間
+        columns: 要接上的欄位（預設為 stock_id、時間與 date 以外的所有欄位）
+        time_column: 時間欄位名稱
+
+    範例：
+        daily = generate_indicators(resample_bars(minute_bars, "1d"), ["ma_20"])
+        minute_bars = align_timeframes(minute_bars, daily, "1d", ["close", "ma_20"])  # 新增 close_1d、ma_20_1d
+    """
+    name = normalize_timeframe(timeframe)
+    every = TIMEFRAMES[name][0]
+    higher_time = time_column if time_column in higher.columns else "date"
+    if higher_time not in higher.columns:
+        raise ValueError(f"長週期資料缺少時間欄位: {time_column} 或 date")
+    if columns is None:
+        columns = [column for column in higher.columns if column not in ("stock_id", time_column, "date")]
+    by = "stock_id" if "stock_id" in base.columns and "stock_id" in higher.columns else None
+
+    row_column = "__row_nr"
+    available_column = "__available_at"
+    left = _prepare_bars(base.with_row_count(row_column), time_column)
+    time_dtype = left.schema[time_column]
+    right = higher.select(
+        ([pl.col("stock_id")] if by else []) +
+        [pl.col(higher_time).cast(pl.Datetime).cast(time_dtype).dt.offset_by(every).alias(available_column)] +
+        [pl.col(column).alias(f"{column}_{name}") for column in columns]
+    ).sort(available_column)
+    joined = left.sort(time_column).join_asof(
+        right, left_on=time_column, right_on=available_column, by=by, strategy="backward"
+    )
+    # 還原原本的列順序與時間欄位型別
+    return joined.sort(row_column).select(
+        base.columns + [f"{column}_{name}" for column in columns]
+    ).with_columns(base[time_column])
@@ -0,0 +1,232 @@
+# 回測結果快取模組
+"""
+回測結果快取（記憶化）
+
+以「策略程式碼 + 解析後參數 + 輸入資料內容指紋」的雜湊作為鍵值（整體結果與逐股結果各一個快取）：
+- 記憶體層為 LRU（OrderedDict），命中時移到最新
+- 磁碟層為 pickle 檔，服務重啟後仍可命中；超過上限時依最後存取時間淘汰
+- 資料指紋以 polars hash_rows 逐列雜湊後整體 blake2b，不需序列化整份資料
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import polars as pl
+
+from core.logger import get_logger
+from core.utils import Utils
+
+logger = get_logger("result_cache.py")
+
+RESULT_CACHE_DIR = os.environ.get("BACKTEST_RESULT_CACHE_DIR", "data/result_cache")
+MAX_MEMORY_ENTRIES = 64
+MAX_DISK_ENTRIES = 512
+# 逐股結果快取：大型股票池每檔一筆，上限需遠大於整體結果快取
+MAX_STOCK_MEMORY_ENTRIES = 4096
+MAX_STOCK_DISK_ENTRIES = 50000
+# 快取鍵值版本：結果內容的計算方式修正時遞增，舊版本寫入（含磁碟上）的項目不再命中，依 LRU 淘汰
+# 2：行程池模式逐股結果不再共用同一份權益曲線與日期
+RESULT_CACHE_VERSION = 2
+
+
+def fingerprint_frame(frame: Optional[pl.DataFrame]) -> str:
+    """
+    計算 DataFrame 的內容指紋（欄位結構 + 逐列雜湊）
+
+    內容、欄位名稱、型別或列順序任一不同，指紋即不同
+    """
+    if frame is None:
+        return "none"
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{pl.__version__}|{frame.shape}|{list(frame.schema.items())}".encode("utf-8"))
+    if len(frame) > 0:
+        try:
+            digest.update(frame.hash_rows(seed=0).to_numpy().tobytes())
+        except Exception:
+            # 含無法逐列雜湊的欄位（如 Object）時退回 IPC 序列化
+            digest.update(frame.write_ipc(None).getvalue())
+    return digest.hexdigest()
+
+
+def make_cache_key(namespace: str, strategy_code: str, parameters: Any, *frames: Optional[pl.DataFrame]) -> str:
+    """
+    產生回測結果快取鍵值
+
+    Args:
+        namespace: 呼叫端類別（strategy_test、backtest 等），避免不同格式的結果互相命中；鍵值另含 RESULT_CACHE_VERSION
+        strategy_code: 策略程式碼
+        parameters: 解析後的策略參數（需可 JSON 序列化，其他型別以字串表示）
+        frames: 輸入資料（股價資料、Excel 資料等）
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"v{RESULT_CACHE_VERSION}:{namespace}".encode("utf-8"))
+    digest.update(b"\0")
+    digest.update((strategy_code or "").encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(json.dumps(parameters, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8"))
+    for frame in frames:
+        digest.update(b"\0")
+        # 已計算好的指紋（字串）直接使用
+        fingerprint = frame if isinstance(frame, str) else fingerprint_frame(frame)
+        digest.update(fingerprint.encode("ascii"))
+    return digest.hexdigest()
+
+
+def stock_cache_keys(namespace: str, strategy_code: str, parameters: Any, stock_data: pl.DataFrame,
+                     excel_data: Optional[pl.DataFrame] = None, column: str = "stock_id") -> Dict[str, str]:
+    """
+    產生逐股回測結果的快取鍵值
+
+    每檔股票的指紋為「該股股價列的逐列雜湊 + Excel 中該股的列」，整份資料只做一次 hash_rows，
+    因此只有輸入變動的股票鍵值會改變
+
+    Returns:
+        Dict[str, str]: {stock_id: 快取鍵值}
+    """
+    frame, ranges = Utils.stock_row_ranges(stock_data, column)
+    if not ranges:
+        return {}
+    stock_ids = [str(stock_id) for stock_id, _, _ in ranges]
+    row_hashes = frame.hash_rows(seed=0).to_numpy()
+    schema = f"{pl.__version__}|{list(frame.schema.items())}".encode("utf-8")
+    excel_parts = {}
+    if excel_data is not None and column in excel_data.columns:
+        excel_parts = Utils.partition_by_stock(excel_data, stock_ids, column)
+    keys = {}
+    for stock_id, (_, offset, length) in zip(stock_ids, ranges):
+        digest = hashlib.blake2b(schema, digest_size=16)
+        digest.update(row_hashes[offset:offset + length].tobytes())
+        price_fingerprint = digest.hexdigest()
+        excel_part = excel_parts.get(stock_id)
+        keys[stock_id] = make_cache_key(namespace, strategy_code, parameters, price_fingerprint,
+                                        excel_part if excel_part is not None else "none")
+    return keys
+
+
+class ResultCache:
+    """回測結果快取（記憶體 LRU + 磁碟持久化）"""
+
+    def __init__(self, cache_dir: str = RESULT_CACHE_DIR, max_memory_entries: int = MAX_MEMORY_ENTRIES,
+                 max_disk_entries: int = MAX_DISK_ENTRIES):
+        self.cache_dir = cache_dir.replace('\\', '/')
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_entries: Optional[int] = None  # 磁碟快取筆數（首次寫入時才掃描目錄）
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pkl").replace('\\', '/')
+
+    def get(self, key: str) -> Optional[Any]:
+        """取得快取結果，沒有時回傳 None"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+        path = self._path(key)
+        if not os.path.exists(path):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)  # 更新存取時間，供磁碟 LRU 淘汰判斷
+        except Exception as e:
+            logger.warning("讀取結果快取失敗 %s: %s", key, e)
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self._remember(key, value)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        """寫入快取結果（記憶體與磁碟）"""
+        with self._lock:
+            self._remember(key, value)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            path = self._path(key)
+            is_new = not os.path.exists(path)
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+            with self._lock:
+                if self._disk_entries is None:
+                    self._disk_entries = self._count_disk_entries()
+                elif is_new:
+                    self._disk_entries += 1
+                over_limit = self._disk_entries > self.max_disk_entries
+            if over_limit:
+                self._evict_disk()
+        except Exception as e:
+            logger.warning("寫入結果快取失敗 %s: %s", key, e)
+
+    def _remember(self, key: str, value: Any) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _count_disk_entries(self) -> int:
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        return sum(1 for entry in os.scandir(self.cache_dir) if entry.name.endswith(".pkl"))
+
+    def _evict_disk(self) -> None:
+        """依最後存取時間淘汰超過上限的磁碟快取（一次淘汰到上限的 90%，避免每次寫入都掃描目錄）"""
+        entries = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".pkl")]
+        keep = int(self.max_disk_entries * 0.9)
+        if len(entries) > keep:
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - keep]:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+        with self._lock:
+            self._disk_entries = self._count_disk_entries()
+
+    def clear(self) -> None:
+        """清除所有快取結果"""
+        with self._lock:
+            self._memory.clear()
+            self._disk_entries = None
+        if os.path.isdir(self.cache_dir):
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith(".pkl"):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+    def info(self) -> dict:
+        """快取統計"""
+        return {
+            "memory_entries": len(self._memory),
+            "disk_entries": self._count_disk_entries(),
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+# 全域回測結果快取
+result_cache = ResultCache()
+# 全域逐股回測結果快取（增量回測用）
+stock_result_cache = ResultCache(
+    os.path.join(RESULT_CACHE_DIR, "stocks"),
+    max_memory_entries=MAX_STOCK_MEMORY_ENTRIES,
+    max_disk_entries=MAX_STOCK_DISK_ENTRIES
+)
@@ -0,0 +1,227 @@
+# 選股篩選引擎模組
+"""
+橫斷面選股篩選引擎
+
+以全市場股價與技術指標資料（stock_id × date）為輸入，將選股條件轉為 Polars 運算式一次評估：
+- 條件依序套用，排名類條件（top、percentile）在前面條件篩選後的股票中，於同一日期（可再依產業等欄位分組）排名
+- 條件用到但資料沒有的欄位若為登錄的技術指標（ma_20、rsi_14、volume_surge 等），先以 generate_indicators 產生
+- 可只篩選最新日期，或篩選整段期間得到每日選股清單（可直接作為回測的 Excel 股票來源：stock_id、date）
+
+條件格式（dict 或字串）：
+    "close > ma_20"                                            # 字串比較式，右側可為欄位或數字
+    {"field": "close", "operator": ">", "value_field": "ma_20"}
+    {"field": "volume", "operator": ">=", "value": 1000}
+    {"field": "stock_name", "operator": "contains", "value": "電"}
+    {"field": "industry", "operator": "in", "value": ["半導體業", "電子零組件業"]}
+    {"field": "close", "operator": "between", "value": [10, 100]}
+    {"type": "top", "field": "volume_ratio_20", "n": 20}        # 每日前 N 名（descending=False 取後 N 名，同值並列一併選入）
+    {"type": "percentile", "field": "rsi_14", "min": 0.8, "by": "industry"}  # 產業內百分位（0~1，1 為最高）
+"""
+
+import re
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Union
+
+import polars as pl
+
+from core.logger import get_logger
+from core.technical_indicators import _parse_indicator, generate_indicators
+
+logger = get_logger("screener.py")
+
+Condition = Union[str, Dict[str, Any]]
+
+_COMPARISON = re.compile(r"^\s*(\w+)\s*(>=|<=|==|!=|>|<)\s*(.+?)\s*$")
+_NUMBER = re.compile(r"^-?\d+(?:\.\d+)?$")
+_COMPARATORS = {
+    ">": lambda left, right: left > right,
+    ">=": lambda left, right: left >= right,
+    "<": lambda left, right: left < right,
+    "<=": lambda left, right: left <= right,
+    "==": lambda left, right: left == right,
+    "!=": lambda left, right: left != right,
+}
+# 選股頁面使用的運算子與欄位名稱
+_OPERATOR_ALIASES = {"equals": "==", "greater_than": ">", "less_than": "<",
+                     "greater_equal": ">=", "less_equal": "<=", "not_equals": "!="}
+_FIELD_ALIASES = {"price": ("close",), "volume": ("trading_volume", "volume")}
+# 文字欄位的比較值維持字串（例如 stock_id == "2330"）
+_TEXT_FIELDS = ("stock_id", "stock_name", "industry", "market")
+# 結果固定保留的欄位（資料中有才保留）
+RESULT_COLUMNS = ("stock_id", "stock_name", "industry", "date")
+
+
+def _parse_number(text: str) -> Union[int, float]:
+    return float(text) if "." in text else int(text)
+
+
+def _normalize_condition(condition: Condition, columns: List[str]) -> Dict[str, Any]:
+    """
+    條件正規化：字串比較式轉為 dict，運算子與欄位別名轉為標準名稱
+
+    選股頁面送出的值為字串：比較運算的數字字串轉為數值、非數字視為欄位（例如 ma_20），
+    between 的值可為 "10,100"
+    """
+    if not isinstance(condition, dict):
+        match = _COMPARISON.match(str(condition))
+        if match is None:
+            raise ValueError(f"無法解析的選股條件: {condition}")
+        field, operator, right = match.groups()
+        condition = {"field": field, "operator": operator, "value": right}
+    elif "expression" in condition:
+        options = {key: value for key, value in condition.items() if key != "expression"}
+        return {**_normalize_condition(condition["expression"], columns), **options}
+
+    condition = dict(condition)
+    field = condition.get("field")
+    if field not in columns and field in _FIELD_ALIASES:
+        condition["field"] = next((alias for alias in _FIELD_ALIASES[field] if alias in columns),
+                                  _FIELD_ALIASES[field][0])
+    operator = condition["operator"] = _OPERATOR_ALIASES.get(condition.get("operator", "=="), condition.get("operator", "=="))
+    value = condition.get("value")
+    if isinstance(value, str):
+        value = value.strip()
+        if operator in _COMPARATORS and not condition.get("value_field") and field not in _TEXT_FIELDS:
+            if _NUMBER.match(value):
+                condition["value"] = _parse_number(value)
+            else:
+                condition["value_field"] = value
+        elif operator == "between":
+            bounds = re.split(r"\s*[,~]\s*", value)
+            if len(bounds) != 2 or not all(_NUMBER.match(bound) for bound in bounds):
+                raise ValueError(f"between 條件值需為兩個數字，例如 10,100: {value}")
+            condition["value"] = [_parse_number(bound) for bound in bounds]
+    return condition
+
+
+def _as_date(value: Any) -> date:
+    """日期參數（字串、datetime 或 date）轉為 date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10].replace("/", "-"))
+
+
+def _referenced_fields(condition: Dict[str, Any]) -> List[str]:
+    fields = [condition.get("field"), condition.get("value_field")]
+    by = condition.get("by")
+    fields += [by] if isinstance(by, str) else list(by or [])
+    return [field for field in fields if field]
+
+
+def _group_keys(condition: Dict[str, Any]) -> List[str]:
+    by = condition.get("by")
+    return ["date"] + ([by] if isinstance(by, str) else list(by or []))
+
+
+def _condition_expression(condition: Dict[str, Any]) -> pl.Expr:
+    """將單一條件轉為篩選運算式"""
+    kind = condition.get("type", "filter")
+    field = condition.get("field")
+    if not field:
+        raise ValueError(f"選股條件缺少 field: {condition}")
+    column = pl.col(field)
+
+    if kind == "top":
+        # 以第 N 名的值為門檻（top_k 不需完整排序），同值並列者一併選入
+        n = int(condition.get("n", 10))
+        if condition.get("descending", True):
+            return column >= column.top_k(n).min().over(_group_keys(condition))
+        return column <= column.bottom_k(n).max().over(_group_keys(condition))
+    if kind == "percentile":
+        # 百分位 = 平均排名 / 非空值數（0~1，數值越大排名越高）
+        percentile = (column.rank("average") / column.count()).over(_group_keys(condition))
+        return (percentile >= condition.get("min", 0.0)) & (percentile <= condition.get("max", 1.0))
+    if kind != "filter":
+        raise ValueError(f"不支援的選股條件類型: {kind}")
+
+    operator = condition.get("operator", "==")
+    value = condition.get("value")
+    if operator in _COMPARATORS:
+        right = pl.col(condition["value_field"]) if condition.get("value_field") else pl.lit(value)
+        return _COMPARATORS[operator](column, right)
+    if operator == "contains":
+        return column.cast(pl.Utf8).str.to_lowercase().str.contains(str(value).lower(), literal=True)
+    if operator in ("in", "not_in"):
+        values = value if isinstance(value, (list, tuple)) else [value]
+        expr = column.is_in(list(values))
+        return ~expr if operator == "not_in" else expr
+    if operator == "between":
+        low, high = value
+        return column.is_between(low, high)
+    raise ValueError(f"不支援的比較運算子: {operator}")
+
+
+def screen(data: pl.DataFrame, conditions: List[Condition], scope: str = "latest",
+           start_date: Optional[Any] = None, end_date: Optional[Any] = None) -> pl.DataFrame:
+    """
+    評估選股條件
+
+    Args:
+        data: 全市場股價資料（需含 stock_id、date，可含 stock_name、industry 與已計算的指標欄位）
+        conditions: 選股條件（格式見模組說明），依序套用
+        scope: "latest" 只篩選最新日期；"all" 篩選整段期間（每日一份清單）
+        start_date / end_date: scope="all" 時的日期範圍（指標仍以完整歷史計算）
+
+    Returns:
+        pl.DataFrame: 符合條件的 (stock_id, date) 與條件用到的欄位，依日期、股票排序
+    """
+    if scope not in ("latest", "all"):
+        raise ValueError(f"不支援的篩選範圍: {scope}")
+    missing = [column for column in ("stock_id", "date") if column not in data.columns]
+    if missing:
+        raise ValueError(f"缺少欄位: {', '.join(missing)}")
+    normalized = [_normalize_condition(condition, data.columns) for condition in conditions]
+
+    # 補上條件用到的技術指標欄位
+    fields = list(dict.fromkeys(field for condition in normalized for field in _referenced_fields(condition)))
+    absent = [field for field in fields if field not in data.columns]
+    unknown = [field for field in absent if _parse_indicator(field) is None]
+    if unknown:
+        raise ValueError(f"找不到欄位或技術指標: {', '.join(unknown)}")
+    if absent:
+        data = generate_indicators(data, absent)
+
+    # 先縮小日期範圍，再依序套用條件（排名類條件只在前面條件篩選後的股票中排名）
+    frame = data.lazy()
+    if scope == "latest":
+        frame = frame.filter(pl.col("date") == pl.col("date").max())
+    else:
+        if start_date is not None:
+            frame = frame.filter(pl.col("date") >= _as_date(start_date))
+        if end_date is not None:
+            frame = frame.filter(pl.col("date") <= _as_date(end_date))
+    for condition in normalized:
+        frame = frame.filter(_condition_expression(condition))
+
+    columns = [column for column in RESULT_COLUMNS if column in data.columns]
+    columns += [field for field in fields if field not in columns]
+    return frame.select(columns).sort(["date", "stock_id"]).collect()
+
+
+def to_excel_frame(result: pl.DataFrame) -> pl.DataFrame:
+    """篩選結果轉為回測 Excel 股票來源格式（stock_id、date）"""
+    return result.select("stock_id", "date").unique(maintain_order=True)
+
+
+def to_stock_list(result: pl.DataFrame) -> List[Dict[str, Any]]:
+    """
+    篩選結果轉為選股列表格式（每檔股票一筆）
+
+    start_date / end_date 為該股票第一次與最後一次符合條件的日期
+    """
+    if result.is_empty():
+        return []
+    aggregations = [pl.col("date").min().alias("start_date"), pl.col("date").max().alias("end_date")]
+    if "stock_name" in result.columns:
+        aggregations.append(pl.col("stock_name").first())
+    stocks = result.group_by("stock_id", maintain_order=True).agg(aggregations)
+    if "stock_name" not in stocks.columns:
+        stocks = stocks.with_columns(pl.lit("").alias("stock_name"))
+    return stocks.select(
+        "stock_id",
+        pl.col("stock_name").fill_null(""),
+        pl.col("start_date").cast(pl.Utf8),
+        pl.col("end_date").cast(pl.Utf8)
+    ).to_dicts()
@@ -4,6 +4,9 @@ import uuid
 from datetime import datetime
 from typing import Dict, List, Any, Optional
 import pandas as pd
+import polars as pl
+
+from core.screener import screen, to_stock_list
 
 def print_log(message: str):
     """日誌輸出"""
@@ -174,39 +177,27 @@ class StockListManager:
             print(f"匯出Excel失敗: {e}")
             return False
     
-    def apply_stock_conditions(self, conditions: List[Dict]) -> List[Dict]:
-        """套用選股條件（模擬功能）"""
-        # 這裡可以實作真實的選股邏輯
-        # 目前返回模擬資料
-        sample_stocks = [
-            {'stock_id': '2330', 'stock_name': '台積電', 'start_date': '', 'end_date': ''},
-            {'stock_id': '2317', 'stock_name': '鴻海', 'start_date': '', 'end_date': ''},
-            {'stock_id': '2454', 'stock_name': '聯發科', 'start_date': '', 'end_date': ''},
-            {'stock_id': '2412', 'stock_name': '中華電', 'start_date': '', 'end_date': ''},
-            {'stock_id': '1301', 'stock_name': '台塑', 'start_date': '', 'end_date': ''},
-            {'stock_id': '1303', 'stock_name': '南亞', 'start_date': '', 'end_date': ''},
-            {'stock_id': '2002', 'stock_name': '中鋼', 'start_date': '', 'end_date': ''},
-            {'stock_id': '2881', 'stock_name': '富邦金', 'start_date': '', 'end_date': ''},
-            {'stock_id': '2882', 'stock_name': '國泰金', 'start_date': '', 'end_date': ''},
-            {'stock_id': '1216', 'stock_name': '統一', 'start_date': '', 'end_date': ''}
-        ]
-        
-        # 根據條件篩選（簡化版本）
-        filtered_stocks = sample_stocks
-        
-        for condition in conditions:
-            field = condition.get('field')
-            operator = condition.get('operator')
-            value = condition.get('value')
-            
-            if field == 'stock_id' and operator == 'contains':
-                filtered_stocks = [s for s in filtered_stocks 
-                                 if value.lower() in s['stock_id'].lower()]
-            elif field == 'stock_name' and operator == 'contains':
-                filtered_stocks = [s for s in filtered_stocks 
-                                 if value.lower() in s['stock_name'].lower()]
-        
-        return filtered_stocks
+    def apply_stock_conditions(self, conditions: List[Dict], price_data: Optional[pl.DataFrame] = None,
+                               scope: str = "latest", start_date: Optional[str] = None,
+                               end_date: Optional[str] = None) -> List[Dict]:
+        """
+        套用選股條件，回傳選股列表格式的股票（每檔一筆）
+
+        Args:
+            conditions: 選股條件（格式見 core/screener.py），例如 ["close > ma_20", {"type": "top", "field": "volume_ratio_20", "n": 20}]
+            price_data: 全市場股價資料（stock_id、date、OHLCV，可含 stock_name、industry）
+            scope: "latest" 只篩選最新日期；"all" 篩選整段期間
+            start_date / end_date: scope="all" 時的日期範圍
+        """
+        return to_stock_list(self.screen_stocks(conditions, price_data, scope, start_date, end_date))
+
+    def screen_stocks(self, conditions: List[Dict], price_data: Optional[pl.DataFrame] = None,
+                      scope: str = "latest", start_date: Optional[str] = None,
+                      end_date: Optional[str] = None) -> pl.DataFrame:
+        """以選股篩選引擎評估條件，回傳符合條件的 (stock_id, date) 與條件欄位"""
+        if price_data is None or price_data.is_empty():
+            raise ValueError("選股需要股價資料")
+        return screen(price_data, conditions, scope, start_date, end_date)
     
     def get_stock_list_statistics(self, stock_list_id: str) -> Dict:
         """取得選股列表統計資訊"""
@@ -0,0 +1,535 @@
+# 增量技術指標模組
+"""
+增量（串流）技術指標更新
+
+每日新增 K 棒時不需重算整段歷史：每檔股票保存 O(視窗) 的狀態，新 K 棒逐筆推進，
+一批新資料的更新成本為 O(新 K 棒數)。
+- 滾動視窗（rolling_max/min、ma、bb_std、rsv、vwap）以 deque(maxlen=n) 環狀緩衝保存最近 n 筆，
+  平均與總和另保存累加值
+- EMA 類（ema、macd_signal、rsi、atr、kd）只保存前一筆平滑值
+- 指標依 generate_indicators 的依賴 DAG 分層順序計算，同一筆 K 棒內後層可引用前層的值
+- 狀態以 pickle 保存在價格快取目錄下（data/cache/indicator_state/），服務重啟後接續更新
+
+計算公式與累加順序比照 core/technical_indicators.py 的登錄指標，結果與全量重算逐位元相同；
+唯一例外為 bb_std 及依賴它的 bb_upper / bb_lower：polars 滾動變異數的內部累加方式無法逐筆重現，
+增量版以兩段式公式計算，差異僅在浮點捨入誤差內。這類指標在登錄時附上容許誤差
+（STREAMING_TOLERANCES，布林通道為相對 1e-9、絕對 1e-9），StreamingIndicatorEngine.verify
+以全量重算核對時，未登錄容許誤差的指標必須完全相同，其餘依容許誤差比較。
+自訂指標需以 register_streaming_indicator 登錄更新器才能增量計算。
+"""
+
+import hashlib
+import math
+import os
+import pickle
+import re
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import polars as pl
+
+from core.cache_manager import cache_manager
+from core.logger import get_logger
+from core.technical_indicators import _parse_indicator, _plan_indicators, _sort_for_indicators, generate_indicators
+
+logger = get_logger("streaming_indicators.py")
+
+# 增量指標狀態目錄（與價格快取同一目錄下）
+INDICATOR_STATE_DIR = os.path.join(cache_manager.cache_dir, "indicator_state").replace('\\', '/')
+STATE_VERSION = 2
+
+_PARAMETER = re.compile(r"\{(\w+)\}")
+
+# 布林通道（bb_std 及通道上下緣）與全量重算的容許誤差：(相對誤差, 絕對誤差)
+BOLLINGER_TOLERANCE = (1e-9, 1e-9)
+
+
+# ===== 更新器 =====
+# 更新器 update(values) 接收當筆 K 棒的價格欄位與已算出的前層指標值，回傳該指標當筆的值；
+# 狀態須可 pickle（不可保存 lambda）
+
+def _ewm_step(previous: Optional[float], value: float, alpha: float) -> float:
+    """adjust=False 的 EMA 一步（與 polars ewm_mean 的加權方式相同，第一筆為起始值）"""
+    if previous is None:
+        return value
+    old_weight = 1.0 - alpha
+    return (old_weight * previous + alpha * value) / (old_weight + alpha)
+
+
+def _population_std(window: deque) -> float:
+    mean = sum(window) / len(window)
+    return math.sqrt(sum((value - mean) ** 2 for value in window) / len(window))
+
+
+def _divide(numerator: float, denominator: float) -> float:
+    """除以 0 時比照 polars 回傳 NaN / ±inf"""
+    if denominator == 0:
+        return math.nan if numerator == 0 else math.copysign(math.inf, numerator)
+    return numerator / denominator
+
+
+class _Rolling:
+    """滾動視窗統計（min_periods=1）"""
+    __slots__ = ("column", "window", "reducer")
+
+    def __init__(self, column: str, n: int, reducer: Callable[[deque], float]):
+        self.column = column
+        self.window = deque(maxlen=n)
+        self.reducer = reducer
+
+    def update(self, values: dict) -> float:
+        self.window.append(values[self.column])
+        return self.reducer(self.window)
+
+
+class _RollingSum:
+    """滾動視窗總和（先減去離開視窗的值再加上新值，與 polars rolling_sum/rolling_mean 的累加順序相同）"""
+    __slots__ = ("window", "total")
+
+    def __init__(self, n: int):
+        self.window = deque(maxlen=n)
+        self.total = 0
+
+    def push(self, value) -> float:
+        if len(self.window) == self.window.maxlen:
+            self.total -= self.window[0]
+        self.total += value
+        self.window.append(value)
+        return self.total
+
+
+class _RollingMean:
+    """滾動平均（min_periods=1）"""
+    __slots__ = ("column", "sums")
+
+    def __init__(self, column: str, n: int):
+        self.column = column
+        self.sums = _RollingSum(n)
+
+    def update(self, values: dict) -> float:
+        return self.sums.push(values[self.column]) / len(self.sums.window)
+
+
+class _Ema:
+    """adjust=False 的 EMA（span 或 Wilder alpha）"""
+    __slots__ = ("column", "alpha", "value")
+
+    def __init__(self, column: str, alpha: float):
+        self.column = column
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, values: dict) -> float:
+        self.value = _ewm_step(self.value, values[self.column], self.alpha)
+        return self.value
+
+
+class _Formula:
+    """同一筆 K 棒內的無狀態組合（旗標、差值、通道）"""
+    __slots__ = ("function", "columns", "arguments")
+
+    def __init__(self, function: Callable[..., Any], columns: Tuple[str, ...], arguments: tuple = ()):
+        self.function = function
+        self.columns = columns
+        self.arguments = arguments
+
+    def update(self, values: dict) -> Any:
+        return self.function(*[values[column] for column in self.columns], *self.arguments)
+
+
+class _BreakHigh:
+    """收盤價突破前一日的 n 日高點"""
+    __slots__ = ("column", "previous")
+
+    def __init__(self, column: str):
+        self.column = column
+        self.previous = None
+
+    def update(self, values: dict) -> int:
+        result = int(self.previous is not None and values["close"] > self.previous)
+        self.previous = values[self.column]
+        return result
+
+
+class _Rsi:
+    """Wilder RSI（第一筆漲跌幅視為 0）"""
+    __slots__ = ("alpha", "previous_close", "gain", "loss")
+
+    def __init__(self, n: int):
+        self.alpha = 1 / n
+        self.previous_close = None
+        self.gain = None
+        self.loss = None
+
+    def update(self, values: dict) -> float:
+        close = values["close"]
+        change = 0.0 if self.previous_close is None else close - self.previous_close
+        self.previous_close = close
+        self.gain = _ewm_step(self.gain, max(change, 0.0), self.alpha)
+        self.loss = _ewm_step(self.loss, max(-change, 0.0), self.alpha)
+        if self.loss == 0:
+            return 50.0 if self.gain == 0 else 100.0
+        return 100.0 - 100.0 / (1.0 + self.gain / self.loss)
+
+
+class _TrueRange:
+    """真實區間（第一筆為當日高低差）"""
+    __slots__ = ("previous_close",)
+
+    def __init__(self):
+        self.previous_close = None
+
+    def update(self, values: dict) -> float:
+        high, low = values["high"], values["low"]
+        previous = self.previous_close
+        self.previous_close = values["close"]
+        if previous is None:
+            return high - low
+        return max(high - low, abs(high - previous), abs(low - previous))
+
+
+class _Rsv:
+    """RSV（區間高低價相同時為 50）"""
+    __slots__ = ("highs", "lows")
+
+    def __init__(self, n: int):
+        self.highs = deque(maxlen=n)
+        self.lows = deque(maxlen=n)
+
+    def update(self, values: dict) -> float:
+        self.highs.append(values["high"])
+        self.lows.append(values["low"])
+        highest, lowest = max(self.highs), min(self.lows)
+        if highest > lowest:
+            return (values["close"] - lowest) / (highest - lowest) * 100.0
+        return 50.0
+
+
+class _Kd:
+    """
+    KD 平滑：K = 2/3 × 前一日 K + 1/3 × RSV，起始值 50
+
+    比照全量版的閉式計算（adjust=False 的 EMA 加上起始值差異的衰減項 (2/3)^(t+1) × (50 - 第一筆)），
+    不以遞推式計算，結果與全量重算逐位元相同
+    """
+    __slots__ = ("column", "ema", "first", "count")
+
+    def __init__(self, column: str):
+        self.column = column
+        self.ema = None
+        self.first = None
+        self.count = 0
+
+    def update(self, values: dict) -> float:
+        value = values[self.column]
+        if self.first is None:
+            self.first = value
+        self.ema = _ewm_step(self.ema, value, 1.0 / 3.0)
+        self.count += 1
+        return self.ema + math.pow(2.0 / 3.0, float(self.count)) * (50.0 - self.first)
+
+
+class _Obv:
+    """能量潮（第一筆為 0）"""
+    __slots__ = ("previous_close", "total")
+
+    def __init__(self):
+        self.previous_close = None
+        self.total = 0.0
+
+    def update(self, values: dict) -> float:
+        close = values["close"]
+        if self.previous_close is not None:
+            self.total += ((close > self.previous_close) - (close < self.previous_close)) * values["trading_volume"]
+        self.previous_close = close
+        return self.total
+
+
+class _Vwap:
+    """n 日成交量加權平均價（典型價）"""
+    __slots__ = ("amounts", "volumes")
+
+    def __init__(self, n: int):
+        self.amounts = _RollingSum(n)
+        self.volumes = _RollingSum(n)
+
+    def update(self, values: dict) -> float:
+        volume = values["trading_volume"]
+        amount = self.amounts.push((values["high"] + values["low"] + values["close"]) / 3.0 * volume)
+        return _divide(amount, self.volumes.push(volume))
+
+
+def _equal_flag(left, right) -> int:
+    return int(left == right)
+
+
+def _surge_flag(volume, volume_ma) -> int:
+    return int(volume > volume_ma * 1.5)
+
+
+def _ascending_flag(short, middle, long) -> int:
+    return int(short > middle and middle > long)
+
+
+def _descending_flag(short, middle, long) -> int:
+    return int(short < middle and middle < long)
+
+
+def _ratio(numerator: float, denominator: float) -> float:
+    return _divide(numerator, denominator)
+
+
+def _difference(left: float, right: float) -> float:
+    return left - right
+
+
+def _band_upper(mean: float, std: float, k: float) -> float:
+    return mean + k * std
+
+
+def _band_lower(mean: float, std: float, k: float) -> float:
+    return mean - k * std
+
+
+# 名稱形狀 -> 更新器工廠（參數名稱與 technical_indicators 的樣板相同）
+STREAMING_UPDATERS: Dict[str, Callable[..., Any]] = {}
+# 名稱形狀 -> 與全量重算的容許誤差 (相對誤差, 絕對誤差)；未列出的指標必須與全量重算完全相同
+STREAMING_TOLERANCES: Dict[str, Tuple[float, float]] = {}
+
+
+def register_streaming_indicator(template: str, factory: Callable[..., Any],
+                                 tolerance: Optional[Tuple[float, float]] = None) -> None:
+    """
+    登錄指標的增量更新器
+
+    Args:
+        template: 與 register_indicator 相同的名稱樣板，例如 "momentum_{n}"
+        factory: factory(**參數) -> 更新器；更新器需有 update(values) 方法並可 pickle，
+                 values 含當筆價格欄位與依賴指標的值
+        tolerance: 無法與全量重算逐位元相同時的容許誤差 (相對誤差, 絕對誤差)，
+                   |增量 - 全量| <= 絕對誤差 + 相對誤差 × |全量|；None 表示必須完全相同
+    """
+    shape = _PARAMETER.sub("{}", template)
+    STREAMING_UPDATERS[shape] = factory
+    if tolerance is None:
+        STREAMING_TOLERANCES.pop(shape, None)
+    else:
+        STREAMING_TOLERANCES[shape] = tolerance
+
+
+def _register_builtin_updaters() -> None:
+    register_streaming_indicator("rolling_max_{n}", lambda n: _Rolling("close", n, max))
+    register_streaming_indicator("rolling_min_{n}", lambda n: _Rolling("close", n, min))
+    register_streaming_indicator("ma_{n}", lambda n: _RollingMean("close", n))
+    register_streaming_indicator("ema_{n}", lambda n: _Ema("close", 2 / (n + 1)))
+    register_streaming_indicator("volume_ma_{n}", lambda n: _RollingMean("trading_volume", n))
+    register_streaming_indicator("is_{n}_day_high", lambda n: _Formula(_equal_flag, ("close", f"rolling_max_{n}")))
+    register_streaming_indicator("break_{n}_day_high", lambda n: _BreakHigh(f"rolling_max_{n}"))
+    register_streaming_indicator("volume_surge", lambda: _Formula(_surge_flag, ("trading_volume", "volume_ma_20")))
+    register_streaming_indicator("volume_ratio_{n}", lambda n: _Formula(_ratio, ("trading_volume", f"volume_ma_{n}")))
+    register_streaming_indicator("ma_bullish", lambda: _Formula(_ascending_flag, ("ma_5", "ma_10", "ma_20")))
+    register_streaming_indicator("ma_bearish", lambda: _Formula(_descending_flag, ("ma_5", "ma_10", "ma_20")))
+    register_streaming_indicator("rsi_{n}", lambda n: _Rsi(n))
+    register_streaming_indicator("macd_{fast}_{slow}",
+                                 lambda fast, slow: _Formula(_difference, (f"ema_{fast}", f"ema_{slow}")))
+    register_streaming_indicator("macd_signal_{fast}_{slow}_{signal}",
+                                 lambda fast, slow, signal: _Ema(f"macd_{fast}_{slow}", 2 / (signal + 1)))
+    register_streaming_indicator("macd_hist_{fast}_{slow}_{signal}",
+                                 lambda fast, slow, signal: _Formula(
+                                     _difference, (f"macd_{fast}_{slow}", f"macd_signal_{fast}_{slow}_{signal}")))
+    register_streaming_indicator("bb_std_{n}", lambda n: _Rolling("close", n, _population_std),
+                                 tolerance=BOLLINGER_TOLERANCE)
+    register_streaming_indicator("bb_upper_{n}_{k}", lambda n, k: _Formula(_band_upper, (f"ma_{n}", f"bb_std_{n}"), (k,)),
+                                 tolerance=BOLLINGER_TOLERANCE)
+    register_streaming_indicator("bb_lower_{n}_{k}", lambda n, k: _Formula(_band_lower, (f"ma_{n}", f"bb_std_{n}"), (k,)),
+                                 tolerance=BOLLINGER_TOLERANCE)
+    register_streaming_indicator("true_range", lambda: _TrueRange())
+    register_streaming_indicator("atr_{n}", lambda n: _Ema("true_range", 1 / n))
+    register_streaming_indicator("rsv_{n}", lambda n: _Rsv(n))
+    register_streaming_indicator("kd_k_{n}", lambda n: _Kd(f"rsv_{n}"))
+    register_streaming_indicator("kd_d_{n}", lambda n: _Kd(f"kd_k_{n}"))
+    register_streaming_indicator("obv", lambda: _Obv())
+    register_streaming_indicator("vwap_{n}", lambda n: _Vwap(n))
+
+
+_register_builtin_updaters()
+
+
+class _StockState:
+    """單一股票的增量狀態：最後處理日期與各指標更新器（依計算順序）"""
+    __slots__ = ("last_date", "updaters")
+
+    def __init__(self, updaters: List[Tuple[str, Any]]):
+        self.last_date = None
+        self.updaters = updaters
+
+
+class StreamingIndicatorEngine:
+    """
+    增量技術指標引擎
+
+    用法：
+        engine = StreamingIndicatorEngine.load(["ma_20", "rsi_14", "macd_hist_12_26_9"])
+        history = engine.update(full_history)   # 第一次以完整歷史建立狀態
+        today = engine.update(new_bars)         # 之後只傳入新 K 棒
+        engine.save()
+    """
+
+    def __init__(self, indicators: List[str], state_dir: str = INDICATOR_STATE_DIR):
+        if isinstance(indicators, str):
+            raise ValueError("請傳入 list，例如 ['ma_20']")
+        required, levels, unknown = _plan_indicators(tuple(indicators))
+        if unknown:
+            raise ValueError(f"不支援的技術指標: {', '.join(unknown)}")
+        self._factories = []
+        unsupported = []
+        for name in (name for level in levels for name in level):
+            spec, params = _parse_indicator(name)
+            factory = STREAMING_UPDATERS.get(spec.shape)
+            if factory is None:
+                unsupported.append(name)
+            else:
+                self._factories.append((name, factory, dict(params)))
+        if unsupported:
+            raise ValueError(f"技術指標未登錄增量更新器: {', '.join(unsupported)}")
+        self.indicators = list(indicators)
+        self.required = required
+        self.inputs = tuple(dict.fromkeys(
+            column for name in required for column in _parse_indicator(name)[0].inputs
+        ))
+        self.state_dir = state_dir.replace('\\', '/')
+        self._states: Dict[Any, _StockState] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def state_path(self) -> str:
+        """狀態檔路徑（依指標組合命名，不同組合互不覆蓋）"""
+        key = hashlib.blake2b("|".join(sorted(self.required)).encode("utf-8"), digest_size=12).hexdigest()
+        return os.path.join(self.state_dir, f"{key}.pkl").replace('\\', '/')
+
+    def _new_state(self) -> _StockState:
+        return _StockState([(name, factory(**params)) for name, factory, params in self._factories])
+
+    def update(self, new_bars: pl.DataFrame) -> pl.DataFrame:
+        """
+        以新 K 棒推進各股狀態並回傳其指標欄位
+
+        日期不晚於該股最後處理日期的 K 棒視為已處理並略過（重跑同一天不會重複累加）
+
+        Args:
+            new_bars: 新 K 棒（可含多檔股票，需含指標使用的價格欄位）
+
+        Returns:
+            pl.DataFrame: 實際處理的 K 棒 + 指標欄位（欄位順序與 generate_indicators 相同）
+        """
+        missing = [column for column in ("date",) + self.inputs if column not in new_bars.columns]
+        if missing:
+            raise ValueError(f"缺少價格欄位: {', '.join(missing)}")
+        null_columns = [column for column in self.inputs if new_bars[column].null_count() > 0]
+        if null_columns:
+            raise ValueError(f"價格欄位含空值，無法增量計算: {', '.join(null_columns)}")
+
+        bars = _sort_for_indicators(new_bars)
+        schema = generate_indicators(bars.clear(), self.indicators, use_cache=False).schema
+        names = [name for name, _, _ in self._factories]
+        results: Dict[str, list] = {name: [] for name in names}
+        keep = []
+        stock_ids = bars["stock_id"].to_list() if "stock_id" in bars.columns else [None] * len(bars)
+
+        with self._lock:
+            for stock_id, date, row in zip(stock_ids, bars["date"].to_list(), bars.select(self.inputs).rows()):
+                state = self._states.get(stock_id)
+                if state is None:
+                    state = self._states[stock_id] = self._new_state()
+                elif date <= state.last_date:
+                    keep.append(False)
+                    continue
+                values = dict(zip(self.inputs, row))
+                for name, updater in state.updaters:
+                    values[name] = updater.update(values)
+                    results[name].append(values[name])
+                state.last_date = date
+                keep.append(True)
+
+        skipped = len(keep) - sum(keep)
+        if skipped:
+            logger.info("略過 %d 筆已處理的 K 棒", skipped)
+            bars = bars.filter(pl.Series(keep))
+        output_columns = bars.columns + [name for name in self.required if name not in bars.columns]
+        bars = bars.with_columns([pl.Series(name, results[name]).cast(schema[name]) for name in self.required])
+        return bars.select(output_columns)
+
+    def verify(self, history: pl.DataFrame) -> Dict[str, float]:
+        """
+        以全量重算（generate_indicators）核對增量計算的結果（使用獨立的空狀態，不影響本引擎的狀態）
+
+        未登錄容許誤差的指標必須完全相同（NaN 與 NaN、空值與空值視為相同），
+        其餘依 STREAMING_TOLERANCES 的 (相對誤差, 絕對誤差) 比較
+
+        Args:
+            history: 完整歷史 K 棒
+
+        Returns:
+            Dict[str, float]: 超出容許誤差的指標與其最大絕對差異（空字典表示全部相符）
+        """
+        streamed = StreamingIndicatorEngine(self.indicators, self.state_dir).update(history)
+        recomputed = generate_indicators(_sort_for_indicators(history), self.indicators, use_cache=False)
+        mismatched = {}
+        for name in self.required:
+            relative, absolute = STREAMING_TOLERANCES.get(_parse_indicator(name)[0].shape, (0.0, 0.0))
+            left = streamed[name].cast(pl.Float64).to_numpy()
+            right = recomputed[name].cast(pl.Float64).to_numpy()
+            with np.errstate(invalid="ignore"):
+                same = (left == right) | (np.isnan(left) & np.isnan(right))
+                difference = np.abs(left - right)
+                within = same | (difference <= absolute + relative * np.abs(right))
+            if not within.all():
+                mismatched[name] = float(np.nanmax(np.where(within, 0.0, difference)))
+        if mismatched:
+            logger.warning("增量指標與全量重算不符: %s", mismatched)
+        return mismatched
+
+    def last_dates(self) -> Dict[Any, Any]:
+        """各股最後處理的日期"""
+        return {stock_id: state.last_date for stock_id, state in self._states.items()}
+
+    def reset(self, stock_ids: Optional[List[Any]] = None) -> None:
+        """清除狀態（未指定股票時全部清除），之後需重新以完整歷史建立"""
+        with self._lock:
+            if stock_ids is None:
+                self._states.clear()
+            else:
+                for stock_id in stock_ids:
+                    self._states.pop(stock_id, None)
+
+    def save(self) -> str:
+        """將狀態寫入磁碟（先寫暫存檔再取代，避免中斷時留下不完整的檔案）"""
+        path = self.state_path
+        os.makedirs(self.state_dir, exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            payload = {"version": STATE_VERSION, "indicators": self.required, "states": self._states}
+            with open(temp_path, 'wb') as f:
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, indicators: List[str], state_dir: str = INDICATOR_STATE_DIR) -> "StreamingIndicatorEngine":
+        """建立引擎並載入已保存的狀態（沒有或無法讀取時從空狀態開始）"""
+        engine = cls(indicators, state_dir)
+        path = engine.state_path
+        if not os.path.exists(path):
+            return engine
+        try:
+            with open(path, 'rb') as f:
+                payload = pickle.load(f)
+            if payload.get("version") != STATE_VERSION or tuple(payload.get("indicators", ())) != engine.required:
+                logger.warning("增量指標狀態版本或指標不符，重新建立: %s", path)
+                return engine
+            engine._states = payload["states"]
+        except Exception as e:
+            logger.warning("讀取增量指標狀態失敗 %s: %s", path, e)
+        return engine
@@ -1,101 +1,305 @@
+"""
+技術指標引擎
+
+指標以登錄表（registry）宣告：名稱樣板（例如 ma_{n}）、依賴指標、使用的價格欄位與 Polars 運算式產生函數。
+generate_indicators 解析指標名稱、展開依賴 DAG 並依深度分層，同一層的欄位在同一次 with_columns 計算：
+- 名稱解析以「數字參數換成 {}」後的形狀查表（O(1)），不對每個樣板逐一 re.fullmatch
+- 共用的依賴欄位（例如 ma_20 同時被布林通道與 ma_bullish 使用）只計算一次
+- 解析結果與運算式以 lru_cache 保存，重複呼叫的規劃成本為常數
+- 計算結果以 indicator_cache 記憶化（見 core/indicator_cache.py）
+- 每日新增 K 棒的增量更新見 core/streaming_indicators.py
+
+內建指標：
+    rolling_max_{n}、rolling_min_{n}、ma_{n}、ema_{n}、volume_ma_{n}、is_{n}_day_high、break_{n}_day_high、
+    volume_surge、volume_ratio_{n}、ma_bullish、ma_bearish、rsi_{n}、macd_{fast}_{slow}、macd_signal_{fast}_{slow}_{signal}、
+    macd_hist_{fast}_{slow}_{signal}、bb_std_{n}、bb_upper_{n}_{k}、bb_lower_{n}_{k}、true_range、atr_{n}、
+    rsv_{n}、kd_k_{n}、kd_d_{n}、obv、vwap_{n}
+"""
+
 import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
 import polars as pl
+from core.indicator_cache import indicator_cache
+from core.logger import get_logger
+
+logger = get_logger("technical_indicators.py")
+
+# 指標計算會用到的價格欄位（快取指紋只涵蓋這些欄位）
+INDICATOR_INPUT_COLUMNS = ("stock_id", "date", "open", "high", "low", "close", "trading_volume")
+
+_PARAMETER = re.compile(r"\{(\w+)\}")
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+@dataclass(frozen=True)
+class IndicatorSpec:
+    """技術指標宣告"""
+    template: str                                 # 名稱樣板，例如 "macd_signal_{fast}_{slow}_{signal}"
+    build: Callable[..., pl.Expr]                 # 以參數產生（單一股票內的）Polars 運算式
+    dependencies: Tuple[str, ...] = ()            # 依賴的指標名稱樣板（以相同參數展開）
+    inputs: Tuple[str, ...] = ("close",)          # 使用的價格欄位
+    per_stock: bool = True                        # 是否需在每檔股票內計算（rolling/shift/ewm 等）
+
+    @property
+    def params(self) -> Tuple[str, ...]:
+        return tuple(_PARAMETER.findall(self.template))
+
+    @property
+    def shape(self) -> str:
+        return _PARAMETER.sub("{}", self.template)
+
+
+# 名稱形狀 -> 指標宣告
+INDICATOR_REGISTRY: Dict[str, IndicatorSpec] = {}
+
+
+def register_indicator(template: str, build: Callable[..., pl.Expr], dependencies: Tuple[str, ...] = (),
+                       inputs: Tuple[str, ...] = ("close",), per_stock: bool = True) -> IndicatorSpec:
+    """
+    登錄技術指標
+
+    Args:
+        template: 名稱樣板，參數以 {名稱} 表示且須為數字，例如 "ma_{n}"
+        build: build(**參數) -> pl.Expr，可直接以 pl.col 引用價格欄位與依賴指標欄位
+        dependencies: 依賴的指標名稱樣板，例如 ("ma_{n}", "bb_std_{n}")
+        inputs: 使用的價格欄位
+        per_stock: True 時多股票資料以 over("stock_id") 分股計算
+
+    範例：
+        register_indicator("momentum_{n}", lambda n: pl.col("close") - pl.col("close").shift(n))
+    """
+    spec = IndicatorSpec(template, build, tuple(dependencies), tuple(inputs), per_stock)
+    INDICATOR_REGISTRY[spec.shape] = spec
+    # 登錄表變動後規劃結果失效
+    _parse_indicator.cache_clear()
+    _plan_indicators.cache_clear()
+    _indicator_expression.cache_clear()
+    return spec
+
+
+@lru_cache(maxsize=4096)
+def _parse_indicator(name: str) -> Optional[Tuple[IndicatorSpec, Tuple[Tuple[str, float], ...]]]:
+    """將指標名稱解析為 (宣告, 參數)，例如 macd_12_26 -> (macd_{fast}_{slow}, (("fast", 12), ("slow", 26)))"""
+    tokens = name.split("_")
+    values = [token for token in tokens if _NUMBER.fullmatch(token)]
+    shape = "_".join("{}" if _NUMBER.fullmatch(token) else token for token in tokens)
+    spec = INDICATOR_REGISTRY.get(shape)
+    if spec is None:
+        return None
+    numbers = tuple(float(value) if "." in value else int(value) for value in values)
+    return spec, tuple(zip(spec.params, numbers))
+
+
+@lru_cache(maxsize=1024)
+def _plan_indicators(names: Tuple[str, ...]) -> Tuple[Tuple[str, ...], Tuple[Tuple[str, ...], ...], Tuple[str, ...]]:
+    """
+    展開依賴 DAG 並依深度分層
+
+    Returns:
+        (所有需要的指標（依賴收集順序）, 每一層的指標（同層互不依賴）, 無法辨識的名稱)
+    """
+    order: Dict[str, None] = {}
+    depth: Dict[str, int] = {}
+    unknown: List[str] = []
+    visiting = set()
 
-def generate_indicators(df: pl.DataFrame, indicators: list[str]) -> pl.DataFrame:
+    def visit(name: str) -> int:
+        if name in depth:
+            return depth[name]
+        parsed = _parse_indicator(name)
+        if parsed is None:
+            unknown.append(name)
+            return -1
+        if name in visiting:
+            raise ValueError(f"技術指標依賴形成循環: {name}")
+        visiting.add(name)
+        order[name] = None
+        spec, params = parsed
+        values = dict(params)
+        level = 0
+        for template in spec.dependencies:
+            level = max(level, visit(template.format(**values)) + 1)
+        visiting.discard(name)
+        depth[name] = level
+        return level
+
+    for name in names:
+        visit(name)
+    levels: List[List[str]] = [[] for _ in range(max(depth.values(), default=-1) + 1)]
+    for name in order:
+        levels[depth[name]].append(name)
+    return tuple(order), tuple(tuple(level) for level in levels), tuple(dict.fromkeys(unknown))
+
+
+@lru_cache(maxsize=4096)
+def _indicator_expression(name: str, per_stock: bool) -> pl.Expr:
+    """產生指標欄位的運算式（多股票資料以 over("stock_id") 分股計算）"""
+    spec, params = _parse_indicator(name)
+    expr = spec.build(**dict(params))
+    if per_stock and spec.per_stock:
+        expr = expr.over("stock_id")
+    return expr.alias(name)
+
+
+def _sort_for_indicators(df: pl.DataFrame) -> pl.DataFrame:
+    """
+    依 (stock_id, date) 排序，讓每檔股票的列連續且依日期排列
+
+    已符合時不排序；只依 date 排序會打散多股票資料中各股的列，因此一律以 stock_id 為第一鍵
+    """
+    if "stock_id" not in df.columns:
+        return df if df["date"].is_sorted() else df.sort("date")
+    new_stock = pl.col("stock_id") != pl.col("stock_id").shift(1)
+    dates_ordered = df.select(
+        ((pl.col("date") >= pl.col("date").shift(1)) | new_stock | new_stock.is_null()).all()
+    ).item()
+    # stock_id 已排序時必定分組連續，不必計算 n_unique
+    grouped = dates_ordered and (df["stock_id"].is_sorted() or df.select(
+        new_stock.fill_null(True).sum() == pl.col("stock_id").n_unique()
+    ).item())
+    return df if grouped else df.sort(["stock_id", "date"])
+
+
+def generate_indicators(df: pl.DataFrame, indicators: list[str], use_cache: bool = True) -> pl.DataFrame:
+    """
+    產生技術指標欄位
+
+    資料依 (stock_id, date) 排序一次；已計算過的指標欄位以「價格欄位指紋 + 指標名稱」從 indicator_cache
+    取回後直接接回（不重新計算），其餘欄位依依賴深度分層，每層一次 with_columns
+
+    Args:
+        df: 股價資料（可含多檔股票）
+        indicators: 指標名稱，例如 ['break_20_day_high', 'ma_5', 'rsi_14']
+        use_cache: 是否使用指標快取
+    """
     if isinstance(indicators, str):
         raise ValueError("請傳入 list，例如 ['break_20_day_high']")
 
-    # 轉日期欄位格式並排序
-    # if df["date"].dtype != pl.Date:
-    #     df = df.with_columns([
-    #         pl.col("date").str.strptime(pl.Date, format="%Y/%m/%d").alias("date")
-    #     ])
-    df = df.sort("date")
-    
-    # 擴展依賴關係
-    indicator_dependencies = {
-        "rolling_max_{n}": [],
-        "rolling_min_{n}": [],
-        "ma_{n}": [],
-        "is_{n}_day_high": ["rolling_max_{n}"],
-        "break_{n}_day_high": ["rolling_max_{n}", "is_{n}_day_high"],
-        "volume_ma_{n}": [],
-        "volume_surge": ["volume_ma_20"],  # 暫定只支援 20 日
-        "ma_bullish": ["ma_5", "ma_10", "ma_20"],
-        "ma_bearish": ["ma_5", "ma_10", "ma_20"],
-    }
-
-    def parse_indicator_pattern(indicator: str):
-        """
-        將例如 break_20_day_high 拆成 base = 'break_{n}_day_high', n = 20
-        """
-        for base in indicator_dependencies:
-            pattern = base.replace("{n}", r"(\d+)")
-            match = re.fullmatch(pattern, indicator)
-            if match:
-                return base, int(match.group(1))
-        return indicator, None  # 若無參數化的版本，回傳原名與 None
-    
-    # 收集所有依賴欄位，含展開 {n}
-    required = set()
-    def collect_dependencies(indicator_list):
-        for indicator in indicator_list:
-            base, n = parse_indicator_pattern(indicator)
-            key = base.format(n=n) if n is not None else base
-            if key not in required:
-                required.add(key)
-                deps = indicator_dependencies.get(base, [])
-                collect_dependencies([d.format(n=n) if "{n}" in d else d for d in deps])
-         
-        return required
-    
-    required = collect_dependencies(indicators)
-    
-    # 建立對應欄位
-    with_cols = []
-
-    for col in required:
-        if match := re.fullmatch(r"rolling_max_(\d+)", col):
-            n = int(match.group(1))
-            with_cols.append(pl.col("close").rolling_max(n, min_periods=1).over("stock_id").alias(col))
-
-        elif match := re.fullmatch(r"rolling_min_(\d+)", col):
-            n = int(match.group(1))
-            with_cols.append(pl.col("close").rolling_min(n, min_periods=1).over("stock_id").alias(col))
-
-        elif match := re.fullmatch(r"ma_(\d+)", col):
-            n = int(match.group(1))
-            with_cols.append(pl.col("close").rolling_mean(n, min_periods=1).over("stock_id").alias(col))
-
-        elif match := re.fullmatch(r"volume_ma_(\d+)", col):
-            n = int(match.group(1))
-            with_cols.append(pl.col("trading_volume").rolling_mean(n, min_periods=1).over("stock_id").alias(col))
-    
-    df = df.with_columns(with_cols)
-
-    # === 推導欄位 ===
-    derived_cols = []
-
-    for col in required:
-        if match := re.fullmatch(r"is_(\d+)_day_high", col):
-            n = int(match.group(1))
-            derived_cols.append((pl.col("close") == pl.col(f"rolling_max_{n}")).cast(pl.Int8).alias(col))
-
-        elif match := re.fullmatch(r"break_(\d+)_day_high", col):
-            n = int(match.group(1))
-            derived_cols.append(((pl.col("close") > pl.col(f"rolling_max_{n}").shift(1)) &
-                                 pl.col(f"rolling_max_{n}").shift(1).is_not_null()).cast(pl.Int8).alias(col))
-
-        elif col == "volume_surge":
-            derived_cols.append((pl.col("trading_volume") > pl.col("volume_ma_20") * 1.5)
-                                 .cast(pl.Int8).alias(col))
-
-        elif col == "ma_bullish":
-            derived_cols.append(((pl.col("ma_5") > pl.col("ma_10")) & (pl.col("ma_10") > pl.col("ma_20")))
-                                 .cast(pl.Int8).alias(col))
-
-        elif col == "ma_bearish":
-            derived_cols.append(((pl.col("ma_5") < pl.col("ma_10")) & (pl.col("ma_10") < pl.col("ma_20")))
-                                 .cast(pl.Int8).alias(col))
-            
-    return df.with_columns(derived_cols)
+    df = _sort_for_indicators(df)
+    required, levels, unknown = _plan_indicators(tuple(indicators))
+    if unknown:
+        logger.warning("不支援的技術指標，略過: %s", ", ".join(unknown))
+    # 輸出欄位順序：原有欄位 + 依賴收集順序（快取命中與否都相同）
+    output_columns = df.columns + [name for name in required if name not in df.columns]
+
+    # 從快取取回已計算的欄位，只計算其餘欄位
+    fingerprint = indicator_cache.fingerprint(df, INDICATOR_INPUT_COLUMNS) if use_cache else None
+    cached = indicator_cache.get_many(fingerprint, required) if use_cache else {}
+    if cached:
+        df = df.with_columns(list(cached.values()))
+    per_stock = "stock_id" in df.columns
+    computed = []
+    for level in levels:
+        expressions = [_indicator_expression(name, per_stock) for name in level if name not in cached]
+        if expressions:
+            df = df.with_columns(expressions)
+            computed.extend(name for name in level if name not in cached)
+    if use_cache and computed:
+        indicator_cache.set_many(fingerprint, {name: df[name] for name in computed})
+    return df.select(output_columns)
+
+
+# ===== 內建指標 =====
+def _wilder_mean(expr: pl.Expr, n: int) -> pl.Expr:
+    """Wilder 平滑（alpha = 1/n 的 EMA）"""
+    return expr.ewm_mean(alpha=1 / n, adjust=False)
+
+
+def _rsi(n: int) -> pl.Expr:
+    change = pl.col("close").diff().fill_null(0.0)
+    gain = _wilder_mean(change.clip(lower_bound=0.0), n)
+    loss = _wilder_mean((-change).clip(lower_bound=0.0), n)
+    return (
+        pl.when(loss == 0)
+        .then(pl.when(gain == 0).then(50.0).otherwise(100.0))
+        .otherwise(100.0 - 100.0 / (1.0 + gain / loss))
+    )
+
+
+def _kd_smoothing(column: str) -> pl.Expr:
+    """
+    台灣慣用 KD 平滑：K = 2/3 × 前一日 K + 1/3 × RSV，起始值 50
+
+    以 adjust=False 的 EMA（起始值為第一筆）加上起始值差異的指數衰減項 (2/3)^(t+1) × (50 - 第一筆) 得到
+    """
+    value = pl.col(column)
+    decay = pl.lit(2.0 / 3.0).pow(pl.int_range(1, pl.count() + 1).cast(pl.Float64))
+    return value.ewm_mean(alpha=1.0 / 3.0, adjust=False) + decay * (50.0 - value.first())
+
+
+def _register_builtin_indicators() -> None:
+    close, volume = pl.col("close"), pl.col("trading_volume")
+    # 滾動視窗
+    register_indicator("rolling_max_{n}", lambda n: close.rolling_max(n, min_periods=1))
+    register_indicator("rolling_min_{n}", lambda n: close.rolling_min(n, min_periods=1))
+    register_indicator("ma_{n}", lambda n: close.rolling_mean(n, min_periods=1))
+    register_indicator("ema_{n}", lambda n: close.ewm_mean(span=n, adjust=False))
+    register_indicator("volume_ma_{n}", lambda n: volume.rolling_mean(n, min_periods=1), inputs=("trading_volume",))
+    # 新高與均線排列
+    register_indicator("is_{n}_day_high", lambda n: (close == pl.col(f"rolling_max_{n}")).cast(pl.Int8),
+                       dependencies=("rolling_max_{n}",), per_stock=False)
+    # 前一日高點在同一檔股票內位移，避免跨股票取到上一檔的最後一列
+    register_indicator("break_{n}_day_high",
+                       lambda n: ((close > pl.col(f"rolling_max_{n}").shift(1)) &
+                                  pl.col(f"rolling_max_{n}").shift(1).is_not_null()).cast(pl.Int8),
+                       dependencies=("rolling_max_{n}", "is_{n}_day_high"))
+    register_indicator("volume_surge", lambda: (volume > pl.col("volume_ma_20") * 1.5).cast(pl.Int8),
+                       dependencies=("volume_ma_20",), inputs=("trading_volume",), per_stock=False)  # 暫定只支援 20 日
+    register_indicator("volume_ratio_{n}", lambda n: volume / pl.col(f"volume_ma_{n}"),
+                       dependencies=("volume_ma_{n}",), inputs=("trading_volume",), per_stock=False)
+    register_indicator("ma_bullish",
+                       lambda: ((pl.col("ma_5") > pl.col("ma_10")) & (pl.col("ma_10") > pl.col("ma_20"))).cast(pl.Int8),
+                       dependencies=("ma_5", "ma_10", "ma_20"), per_stock=False)
+    register_indicator("ma_bearish",
+                       lambda: ((pl.col("ma_5") < pl.col("ma_10")) & (pl.col("ma_10") < pl.col("ma_20"))).cast(pl.Int8),
+                       dependencies=("ma_5", "ma_10", "ma_20"), per_stock=False)
+    # RSI（Wilder）
+    register_indicator("rsi_{n}", _rsi)
+    # MACD：DIF = EMA(fast) - EMA(slow)，訊號線 = DIF 的 EMA(signal)，柱狀體 = DIF - 訊號線
+    register_indicator("macd_{fast}_{slow}", lambda fast, slow: pl.col(f"ema_{fast}") - pl.col(f"ema_{slow}"),
+                       dependencies=("ema_{fast}", "ema_{slow}"), per_stock=False)
+    register_indicator("macd_signal_{fast}_{slow}_{signal}",
+                       lambda fast, slow, signal: pl.col(f"macd_{fast}_{slow}").ewm_mean(span=signal, adjust=False),
+                       dependencies=("macd_{fast}_{slow}",))
+    register_indicator("macd_hist_{fast}_{slow}_{signal}",
+                       lambda fast, slow, signal: pl.col(f"macd_{fast}_{slow}") - pl.col(f"macd_signal_{fast}_{slow}_{signal}"),
+                       dependencies=("macd_{fast}_{slow}", "macd_signal_{fast}_{slow}_{signal}"), per_stock=False)
+    # 布林通道（母體標準差）
+    register_indicator("bb_std_{n}", lambda n: close.rolling_std(n, min_periods=1, ddof=0))
+    register_indicator("bb_upper_{n}_{k}", lambda n, k: pl.col(f"ma_{n}") + k * pl.col(f"bb_std_{n}"),
+                       dependencies=("ma_{n}", "bb_std_{n}"), per_stock=False)
+    register_indicator("bb_lower_{n}_{k}", lambda n, k: pl.col(f"ma_{n}") - k * pl.col(f"bb_std_{n}"),
+                       dependencies=("ma_{n}", "bb_std_{n}"), per_stock=False)
+    # ATR（Wilder）
+    previous_close = close.shift(1)
+    register_indicator("true_range",
+                       lambda: pl.max_horizontal(pl.col("high") - pl.col("low"),
+                                                 (pl.col("high") - previous_close).abs(),
+                                                 (pl.col("low") - previous_close).abs()),
+                       inputs=("high", "low", "close"))
+    register_indicator("atr_{n}", lambda n: _wilder_mean(pl.col("true_range"), n),
+                       dependencies=("true_range",), inputs=("high", "low", "close"))
+    # KD（RSV 區間高低價相同時視為 50）
+    register_indicator("rsv_{n}",
+                       lambda n: pl.when(pl.col("high").rolling_max(n, min_periods=1) > pl.col("low").rolling_min(n, min_periods=1))
+                       .then((close - pl.col("low").rolling_min(n, min_periods=1)) /
+                             (pl.col("high").rolling_max(n, min_periods=1) - pl.col("low").rolling_min(n, min_periods=1)) * 100.0)
+                       .otherwise(50.0),
+                       inputs=("high", "low", "close"))
+    register_indicator("kd_k_{n}", lambda n: _kd_smoothing(f"rsv_{n}"), dependencies=("rsv_{n}",),
+                       inputs=("high", "low", "close"))
+    register_indicator("kd_d_{n}", lambda n: _kd_smoothing(f"kd_k_{n}"), dependencies=("kd_k_{n}",),
+                       inputs=("high", "low", "close"))
+    # 量能
+    register_indicator("obv", lambda: (close.diff().sign().fill_null(0) * volume).cum_sum(),
+                       inputs=("close", "trading_volume"))
+    typical_price = (pl.col("high") + pl.col("low") + close) / 3.0
+    register_indicator("vwap_{n}",
+                       lambda n: (typical_price * volume).rolling_sum(n, min_periods=1) / volume.rolling_sum(n, min_periods=1),
+                       inputs=("high", "low", "close", "trading_volume"))
+
+
+_register_builtin_indicators()
@@ -200,7 +200,54 @@ class Utils:
     def chunk_list(lst: List, chunk_size: int) -> List[List]:
         """將列表分割成指定大小的塊"""
         return [lst[i:i + chunk_size] for i in range(0, len(lst), chunk_size)]
-    
+
+    @staticmethod
+    def stock_row_ranges(data: pl.DataFrame, column: str = "stock_id") -> Tuple[pl.DataFrame, List[Tuple[Any, int, int]]]:
+        """
+        計算多股票資料中每檔股票的連續列區間
+
+        資料已依股票分組排列時直接以 run-length 計算區間（不複製資料）；
+        否則先以一次 gather 將同一股票的列集中，股票依首次出現順序、股票內保留原本的列順序
+        （與逐股 filter 的結果相同）。
+
+        Returns:
+            Tuple[pl.DataFrame, List[Tuple[Any, int, int]]]: (分組後資料, [(stock_id, 起始列, 列數)])
+        """
+        if len(data) == 0:
+            return data, []
+        runs = data[column].rle().struct.unnest()
+        if len(runs) != data[column].n_unique():
+            row_column = "__row_nr"
+            order = data.with_row_count(row_column).group_by(column, maintain_order=True) \
+                .agg(pl.col(row_column))[row_column].explode()
+            data = data[order]
+            runs = data[column].rle().struct.unnest()
+        ranges = []
+        offset = 0
+        for length, stock_id in zip(runs["lengths"].to_list(), runs["values"].to_list()):
+            ranges.append((stock_id, offset, length))
+            offset += length
+        return data, ranges
+
+    @staticmethod
+    def partition_by_stock(data: pl.DataFrame, stock_ids: List[Any] = None, column: str = "stock_id") -> Dict[Any, pl.DataFrame]:
+        """
+        將多股票資料切分為 {stock_id: 單股資料}
+
+        以 stock_row_ranges 取得各股票列區間後用 slice 取出（零複製），取代對每檔股票各 filter 一次整份資料。
+
+        Args:
+            data: 多股票資料
+            stock_ids: 要取出的股票代碼（依字串比對）；提供時沒有資料的股票會對應到空的 DataFrame
+            column: 股票代碼欄位
+        """
+        sorted_data, ranges = Utils.stock_row_ranges(data, column)
+        partitions = {stock_id: sorted_data.slice(offset, length) for stock_id, offset, length in ranges}
+        if stock_ids is None:
+            return partitions
+        by_text = {str(stock_id): frame for stock_id, frame in partitions.items()}
+        return {stock_id: by_text.get(str(stock_id), data.clear()) for stock_id in stock_ids}
+
     @staticmethod
     async def async_read_file(file_path: str) -> str:
         """非同步讀取檔案"""
@@ -234,43 +281,17 @@ class Utils:
     
     @staticmethod
     def calculate_drawdown(equity_curve: List[float]) -> Dict[str, float]:
-        """計算回撤"""
+        """計算回撤（委派給向量化績效指標模組）"""
         if not equity_curve:
             return {}
-        
-        peak = equity_curve[0]
-        max_drawdown = 0
-        max_drawdown_pct = 0
-        
-        for value in equity_curve:
-            if value > peak:
-                peak = value
-            
-            drawdown = peak - value
-            drawdown_pct = drawdown / peak if peak > 0 else 0
-            
-            if drawdown > max_drawdown:
-                max_drawdown = drawdown
-                max_drawdown_pct = drawdown_pct
-        
-        return {
-            'max_drawdown': max_drawdown,
-            'max_drawdown_pct': max_drawdown_pct
-        }
+        from core.metrics import PerformanceMetrics
+        return PerformanceMetrics.drawdown(equity_curve)
     
     @staticmethod
     def calculate_sharpe_ratio(returns: List[float], risk_free_rate: float = 0.02) -> float:
-        """計算夏普比率"""
-        if not returns:
-            return 0.0
-        
-        returns_array = np.array(returns)
-        excess_returns = returns_array - risk_free_rate / 252  # 日化無風險利率
-        
-        if np.std(excess_returns) == 0:
-            return 0.0
-        
-        return np.mean(excess_returns) / np.std(excess_returns) * np.sqrt(252)
+        """計算夏普比率（委派給向量化績效指標模組）"""
+        from core.metrics import PerformanceMetrics
+        return PerformanceMetrics.sharpe_ratio(returns, risk_free_rate)
     
     @staticmethod
     def format_number(number: float, decimal_places: int = 2) -> str:
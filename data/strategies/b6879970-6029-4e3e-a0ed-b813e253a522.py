@@ -49,18 +49,9 @@ df = df.with_columns([
     .alias("base_price")
 ])
 df = df.with_columns([
-    pl.Series("up_limit_price", [
-        PriceUtils.calculate_limit_price(p, up_limit_rate) if p is not None else None
-        for p in df["base_price"]
-    ]),
-    pl.Series("down_limit_price", [
-        PriceUtils.calculate_limit_price(p, down_limit_rate) if p is not None else None
-        for p in df["base_price"]
-    ]),
-    pl.Series("shares", [
-        PriceUtils.calculate_shares(1000000, p, parameters['share_type']) if p is not None else None
-        for p in df["entry_price"]
-    ])
+    PriceUtils.calculate_limit_price_expr("base_price", up_limit_rate).alias("up_limit_price"),
+    PriceUtils.calculate_limit_price_expr("base_price", down_limit_rate).alias("down_limit_price"),
+    PriceUtils.calculate_shares_expr(1000000, "entry_price", parameters['share_type']).alias("shares")
 ])
 
 df = df.with_columns([
@@ -71,18 +71,9 @@ def calculate_entry_signals(stock_data, excel_pl_df, **kwargs):
           .alias("base_price")
     ])
     df = df.with_columns([
-        pl.Series("up_limit_price", [
-            PriceUtils.calculate_limit_price(p, up_limit_rate) if p is not None else None
-            for p in df["base_price"]
-        ]),
-        pl.Series("down_limit_price", [
-            PriceUtils.calculate_limit_price(p, down_limit_rate) if p is not None else None
-            for p in df["base_price"]
-        ]),
-        pl.Series("shares", [
-            PriceUtils.calculate_shares(self.parameters['initial_capital'], p, self.parameters['share_type']) if p is not None else None
-            for p in df["entry_price"]
-        ])
+        PriceUtils.calculate_limit_price_expr("base_price", up_limit_rate).alias("up_limit_price"),
+        PriceUtils.calculate_limit_price_expr("base_price", down_limit_rate).alias("down_limit_price"),
+        PriceUtils.calculate_shares_expr(self.parameters['initial_capital'], "entry_price", self.parameters['share_type']).alias("shares")
     ])
     
     return df
@@ -18,6 +18,7 @@ from config.trading_config import TradingConfig
 from config.api_config import APIConfig
 from core.utils import Utils
 from core.cache_manager import cache_manager
+from core.job_manager import job_manager
 from strategies.strategy_manager import StrategyManager
 from core.data_provider import DataProvider
 from core.stock_list_manager import StockListManager
@@ -61,6 +62,7 @@ async def startup_event():
         app.state.data_provider = DataProvider()
         app.state.stock_list_manager = StockListManager()
         app.state.cache_manager = cache_manager
+        app.state.job_manager = job_manager
         
         print_log("FastAPI 啟動事件：所有管理器初始化成功")
         
@@ -69,6 +71,15 @@ async def startup_event():
         print_log(f"錯誤詳情: {traceback.format_exc()}")
         raise
 
+# FastAPI 關閉事件 - 取消背景工作並釋放回測行程池與圖表執行緒池
+@app.on_event("shutdown")
+async def shutdown_event():
+    from strategies.process_executor import shutdown_executor
+    from api.chart_api import shutdown_render_executor
+    job_manager.shutdown()
+    shutdown_executor()
+    shutdown_render_executor()
+
 # 註冊路由
 app.include_router(pages_router)
 app.include_router(api_router)
@@ -19,6 +19,7 @@ from api.chart_api import ChartAPI
 from api.sample_data_api import SampleDataAPI
 from api.stock_list_api import StockListAPI
 from api.jupyter_api import JupyterAPI
+from api.job_api import JobAPI
 from config.trading_config import TradingConfig
 
 # 建立路由器
@@ -80,6 +81,16 @@ async def test_custom_strategy(
 ):
     return await StrategyAPI.test_custom_strategy(strategy_id, code, strategy_table, excel_file, request)
 
+@router.post("/api/strategies/custom/test/jobs")
+async def submit_custom_strategy_test_job(
+    strategy_id: str = Form(...),
+    code: str = Form(...),
+    strategy_table: str = Form(...),
+    excel_file: Optional[UploadFile] = File(None),
+    request: Request = None
+):
+    return await StrategyAPI.submit_test_job(strategy_id, code, strategy_table, excel_file, request)
+
 @router.post("/api/strategies/custom/test-excel")
 async def test_custom_strategy_with_excel(
     strategy_id: str = Form(...),
@@ -140,6 +151,64 @@ async def execute_backtest(
         start_year, end_year, request
     )
 
+@router.post("/api/backtest/jobs")
+async def submit_backtest_job(
+    excel_file: Optional[UploadFile] = File(None),
+    strategy_id: str = Form(...),
+    stock_source: str = Form(...),
+    price_source: str = Form(...),
+    initial_capital: float = Form(...),
+    manual_stock_ids: Optional[str] = Form(None),
+    start_date: Optional[str] = Form(None),
+    end_date: Optional[str] = Form(None),
+    start_year: Optional[str] = Form(None),
+    end_year: Optional[str] = Form(None),
+    request: Request = None
+):
+    return await BacktestAPI.submit_backtest_job(
+        excel_file, strategy_id, stock_source, price_source, 
+        initial_capital, manual_stock_ids, start_date, end_date, 
+        start_year, end_year, request
+    )
+
+@router.post("/api/backtest/sweep")
+async def submit_parameter_sweep(
+    excel_file: Optional[UploadFile] = File(None),
+    strategy_id: str = Form(...),
+    stock_source: str = Form(...),
+    price_source: str = Form(...),
+    initial_capital: float = Form(...),
+    manual_stock_ids: Optional[str] = Form(None),
+    start_date: Optional[str] = Form(None),
+    end_date: Optional[str] = Form(None),
+    start_year: Optional[str] = Form(None),
+    end_year: Optional[str] = Form(None),
+    sweep_config: str = Form(...),
+    request: Request = None
+):
+    return await BacktestAPI.submit_parameter_sweep(
+        excel_file, strategy_id, stock_source, price_source, 
+        initial_capital, manual_stock_ids, start_date, end_date, 
+        start_year, end_year, sweep_config, request
+    )
+
+# 背景工作API路由
+@router.get("/api/jobs")
+async def list_jobs():
+    return await JobAPI.list_jobs()
+
+@router.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    return await JobAPI.get_job(job_id)
+
+@router.delete("/api/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    return await JobAPI.cancel_job(job_id)
+
+@router.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    return await JobAPI.stream_job_events(job_id)
+
 @router.post("/api/backtest/export-excel")
 async def export_backtest_excel(request: Request):
     return await BacktestAPI.export_backtest_excel(request)
@@ -173,6 +242,19 @@ async def get_complete_trade_data(request: Request):
 async def generate_charts(request: Request):
     return await ChartAPI.generate_charts(request)
 
+@router.get("/api/backtest/charts/{chart_key}/{chart_type}")
+async def get_backtest_chart(chart_key: str, chart_type: str):
+    return await ChartAPI.get_backtest_chart(chart_key, chart_type)
+
+@router.get("/api/backtest/equity-curve/{result_key}")
+async def get_equity_curve(result_key: str, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                           max_points: Optional[int] = None):
+    return await BacktestAPI.get_equity_curve(result_key, start_date, end_date, max_points)
+
+@router.post("/api/backtest/chart-data")
+async def get_chart_data(request: Request):
+    return await ChartAPI.get_chart_data(request)
+
 # 範例資料API路由
 @router.get("/api/sample-data/types")
 async def get_sample_data_types(request: Request):
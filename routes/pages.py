@@ -5,8 +5,11 @@
 包含所有頁面的路由定義
 """
 
+import os
+
+import plotly
 from fastapi import APIRouter, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import FileResponse, HTMLResponse
 from fastapi.templating import Jinja2Templates
 
 def print_log(message: str):
@@ -16,9 +19,18 @@ def print_log(message: str):
 # 設定模板
 templates = Jinja2Templates(directory="web/templates")
 
+# plotly.js 使用 plotly 套件內附的版本（與伺服器端產生的圖表版本一致）
+PLOTLY_JS_PATH = os.path.join(os.path.dirname(plotly.__file__), "package_data", "plotly.min.js")
+
 # 建立路由器
 router = APIRouter()
 
+@router.get("/assets/plotly.min.js")
+async def plotly_js():
+    """plotly.js 靜態檔（瀏覽器長期快取，各頁面與圖表共用）"""
+    return FileResponse(PLOTLY_JS_PATH, media_type="application/javascript",
+                        headers={"Cache-Control": "public, max-age=604800, immutable"})
+
 @router.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     """首頁"""
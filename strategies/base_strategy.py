@@ -4,6 +4,7 @@ from typing import Dict, List, Any, Optional, Tuple
 import polars as pl
 from datetime import datetime
 from dataclasses import dataclass
+from core.logger import get_logger, TRACE, DEBUG
 
 def print_log(message):
     print(f"********** base_strategy.py - {message}")
@@ -93,13 +94,22 @@ class StrategyResult:
 class BaseStrategy(ABC):
     """策略基礎類別"""
     
+    # 日誌來源名稱，子類別可覆寫為自己的檔名
+    log_source = "base_strategy.py"
+    
     def __init__(self, parameters: Dict[str, Any]):
+        from strategies.trade_ledger import TradeLedger
+        from strategies.position_book import HoldingPositionBook
         self.parameters = parameters
-        self.trade_records: List[TradeRecord] = []
-        self.holding_positions: List[HoldingPosition] = []  # 持有未出場部位列表
+        self.trade_records: TradeLedger = TradeLedger()  # 欄式交易帳本，相容 List[TradeRecord] 介面
+        self.holding_positions: HoldingPositionBook = HoldingPositionBook()  # 持有未出場部位（以 position_id 索引）
         self.equity_curve: List[float] = []
         self.dates: List[datetime] = []
         self.current_position: Optional[Dict[str, Any]] = None
+        # 日誌層級：可由參數 log_level 逐次請求調整，熱路徑以旗標守衛避免格式化成本
+        self.logger = get_logger(self.log_source).bind(parameters.get("log_level") if parameters else None)
+        self._trace = self.logger.is_enabled(TRACE)
+        self._debug = self.logger.is_enabled(DEBUG)
         self._validate_parameters()
     
     @property
@@ -325,68 +335,77 @@ class BaseStrategy(ABC):
         """新增持有未出場部位"""
         # 檢查是否啟用持有記錄功能
         record_holdings = self.parameters.get('record_holdings', 0)
-        print(f"DEBUG: record_holdings = {record_holdings}, type = {type(record_holdings)}")
         if record_holdings == 1:
-            print(f"DEBUG: 新增持有部位: {holding_position.stock_id} (ID: {holding_position.position_id})")
+            if self._debug:
+                self.logger.debug("新增持有部位: %s (ID: %s)", holding_position.stock_id, holding_position.position_id)
             self.holding_positions.append(holding_position)
-        else:
-            print(f"DEBUG: 持有記錄功能未啟用，跳過新增持有部位")
+        elif self._trace:
+            self.logger.trace("持有記錄功能未啟用，跳過新增持有部位")
     
     def update_holding_position(self, position_id: str, current_price: float, current_date: datetime, 
                                current_row: Dict[str, Any] = None, exit_price_type: str = "close") -> None:
         """根據 position_id 更新持有部位的當前價格和未實現損益"""
         if self.parameters.get('record_holdings', 0) != 1:
             return
-        for position in self.holding_positions:
-            if position.position_id == position_id:
-                position.current_price = current_price
-                position.current_date = current_date
-                position.holding_days = (current_date - position.entry_date).days
-                
-                # 根據出場價類型設定當日未出場價
-                if current_row:
-                    if exit_price_type == "open":
-                        position.current_exit_price = current_row.get("open", current_price)
-                    elif exit_price_type == "close":
-                        position.current_exit_price = current_row.get("close", current_price)
-                    elif exit_price_type == "high":
-                        position.current_exit_price = current_row.get("high", current_price)
-                    elif exit_price_type == "low":
-                        position.current_exit_price = current_row.get("low", current_price)
-                    else:
-                        position.current_exit_price = current_price
-                    
-                    # 更新其他價格欄位
-                    position.open_price = current_row.get("open", 0.0)
-                    position.high_price = current_row.get("high", 0.0)
-                    position.low_price = current_row.get("low", 0.0)
-                    position.close_price = current_row.get("close", 0.0)
-                else:
-                    position.current_exit_price = current_price
-                
-                # 計算未出場報酬（使用當日未出場價）
-                if position.trade_direction == 1:  # 做多
-                    position.unrealized_profit_loss = (current_price - position.entry_price) * position.shares
-                    position.unrealized_profit_loss_rate = ((current_price - position.entry_price) / position.entry_price) * 100
-                    position.current_profit_loss = (position.current_exit_price - position.entry_price) * position.shares
-                    position.current_profit_loss_rate = ((position.current_exit_price - position.entry_price) / position.entry_price) * 100
-                else:  # 做空
-                    position.unrealized_profit_loss = (position.entry_price - current_price) * position.shares
-                    position.unrealized_profit_loss_rate = ((position.entry_price - current_price) / position.entry_price) * 100
-                    position.current_profit_loss = (position.entry_price - position.current_exit_price) * position.shares
-                    position.current_profit_loss_rate = ((position.entry_price - position.current_exit_price) / position.entry_price) * 100
-                
-                position.exit_price_type = exit_price_type
-                break
+        # 以 position_id 直接查詢（O(1)）
+        position = self.holding_positions.get(position_id)
+        if position is None:
+            return
+        position.current_price = current_price
+        position.current_date = current_date
+        position.holding_days = (current_date - position.entry_date).days
+        
+        # 根據出場價類型設定當日未出場價
+        if current_row:
+            if exit_price_type == "open":
+                position.current_exit_price = current_row.get("open", current_price)
+            elif exit_price_type == "close":
+                position.current_exit_price = current_row.get("close", current_price)
+            elif exit_price_type == "high":
+                position.current_exit_price = current_row.get("high", current_price)
+            elif exit_price_type == "low":
+                position.current_exit_price = current_row.get("low", current_price)
+            else:
+                position.current_exit_price = current_price
+            
+            # 更新其他價格欄位
+            position.open_price = current_row.get("open", 0.0)
+            position.high_price = current_row.get("high", 0.0)
+            position.low_price = current_row.get("low", 0.0)
+            position.close_price = current_row.get("close", 0.0)
+        else:
+            position.current_exit_price = current_price
+        
+        # 計算未出場報酬（使用當日未出場價）
+        if position.trade_direction == 1:  # 做多
+            position.unrealized_profit_loss = (current_price - position.entry_price) * position.shares
+            position.unrealized_profit_loss_rate = ((current_price - position.entry_price) / position.entry_price) * 100
+            position.current_profit_loss = (position.current_exit_price - position.entry_price) * position.shares
+            position.current_profit_loss_rate = ((position.current_exit_price - position.entry_price) / position.entry_price) * 100
+        else:  # 做空
+            position.unrealized_profit_loss = (position.entry_price - current_price) * position.shares
+            position.unrealized_profit_loss_rate = ((position.entry_price - current_price) / position.entry_price) * 100
+            position.current_profit_loss = (position.entry_price - position.current_exit_price) * position.shares
+            position.current_profit_loss_rate = ((position.entry_price - position.current_exit_price) / position.entry_price) * 100
+        
+        position.exit_price_type = exit_price_type
     
     def remove_holding_position(self, position_id: str) -> None:
         """根據 position_id 移除持有部位記錄"""
         record_holdings = self.parameters.get('record_holdings', 0)
         if record_holdings == 1:
-            print(f"DEBUG: 移除持有部位: {position_id}")
-            self.holding_positions = [pos for pos in self.holding_positions if pos.position_id != position_id]
-        else:
-            print(f"DEBUG: 持有記錄功能未啟用，跳過移除持有部位")
+            if self._debug:
+                self.logger.debug("移除持有部位: %s", position_id)
+            self.holding_positions.remove(position_id)
+        elif self._trace:
+            self.logger.trace("持有記錄功能未啟用，跳過移除持有部位")
+    
+    def mark_holding_positions(self, current_row: Dict[str, Any], current_date: datetime,
+                               exit_price_type: str = "close", stock_id: str = None) -> int:
+        """以當根 K 棒向量化更新所有（或指定股票）持有部位的未實現損益，回傳更新數量"""
+        if self.parameters.get('record_holdings', 0) != 1:
+            return 0
+        return self.holding_positions.mark_to_market(current_row, current_date, exit_price_type, stock_id=stock_id)
     
     def get_holding_positions_data(self) -> pl.DataFrame:
         """取得持有部位資料用於匯出"""
@@ -442,57 +461,31 @@ class BaseStrategy(ABC):
         if not self.trade_records:
             return pl.DataFrame()
         
-        # 轉換交易記錄為字典列表
-        data = []
-        for trade in self.trade_records:
-            trade_dict = {
-                "position_id": trade.position_id,
-                "entry_date": trade.entry_date.strftime("%Y-%m-%d") if trade.entry_date else "",
-                "exit_date": trade.exit_date.strftime("%Y-%m-%d") if trade.exit_date else "",
-                "stock_id": trade.stock_id,
-                "stock_name": trade.stock_name,
-                "trade_direction": "買入" if trade.trade_direction == 1 else "賣出",
-                "entry_price": trade.entry_price,
-                "exit_price": trade.exit_price,
-                "shares": trade.shares,
-                "profit_loss": trade.profit_loss,
-                "profit_loss_rate": trade.profit_loss_rate,
-                "commission": trade.commission,
-                "securities_tax": trade.securities_tax,
-                "net_profit_loss": trade.net_profit_loss,
-                "take_profit_price": trade.take_profit_price,
-                "stop_loss_price": trade.stop_loss_price,
-                "exit_reason": trade.exit_reason,
-                "holding_days": trade.holding_days,
-                "current_price": trade.current_price,
-                "unrealized_profit_loss": trade.unrealized_profit_loss,
-                "unrealized_profit_loss_rate": trade.unrealized_profit_loss_rate,
-                "current_date": trade.current_date.strftime("%Y-%m-%d") if trade.current_date else "",
-                "exit_price_type": trade.exit_price_type,
-                "current_entry_price": trade.current_entry_price,
-                "current_exit_price": trade.current_exit_price,
-                "current_profit_loss": trade.current_profit_loss,
-                "current_profit_loss_rate": trade.current_profit_loss_rate,
-                "open_price": trade.open_price,
-                "high_price": trade.high_price,
-                "low_price": trade.low_price,
-                "close_price": trade.close_price
-            }
-            
-            if export_type == "basic":
-                # 基本匯出只包含重要欄位
-                basic_fields = ["entry_date", "stock_id", "stock_name", "trade_direction", 
-                              "entry_price", "exit_price", "shares", "profit_loss", "profit_loss_rate"]
-                trade_dict = {k: v for k, v in trade_dict.items() if k in basic_fields}
-            
-            data.append(trade_dict)
+        # 直接由欄式帳本批次轉換，日期欄位一次格式化
+        export_columns = [
+            "position_id", "entry_date", "exit_date", "stock_id", "stock_name", "trade_direction",
+            "entry_price", "exit_price", "shares", "profit_loss", "profit_loss_rate",
+            "commission", "securities_tax", "net_profit_loss", "take_profit_price", "stop_loss_price",
+            "exit_reason", "holding_days", "current_price", "unrealized_profit_loss",
+            "unrealized_profit_loss_rate", "current_date", "exit_price_type", "current_entry_price",
+            "current_exit_price", "current_profit_loss", "current_profit_loss_rate",
+            "open_price", "high_price", "low_price", "close_price"
+        ]
+        if export_type == "basic":
+            # 基本匯出只包含重要欄位
+            basic_fields = ["entry_date", "stock_id", "stock_name", "trade_direction", 
+                          "entry_price", "exit_price", "shares", "profit_loss", "profit_loss_rate"]
+            export_columns = [name for name in export_columns if name in basic_fields]
         
-        return pl.DataFrame(data)
+        return self.trade_records.formatted_frame(export_columns).with_columns(
+            pl.when(pl.col("trade_direction") == 1).then(pl.lit("買入")).otherwise(pl.lit("賣出")).alias("trade_direction")
+        )
     
     def reset(self) -> None:
         """重置策略狀態"""
         self.trade_records.clear()
         self.holding_positions.clear()
-        self.equity_curve.clear()
-        self.dates.clear()
+        # 建立新的列表（不就地清空），先前 get_strategy_result 回傳的權益曲線不受下一檔股票影響
+        self.equity_curve = []
+        self.dates = []
         self.current_position = None 
\ No newline at end of file
@@ -6,6 +6,7 @@ import uuid
 from strategies.base_strategy import BaseStrategy, TradeRecord, HoldingPosition
 from core.price_utils import PriceUtils
 from core.utils import Utils
+from core.metrics import PerformanceMetrics
 
 def print_log(message: str):
     print(f"****** bookbuilding.py : {message}")
@@ -15,7 +16,6 @@ class BookbuildingStrategy(BaseStrategy):
     
     def __init__(self, parameters: Dict[str, Any]):
         super().__init__(parameters)
-        self.trade_records: List[TradeRecord] = []
         self.equity_curve: List[float] = []
         self.dates: List[datetime] = []
         self.active_positions = []  # 改為追蹤多個活躍部位
@@ -516,64 +516,27 @@ class BookbuildingStrategy(BaseStrategy):
             }
         
         # 計算統計資料
-        total_trades = len(self.trade_records)
-        winning_trades = len([t for t in self.trade_records if t.net_profit_loss > 0])
-        losing_trades = len([t for t in self.trade_records if t.net_profit_loss < 0])
-        win_rate = winning_trades / total_trades if total_trades > 0 else 0.0
-        
-        total_profit_loss = sum(t.net_profit_loss for t in self.trade_records)
-        total_profit_loss_rate = total_profit_loss / initial_capital if initial_capital > 0 else 0.0
-        
-        # 計算最大回撤
-        drawdown_info = Utils.calculate_drawdown(self.equity_curve) if self.equity_curve else {"max_drawdown": 0.0, "max_drawdown_pct": 0.0}
-        max_drawdown = drawdown_info.get("max_drawdown", 0.0)
-        max_drawdown_rate = drawdown_info.get("max_drawdown_pct", 0.0)
-        
-        # 計算夏普比率
-        returns = []
-        for i in range(1, len(self.equity_curve)):
-            if self.equity_curve[i-1] > 0:
-                returns.append((self.equity_curve[i] - self.equity_curve[i-1]) / self.equity_curve[i-1])
-        
-        sharpe_ratio = Utils.calculate_sharpe_ratio(returns)
-        
-        # 將 TradeRecord 物件轉換為字典
-        trade_records_dict = []
-        for trade in self.trade_records:
-            trade_dict = {
-                "position_id": trade.position_id,
-                "entry_date": trade.entry_date.strftime("%Y-%m-%d") if trade.entry_date else "",
-                "exit_date": trade.exit_date.strftime("%Y-%m-%d") if trade.exit_date else "",
-                "stock_id": trade.stock_id,
-                "stock_name": trade.stock_name,
-                "trade_direction": trade.trade_direction,
-                "entry_price": trade.entry_price,
-                "exit_price": trade.exit_price,
-                "shares": trade.shares,
-                "profit_loss": trade.profit_loss,
-                "profit_loss_rate": trade.profit_loss_rate,
-                "commission": trade.commission,
-                "securities_tax": trade.securities_tax,
-                "net_profit_loss": trade.net_profit_loss,
-                "exit_reason": trade.exit_reason,
-                "holding_days": trade.holding_days,
-                "current_price": trade.current_price,
-                "unrealized_profit_loss": trade.unrealized_profit_loss,
-                "unrealized_profit_loss_rate": trade.unrealized_profit_loss_rate,
-                "current_date": trade.current_date.strftime("%Y-%m-%d") if trade.current_date else "",
-                "exit_price_type": trade.exit_price_type,
-                "current_entry_price": trade.current_entry_price,
-                "current_exit_price": trade.current_exit_price,
-                "current_profit_loss": trade.current_profit_loss,
-                "current_profit_loss_rate": trade.current_profit_loss_rate,
-                "take_profit_price": trade.take_profit_price,
-                "stop_loss_price": trade.stop_loss_price,
-                "open_price": trade.open_price,
-                "high_price": trade.high_price,
-                "low_price": trade.low_price,
-                "close_price": trade.close_price
-            }
-            trade_records_dict.append(trade_dict)
+        trade_frame = self.trade_records.to_frame()
+        metrics = PerformanceMetrics.compute(
+            self.equity_curve,
+            trade_frame["net_profit_loss"],
+            initial_capital,
+            dates=self.dates,
+            entry_dates=trade_frame["entry_date"],
+            exit_dates=trade_frame["exit_date"]
+        )
+        total_trades = metrics["total_trades"]
+        winning_trades = metrics["winning_trades"]
+        losing_trades = metrics["losing_trades"]
+        win_rate = metrics["win_rate"]
+        total_profit_loss = metrics["total_profit_loss"]
+        total_profit_loss_rate = metrics["total_profit_loss_rate"]
+        max_drawdown = metrics["max_drawdown"]
+        max_drawdown_rate = metrics["max_drawdown_rate"]
+        sharpe_ratio = metrics["sharpe_ratio"]
+        
+        # 交易記錄由欄式帳本批次轉換為字典
+        trade_records_dict = self.trade_records.to_dicts()
         
         return {
             "total_trades": total_trades,
@@ -585,9 +548,15 @@ class BookbuildingStrategy(BaseStrategy):
             "max_drawdown": max_drawdown,
             "max_drawdown_rate": max_drawdown_rate,
             "sharpe_ratio": sharpe_ratio,
+            "sortino_ratio": metrics["sortino_ratio"],
+            "calmar_ratio": metrics["calmar_ratio"],
+            "profit_factor": metrics["profit_factor"],
+            "expectancy": metrics["expectancy"],
+            "exposure": metrics["exposure"],
             "trade_records": trade_records_dict,
-            "equity_curve": self.equity_curve,
-            "dates": self.dates,
+            "trade_frame": trade_frame,
+            "equity_curve": list(self.equity_curve),
+            "dates": list(self.dates),
             "charts": []
         }
 
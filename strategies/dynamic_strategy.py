@@ -8,19 +8,24 @@ import threading
 import uuid
 from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
+import numpy as np
 import polars as pl
 from strategies.base_strategy import BaseStrategy, TradeRecord, HoldingPosition
 from core.price_utils import PriceUtils
 from core.utils import Utils
+from core.metrics import PerformanceMetrics
 import copy
 from core.technical_indicators import generate_indicators
+from core.resampler import align_timeframes, resample_bars
+from core.logger import get_logger
 
-def print_log(message):
-    print(f"********** dynamic_strategy.py - {message}")
+logger = get_logger("dynamic_strategy.py")
 
 class DynamicStrategy(BaseStrategy):
     """動態策略類別，允許用戶透過程式碼字串來定義策略"""
     
+    log_source = "dynamic_strategy.py"
+    
     def __init__(self, parameters: Dict[str, Any], strategy_code: str = "", strategy_name: str = "自定義策略", data: Dict[str, Any] = None):
         """
         初始化動態策略
@@ -30,7 +35,7 @@ class DynamicStrategy(BaseStrategy):
             strategy_code (str): 策略程式碼字串
             strategy_name (str): 策略名稱
         """
-        print_log(f"__init__")
+        logger.trace("__init__ %s", strategy_name)
         self.strategy_code = strategy_code
         self.custom_strategy_name = strategy_name
         self.compiled_code = None
@@ -64,7 +69,8 @@ class DynamicStrategy(BaseStrategy):
     
     def _process_parameter_configs(self):
         """處理參數中的字典類型配置，提取實際值"""
-        print_log(f"_process_parameter_configs")
+        if self._trace:
+            self.logger.trace("_process_parameter_configs")
         if not hasattr(self, 'parameters') or not self.parameters:
             return
             
@@ -75,7 +81,8 @@ class DynamicStrategy(BaseStrategy):
     
     def _compile_strategy_code(self):
         """編譯策略程式碼"""
-        print_log(f"_compile_strategy_code")
+        if self._trace:
+            self.logger.trace("_compile_strategy_code")
         try:
             # 解析程式碼
             tree = ast.parse(self.strategy_code)
@@ -94,6 +101,8 @@ class DynamicStrategy(BaseStrategy):
                 'PriceUtils': PriceUtils,
                 'Utils': Utils,
                 'generate_indicators': generate_indicators,
+                'resample_bars': resample_bars,
+                'align_timeframes': align_timeframes,
                 'self': self
             }
             
@@ -132,7 +141,8 @@ class DynamicStrategy(BaseStrategy):
     
     def _initialize_dynamic_parameters(self):
         """初始化動態參數"""
-        print_log(f"_initialize_dynamic_parameters")
+        if self._trace:
+            self.logger.trace("_initialize_dynamic_parameters")
         if hasattr(self, 'custom_parameters'):
             for param_name, param_config in self.custom_parameters.items():
                 if param_config.get('type') == 'dynamic':
@@ -140,6 +150,21 @@ class DynamicStrategy(BaseStrategy):
                     self.dynamic_parameters[param_name] = param_config.get('default', 0)
                     self.parameter_history[param_name] = []
     
+    def reset(self, parameters: Dict[str, Any] = None) -> None:
+        """
+        重置策略狀態
+
+        提供 parameters 時一併還原策略參數與動態參數，讓已編譯的策略實例可直接重複用於下一檔股票
+        """
+        super().reset()
+        if parameters is not None:
+            self.parameters = copy.deepcopy(parameters)
+            self.parameters.setdefault("record_holdings", 0)
+            self._process_parameter_configs()
+        self.dynamic_parameters = {}
+        self.parameter_history = {}
+        self._initialize_dynamic_parameters()
+
     def get_dynamic_parameter(self, param_name: str, default=None):
         """
         取得動態參數值
@@ -151,7 +176,8 @@ class DynamicStrategy(BaseStrategy):
         Returns:
             參數值
         """
-        print_log(f"get_dynamic_parameter")
+        if self._trace:
+            self.logger.trace("get_dynamic_parameter")
         return self.dynamic_parameters.get(param_name, default)
     
     def set_dynamic_parameter(self, param_name: str, value, record_history=True):
@@ -164,7 +190,8 @@ class DynamicStrategy(BaseStrategy):
             value: 參數值
             record_history: 是否記錄歷史
         """
-        print_log(f"set_dynamic_parameter")
+        if self._trace:
+            self.logger.trace("set_dynamic_parameter")
         old_value = self.dynamic_parameters.get(param_name)
         self.dynamic_parameters[param_name] = value
         if record_history and param_name in self.parameter_history:
@@ -182,7 +209,8 @@ class DynamicStrategy(BaseStrategy):
             param_name: 參數名稱
             increment: 增加量
         """
-        print_log(f"increment_dynamic_parameter")
+        if self._trace:
+            self.logger.trace("increment_dynamic_parameter")
         current_value = self.get_dynamic_parameter(param_name, 0)
         self.set_dynamic_parameter(param_name, current_value + increment)
     
@@ -193,7 +221,8 @@ class DynamicStrategy(BaseStrategy):
         Args:
             param_name: 參數名稱
         """
-        print_log(f"reset_dynamic_parameter")
+        if self._trace:
+            self.logger.trace("reset_dynamic_parameter")
         if param_name in self.custom_parameters:
             default_value = self.custom_parameters[param_name].get('default', 0)
             self.set_dynamic_parameter(param_name, default_value)
@@ -208,23 +237,27 @@ class DynamicStrategy(BaseStrategy):
         Returns:
             參數變更歷史列表
         """
-        print_log(f"get_parameter_history")
+        if self._trace:
+            self.logger.trace("get_parameter_history")
         return self.parameter_history.get(param_name, [])
     
     @property
     def strategy_name(self) -> str:
-        print_log(f"strategy_name {self.custom_strategy_name}")
+        if self._trace:
+            self.logger.trace("strategy_name %s", self.custom_strategy_name)
         return self.custom_strategy_name
     
     @property
     def strategy_description(self) -> str:
-        print_log(f"strategy_description")
+        if self._trace:
+            self.logger.trace("strategy_description")
         return "用戶自定義策略"
     
     @property
     def parameter_sources(self) -> Dict[str, Dict[str, Any]]:
         """取得策略所需的參數來源"""
-        print_log(f"parameter_sources")
+        if self._trace:
+            self.logger.trace("parameter_sources")
         return {
             "stock_source": {
                 "type": "excel",
@@ -247,7 +280,8 @@ class DynamicStrategy(BaseStrategy):
     @property
     def strategy_parameters(self) -> Dict[str, Dict[str, Any]]:
         """取得策略參數配置"""
-        print_log(f"strategy_parameters")
+        if self._trace:
+            self.logger.trace("strategy_parameters")
         # 從 trading_config 取得基礎參數
         from config.trading_config import TradingConfig
         
@@ -317,7 +351,8 @@ class DynamicStrategy(BaseStrategy):
     
     def get_parameter_default(self, param_name: str, fallback=None):
         """從 custom_parameters 的 default 值取得參數"""
-        print_log(f"get_parameter_default")
+        if self._trace:
+            self.logger.trace("get_parameter_default")
         # 先從 strategy_parameters 中查找
         strategy_params = self.strategy_parameters
         
@@ -339,7 +374,8 @@ class DynamicStrategy(BaseStrategy):
         Returns:
             參數值
         """
-        print_log(f"get_parameter_value")
+        if self._trace:
+            self.logger.trace("get_parameter_value")
         # 優先從 self.parameters 取得（用戶實際值）
         if hasattr(self, 'parameters') and self.parameters and param_name in self.parameters:
             param_value = self.parameters[param_name]
@@ -354,7 +390,8 @@ class DynamicStrategy(BaseStrategy):
     
     def process_parameters(self, parameters: Dict[str, Any], stock_df: pl.DataFrame = None) -> Dict[str, Any]:
         """處理策略參數"""
-        print_log(f"process_parameters")
+        if self._trace:
+            self.logger.trace("process_parameters")
         # 檢查是否有策略程式碼
         if not self.strategy_code or not self.strategy_code.strip():
             raise ValueError("沒有選擇策略(策略管理中其中一個)或未輸入指令")
@@ -368,14 +405,16 @@ class DynamicStrategy(BaseStrategy):
     
     def validate_special_parameters(self, parameters: Dict[str, Any]) -> None:
         """驗證策略特定的參數"""
-        print_log(f"validate_special_parameters")
+        if self._trace:
+            self.logger.trace("validate_special_parameters")
         # 如果有自定義的驗證函數，則使用它
         if 'validate_parameters' in self.strategy_functions:
             self._execute_function('validate_parameters', parameters)
     
     async def process_api_data(self, stock_data: pl.DataFrame, stock_api, excel_pl_df: pl.DataFrame = None) -> pl.DataFrame:
         """處理API取得的資料"""
-        print_log(f"process_api_data")
+        if self._trace:
+            self.logger.trace("process_api_data")
         # 檢查是否有策略程式碼
         if not self.strategy_code or not self.strategy_code.strip():
             raise ValueError("沒有選擇策略(策略管理中其中一個)或未輸入指令")
@@ -389,7 +428,8 @@ class DynamicStrategy(BaseStrategy):
     
     def process_excel_data(self, excel_data: pl.DataFrame, excel_pl_df: pl.DataFrame = None) -> Dict[str, Any]:
         """處理Excel資料"""
-        print_log(f"process_excel_data")
+        if self._trace:
+            self.logger.trace("process_excel_data")
         # 檢查是否有策略程式碼
         if not self.strategy_code or not self.strategy_code.strip():
             raise ValueError("沒有選擇策略(策略管理中其中一個)或未輸入指令")
@@ -403,7 +443,8 @@ class DynamicStrategy(BaseStrategy):
     
     def should_entry(self, stock_data: pl.DataFrame, current_index: int, excel_pl_df: pl.DataFrame = None) -> Tuple[bool, Dict[str, Any]]:        
         """判斷是否應該進場"""
-        print_log(f"should_entry")
+        if self._trace:
+            self.logger.trace("should_entry")
         # 檢查是否有策略程式碼
         if not self.strategy_code or not self.strategy_code.strip():
             raise ValueError("沒有選擇策略(策略管理中其中一個)或未輸入指令")
@@ -417,7 +458,8 @@ class DynamicStrategy(BaseStrategy):
     
     def should_exit(self, stock_data: pl.DataFrame, current_index: int, position: Dict[str, Any], excel_pl_df: pl.DataFrame = None) -> Tuple[bool, Dict[str, Any]]:
         """判斷是否應該出場"""
-        print_log(f"should_exit")
+        if self._trace:
+            self.logger.trace("should_exit")
         # 檢查是否有策略程式碼
         if not self.strategy_code or not self.strategy_code.strip():
             raise ValueError("沒有選擇策略(策略管理中其中一個)或未輸入指令")
@@ -433,7 +475,7 @@ class DynamicStrategy(BaseStrategy):
                 
                 return result
             except Exception as e:
-                print_log(f"should_exit 執行錯誤: {e}")
+                self.logger.warning("should_exit 執行錯誤: %s", e)
                 return False, {}
         
         # 如果沒有定義 should_exit 函數，拋出錯誤
@@ -444,7 +486,8 @@ class DynamicStrategy(BaseStrategy):
         準備傳給自定義策略函數的 kwargs
         只查 self.custom_parameters 取得型別/結構/預設值，實際值一律用 self.parameters
         """
-        print_log(f"_prepare_parameters")
+        if self._trace:
+            self.logger.trace("_prepare_parameters")
         kwargs = {}
         # 添加基礎參數（用戶實際值）
         base_params = ["commission_rate", "commission_discount", "securities_tax_rate", "sstt_rate", "shares_per_trade", "holding_days"]
@@ -475,7 +518,8 @@ class DynamicStrategy(BaseStrategy):
         Args:
             should_exit: 是否出場
         """
-        print_log(f"_update_dynamic_parameters_after_exit")
+        if self._trace:
+            self.logger.trace("_update_dynamic_parameters_after_exit")
         if hasattr(self, 'custom_parameters'):
             for param_name, param_config in self.custom_parameters.items():
                 if param_config.get('type') == 'dynamic':
@@ -489,7 +533,8 @@ class DynamicStrategy(BaseStrategy):
     
     def run_backtest(self, stock_data: pl.DataFrame, excel_pl_df: pl.DataFrame, initial_capital: float, stock_id: str, stock_name: str):
         """執行回測"""
-        print_log(f"run_backtest")
+        if self._trace:
+            self.logger.trace("run_backtest")
         # 檢查是否有策略程式碼
         if not self.strategy_code or not self.strategy_code.strip():
             raise ValueError("沒有選擇策略(策略管理中其中一個)或未輸入指令")
@@ -516,7 +561,19 @@ class DynamicStrategy(BaseStrategy):
     
     def _run_single_stock_backtest(self, stock_data: pl.DataFrame, excel_pl_df: pl.DataFrame, stock_id: str, stock_name: str):
         """執行單股票回測"""
-        print_log(f"_run_single_stock_backtest")
+        if self._trace:
+            self.logger.trace("_run_single_stock_backtest")
+        # 事件驅動模式：向量化進出場信號 + 只在事件之間跳躍
+        if self.parameters.get("event_driven", False) and "Jupyter" not in self.strategy_name:
+            from strategies.event_engine import is_long
+            if not is_long(self.parameters):
+                self.logger.warning("事件驅動模式只支援做多（trade_direction=%s），改用一般回測",
+                                    self.parameters.get("trade_direction"))
+            elif 'calculate_entry_signals' in self.strategy_functions:
+                self._execute_event_driven_backtest(stock_data, excel_pl_df, stock_id, stock_name)
+                return
+            else:
+                self.logger.warning("事件驅動模式需要定義 calculate_entry_signals，改用一般回測")
         # 使用狀態機模式
         if "Jupyter" not in self.strategy_name and self.compiled_code.get('should_entry', None) and self.compiled_code.get('calculate_entry_signals', None):
             # 完全向量化模式（實驗性，適用於簡單策略）
@@ -545,6 +602,8 @@ class DynamicStrategy(BaseStrategy):
                             'PriceUtils': PriceUtils,
                             'Utils': Utils,
                             'generate_indicators': generate_indicators,
+                            'resample_bars': resample_bars,
+                            'align_timeframes': align_timeframes,
                             'self': self,
                             'df': stock_data,
                             'stock_df': excel_pl_df,
@@ -558,20 +617,21 @@ class DynamicStrategy(BaseStrategy):
                         # 從執行環境中提取計算結果
                         if 'df' in exec_globals:
                             stock_data = exec_globals['df']
-                            print_log(f"Jupyter 編輯器策略執行完成，df 形狀: {stock_data.shape}")
+                            self.logger.debug("Jupyter 編輯器策略執行完成，df 形狀: %s", stock_data.shape)
                         
                         stock_data = exec_globals['df']
                         excel_pl_df = exec_globals['stock_data']
                         
                     except Exception as e:
-                        print_log(f"Jupyter 編輯器策略執行失敗: {e}")
+                        self.logger.error("Jupyter 編輯器策略執行失敗: %s", e)
                         # 如果執行失敗，至少保留原始資料
 
             self._execute_vectorized_backtest(stock_data, excel_pl_df, stock_id, stock_name) 
     
     def _calculate_entry_exit_signals(self, stock_data: pl.DataFrame, excel_pl_df: pl.DataFrame) -> pl.DataFrame:
         """使用向量化操作計算進出場信號"""
-        print_log(f"_calculate_entry_exit_signals")
+        if self._trace:
+            self.logger.trace("_calculate_entry_exit_signals")
         try:
             # 初始化進出場信號欄位
             df = stock_data.with_columns([
@@ -594,16 +654,122 @@ class DynamicStrategy(BaseStrategy):
                     
                 return df                    
             except Exception as e:
-                print_log(f"向量化計算失敗，回退到狀態機模式: {e}")
+                self.logger.warning("向量化計算失敗，回退到狀態機模式: %s", e)
                 return self._calculate_signals_state_machine(stock_data, excel_pl_df)
             
         except Exception as e:
-            print_log(f"計算進出場信號失敗: {e}")
+            self.logger.error("計算進出場信號失敗: %s", e)
             return stock_data
-    
+
+    def calculate_universe_signals(self, stock_data: pl.DataFrame, excel_pl_df: pl.DataFrame) -> pl.DataFrame:
+        """
+        計算整個股票池的向量化進出場信號（投資組合回測用）
+
+        逐股呼叫策略的向量化函數，避免 shift/rolling 等運算跨越不同股票，再合併為單一長表
+        """
+        if self._trace:
+            self.logger.trace("calculate_universe_signals")
+        if 'calculate_entry_signals' not in self.strategy_functions:
+            raise ValueError("投資組合回測需要向量化策略，請定義 calculate_entry_signals 函數")
+        frames = [
+            self._calculate_entry_exit_signals(group, excel_pl_df)
+            for group in Utils.partition_by_stock(stock_data).values()
+        ]
+        if not frames:
+            return stock_data
+        return pl.concat(frames, how="diagonal_relaxed")
+
+    def prepare_indicators(self, stock_data: pl.DataFrame, excel_pl_df: pl.DataFrame = None,
+                           indicators: List[str] = None) -> pl.DataFrame:
+        """
+        預先計算與參數無關的指標欄位（參數掃描、滾動視窗回測共用，只算一次）
+
+        逐股套用 generate_indicators(indicators)，策略程式碼有定義 prepare_indicators(stock_data, excel_pl_df)
+        時再逐股呼叫；兩者皆無時原樣回傳
+        """
+        if self._trace:
+            self.logger.trace("prepare_indicators")
+        has_hook = 'prepare_indicators' in self.strategy_functions
+        if not indicators and not has_hook:
+            return stock_data
+        frames = []
+        for group in Utils.partition_by_stock(stock_data).values():
+            if indicators:
+                group = generate_indicators(group, list(indicators))
+            if has_hook:
+                group = self._execute_function('prepare_indicators', group, excel_pl_df)
+            frames.append(group)
+        if not frames:
+            return stock_data
+        return pl.concat(frames, how="diagonal_relaxed")
+
+    def _entry_candidate_indices(self, stock_data: pl.DataFrame, excel_pl_df: pl.DataFrame) -> Optional[np.ndarray]:
+        """
+        狀態機模式的進場候選列（向量化預先篩選）
+
+        策略宣告 entry_prefilter = {"excel_dates": True, "columns": [...], "shift": 0}
+        或定義 entry_candidates(stock_data, excel_pl_df, **kwargs)（回傳布林 Series 或運算式）時，
+        候選列以外的列不呼叫 should_entry；未宣告或篩選失敗時回傳 None，維持逐列呼叫
+        """
+        if self._trace:
+            self.logger.trace("_entry_candidate_indices")
+        prefilter = (self.compiled_code or {}).get('entry_prefilter')
+        has_function = 'entry_candidates' in self.strategy_functions
+        if not isinstance(prefilter, dict) and not has_function:
+            return None
+        try:
+            mask = pl.Series("candidate", [True] * len(stock_data), dtype=pl.Boolean)
+            if isinstance(prefilter, dict):
+                if prefilter.get("excel_dates"):
+                    if excel_pl_df is None or not {"stock_id", "date"}.issubset(excel_pl_df.columns):
+                        return None
+                    # Excel 股票代碼可能帶有名稱（例如 "2330 台積電"），以第一段比對
+                    stock_id = str(stock_data["stock_id"][0])
+                    excel_dates = excel_pl_df.filter(
+                        pl.col("stock_id").cast(pl.Utf8).str.split(" ").list.first() == stock_id
+                    )["date"].cast(pl.Date)
+                    mask = mask & stock_data["date"].cast(pl.Date).is_in(excel_dates)
+                shift = int(prefilter.get("shift", 0) or 0)
+                for column in prefilter.get("columns", []):
+                    if column not in stock_data.columns:
+                        self.logger.warning("entry_prefilter 欄位 %s 不存在，略過預先篩選", column)
+                        return None
+                    condition = stock_data[column].cast(pl.Boolean)
+                    if shift:
+                        condition = condition.shift(shift)
+                    mask = mask & condition.fill_null(False)
+            if has_function:
+                kwargs = self._prepare_parameters()
+                candidates = self._execute_function('entry_candidates', stock_data, excel_pl_df, **kwargs)
+                if isinstance(candidates, pl.Expr):
+                    candidates = stock_data.select(candidates).to_series()
+                candidates = pl.Series("candidate", candidates).cast(pl.Boolean).fill_null(False)
+                mask = mask & candidates
+            return np.flatnonzero(mask.to_numpy())
+        except Exception as e:
+            self.logger.warning("進場候選預先篩選失敗，改為逐列判斷: %s", e)
+            return None
+
+    def _skip_to_entry_candidate(self, candidates: Optional[np.ndarray], start: int, bar_dates: Optional[List[Any]],
+                                 capital: float) -> int:
+        """
+        空手時跳到下一個進場候選列
+
+        跳過的列資金不變，直接整批寫入權益曲線；回傳下一個需要逐列處理的索引（沒有候選列時為資料長度）
+        """
+        if candidates is None:
+            return start
+        position = int(np.searchsorted(candidates, start))
+        stop = int(candidates[position]) if position < len(candidates) else len(bar_dates)
+        if stop > start:
+            self.equity_curve.extend([capital] * (stop - start))
+            self.dates.extend(bar_dates[start:stop])
+        return stop
+
     def _calculate_signals_state_machine(self, stock_data: pl.DataFrame, excel_pl_df: pl.DataFrame, stock_id: str, stock_name: str) -> pl.DataFrame:
         """使用狀態機模式計算進出場信號（適用於複雜邏輯）"""
-        print_log(f"_calculate_signals_state_machine")
+        if self._trace:
+            self.logger.trace("_calculate_signals_state_machine")
         try:
             # 預設回測邏輯
             capital = self.parameters.get("initial_capital", 0)
@@ -613,8 +779,15 @@ class DynamicStrategy(BaseStrategy):
             if "holding_days" not in self.parameters:
                 self.parameters["holding_days"] = 0
             
-            # 使用狀態機逐行處理
-            for i in range(len(stock_data)):
+            # 預先篩選進場候選列：空手時直接跳到下一個候選列，中間的列整批寫入權益曲線
+            candidates = self._entry_candidate_indices(stock_data, excel_pl_df)
+            bar_dates = stock_data["date"].to_list() if candidates is not None else None
+            resume_at = self._skip_to_entry_candidate(candidates, 0, bar_dates, capital)
+            
+            # 使用狀態機逐行處理（空手時索引直接跳到下一個候選列）
+            i = resume_at
+            row_count = len(stock_data)
+            while i < row_count:
                 current_row = stock_data.row(i, named=True)
                 previous_row = stock_data.row(i-1, named=True) if i > 0 else current_row
                 
@@ -699,7 +872,8 @@ class DynamicStrategy(BaseStrategy):
                         
                         # 狀態改為空手
                         current_position = None
-                        print_log(f"出場: {stock_id} 進場價: {trade_record.entry_price} 出場價: {exit_price} 損益: {trade_record.net_profit_loss}")
+                        if self._debug:
+                            self.logger.debug("出場: %s 進場價: %s 出場價: %s 損益: %s", stock_id, trade_record.entry_price, exit_price, trade_record.net_profit_loss)
                         self.parameters["holding_days"] = 0
 
                     elif self.parameters.get("record_holdings", 0) == 1:
@@ -708,14 +882,18 @@ class DynamicStrategy(BaseStrategy):
                 
                 # 更新權益曲線
                 self.update_equity_curve(capital, current_row["date"])            
+                i += 1
+                if not current_position:
+                    i = self._skip_to_entry_candidate(candidates, i, bar_dates, capital)
             
         except Exception as e:
-            print_log(f"狀態機計算失敗: {e}")
+            self.logger.error("狀態機計算失敗: %s", e)
             return stock_data
     
     def _execute_vectorized_backtest(self, stock_data: pl.DataFrame, excel_pl_df: pl.DataFrame, stock_id: str, stock_name: str):
         """使用向量化操作執行回測"""        
-        print_log(f"_execute_vectorized_backtest")
+        if self._trace:
+            self.logger.trace("_execute_vectorized_backtest")
         try:
             capital = self.parameters.get("initial_capital", 1000000.0)
             current_position = None
@@ -727,9 +905,16 @@ class DynamicStrategy(BaseStrategy):
             
             # 使用 Polars 的 apply 或 map_rows 來處理每一行
             # 由於需要維護狀態（current_position, capital），我們仍然需要逐行處理
-            # 但可以優化為只在有進出場信號時才執行複雜的判斷邏輯
+            # 但空手時只需造訪 should_entry == 1 的列，其餘列整批寫入權益曲線
+            candidates = None
+            if "should_entry" in stock_data.columns:
+                candidates = np.flatnonzero((stock_data["should_entry"].fill_null(0) == 1).to_numpy())
+            bar_dates = stock_data["date"].to_list() if candidates is not None else None
+            resume_at = self._skip_to_entry_candidate(candidates, 0, bar_dates, capital)
             
-            for i in range(len(stock_data)):
+            i = resume_at
+            row_count = len(stock_data)
+            while i < row_count:
                 current_row = stock_data.row(i, named=True)
                 previous_row = stock_data.row(i-1, named=True) if i > 0 else current_row
                 
@@ -751,7 +936,8 @@ class DynamicStrategy(BaseStrategy):
                         }
                         holding_days = 0
                         
-                        # print_log(f"進場: {stock_id} 價格: {entry_price} 股數: {shares} 原因: {current_row.get('entry_reason', '')}")
+                        if self._debug:
+                            self.logger.debug("進場: %s 價格: %s 股數: %s 原因: %s", stock_id, entry_price, shares, current_row.get('entry_reason', ''))
                 
                 # 檢查出場信號
                 if current_position and current_row.get("should_exit", 0) == 1:
@@ -831,12 +1017,16 @@ class DynamicStrategy(BaseStrategy):
                         holding_days = 0
                         self.parameters["holding_days"] = 0
                         
-                        # print_log(f"出場: {stock_id} 進場價: {trade_record.entry_price} 出場價: {exit_price} 損益: {trade_record.net_profit_loss} 原因: {exit_reason}")
+                        if self._debug:
+                            self.logger.debug("出場: %s 進場價: %s 出場價: %s 損益: %s 原因: %s", stock_id, trade_record.entry_price, exit_price, trade_record.net_profit_loss, exit_reason)
                 # 更新權益曲線
                 self.update_equity_curve(capital, current_row["date"])
+                i += 1
+                if not current_position:
+                    i = self._skip_to_entry_candidate(candidates, i, bar_dates, capital)
                 
         except Exception as e:
-            print_log(f"向量化回測執行失敗: {e}")
+            self.logger.error("向量化回測執行失敗: %s", e)
             raise e
     
     def _execute_fully_vectorized_backtest(self, stock_data: pl.DataFrame, excel_pl_df: pl.DataFrame, stock_id: str, stock_name: str):
@@ -844,7 +1034,8 @@ class DynamicStrategy(BaseStrategy):
         完全向量化的回測方法（實驗性）
         使用 Polars 的窗口函數和累積操作來避免 for 迴圈
         """
-        print_log(f"_execute_fully_vectorized_backtest")
+        if self._trace:
+            self.logger.trace("_execute_fully_vectorized_backtest")
         try:
             # 使用窗口函數計算持有狀態
             df = stock_data.with_columns([
@@ -979,13 +1170,71 @@ class DynamicStrategy(BaseStrategy):
                 self.update_equity_curve(row["cumulative_capital"], row["date"])
                 
         except Exception as e:
-            print_log(f"完全向量化回測執行失敗: {e}")
+            self.logger.warning("完全向量化回測執行失敗: %s", e)
             # 如果完全向量化失敗，回退到混合模式
             self._execute_vectorized_backtest(stock_data, excel_pl_df, stock_id, stock_name)
     
+    def _execute_event_driven_backtest(self, stock_data: pl.DataFrame, excel_pl_df: pl.DataFrame, stock_id: str, stock_name: str):
+        """
+        事件驅動回測（參數 event_driven）
+
+        以 calculate_entry_signals / calculate_exit_signals 算出信號後交給 EventDrivenBacktestEngine，
+        進場點為索引陣列、出場點以向前搜尋求得，不逐根 K 棒呼叫策略函數；交易記錄整欄寫入帳本
+        """
+        if self._trace:
+            self.logger.trace("_execute_event_driven_backtest")
+        from strategies.event_engine import EventDrivenBacktestEngine
+
+        signals = self._calculate_entry_exit_signals(stock_data, excel_pl_df)
+        if signals is None or "should_entry" not in signals.columns:
+            raise ValueError("事件驅動模式需要 should_entry 欄位，請確認 calculate_entry_signals 的回傳值")
+        capital = self.parameters.get("initial_capital", 0)
+        engine = EventDrivenBacktestEngine.from_parameters(capital, self.parameters)
+        result = engine.run(signals, stock_id, f"{stock_name}")
+        self.trade_records.extend_columns(result["trades"], result["size"])
+        self.equity_curve.extend(result["equity_curve"].tolist())
+        self.dates.extend(signals["date"].to_list())
+
+        open_position = result["open_position"]
+        if open_position is not None and self.parameters.get("record_holdings", 0) == 1:
+            # 資料結束時仍持有的部位，以最後一根 K 棒評估
+            last_row = signals.row(len(signals) - 1, named=True)
+            entry_price = open_position["entry_price"]
+            shares = open_position["shares"]
+            exit_price_type = self.parameters.get("exit_price_condition", "close")
+            current_exit_price = last_row.get(exit_price_type, last_row["close"]) if exit_price_type in ("open", "close", "high", "low") else last_row["close"]
+            self.add_holding_position(HoldingPosition(
+                position_id=f"{stock_id}_{signals['date'][open_position['entry_row']]}_{entry_price}_{uuid.uuid4().hex[:8]}",
+                entry_date=signals["date"][open_position["entry_row"]],
+                stock_id=stock_id,
+                stock_name=f"{stock_name}",
+                trade_direction=1,
+                entry_price=entry_price,
+                shares=shares,
+                current_price=last_row["close"],
+                unrealized_profit_loss=(last_row["close"] - entry_price) * shares,
+                unrealized_profit_loss_rate=((last_row["close"] - entry_price) / entry_price) * 100,
+                holding_days=len(signals) - 1 - open_position["entry_row"],
+                current_date=last_row["date"],
+                exit_price_type=exit_price_type,
+                current_entry_price=entry_price,
+                current_exit_price=current_exit_price,
+                current_profit_loss=(current_exit_price - entry_price) * shares,
+                current_profit_loss_rate=((current_exit_price - entry_price) / entry_price) * 100,
+                take_profit_price=entry_price * (1 + engine.take_profit) if engine.take_profit is not None else 0.0,
+                stop_loss_price=entry_price * (1 + engine.stop_loss) if engine.stop_loss is not None else 0.0,
+                open_price=last_row["open"],
+                high_price=last_row["high"],
+                low_price=last_row["low"],
+                close_price=last_row["close"]
+            ))
+        if self._debug:
+            self.logger.debug("事件驅動回測完成: %s 交易 %s 筆，K 棒 %s 根", stock_id, result["size"], len(signals))
+
     def get_strategy_result(self, initial_capital: float) -> Dict[str, Any]:
         """取得策略結果"""
-        print_log(f"get_strategy_result")
+        if self._trace:
+            self.logger.trace("get_strategy_result")
         if not self.trade_records:
             return {
                 "strategy_name": self.strategy_name,
@@ -998,91 +1247,41 @@ class DynamicStrategy(BaseStrategy):
                 "max_drawdown": 0.0,
                 "max_drawdown_rate": 0.0,
                 "sharpe_ratio": 0.0,
+                "sortino_ratio": 0.0,
+                "calmar_ratio": 0.0,
+                "profit_factor": 0.0,
+                "expectancy": 0.0,
+                "exposure": 0.0,
                 "trade_records": [],
-                "equity_curve": self.equity_curve,
-                "dates": self.dates,
+                "equity_curve": list(self.equity_curve),
+                "dates": list(self.dates),
                 "parameters": self.parameters,
                 "charts": self.supported_charts,
                 "holding_positions": []
             }
         
-        # 計算統計資料
-        total_trades = len(self.trade_records)
-        winning_trades = len([t for t in self.trade_records if t.net_profit_loss > 0])
-        losing_trades = len([t for t in self.trade_records if t.net_profit_loss < 0])
-        win_rate = (winning_trades / total_trades) * 100 if total_trades > 0 else 0
-        
-        total_profit_loss = sum(t.net_profit_loss for t in self.trade_records)
-        total_profit_loss_rate = (total_profit_loss / initial_capital) * 100
-        
-        # 計算最大回撤
-        max_drawdown = 0.0
-        max_drawdown_rate = 0.0
-        peak = initial_capital
-        
-        for equity in self.equity_curve:
-            if equity > peak:
-                peak = equity
-            drawdown = peak - equity
-            drawdown_rate = (drawdown / peak) * 100
-            
-            if drawdown > max_drawdown:
-                max_drawdown = drawdown
-                max_drawdown_rate = drawdown_rate
-        
-        # 計算夏普比率
-        if len(self.equity_curve) > 1:
-            returns = []
-            for i in range(1, len(self.equity_curve)):
-                if self.equity_curve[i-1] > 0:
-                    returns.append((self.equity_curve[i] - self.equity_curve[i-1]) / self.equity_curve[i-1])
-            
-            if returns:
-                avg_return = sum(returns) / len(returns)
-                std_return = (sum((r - avg_return) ** 2 for r in returns) / len(returns)) ** 0.5
-                sharpe_ratio = avg_return / std_return if std_return > 0 else 0
-            else:
-                sharpe_ratio = 0
-        else:
-            sharpe_ratio = 0
+        # 計算統計資料（共用向量化績效指標，比率轉為百分比輸出）
+        trade_frame = self.trade_records.to_frame()
+        metrics = PerformanceMetrics.compute(
+            self.equity_curve,
+            trade_frame["net_profit_loss"],
+            initial_capital,
+            dates=self.dates,
+            entry_dates=trade_frame["entry_date"],
+            exit_dates=trade_frame["exit_date"]
+        )
+        total_trades = metrics["total_trades"]
+        winning_trades = metrics["winning_trades"]
+        losing_trades = metrics["losing_trades"]
+        win_rate = metrics["win_rate"] * 100
+        total_profit_loss = metrics["total_profit_loss"]
+        total_profit_loss_rate = metrics["total_profit_loss_rate"] * 100
+        max_drawdown = metrics["max_drawdown"]
+        max_drawdown_rate = metrics["max_drawdown_rate"] * 100
+        sharpe_ratio = metrics["sharpe_ratio"]
         
-        # 將 TradeRecord 物件轉換為字典
-        trade_records_dict = []
-        for trade in self.trade_records:
-            trade_dict = {
-                "position_id": trade.position_id,
-                "entry_date": trade.entry_date.strftime("%Y-%m-%d") if trade.entry_date else "",
-                "exit_date": trade.exit_date.strftime("%Y-%m-%d") if trade.exit_date else "",
-                "stock_id": trade.stock_id,
-                "stock_name": trade.stock_name,
-                "trade_direction": trade.trade_direction,
-                "entry_price": trade.entry_price,
-                "exit_price": trade.exit_price,
-                "shares": trade.shares,
-                "profit_loss": trade.profit_loss,
-                "profit_loss_rate": trade.profit_loss_rate,
-                "commission": trade.commission,
-                "securities_tax": trade.securities_tax,
-                "net_profit_loss": trade.net_profit_loss,
-                "holding_days": trade.holding_days,
-                "exit_reason": trade.exit_reason,
-                "current_price": trade.current_price,
-                "unrealized_profit_loss": trade.unrealized_profit_loss,
-                "unrealized_profit_loss_rate": trade.unrealized_profit_loss_rate,
-                "current_date": trade.current_date.strftime("%Y-%m-%d") if trade.current_date else "",
-                "exit_price_type": trade.exit_price_type,
-                "current_entry_price": trade.current_entry_price,
-                "current_exit_price": trade.current_exit_price,
-                "current_profit_loss": trade.current_profit_loss,
-                "current_profit_loss_rate": trade.current_profit_loss_rate,
-                "take_profit_price": trade.take_profit_price,
-                "stop_loss_price": trade.stop_loss_price,
-                "open_price": trade.open_price,
-                "high_price": trade.high_price,
-                "low_price": trade.low_price,
-                "close_price": trade.close_price
-            }
-            trade_records_dict.append(trade_dict)
+        # 交易記錄由欄式帳本批次轉換為字典
+        trade_records_dict = self.trade_records.to_dicts()
         
         # 將 HoldingPosition 物件轉換為字典
         holding_positions_dict = []
@@ -1125,9 +1324,15 @@ class DynamicStrategy(BaseStrategy):
             "max_drawdown": max_drawdown,
             "max_drawdown_rate": max_drawdown_rate,
             "sharpe_ratio": sharpe_ratio,
+            "sortino_ratio": metrics["sortino_ratio"],
+            "calmar_ratio": metrics["calmar_ratio"],
+            "profit_factor": metrics["profit_factor"],
+            "expectancy": metrics["expectancy"],
+            "exposure": metrics["exposure"] * 100,
             "trade_records": trade_records_dict,
-            "equity_curve": self.equity_curve,
-            "dates": self.dates,
+            "trade_frame": trade_frame,
+            "equity_curve": list(self.equity_curve),
+            "dates": list(self.dates),
             "parameters": self.parameters,
             "charts": self.supported_charts,
             "holding_positions": holding_positions_dict
@@ -1135,7 +1340,8 @@ class DynamicStrategy(BaseStrategy):
     
     def _execute_function(self, function_name: str, *args, **kwargs):
         """執行策略函數"""
-        print_log(f"_execute_function")
+        if self._trace:
+            self.logger.trace("_execute_function")
         if function_name in self.compiled_code:
             try:
                 # 取得函數對象
@@ -1190,35 +1396,40 @@ class DynamicStrategy(BaseStrategy):
                     else:
                         return None
                 else:
-                    print_log(f"-------_execute_function------ValueError: {e}")
+                    self.logger.error("_execute_function %s ValueError: %s", function_name, e)
                     raise e
             except Exception as e:
-                print_log(f"-------_execute_function------e: {e}")
+                self.logger.error("_execute_function %s 執行錯誤: %s", function_name, e)
                 raise e
         else:
             raise ValueError(f"策略函數 {function_name} 不存在")
     
     @property
     def required_parameters(self) -> List[str]:
-        print_log(f"required_parameters")
+        if self._trace:
+            self.logger.trace("required_parameters")
         return ["commission_rate", "commission_discount", "securities_tax_rate", "shares_per_trade"]
     
     @property
     def supported_charts(self) -> List[str]:
-        print_log(f"supported_charts")
+        if self._trace:
+            self.logger.trace("supported_charts")
         return ["price_chart", "volume_chart", "profit_loss_chart"]
     
     @property
     def data_source(self) -> str:
-        print_log(f"data_source")
+        if self._trace:
+            self.logger.trace("data_source")
         return "excel"
     
     @property
     def stock_source(self) -> str:
-        print_log(f"stock_source")
+        if self._trace:
+            self.logger.trace("stock_source")
         return "excel"
     
     @property
     def need_date_range(self) -> bool:
-        print_log(f"need_date_range")
+        if self._trace:
+            self.logger.trace("need_date_range")
         return False 
\ No newline at end of file
@@ -0,0 +1,293 @@
+# 事件驅動回測引擎
+"""
+單一股票的事件驅動回測
+
+持有時間佔全部 K 棒比例很低的策略（當沖、詢圈、N 日突破等），逐根 K 棒迴圈大部分時間都在空轉。
+本引擎只在事件之間跳躍：
+- 進場候選為 should_entry == 1 的列索引陣列，出場後以 searchsorted 找下一個進場點
+- 出場以持有區間的切片向前搜尋：停利/停損分別以 cummax(high) / cummin(low) 後 searchsorted
+  找第一根觸價 K 棒，出場訊號（should_exit）以 searchsorted 找下一個訊號列，最大持有天數直接換算列索引
+- 每筆交易只做常數次 NumPy 運算，成本與交易筆數（與持有長度）成正比，與總 K 棒數無關
+
+只支援做多（停利看最高價、停損看最低價、損益以買進計算）；trade_direction 不是做多時
+from_parameters 拋出 ValueError，DynamicStrategy 會改用一般回測。
+
+同一根 K 棒多個出場條件同時成立時依序為：停損、停利、出場訊號、最大持有天數。
+以開盤價進場時進場當根即開始檢查出場（與向量化模式相同，允許當日進出），以收盤價進場時從次一根開始。
+"""
+
+from typing import Any, Dict, List, Optional
+import uuid
+import numpy as np
+import polars as pl
+
+from config.trading_config import TradingConfig
+from core.logger import get_logger
+from core.price_utils import PriceUtils
+
+logger = get_logger("event_engine.py")
+
+REQUIRED_COLUMNS = ["date", "open", "high", "low", "close", "should_entry"]
+# 同一根 K 棒多個出場條件成立時的優先順序（數值小者優先）
+EXIT_PRIORITY = ("stop_loss", "take_profit", "signal", "max_holding")
+EXIT_REASONS = {
+    "stop_loss": "停損",
+    "take_profit": "停利",
+    "signal": "出場訊號",
+    "max_holding": "超過最大持有天數",
+    "force_exit": "回測結束強制出場"
+}
+
+
+def is_long(parameters: Dict[str, Any]) -> bool:
+    """策略參數的交易方向是否為做多（未設定時預設做多）"""
+    return parameters.get("trade_direction", "long") in ("long", 1)
+
+
+def _column(frame: pl.DataFrame, name: str, fill: float) -> np.ndarray:
+    return frame[name].cast(pl.Float64, strict=False).fill_null(fill).fill_nan(fill).to_numpy()
+
+
+def _first_at_or_above(values: np.ndarray, level: float) -> int:
+    """切片中第一個 >= level 的位置（以 cummax 後 searchsorted），沒有時回傳切片長度"""
+    return int(np.searchsorted(np.maximum.accumulate(values), level, side="left"))
+
+
+def _first_at_or_below(values: np.ndarray, level: float) -> int:
+    """切片中第一個 <= level 的位置（以 cummin 取負號後 searchsorted），沒有時回傳切片長度"""
+    return int(np.searchsorted(-np.minimum.accumulate(values), -level, side="left"))
+
+
+class EventDrivenBacktestEngine:
+    """
+    事件驅動回測引擎（單一股票、獨立資金、每次進場投入全部資金，與狀態機模式相同以已實現損益累積資金）
+
+    出場條件：
+    - 停利：use_take_profit 且最高價觸及 進場價 × (1 + take_profit_percentage)
+    - 停損：use_stop_loss 且最低價觸及 進場價 × (1 + stop_loss_percentage)（stop_loss_percentage 為負值）
+    - 出場訊號：should_exit == 1，出場價為 exit_price 欄位（> 0 時）或依 exit_price_condition 取開盤/收盤價
+    - 最大持有天數：use_max_holding_days 且持有滿 max_holding_days 根 K 棒，以收盤價出場
+    停利/停損跳空越過觸價時以開盤價成交。
+    """
+
+    def __init__(self, initial_capital: float, share_type: str = "mixed", entry_type: str = "open",
+                 exit_price_condition: str = "open", take_profit: Optional[float] = None,
+                 stop_loss: Optional[float] = None, max_holding_days: Optional[int] = None,
+                 force_exit: bool = False):
+        self.initial_capital = float(initial_capital)
+        self.share_type = share_type or "mixed"
+        self.entry_type = entry_type or "open"
+        self.exit_price_condition = exit_price_condition or "open"
+        self.take_profit = take_profit
+        self.stop_loss = stop_loss
+        self.max_holding_days = int(max_holding_days) if max_holding_days else None
+        self.force_exit = bool(force_exit)
+
+    @classmethod
+    def from_parameters(cls, initial_capital: float, parameters: Dict[str, Any]) -> "EventDrivenBacktestEngine":
+        """以策略參數建立引擎（參數名稱與 DynamicStrategy 相同，未開啟的出場條件不啟用；只支援做多）"""
+        if not is_long(parameters):
+            raise ValueError(f"事件驅動回測只支援做多，不支援 trade_direction={parameters.get('trade_direction')!r}")
+        def enabled_value(flag: str, name: str):
+            if not parameters.get(flag, False):
+                return None
+            value = parameters.get(name)
+            return TradingConfig.FLOAT_PARAMETERS.get(name, {}).get("default") if value is None else value
+
+        max_holding_days = None
+        if parameters.get("use_max_holding_days", False):
+            max_holding_days = parameters.get("max_holding_days") or TradingConfig.get_int_parameter_default("max_holding_days")
+        take_profit = enabled_value("use_take_profit", "take_profit_percentage")
+        stop_loss = enabled_value("use_stop_loss", "stop_loss_percentage")
+        return cls(
+            initial_capital,
+            share_type=parameters.get("share_type", "mixed"),
+            entry_type=parameters.get("entry_type", "open"),
+            exit_price_condition=parameters.get("exit_price_condition", "open"),
+            take_profit=float(take_profit) if take_profit is not None else None,
+            stop_loss=float(stop_loss) if stop_loss is not None else None,
+            max_holding_days=max_holding_days,
+            force_exit=bool(parameters.get("force_exit", False))
+        )
+
+    def _exit_for_entry(self, data: Dict[str, np.ndarray], entry_row: int, entry_price: float,
+                        exit_signals: np.ndarray) -> Optional[tuple]:
+        """
+        找出單筆部位的出場點
+
+        Returns:
+            (出場列, 出場價, 出場條件) 或 None（資料結束前未出場）
+        """
+        n = len(data["close"])
+        first = entry_row if self.entry_type == "open" else entry_row + 1
+        if first >= n:
+            return None
+        # 候選出場列：(列, 優先序, 條件)
+        candidates = []
+        horizon = n
+        if self.max_holding_days is not None:
+            row = entry_row + self.max_holding_days
+            if row < n:
+                candidates.append((row, EXIT_PRIORITY.index("max_holding"), "max_holding"))
+                horizon = row + 1
+        position = int(np.searchsorted(exit_signals, first, side="left"))
+        if position < len(exit_signals) and exit_signals[position] < horizon:
+            row = int(exit_signals[position])
+            candidates.append((row, EXIT_PRIORITY.index("signal"), "signal"))
+            horizon = row + 1
+        # 停利/停損只需搜尋到目前最早的出場列為止
+        if self.take_profit is not None:
+            level = entry_price * (1 + self.take_profit)
+            offset = _first_at_or_above(data["high"][first:horizon], level)
+            if first + offset < horizon:
+                candidates.append((first + offset, EXIT_PRIORITY.index("take_profit"), "take_profit"))
+                horizon = first + offset + 1
+        if self.stop_loss is not None:
+            level = entry_price * (1 + self.stop_loss)
+            offset = _first_at_or_below(data["low"][first:horizon], level)
+            if first + offset < horizon:
+                candidates.append((first + offset, EXIT_PRIORITY.index("stop_loss"), "stop_loss"))
+        if not candidates:
+            return None
+        row, _, condition = min(candidates)
+        open_price = data["open"][row]
+        if condition == "take_profit":
+            level = entry_price * (1 + self.take_profit)
+            price = open_price if row > entry_row and open_price >= level else level
+        elif condition == "stop_loss":
+            level = entry_price * (1 + self.stop_loss)
+            price = open_price if row > entry_row and open_price <= level else level
+        elif condition == "signal":
+            price = data["exit_price"][row] if data["exit_price"][row] > 0 else (
+                open_price if self.exit_price_condition == "open" else data["close"][row]
+            )
+        else:
+            price = data["close"][row]
+        return row, float(price), condition
+
+    def run(self, signals: pl.DataFrame, stock_id: str = "", stock_name: str = "") -> Dict[str, Any]:
+        """
+        執行單一股票的事件驅動回測
+
+        Args:
+            signals: 已計算 should_entry（及選用 should_exit、exit_price、exit_reason）的股價資料，需依日期排序
+            stock_id / stock_name: 寫入交易記錄的股票代碼與名稱
+
+        Returns:
+            Dict[str, Any]: trades（交易帳本欄位，供 TradeLedger.extend_columns）、size（交易筆數）、
+                            equity_curve（以已實現損益累積的每日資金）、open_position（資料結束時仍持有的部位）
+        """
+        missing = [name for name in REQUIRED_COLUMNS if name not in signals.columns]
+        if missing:
+            raise ValueError(f"事件驅動回測資料缺少欄位: {missing}")
+        n = len(signals)
+        data = {
+            "open": _column(signals, "open", np.nan),
+            "close": _column(signals, "close", np.nan),
+            # 缺值不可觸發停利/停損
+            "high": _column(signals, "high", -np.inf),
+            "low": _column(signals, "low", np.inf),
+            "exit_price": _column(signals, "exit_price", 0.0) if "exit_price" in signals.columns else np.zeros(n)
+        }
+        entries = np.flatnonzero(_column(signals, "should_entry", 0.0) == 1)
+        exit_signals = (
+            np.flatnonzero(_column(signals, "should_exit", 0.0) == 1) if "should_exit" in signals.columns
+            else np.empty(0, dtype=np.int64)
+        )
+        exit_reasons = signals["exit_reason"].to_list() if "exit_reason" in signals.columns else None
+
+        capital = self.initial_capital
+        trades: List[tuple] = []
+        open_position = None
+        position = 0
+        while position < len(entries):
+            entry_row = int(entries[position])
+            entry_price = data["open"][entry_row] if self.entry_type == "open" else data["close"][entry_row]
+            shares = PriceUtils.calculate_shares(capital, entry_price, self.share_type) if entry_price > 0 else 0
+            if shares <= 0:
+                position += 1
+                continue
+            exit_info = self._exit_for_entry(data, entry_row, float(entry_price), exit_signals)
+            if exit_info is None and self.force_exit and entry_row < n - 1:
+                exit_info = (n - 1, float(data["close"][n - 1]), "force_exit")
+            if exit_info is None:
+                open_position = {"entry_row": entry_row, "entry_price": float(entry_price), "shares": shares}
+                break
+            exit_row, exit_price, condition = exit_info
+            profit_loss = (exit_price - entry_price) * shares
+            commission = TradingConfig.calculate_commission(entry_price * shares)
+            tax = TradingConfig.calculate_securities_tax(exit_price * shares)
+            net_profit_loss = profit_loss - commission - tax
+            capital += net_profit_loss
+            reason = EXIT_REASONS[condition]
+            if condition == "signal" and exit_reasons is not None and exit_reasons[exit_row]:
+                reason = exit_reasons[exit_row]
+            trades.append((entry_row, exit_row, float(entry_price), exit_price, shares,
+                           profit_loss, commission, tax, net_profit_loss, reason))
+            # 出場當根不再進場，跳到出場後的下一個進場點
+            position = int(np.searchsorted(entries, exit_row, side="right"))
+
+        # 權益曲線：出場當根起資金加上該筆淨損益
+        deltas = np.zeros(n, dtype=np.float64)
+        for trade in trades:
+            deltas[trade[1]] += trade[8]
+        equity_curve = self.initial_capital + np.cumsum(deltas)
+        return {
+            "trades": self._trade_columns(signals, data, trades, stock_id, stock_name),
+            "size": len(trades),
+            "equity_curve": equity_curve,
+            "open_position": open_position
+        }
+
+    def _trade_columns(self, signals: pl.DataFrame, data: Dict[str, np.ndarray], trades: List[tuple],
+                       stock_id: str, stock_name: str) -> Dict[str, Any]:
+        if not trades:
+            return {}
+        columns = list(zip(*trades))
+        entry_rows = np.asarray(columns[0], dtype=np.int64)
+        exit_rows = np.asarray(columns[1], dtype=np.int64)
+        entry_price = np.asarray(columns[2], dtype=np.float64)
+        exit_price = np.asarray(columns[3], dtype=np.float64)
+        shares = np.asarray(columns[4], dtype=np.float64)
+        profit_loss = np.asarray(columns[5], dtype=np.float64)
+        profit_loss_rate = (exit_price - entry_price) / entry_price * 100
+        # 只取交易列的日期，不轉換整欄
+        entry_dates = signals["date"].gather(entry_rows).to_list()
+        exit_dates = signals["date"].gather(exit_rows).to_list()
+        size = len(trades)
+        return {
+            "position_id": [
+                f"{stock_id}_{day}_{price}_{uuid.uuid4().hex[:8]}"
+                for day, price in zip(entry_dates, entry_price.tolist())
+            ],
+            "entry_date": entry_dates,
+            "exit_date": exit_dates,
+            "stock_id": [stock_id] * size,
+            "stock_name": [stock_name] * size,
+            "trade_direction": np.ones(size, dtype=np.int64),
+            "entry_price": entry_price,
+            "exit_price": exit_price,
+            "shares": shares,
+            "profit_loss": profit_loss,
+            "profit_loss_rate": profit_loss_rate,
+            "commission": np.asarray(columns[6], dtype=np.float64),
+            "securities_tax": np.asarray(columns[7], dtype=np.float64),
+            "net_profit_loss": np.asarray(columns[8], dtype=np.float64),
+            "holding_days": exit_rows - entry_rows,
+            "exit_reason": list(columns[9]),
+            "current_price": exit_price,
+            "unrealized_profit_loss": profit_loss,
+            "unrealized_profit_loss_rate": profit_loss_rate,
+            "current_date": exit_dates,
+            "exit_price_type": [self.exit_price_condition] * size,
+            "current_entry_price": entry_price,
+            "current_exit_price": exit_price,
+            "current_profit_loss": profit_loss,
+            "current_profit_loss_rate": profit_loss_rate,
+            "take_profit_price": entry_price * (1 + self.take_profit) if self.take_profit is not None else None,
+            "stop_loss_price": entry_price * (1 + self.stop_loss) if self.stop_loss is not None else None,
+            "open_price": data["open"][exit_rows],
+            "high_price": np.nan_to_num(data["high"][exit_rows], neginf=0.0),
+            "low_price": np.nan_to_num(data["low"][exit_rows], posinf=0.0),
+            "close_price": data["close"][exit_rows]
+        }
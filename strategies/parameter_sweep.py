@@ -0,0 +1,295 @@
+# 參數掃描模組
+"""
+策略參數掃描（grid / random / 提前停止）
+
+- 股價資料只載入、排序、分段一次，參數無關的指標欄位（generate_indicators 與策略的 prepare_indicators）
+  也只在主行程計算一次，再寫成共用的 Arrow IPC 檔
+- 每組參數組合為一個行程池任務：子行程以 memory map 讀取資料、策略只編譯一次，
+  之後每檔股票以 reset(參數) 重複使用，只回傳彙總指標（不傳回交易明細）
+- 結果依目標指標排序為績效表
+"""
+
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import copy
+import itertools
+import random
+import numpy as np
+import polars as pl
+
+from core.logger import get_logger
+from core.metrics import PerformanceMetrics
+from strategies.process_executor import (
+    default_worker_count, get_executor, shared_backtest_inputs, _load_inputs, _load_strategy
+)
+
+logger = get_logger("parameter_sweep.py")
+
+# grid 模式允許的最大組合數，避免一次送出過量任務
+MAX_COMBINATIONS = 2000
+SWEEP_METHODS = ("grid", "random")
+# 數值越小越好的指標，排序時改為遞增
+LOWER_IS_BETTER = ("max_drawdown", "max_drawdown_rate")
+
+
+def _expand_values(name: str, spec: Any) -> List[Any]:
+    """
+    展開單一參數的候選值
+
+    支援 list / tuple、{"values": [...]}、{"min": a, "max": b, "step": s}，其他值視為固定值
+    """
+    if isinstance(spec, (list, tuple)):
+        values = list(spec)
+    elif isinstance(spec, dict) and "values" in spec:
+        values = list(spec["values"])
+    elif isinstance(spec, dict) and "min" in spec and "max" in spec:
+        start, stop = spec["min"], spec["max"]
+        step = spec.get("step") or 1
+        if step <= 0:
+            raise ValueError(f"參數 {name} 的 step 必須大於 0")
+        count = int(np.floor((stop - start) / step + 1e-9)) + 1
+        if count <= 0:
+            raise ValueError(f"參數 {name} 的 min 不可大於 max")
+        integral = all(isinstance(v, int) and not isinstance(v, bool) for v in (start, stop, step))
+        values = [start + i * step if integral else round(start + i * step, 10) for i in range(count)]
+    else:
+        values = [spec]
+    if not values:
+        raise ValueError(f"參數 {name} 沒有候選值")
+    return values
+
+
+def build_parameter_combinations(space: Dict[str, Any], method: str = "grid", n_samples: int = 0,
+                                 seed: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    由參數空間產生參數組合
+
+    Args:
+        space: {參數名稱: 候選值設定}
+        method: grid（完整笛卡兒積）或 random（不重複隨機抽樣）
+        n_samples: random 模式的抽樣數
+        seed: random 模式的亂數種子
+
+    Returns:
+        List[Dict[str, Any]]: 參數組合
+    """
+    if method not in SWEEP_METHODS:
+        raise ValueError(f"不支援的掃描方式: {method}，可用: {', '.join(SWEEP_METHODS)}")
+    if not space:
+        raise ValueError("參數空間不可為空")
+    names = list(space.keys())
+    axes = [_expand_values(name, space[name]) for name in names]
+    total = int(np.prod([len(axis) for axis in axes], dtype=np.int64))
+
+    if method == "grid":
+        if total > MAX_COMBINATIONS:
+            raise ValueError(f"參數組合共 {total} 組，超過上限 {MAX_COMBINATIONS}，請縮小範圍或改用 random")
+        return [dict(zip(names, values)) for values in itertools.product(*axes)]
+
+    # random：抽出組合索引後以混合進位解碼，不需展開整個笛卡兒積
+    n_samples = min(int(n_samples or MAX_COMBINATIONS), total, MAX_COMBINATIONS)
+    rng = random.Random(seed)
+    indices = rng.sample(range(total), n_samples)
+    combinations = []
+    for index in indices:
+        combo = {}
+        for name, axis in zip(reversed(names), reversed(axes)):
+            index, position = divmod(index, len(axis))
+            combo[name] = axis[position]
+        combinations.append({name: combo[name] for name in names})
+    return combinations
+
+
+def summarize_results(results: List[Dict[str, Any]], initial_capital: float) -> Dict[str, Any]:
+    """彙總單一參數組合所有股票的結果（比率皆為小數）"""
+    frames = [result["trade_frame"] for result in results if result.get("trade_frame") is not None]
+    net_profit_loss = (
+        pl.concat([frame["net_profit_loss"] for frame in frames]) if frames else pl.Series("net_profit_loss", [], dtype=pl.Float64)
+    )
+    summary = PerformanceMetrics.trade_statistics(net_profit_loss)
+    returns = [PerformanceMetrics.returns(result.get("equity_curve") or []) for result in results]
+    returns = np.concatenate(returns) if returns else np.empty(0, dtype=np.float64)
+    drawdowns = [PerformanceMetrics.drawdown(result.get("equity_curve") or [], initial_capital) for result in results]
+    summary.update({
+        "total_profit_loss_rate": summary["total_profit_loss"] / initial_capital if initial_capital else 0.0,
+        "max_drawdown": max((d["max_drawdown"] for d in drawdowns), default=0.0),
+        "max_drawdown_rate": max((d["max_drawdown_pct"] for d in drawdowns), default=0.0),
+        "sharpe_ratio": PerformanceMetrics.sharpe_ratio(returns),
+        "stocks": len(results)
+    })
+    return summary
+
+
+def _run_parameter_combination(data_path: str, excel_path: Optional[str], strategy_code: str, strategy_name: str,
+                               parameters: Dict[str, Any], initial_capital: float,
+                               ranges: List[Tuple[str, int, int]]) -> Dict[str, Any]:
+    """子行程：以一組參數回測所有股票，只回傳彙總指標"""
+    frame, excel_data = _load_inputs(data_path, excel_path)
+    results = []
+    for stock_id, offset, length in ranges:
+        try:
+            strategy = _load_strategy(strategy_code, strategy_name, parameters)
+            group_data = frame.slice(offset, length)
+            stock_name = group_data["stock_name"][0] if "stock_name" in group_data.columns else stock_id
+            strategy.run_backtest(group_data, excel_data, initial_capital, stock_id, f"{stock_name}")
+            result = strategy.get_strategy_result(initial_capital)
+            # 策略實例會重複用於下一檔股票，逐股保留權益曲線與日期的複本，回落與夏普比率才不會共用同一份曲線
+            results.append({
+                "trade_frame": result.get("trade_frame"),
+                "equity_curve": list(result.get("equity_curve") or []),
+                "dates": list(result.get("dates") or [])
+            })
+        except Exception as e:
+            logger.error("股票 %s 回測失敗: %s", stock_id, e)
+    return summarize_results(results, initial_capital)
+
+
+class ParameterSweep:
+    """策略參數掃描器"""
+
+    def __init__(self, strategy, base_parameters: Dict[str, Any], space: Dict[str, Any],
+                 method: str = "grid", n_samples: int = 0, seed: Optional[int] = None,
+                 target: str = "total_profit_loss", patience: int = 0, min_trades: int = 0,
+                 indicators: List[str] = None, max_workers: int = 0):
+        """
+        Args:
+            strategy: 已編譯的 DynamicStrategy（主行程用於預先計算指標）
+            base_parameters: 基礎策略參數，每組組合覆寫其中的掃描參數
+            space: 參數空間，見 build_parameter_combinations
+            method: grid 或 random
+            n_samples / seed: random 模式的抽樣數與亂數種子
+            target: 排序與提前停止依據的指標
+            patience: 連續多少組沒有改善目標指標就提前停止，0 表示不提前停止
+            min_trades: 交易筆數少於此值的組合不列入排名與提前停止判斷
+            indicators: 預先計算的 generate_indicators 指標名稱
+            max_workers: 子行程數量，0 表示使用 CPU 核心數
+        """
+        self.strategy = strategy
+        self.base_parameters = base_parameters
+        self.combinations = build_parameter_combinations(space, method, n_samples, seed)
+        self.method = method
+        self.target = target
+        self.patience = max(int(patience or 0), 0)
+        self.min_trades = max(int(min_trades or 0), 0)
+        self.indicators = list(indicators or [])
+        self.max_workers = max_workers or default_worker_count()
+
+    @classmethod
+    def from_config(cls, strategy, base_parameters: Dict[str, Any], config: Dict[str, Any]) -> "ParameterSweep":
+        """由掃描設定（API 傳入的 JSON）建立掃描器"""
+        return cls(
+            strategy,
+            base_parameters,
+            config.get("parameters") or {},
+            method=config.get("method", "grid"),
+            n_samples=int(config.get("n_samples") or 0),
+            seed=config.get("seed"),
+            target=config.get("target") or "total_profit_loss",
+            patience=int(config.get("patience") or 0),
+            min_trades=int(config.get("min_trades") or 0),
+            indicators=config.get("indicators"),
+            max_workers=int(config.get("max_workers") or base_parameters.get("max_workers") or 0)
+        )
+
+    def _score(self, metrics: Dict[str, Any]) -> Optional[float]:
+        if metrics.get("total_trades", 0) < self.min_trades:
+            return None
+        value = metrics.get(self.target)
+        if value is None:
+            return None
+        return -float(value) if self.target in LOWER_IS_BETTER else float(value)
+
+    def run(self, stock_data: pl.DataFrame, excel_data: Optional[pl.DataFrame], initial_capital: float,
+            progress: Callable[..., None] = None) -> Dict[str, Any]:
+        """
+        執行參數掃描
+
+        Args:
+            stock_data: 全部股票的股價資料
+            excel_data: 策略用的 Excel 資料
+            initial_capital: 初始資金
+            progress: 進度回呼 progress(已完成組合數, total=組合總數, trades=累計交易筆數, message=目前最佳)，
+                      回呼拋出例外時取消尚未執行的組合並向上拋出
+
+        Returns:
+            Dict[str, Any]: rankings（依目標指標排序的績效表）、best、evaluated、stopped_early 等
+        """
+        stock_data = self.strategy.prepare_indicators(stock_data, excel_data, self.indicators)
+        total = len(self.combinations)
+        rows: List[Dict[str, Any]] = []
+        best_score = None
+        since_improvement = 0
+        stopped_early = False
+        trades = 0
+
+        with shared_backtest_inputs(stock_data, excel_data) as (data_path, excel_path, ranges):
+            executor = get_executor(self.max_workers)
+            pending = {}
+            queue = iter(enumerate(self.combinations))
+
+            def submit_next() -> bool:
+                item = next(queue, None)
+                if item is None:
+                    return False
+                index, combo = item
+                parameters = copy.deepcopy(self.base_parameters)
+                parameters.update(combo)
+                future = executor.submit(_run_parameter_combination, data_path, excel_path,
+                                         self.strategy.strategy_code, self.strategy.custom_strategy_name,
+                                         parameters, initial_capital, ranges)
+                pending[future] = (index, combo)
+                return True
+
+            # 只讓 worker 數量的任務在途，提前停止時不必等待整批已送出的組合
+            for _ in range(self.max_workers):
+                if not submit_next():
+                    break
+            try:
+                while pending:
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index, combo = pending.pop(future)
+                        try:
+                            metrics = future.result()
+                        except Exception as e:
+                            logger.error("參數組合 %s 執行失敗: %s", combo, e)
+                            metrics = {"error": str(e)}
+                        rows.append({"combination": index, "parameters": combo, **metrics})
+                        trades += metrics.get("total_trades", 0)
+                        score = self._score(metrics)
+                        if score is not None and (best_score is None or score > best_score):
+                            best_score = score
+                            since_improvement = 0
+                        else:
+                            since_improvement += 1
+                        if self.patience and since_improvement >= self.patience:
+                            stopped_early = True
+                    if progress is not None:
+                        best = None if best_score is None else (-best_score if self.target in LOWER_IS_BETTER else best_score)
+                        progress(len(rows), total=total, trades=trades, message=f"{self.target} 最佳: {best}")
+                    if not stopped_early:
+                        while len(pending) < self.max_workers and submit_next():
+                            pass
+            except Exception:
+                for future in pending:
+                    future.cancel()
+                raise
+        return self._build_result(rows, total, stopped_early)
+
+    def _build_result(self, rows: List[Dict[str, Any]], total: int, stopped_early: bool) -> Dict[str, Any]:
+        """依目標指標排序，未達最少交易筆數或失敗的組合排在最後"""
+        ranked = sorted(
+            rows,
+            key=lambda row: (self._score(row) is None, -(self._score(row) or 0.0), row["combination"])
+        )
+        for rank, row in enumerate(ranked, start=1):
+            row["rank"] = rank
+        return {
+            "method": self.method,
+            "target": self.target,
+            "total_combinations": total,
+            "evaluated": len(rows),
+            "stopped_early": stopped_early,
+            "best": ranked[0] if ranked and self._score(ranked[0]) is not None else None,
+            "rankings": ranked
+        }
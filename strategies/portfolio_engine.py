@@ -0,0 +1,390 @@
+# 投資組合回測引擎
+"""
+多股票共用資金的投資組合回測
+
+將整個股票池的訊號資料（長表，含 stock_id/date/open/close/should_entry/should_exit）
+轉為 [日期 × 股票] 的 NumPy 矩陣後，只沿日期軸走一次；每個交易日的進出場、
+資金分配與市值評估都以橫截面（所有股票）向量化計算，取代每檔股票各跑一次迴圈。
+"""
+
+from typing import Any, Dict, List, Optional
+import uuid
+import numpy as np
+import polars as pl
+
+from config.trading_config import TradingConfig
+from core.logger import get_logger
+from core.metrics import PerformanceMetrics
+from core.price_utils import PriceUtils
+from strategies.trade_ledger import TradeLedger
+
+logger = get_logger("portfolio_engine.py")
+
+REQUIRED_COLUMNS = ["stock_id", "date", "open", "close", "should_entry"]
+
+
+def _vectorized_commission(amount: np.ndarray) -> np.ndarray:
+    """TradingConfig.calculate_commission 的陣列版本"""
+    return np.clip(amount * TradingConfig.COMMISSION_RATE, TradingConfig.MIN_COMMISSION, TradingConfig.MAX_COMMISSION)
+
+
+class PortfolioBacktestEngine:
+    """
+    投資組合回測引擎
+
+    所有股票共用同一筆資金：
+    - 單一股票部位上限為前一日權益 × max_position_size（預設 TradingConfig.MAX_POSITION_SIZE）
+    - 同時持有檔數上限為 max_positions（0 表示不限制）
+    - 同日多檔進場時依 rank_column 由大到小分配資金，未提供時依股票代碼順序
+    - 權益曲線以所有股票的聯集日期對齊，未開盤的股票沿用最近收盤價評估市值
+
+    交易日內的順序與 DynamicStrategy 向量化模式一致：先處理進場、再處理出場（允許當日進出）。
+    """
+
+    def __init__(self, initial_capital: float, max_position_size: float = None, max_positions: int = 0,
+                 share_type: str = "mixed", entry_type: str = "open", exit_price_condition: str = "open",
+                 trade_direction: int = 1, rank_column: Optional[str] = None, record_holdings: bool = False):
+        self.initial_capital = float(initial_capital)
+        self.max_position_size = TradingConfig.MAX_POSITION_SIZE if max_position_size is None else float(max_position_size)
+        self.max_positions = int(max_positions or 0)
+        self.share_type = share_type or "mixed"
+        self.entry_type = entry_type or "open"
+        self.exit_price_condition = exit_price_condition or "open"
+        self.trade_direction = 1 if trade_direction in (1, "long") else -1
+        self.rank_column = rank_column
+        self.record_holdings = bool(record_holdings)
+
+    @classmethod
+    def from_parameters(cls, initial_capital: float, parameters: Dict[str, Any]) -> "PortfolioBacktestEngine":
+        """以策略參數建立引擎（參數名稱與 DynamicStrategy 相同）"""
+        return cls(
+            initial_capital,
+            max_position_size=parameters.get("max_position_size"),
+            max_positions=parameters.get("max_positions", 0),
+            share_type=parameters.get("share_type", "mixed"),
+            entry_type=parameters.get("entry_type", "open"),
+            exit_price_condition=parameters.get("exit_price_condition", "open"),
+            trade_direction=parameters.get("trade_direction", "long"),
+            rank_column=parameters.get("rank_column") or None,
+            record_holdings=bool(parameters.get("record_holdings", 0))
+        )
+
+    # ===== 資料轉換 =====
+    @staticmethod
+    def _pivot(frame: pl.DataFrame, date_index: np.ndarray, stock_index: np.ndarray, shape, column: str,
+               fill: float = np.nan) -> np.ndarray:
+        matrix = np.full(shape, fill, dtype=np.float64)
+        if column in frame.columns:
+            values = frame[column].cast(pl.Float64, strict=False).fill_null(fill).to_numpy()
+            matrix[date_index, stock_index] = values
+        return matrix
+
+    def _prepare(self, signals: pl.DataFrame) -> Dict[str, Any]:
+        missing = [name for name in REQUIRED_COLUMNS if name not in signals.columns]
+        if missing:
+            raise ValueError(f"投資組合回測資料缺少欄位: {missing}")
+
+        frame = signals.with_columns(pl.col("stock_id").cast(pl.Utf8)).sort(["date", "stock_id"])
+        dates = frame["date"].unique(maintain_order=True)
+        stock_ids = frame["stock_id"].unique().sort()
+        date_index = frame.select(pl.col("date").rank("dense").cast(pl.Int64) - 1).to_series().to_numpy()
+        stock_lookup = pl.DataFrame({"stock_id": stock_ids, "_stock_index": np.arange(len(stock_ids), dtype=np.int64)})
+        stock_index = frame.join(stock_lookup, on="stock_id", how="left")["_stock_index"].to_numpy()
+        shape = (len(dates), len(stock_ids))
+
+        has_bar = np.zeros(shape, dtype=bool)
+        has_bar[date_index, stock_index] = True
+        close = self._pivot(frame, date_index, stock_index, shape, "close")
+        # 未開盤日沿用最近一次收盤價（前向填補）
+        rows = np.where(has_bar, np.arange(shape[0])[:, None], 0)
+        np.maximum.accumulate(rows, axis=0, out=rows)
+        last_close = np.nan_to_num(close[rows, np.arange(shape[1])[None, :]], nan=0.0)
+
+        names = stock_ids.to_list()
+        if "stock_name" in frame.columns:
+            name_frame = frame.group_by("stock_id").agg(pl.col("stock_name").first())
+            name_map = dict(zip(name_frame["stock_id"].to_list(), name_frame["stock_name"].to_list()))
+            names = [str(name_map.get(sid) or sid) for sid in names]
+
+        reasons = None
+        if "exit_reason" in frame.columns:
+            reasons = np.full(shape, "", dtype=object)
+            reasons[date_index, stock_index] = frame["exit_reason"].cast(pl.Utf8).fill_null("").to_numpy()
+
+        return {
+            "dates": dates.to_list(),
+            "stock_ids": np.asarray(stock_ids.to_list(), dtype=object),
+            "stock_names": np.asarray(names, dtype=object),
+            "has_bar": has_bar,
+            "open": self._pivot(frame, date_index, stock_index, shape, "open"),
+            "high": self._pivot(frame, date_index, stock_index, shape, "high"),
+            "low": self._pivot(frame, date_index, stock_index, shape, "low"),
+            "close": close,
+            "last_close": last_close,
+            "should_entry": self._pivot(frame, date_index, stock_index, shape, "should_entry", 0.0) == 1,
+            "should_exit": self._pivot(frame, date_index, stock_index, shape, "should_exit", 0.0) == 1,
+            "exit_price": self._pivot(frame, date_index, stock_index, shape, "exit_price", 0.0),
+            "rank": self._pivot(frame, date_index, stock_index, shape, self.rank_column, -np.inf) if self.rank_column else None,
+            "exit_reason": reasons
+        }
+
+    # ===== 回測 =====
+    def run(self, signals: pl.DataFrame, strategy_name: str = "") -> Dict[str, Any]:
+        """
+        執行投資組合回測
+
+        Args:
+            signals: 全部股票的訊號長表（依日期排序與否皆可）
+            strategy_name: 策略名稱（寫入結果）
+
+        Returns:
+            Dict[str, Any]: 與 combine_backtest_results 相同格式的結果（比率為小數），
+                            equity_curve/dates 為依日期對齊的投資組合權益曲線
+        """
+        data = self._prepare(signals)
+        has_bar = data["has_bar"]
+        num_dates, num_stocks = has_bar.shape
+        open_price, close_price, last_close = data["open"], data["close"], data["last_close"]
+        entry_matrix = open_price if self.entry_type == "open" else close_price
+        default_exit_matrix = open_price if self.exit_price_condition == "open" else close_price
+        direction = self.trade_direction
+
+        cash = self.initial_capital
+        equity = self.initial_capital
+        shares = np.zeros(num_stocks, dtype=np.float64)
+        entry_price = np.zeros(num_stocks, dtype=np.float64)
+        entry_row = np.zeros(num_stocks, dtype=np.int64)
+        equity_curve = np.empty(num_dates, dtype=np.float64)
+        closed: List[tuple] = []  # (日期列, 股票索引陣列, 進場價, 出場價, 股數, 進場列)
+
+        for t in range(num_dates):
+            held = shares > 0
+
+            # 進場：未持有且有訊號的股票，依排名在部位上限與剩餘資金內依序配置
+            candidates = np.flatnonzero(data["should_entry"][t] & has_bar[t] & ~held)
+            slots = max(self.max_positions - int(held.sum()), 0) if self.max_positions > 0 else candidates.size
+            if candidates.size and slots and cash > 0:
+                if data["rank"] is not None:
+                    candidates = candidates[np.argsort(-data["rank"][t, candidates], kind="stable")]
+                price = entry_matrix[t, candidates]
+                filled, new_shares, cost = self._allocate(price, equity * self.max_position_size, cash, slots)
+                if filled.size:
+                    chosen = candidates[filled]
+                    shares[chosen] = new_shares
+                    entry_price[chosen] = price[filled]
+                    entry_row[chosen] = t
+                    cash -= float(cost.sum())
+
+            # 出場：持有中（含當日進場）且有出場訊號的股票
+            exiting = np.flatnonzero(data["should_exit"][t] & has_bar[t] & (shares > 0))
+            if exiting.size:
+                signal_price = data["exit_price"][t, exiting]
+                exit_price = np.where(signal_price > 0, signal_price, default_exit_matrix[t, exiting])
+                exit_shares = shares[exiting]
+                cost_basis = entry_price[exiting] * exit_shares
+                profit_loss = (exit_price - entry_price[exiting]) * exit_shares * direction
+                commission = _vectorized_commission(cost_basis)
+                tax = exit_price * exit_shares * TradingConfig.SECURITIES_TAX_RATE
+                cash += float((cost_basis + profit_loss - commission - tax).sum())
+                closed.append((t, exiting, entry_price[exiting].copy(), exit_price, exit_shares.copy(), entry_row[exiting].copy()))
+                shares[exiting] = 0.0
+                entry_price[exiting] = 0.0
+
+            # 市值評估：現金 + 所有持股以最近收盤價計算的部位價值
+            held = shares > 0
+            if held.any():
+                position_value = shares[held] * (entry_price[held] + (last_close[t, held] - entry_price[held]) * direction)
+                equity = cash + float(position_value.sum())
+            else:
+                equity = cash
+            equity_curve[t] = equity
+
+        ledger = self._build_ledger(data, closed)
+        result = self._build_result(data, ledger, equity_curve, strategy_name)
+        result["holding_positions"] = self._open_positions(data, shares, entry_price, entry_row) if self.record_holdings else []
+        logger.debug("投資組合回測完成: %s 檔股票, %s 個交易日, %s 筆交易", num_stocks, num_dates, len(ledger))
+        return result
+
+    def _allocate(self, price: np.ndarray, position_budget: float, cash: float, slots: int):
+        """
+        依排名順序配置進場部位
+
+        每檔預算為 min(單檔上限, 剩餘資金)，成交後由剩餘資金扣除；買不起（股數為 0）的股票略過，
+        不佔用部位數，也不影響排名在後、較便宜的股票
+
+        Args:
+            price: 依排名排序的候選股票進場價
+            position_budget: 單檔部位上限（權益 × max_position_size）
+            cash: 可用資金
+            slots: 可新增的部位數
+
+        Returns:
+            (成交的候選索引, 股數, 成本)
+        """
+        # 剩餘資金不低於單檔上限時股數與整批計算相同，只有資金不足單檔上限時才逐檔重算
+        full_shares = PriceUtils.calculate_shares_array(position_budget, price, self.share_type)
+        filled, filled_shares, costs = [], [], []
+        for index in range(price.size):
+            if len(filled) >= slots or cash <= 0:
+                break
+            if cash >= position_budget:
+                count = full_shares[index]
+            else:
+                count = PriceUtils.calculate_shares_array(cash, price[index:index + 1], self.share_type)[0]
+            if count <= 0:
+                continue
+            cost = float(count * price[index])
+            filled.append(index)
+            filled_shares.append(count)
+            costs.append(cost)
+            cash -= cost
+        return (np.asarray(filled, dtype=np.int64), np.asarray(filled_shares, dtype=np.float64),
+                np.asarray(costs, dtype=np.float64))
+
+    def _build_ledger(self, data: Dict[str, Any], closed: List[tuple]) -> TradeLedger:
+        """將每日出場批次整欄寫入交易帳本"""
+        ledger = TradeLedger()
+        if not closed:
+            return ledger
+        exit_rows = np.concatenate([np.full(len(item[1]), item[0], dtype=np.int64) for item in closed])
+        stocks = np.concatenate([item[1] for item in closed])
+        entry_price = np.concatenate([item[2] for item in closed])
+        exit_price = np.concatenate([item[3] for item in closed])
+        shares = np.concatenate([item[4] for item in closed])
+        entry_rows = np.concatenate([item[5] for item in closed])
+        size = len(stocks)
+
+        direction = self.trade_direction
+        dates = data["dates"]
+        stock_ids = data["stock_ids"][stocks]
+        entry_dates = [dates[row] for row in entry_rows.tolist()]
+        exit_dates = [dates[row] for row in exit_rows.tolist()]
+        profit_loss = (exit_price - entry_price) * shares * direction
+        with np.errstate(divide="ignore", invalid="ignore"):
+            profit_loss_rate = np.where(entry_price != 0, (exit_price - entry_price) / entry_price * 100 * direction, 0.0)
+        commission = _vectorized_commission(entry_price * shares)
+        tax = exit_price * shares * TradingConfig.SECURITIES_TAX_RATE
+        exit_reason = data["exit_reason"][exit_rows, stocks] if data["exit_reason"] is not None else None
+
+        ledger.extend_columns({
+            "position_id": [f"{sid}_{day}_{price}_{uuid.uuid4().hex[:8]}"
+                            for sid, day, price in zip(stock_ids.tolist(), entry_dates, entry_price.tolist())],
+            "entry_date": entry_dates,
+            "exit_date": exit_dates,
+            "stock_id": stock_ids,
+            "stock_name": data["stock_names"][stocks],
+            "trade_direction": np.full(size, direction, dtype=np.int64),
+            "entry_price": entry_price,
+            "exit_price": exit_price,
+            "shares": shares,
+            "profit_loss": profit_loss,
+            "profit_loss_rate": profit_loss_rate,
+            "commission": commission,
+            "securities_tax": tax,
+            "net_profit_loss": profit_loss - commission - tax,
+            "holding_days": exit_rows - entry_rows,
+            "exit_reason": exit_reason,
+            "current_price": exit_price,
+            "unrealized_profit_loss": profit_loss,
+            "unrealized_profit_loss_rate": profit_loss_rate,
+            "current_date": exit_dates,
+            "exit_price_type": [self.exit_price_condition] * size,
+            "current_entry_price": entry_price,
+            "current_exit_price": exit_price,
+            "current_profit_loss": profit_loss,
+            "current_profit_loss_rate": profit_loss_rate,
+            "open_price": data["open"][exit_rows, stocks],
+            "high_price": np.nan_to_num(data["high"][exit_rows, stocks]),
+            "low_price": np.nan_to_num(data["low"][exit_rows, stocks]),
+            "close_price": data["close"][exit_rows, stocks]
+        }, size)
+        return ledger
+
+    def _build_result(self, data: Dict[str, Any], ledger: TradeLedger, equity_curve: np.ndarray,
+                      strategy_name: str) -> Dict[str, Any]:
+        trade_frame = ledger.to_frame()
+        metrics = PerformanceMetrics.compute(
+            equity_curve,
+            trade_frame["net_profit_loss"],
+            self.initial_capital,
+            dates=data["dates"],
+            entry_dates=trade_frame["entry_date"],
+            exit_dates=trade_frame["exit_date"]
+        )
+        final_equity = float(equity_curve[-1]) if equity_curve.size else self.initial_capital
+        return {
+            "strategy_name": strategy_name,
+            "total_trades": metrics["total_trades"],
+            "winning_trades": metrics["winning_trades"],
+            "losing_trades": metrics["losing_trades"],
+            "win_rate": metrics["win_rate"],
+            "total_profit_loss": metrics["total_profit_loss"],
+            "total_profit_loss_rate": metrics["total_profit_loss_rate"],
+            "max_drawdown": metrics["max_drawdown"],
+            "max_drawdown_rate": metrics["max_drawdown_rate"],
+            "sharpe_ratio": metrics["sharpe_ratio"],
+            "sortino_ratio": metrics["sortino_ratio"],
+            "calmar_ratio": metrics["calmar_ratio"],
+            "profit_factor": metrics["profit_factor"],
+            "expectancy": metrics["expectancy"],
+            "exposure": metrics["exposure"],
+            "final_equity": final_equity,
+            "total_return_rate": final_equity / self.initial_capital - 1 if self.initial_capital else 0.0,
+            "trade_records": [],
+            "trade_frame": trade_frame,
+            "equity_curve": equity_curve.tolist(),
+            "dates": data["dates"],
+            "charts": []
+        }
+
+    def _open_positions(self, data: Dict[str, Any], shares: np.ndarray, entry_price: np.ndarray,
+                        entry_row: np.ndarray) -> List[Dict[str, Any]]:
+        """回測結束時仍持有的部位（格式同 DynamicStrategy 的 holding_positions）"""
+        held = np.flatnonzero(shares > 0)
+        if held.size == 0:
+            return []
+        dates = data["dates"]
+        last_row = len(dates) - 1
+        direction = self.trade_direction
+        current_price = data["last_close"][last_row, held]
+        exit_matrix = data["open"] if self.exit_price_condition == "open" else data["close"]
+        current_exit_price = np.where(data["has_bar"][last_row, held], exit_matrix[last_row, held], current_price)
+        price = entry_price[held]
+        unrealized = (current_price - price) * shares[held] * direction
+        current_pl = (current_exit_price - price) * shares[held] * direction
+        with np.errstate(divide="ignore", invalid="ignore"):
+            unrealized_rate = np.where(price != 0, (current_price - price) / price * 100 * direction, 0.0)
+            current_pl_rate = np.where(price != 0, (current_exit_price - price) / price * 100 * direction, 0.0)
+
+        def _format(value):
+            return value.strftime("%Y-%m-%d") if hasattr(value, "strftime") else str(value)
+
+        positions = []
+        for k, stock in enumerate(held.tolist()):
+            entry_date = dates[int(entry_row[stock])]
+            positions.append({
+                "position_id": f"{data['stock_ids'][stock]}_{entry_date}_{price[k]}",
+                "entry_date": _format(entry_date),
+                "stock_id": data["stock_ids"][stock],
+                "stock_name": data["stock_names"][stock],
+                "trade_direction": direction,
+                "entry_price": float(price[k]),
+                "shares": int(shares[stock]),
+                "current_price": float(current_price[k]),
+                "unrealized_profit_loss": float(unrealized[k]),
+                "unrealized_profit_loss_rate": float(unrealized_rate[k]),
+                "holding_days": int(last_row - entry_row[stock]),
+                "current_date": _format(dates[last_row]),
+                "exit_price_type": self.exit_price_condition,
+                "current_entry_price": float(price[k]),
+                "current_exit_price": float(current_exit_price[k]),
+                "current_profit_loss": float(current_pl[k]),
+                "current_profit_loss_rate": float(current_pl_rate[k]),
+                "take_profit_price": 0.0,
+                "stop_loss_price": 0.0,
+                "open_price": float(np.nan_to_num(data["open"][last_row, stock])),
+                "high_price": float(np.nan_to_num(data["high"][last_row, stock])),
+                "low_price": float(np.nan_to_num(data["low"][last_row, stock])),
+                "close_price": float(current_price[k])
+            })
+        return positions
@@ -0,0 +1,173 @@
+# 持有部位簿
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import numpy as np
+
+from strategies.base_strategy import HoldingPosition
+
+_PRICE_FIELDS = {"open": "open", "close": "close", "high": "high", "low": "low"}
+
+
+def _date_ordinal(value) -> int:
+    if isinstance(value, (datetime, date)):
+        return value.toordinal()
+    return 0
+
+
+class HoldingPositionBook:
+    """
+    持有部位簿
+
+    以 position_id 為鍵的字典提供 O(1) 查詢/移除，並以槽位（slot）索引的 NumPy 陣列
+    保存進場價、股數、方向與進場日，讓每根 K 棒可一次向量化計算所有未平倉部位的損益。
+    迭代時依新增順序回傳 HoldingPosition，相容原本的 List[HoldingPosition] 用法。
+    """
+
+    __slots__ = ("_index", "_positions", "_free", "_entry_price", "_shares",
+                 "_direction", "_entry_ordinal", "_active", "_stock_ids")
+
+    def __init__(self, positions: Iterable[HoldingPosition] = None, capacity: int = 16):
+        self._index: Dict[str, int] = {}  # position_id -> slot
+        self._positions: List[Optional[HoldingPosition]] = []
+        self._free: List[int] = []
+        self._entry_price = np.zeros(capacity, dtype=np.float64)
+        self._shares = np.zeros(capacity, dtype=np.float64)
+        self._direction = np.zeros(capacity, dtype=np.int8)
+        self._entry_ordinal = np.zeros(capacity, dtype=np.int64)
+        self._active = np.zeros(capacity, dtype=bool)
+        self._stock_ids = np.empty(capacity, dtype=object)
+        if positions:
+            self.extend(positions)
+
+    # ===== list 相容介面 =====
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __bool__(self) -> bool:
+        return bool(self._index)
+
+    def __iter__(self) -> Iterator[HoldingPosition]:
+        positions = self._positions
+        for slot in self._index.values():
+            yield positions[slot]
+
+    def __contains__(self, position_id: str) -> bool:
+        return position_id in self._index
+
+    def append(self, position: HoldingPosition) -> None:
+        self.add(position)
+
+    def extend(self, positions: Iterable[HoldingPosition]) -> None:
+        for position in positions:
+            self.add(position)
+
+    def clear(self) -> None:
+        self._index.clear()
+        self._positions.clear()
+        self._free.clear()
+        self._active[:] = False
+
+    # ===== 部位操作 =====
+    def get(self, position_id: str) -> Optional[HoldingPosition]:
+        slot = self._index.get(position_id)
+        return self._positions[slot] if slot is not None else None
+
+    def add(self, position: HoldingPosition) -> None:
+        """新增部位；相同 position_id 會覆蓋原本的部位"""
+        slot = self._index.get(position.position_id)
+        if slot is None:
+            slot = self._free.pop() if self._free else self._allocate_slot()
+            self._index[position.position_id] = slot
+        self._positions[slot] = position
+        self._entry_price[slot] = position.entry_price or 0.0
+        self._shares[slot] = position.shares or 0
+        self._direction[slot] = 1 if position.trade_direction == 1 else -1
+        self._entry_ordinal[slot] = _date_ordinal(position.entry_date)
+        self._stock_ids[slot] = position.stock_id
+        self._active[slot] = True
+
+    def remove(self, position_id: str) -> Optional[HoldingPosition]:
+        """移除部位並回收槽位，找不到時回傳 None"""
+        slot = self._index.pop(position_id, None)
+        if slot is None:
+            return None
+        position = self._positions[slot]
+        self._positions[slot] = None
+        self._active[slot] = False
+        self._free.append(slot)
+        return position
+
+    def _allocate_slot(self) -> int:
+        slot = len(self._positions)
+        self._positions.append(None)
+        if slot >= len(self._active):
+            new_capacity = max(16, len(self._active) * 2)
+            for name in ("_entry_price", "_shares", "_direction", "_entry_ordinal", "_active", "_stock_ids"):
+                old = getattr(self, name)
+                grown = np.zeros(new_capacity, dtype=old.dtype) if old.dtype != object else np.empty(new_capacity, dtype=object)
+                grown[:len(old)] = old
+                setattr(self, name, grown)
+        return slot
+
+    # ===== 市值評估 =====
+    def mark_to_market(self, current_row: Dict[str, Any], current_date: datetime,
+                       exit_price_type: str = "close", current_price: float = None,
+                       stock_id: str = None) -> int:
+        """
+        以當根 K 棒一次更新所有未平倉部位的未實現損益
+
+        Args:
+            current_row: 當根 K 棒（需含 open/high/low/close）
+            current_date: 當前日期
+            exit_price_type: 當日未出場價類型（open, close, high, low）
+            current_price: 當前價格，None 時使用收盤價
+            stock_id: 只更新指定股票的部位，None 表示全部
+
+        Returns:
+            int: 更新的部位數量
+        """
+        size = len(self._positions)
+        if size == 0 or not self._index:
+            return 0
+        mask = self._active[:size]
+        if stock_id is not None:
+            mask = mask & (self._stock_ids[:size] == stock_id)
+        slots = np.flatnonzero(mask)
+        if len(slots) == 0:
+            return 0
+
+        close_price = current_row.get("close", 0.0)
+        price = close_price if current_price is None else current_price
+        exit_field = _PRICE_FIELDS.get(exit_price_type)
+        exit_price = current_row.get(exit_field, price) if exit_field else price
+
+        entry_price = self._entry_price[slots]
+        shares = self._shares[slots]
+        direction = self._direction[slots]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            unrealized = (price - entry_price) * shares * direction
+            unrealized_rate = np.where(entry_price != 0, (price - entry_price) / entry_price * 100 * direction, 0.0)
+            current_pl = (exit_price - entry_price) * shares * direction
+            current_pl_rate = np.where(entry_price != 0, (exit_price - entry_price) / entry_price * 100 * direction, 0.0)
+        holding_days = _date_ordinal(current_date) - self._entry_ordinal[slots]
+
+        open_price = current_row.get("open", 0.0)
+        high_price = current_row.get("high", 0.0)
+        low_price = current_row.get("low", 0.0)
+        positions = self._positions
+        for k, slot in enumerate(slots.tolist()):
+            position = positions[slot]
+            position.current_price = price
+            position.current_date = current_date
+            position.holding_days = int(holding_days[k])
+            position.current_exit_price = exit_price
+            position.unrealized_profit_loss = float(unrealized[k])
+            position.unrealized_profit_loss_rate = float(unrealized_rate[k])
+            position.current_profit_loss = float(current_pl[k])
+            position.current_profit_loss_rate = float(current_pl_rate[k])
+            position.exit_price_type = exit_price_type
+            position.open_price = open_price
+            position.high_price = high_price
+            position.low_price = low_price
+            position.close_price = close_price
+        return len(slots)
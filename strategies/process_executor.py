@@ -0,0 +1,240 @@
+# 多行程回測執行器
+"""
+以行程池（ProcessPoolExecutor）執行逐股回測，逐列執行的 Python 策略不再受 GIL 限制
+
+行程池有固定成本（寫入 IPC 檔、子行程啟動、結果序列化）：只有多核心機器上的 CPU 密集策略才可能比
+execution_mode=isolated（執行緒池）快；單核心機器上只會增加成本。尚未在多核心機器上量測兩者的差異，
+應以回應中的 execution.elapsed_seconds 對同一組股票實測比較後再選用
+
+- 主行程將股價資料依 stock_id 排序後寫成未壓縮的 Arrow IPC 檔，並以 Utils.stock_row_ranges 取得每檔股票的列區間
+- 子行程以 memory map 讀取 IPC 檔（每個子行程只開一次），依區間 slice 出零複製的單股資料
+- 策略程式碼在每個子行程只編譯一次，之後每檔股票以 reset() 還原狀態重複使用
+- 子行程回傳 get_strategy_result 的結果，交易記錄以欄式 trade_frame 傳回
+- IPC 暫存目錄在回測結束時刪除；檔案仍被 memory map 開啟（例如 Windows）而無法刪除時重試，
+  仍失敗則記錄警告，並在關閉行程池（子行程釋放 memory map）後再刪除一次
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import hashlib
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import polars as pl
+
+from core.logger import get_logger
+from core.utils import Utils
+
+logger = get_logger("process_executor.py")
+
+# 每批次股票數量：讓每個子行程約分到 4 批，兼顧負載平衡與傳輸次數
+BATCHES_PER_WORKER = 4
+# 刪除 IPC 暫存目錄的重試次數與間隔（秒）
+CLEANUP_ATTEMPTS = 3
+CLEANUP_RETRY_DELAY = 0.2
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+# 無法立即刪除的 IPC 暫存目錄，關閉行程池時再刪除
+_pending_cleanup: List[str] = []
+
+# ===== 子行程快取 =====
+# (股價 IPC 路徑, Excel IPC 路徑) -> (股價資料, Excel 資料)
+_worker_inputs: Dict[Tuple[str, Optional[str]], Tuple[pl.DataFrame, Optional[pl.DataFrame]]] = {}
+_worker_strategies: Dict[str, Any] = {}
+
+
+def default_worker_count() -> int:
+    return os.cpu_count() or 1
+
+
+def get_executor(max_workers: int) -> ProcessPoolExecutor:
+    """取得共用的行程池（worker 數量改變或行程池損壞時重建）"""
+    global _executor, _executor_workers
+    with _executor_lock:
+        broken = _executor is not None and getattr(_executor, "_broken", False)
+        if _executor is None or broken or _executor_workers != max_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False, cancel_futures=True)
+            # 使用 spawn：主行程為多執行緒的 Web 服務，fork 可能複製到被鎖住的鎖
+            _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+            _executor_workers = max_workers
+        return _executor
+
+
+def shutdown_executor() -> None:
+    """關閉共用行程池（應用程式結束時呼叫）"""
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
+        _executor_workers = 0
+    # 子行程已結束、memory map 已釋放，刪除先前無法刪除的暫存目錄
+    while _pending_cleanup:
+        _remove_temp_dir(_pending_cleanup.pop(), defer=False)
+
+
+def _remove_temp_dir(temp_dir: str, defer: bool = True) -> bool:
+    """
+    刪除 IPC 暫存目錄，失敗時重試；仍失敗時記錄警告
+
+    Args:
+        defer: 仍無法刪除時是否留待 shutdown_executor 再刪除
+
+    Returns:
+        bool: 是否已刪除
+    """
+    error = None
+    for attempt in range(CLEANUP_ATTEMPTS):
+        try:
+            shutil.rmtree(temp_dir)
+            return True
+        except FileNotFoundError:
+            return True
+        except OSError as e:
+            error = e
+            if attempt + 1 < CLEANUP_ATTEMPTS:
+                time.sleep(CLEANUP_RETRY_DELAY)
+    if defer:
+        _pending_cleanup.append(temp_dir)
+        logger.warning("無法刪除回測暫存目錄 %s（%s），將於關閉行程池時再刪除", temp_dir, error)
+    else:
+        logger.warning("無法刪除回測暫存目錄 %s: %s", temp_dir, error)
+    return False
+
+
+def _load_inputs(data_path: str, excel_path: Optional[str]) -> Tuple[pl.DataFrame, Optional[pl.DataFrame]]:
+    """子行程：以 memory map 讀取任務的股價與 Excel IPC 檔（同一組路徑只開一次）"""
+    key = (data_path, excel_path)
+    inputs = _worker_inputs.get(key)
+    if inputs is None:
+        # 新任務的路徑到達時才釋放上一組，避免子行程累積過期的 memory map
+        _worker_inputs.clear()
+        inputs = (
+            pl.read_ipc(data_path, memory_map=True),
+            pl.read_ipc(excel_path, memory_map=True) if excel_path else None
+        )
+        _worker_inputs[key] = inputs
+    return inputs
+
+
+def _load_strategy(strategy_code: str, strategy_name: str, parameters: Dict[str, Any]):
+    from strategies.dynamic_strategy import DynamicStrategy
+
+    key = hashlib.sha1(f"{strategy_name}\0{strategy_code}".encode("utf-8")).hexdigest()
+    strategy = _worker_strategies.get(key)
+    if strategy is None:
+        strategy = DynamicStrategy(parameters=parameters, strategy_code=strategy_code, strategy_name=strategy_name)
+        _worker_strategies.clear()
+        _worker_strategies[key] = strategy
+    else:
+        strategy.reset(parameters)
+    return strategy
+
+
+def _run_stock_batch(data_path: str, excel_path: Optional[str], strategy_code: str, strategy_name: str,
+                     parameters: Dict[str, Any], initial_capital: float,
+                     batch: List[Tuple[str, int, int]]) -> List[Dict[str, Any]]:
+    """子行程：依序回測一批股票"""
+    frame, excel_data = _load_inputs(data_path, excel_path)
+    results = []
+    for stock_id, offset, length in batch:
+        try:
+            strategy = _load_strategy(strategy_code, strategy_name, parameters)
+            group_data = frame.slice(offset, length)
+            stock_name = group_data["stock_name"][0] if "stock_name" in group_data.columns else stock_id
+            strategy.run_backtest(group_data, excel_data, initial_capital, stock_id, f"{stock_name}")
+            result = strategy.get_strategy_result(initial_capital)
+            # 交易記錄已由 trade_frame 整欄傳回，省去逐筆字典的序列化成本
+            result["trade_records"] = []
+            result["stock_id"] = stock_id
+            results.append(result)
+        except Exception as e:
+            logger.error("股票 %s 回測失敗: %s", stock_id, e)
+    return results
+
+
+@contextmanager
+def shared_backtest_inputs(stock_data: pl.DataFrame,
+                           excel_data: Optional[pl.DataFrame]) -> Iterator[Tuple[str, Optional[str], List[Tuple[str, int, int]]]]:
+    """
+    將回測輸入寫成子行程共用的 Arrow IPC 檔，離開時刪除
+
+    Yields:
+        (股價資料路徑, Excel 資料路徑或 None, [(stock_id, 起始列, 列數)])
+    """
+    frame, ranges = Utils.stock_row_ranges(stock_data)
+    ranges = [(str(stock_id), offset, length) for stock_id, offset, length in ranges]
+    temp_dir = tempfile.mkdtemp(prefix="backtest_ipc_")
+    try:
+        data_path = os.path.join(temp_dir, "stock_data.arrow")
+        frame.write_ipc(data_path)
+        excel_path = None
+        if excel_data is not None and len(excel_data) > 0:
+            excel_path = os.path.join(temp_dir, "excel_data.arrow")
+            excel_data.write_ipc(excel_path)
+        yield data_path, excel_path, ranges
+    finally:
+        _remove_temp_dir(temp_dir)
+
+
+def run_backtests_in_processes(stock_data: pl.DataFrame, excel_data: Optional[pl.DataFrame],
+                               strategy_code: str, strategy_name: str, parameters: Dict[str, Any],
+                               initial_capital: float, max_workers: int = 0,
+                               progress: Callable[..., None] = None) -> List[Dict[str, Any]]:
+    """
+    以行程池逐股執行回測
+
+    Args:
+        stock_data: 全部股票的股價資料（需含 stock_id）
+        excel_data: 策略用的 Excel 資料
+        strategy_code / strategy_name: 策略程式碼與名稱（子行程各自編譯一次）
+        parameters: 策略參數
+        initial_capital: 初始資金
+        max_workers: 子行程數量，0 表示使用 CPU 核心數
+        progress: 進度回呼 progress(已完成股票數, total=股票總數, trades=累計交易筆數)，
+                  回呼拋出例外時取消尚未執行的批次並向上拋出
+
+    Returns:
+        List[Dict[str, Any]]: 每檔股票的 get_strategy_result 結果
+    """
+    with shared_backtest_inputs(stock_data, excel_data) as (data_path, excel_path, ranges):
+        if not ranges:
+            return []
+        pool_size = max_workers or default_worker_count()
+        workers = min(pool_size, len(ranges))
+        batch_size = max(1, -(-len(ranges) // (workers * BATCHES_PER_WORKER)))
+        batches = [ranges[i:i + batch_size] for i in range(0, len(ranges), batch_size)]
+
+        # 行程池依設定的 worker 數量共用，不隨單次請求的股票數量重建
+        executor = get_executor(pool_size)
+        futures = {
+            executor.submit(_run_stock_batch, data_path, excel_path, strategy_code, strategy_name,
+                            parameters, initial_capital, batch): len(batch)
+            for batch in batches
+        }
+        results = []
+        completed = 0
+        trades = 0
+        for future in as_completed(futures):
+            try:
+                batch_results = future.result()
+                results.extend(batch_results)
+                trades += sum(result.get("total_trades", 0) for result in batch_results)
+            except Exception as e:
+                logger.error("行程池任務執行失敗: %s", e)
+            completed += futures[future]
+            if progress is not None:
+                try:
+                    progress(completed, total=len(ranges), trades=trades)
+                except Exception:
+                    for pending in futures:
+                        pending.cancel()
+                    raise
+        return results
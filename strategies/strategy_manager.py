@@ -351,9 +351,12 @@ class StrategyManager:
 # 
 # 可用的工具類別：
 # - PriceUtils: 價格計算工具，包含最小變動單位、漲跌停計算等
+#   （向量化策略請用整欄版本，如 PriceUtils.calculate_limit_price_expr("base_price", 10).alias("up_limit_price")）
 # - Utils: 通用工具類別
 # - TradeRecord: 交易記錄資料類別
-# - generate_indicators: 生成技術指標
+# - generate_indicators: 生成技術指標（ma_20、break_20_day_high、rsi_14、macd_hist_12_26_9、bb_upper_20_2、atr_14、kd_k_9、obv、vwap_20 等）
+# - resample_bars / align_timeframes: 分 K 重取樣為 5m/15m/60m/1d/1w，並以 as-of join 接上已收盤的長週期欄位
+#   （如 align_timeframes(minute_bars, generate_indicators(resample_bars(minute_bars, "1d"), ["ma_20"]), "1d", ["ma_20"])）
 
 # ===== 向量化模式（推薦，效能最佳） =====
 def calculate_entry_signals(stock_data, excel_pl_df, **kwargs):
@@ -526,6 +529,8 @@ def validate_parameters(parameters):
 #    - 逐行判斷，適用於複雜邏輯和跨列狀態追蹤
 #    - 支援複雜的進出場條件和狀態管理
 #    - 向後相容，適合複雜策略
+#    - 進場條件稀疏時可宣告 entry_prefilter = {"excel_dates": True, "columns": ["欄位"], "shift": 0}
+#      或定義 entry_candidates(stock_data, excel_pl_df, **kwargs) 回傳布林 Series，空手時只在候選列呼叫 should_entry
 #
 # 3. 混合模式(適用於複雜策略)：
 #    - 可以同時定義向量化和傳統函數
@@ -562,9 +567,12 @@ def validate_parameters(parameters):
 # 
 # 可用的工具類別：
 # - PriceUtils: 價格計算工具，包含最小變動單位、漲跌停計算等
+#   （向量化策略請用整欄版本，如 PriceUtils.calculate_limit_price_expr("base_price", 10).alias("up_limit_price")）
 # - Utils: 通用工具類別
 # - TradeRecord: 交易記錄資料類別
-# - generate_indicators: 生成技術指標
+# - generate_indicators: 生成技術指標（ma_20、break_20_day_high、rsi_14、macd_hist_12_26_9、bb_upper_20_2、atr_14、kd_k_9、obv、vwap_20 等）
+# - resample_bars / align_timeframes: 分 K 重取樣為 5m/15m/60m/1d/1w，並以 as-of join 接上已收盤的長週期欄位
+#   （如 align_timeframes(minute_bars, generate_indicators(resample_bars(minute_bars, "1d"), ["ma_20"]), "1d", ["ma_20"])）
 
 def calculate_entry_signals(stock_data, excel_pl_df, **kwargs):
     """
@@ -713,9 +721,12 @@ def validate_parameters(parameters):
 # 
 # 可用的工具類別：
 # - PriceUtils: 價格計算工具，包含最小變動單位、漲跌停計算等
+#   （向量化策略請用整欄版本，如 PriceUtils.calculate_limit_price_expr("base_price", 10).alias("up_limit_price")）
 # - Utils: 通用工具類別
 # - TradeRecord: 交易記錄資料類別
-# - generate_indicators: 生成技術指標
+# - generate_indicators: 生成技術指標（ma_20、break_20_day_high、rsi_14、macd_hist_12_26_9、bb_upper_20_2、atr_14、kd_k_9、obv、vwap_20 等）
+# - resample_bars / align_timeframes: 分 K 重取樣為 5m/15m/60m/1d/1w，並以 as-of join 接上已收盤的長週期欄位
+#   （如 align_timeframes(minute_bars, generate_indicators(resample_bars(minute_bars, "1d"), ["ma_20"]), "1d", ["ma_20"])）
 
 def should_entry(stock_data, current_index, excel_pl_df, **kwargs):
     """
@@ -873,6 +884,10 @@ def validate_parameters(parameters):
 # 4. 返回值格式：
 #    - should_entry: (bool, dict) - (是否進場, 進場資訊)
 #    - should_exit: (bool, dict) - (是否出場, 出場資訊)
+#    - entry_candidates（選用）: 布林 Series / 運算式，標記可能進場的列；
+#      空手時只在候選列呼叫 should_entry，候選列以外的日子直接略過
+#    - entry_prefilter（選用）: {"excel_dates": True, "columns": ["欄位"], "shift": 0}，
+#      以 Excel 日期或布林欄位宣告候選列，效果同 entry_candidates
 #
 # 5. 範例邏輯：
 #    - 連續上漲/下跌檢測
@@ -0,0 +1,296 @@
+# 欄式交易帳本
+from array import array
+from dataclasses import MISSING, fields as dataclass_fields
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+import math
+import numpy as np
+import polars as pl
+
+from strategies.base_strategy import TradeRecord
+
+# 依 TradeRecord 欄位型別決定儲存方式：浮點數/整數使用 array，其餘使用 list
+_FLOAT = "float"
+_INT = "int"
+_DATE = "date"
+_OBJECT = "object"
+
+
+def _column_kind(field_type) -> str:
+    if field_type is float:
+        return _FLOAT
+    if field_type is int:
+        return _INT
+    if field_type is datetime or field_type == Optional[datetime]:
+        return _DATE
+    return _OBJECT
+
+
+TRADE_FIELDS: List[str] = [f.name for f in dataclass_fields(TradeRecord)]
+TRADE_FIELD_KINDS: Dict[str, str] = {f.name: _column_kind(f.type) for f in dataclass_fields(TradeRecord)}
+DATE_FIELDS: List[str] = [name for name, kind in TRADE_FIELD_KINDS.items() if kind == _DATE]
+_DEFAULTS: Dict[str, Any] = {f.name: f.default for f in dataclass_fields(TradeRecord) if f.default is not MISSING}
+
+
+def _new_column(kind: str):
+    if kind == _FLOAT:
+        return array("d")
+    if kind == _INT:
+        return array("q")
+    return []
+
+
+def _to_float(value) -> float:
+    # None 以 NaN 儲存，轉為 DataFrame 時再還原為 null
+    if value is None:
+        return math.nan
+    return float(value)
+
+
+def _to_int(value) -> int:
+    if value is None:
+        return 0
+    return int(value)
+
+
+class TradeRecordView:
+    """交易帳本中單筆交易的輕量檢視，提供與 TradeRecord 相同的屬性存取"""
+
+    __slots__ = ("_ledger", "_index")
+
+    def __init__(self, ledger: "TradeLedger", index: int):
+        self._ledger = ledger
+        self._index = index
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in TRADE_FIELDS}
+
+    def to_record(self) -> TradeRecord:
+        """轉回 TradeRecord 資料類別"""
+        return TradeRecord(**self.to_dict())
+
+    def __repr__(self) -> str:
+        return f"TradeRecordView({self.to_dict()!r})"
+
+
+def _make_view_property(name: str, kind: str):
+    def getter(view: TradeRecordView):
+        value = view._ledger._columns[name][view._index]
+        if kind == _FLOAT and value != value:
+            return None
+        return value
+
+    def setter(view: TradeRecordView, value):
+        view._ledger._set(view._index, name, value)
+
+    return property(getter, setter)
+
+
+for _name, _kind in TRADE_FIELD_KINDS.items():
+    setattr(TradeRecordView, _name, _make_view_property(_name, _kind))
+
+
+class TradeLedger:
+    """
+    欄式交易帳本（append-only）
+
+    以每個欄位一個型別化陣列儲存交易記錄，取代 List[TradeRecord]。
+    保留 list 介面（len、迭代、索引、append、extend、clear）以相容既有程式碼，
+    結果、匯出與圖表則透過 to_frame() / to_dicts() 一次性轉換。
+    """
+
+    __slots__ = ("_columns", "_size", "_frame")
+
+    def __init__(self, records: Iterable[Any] = None):
+        self._columns: Dict[str, Any] = {name: _new_column(kind) for name, kind in TRADE_FIELD_KINDS.items()}
+        self._size = 0
+        self._frame: Optional[pl.DataFrame] = None
+        if records:
+            self.extend(records)
+
+    # ===== list 相容介面 =====
+    def __len__(self) -> int:
+        return self._size
+
+    def __bool__(self) -> bool:
+        return self._size > 0
+
+    def __iter__(self) -> Iterator[TradeRecordView]:
+        for index in range(self._size):
+            yield TradeRecordView(self, index)
+
+    def __getitem__(self, index: int) -> TradeRecordView:
+        if index < 0:
+            index += self._size
+        if index < 0 or index >= self._size:
+            raise IndexError("交易帳本索引超出範圍")
+        return TradeRecordView(self, index)
+
+    def append(self, record: Union[TradeRecord, TradeRecordView, Dict[str, Any]]) -> None:
+        """新增一筆交易記錄（TradeRecord、檢視或字典）"""
+        if isinstance(record, dict):
+            self.add(**record)
+            return
+        columns = self._columns
+        for name, kind in TRADE_FIELD_KINDS.items():
+            value = getattr(record, name)
+            if kind == _FLOAT:
+                columns[name].append(_to_float(value))
+            elif kind == _INT:
+                columns[name].append(_to_int(value))
+            else:
+                columns[name].append(value)
+        self._size += 1
+        self._frame = None
+
+    def add(self, **values: Any) -> None:
+        """以欄位值直接新增一筆交易記錄，未提供的欄位使用 TradeRecord 預設值"""
+        columns = self._columns
+        for name, kind in TRADE_FIELD_KINDS.items():
+            value = values.get(name, _DEFAULTS.get(name))
+            if kind == _FLOAT:
+                columns[name].append(_to_float(value))
+            elif kind == _INT:
+                columns[name].append(_to_int(value))
+            else:
+                columns[name].append(value)
+        self._size += 1
+        self._frame = None
+
+    def extend(self, records: Iterable[Any]) -> None:
+        """批次新增交易記錄，另一個帳本會以整欄串接"""
+        if isinstance(records, TradeLedger):
+            for name in TRADE_FIELDS:
+                self._columns[name].extend(records._columns[name])
+            self._size += records._size
+            self._frame = None
+            return
+        for record in records:
+            self.append(record)
+
+    def extend_columns(self, columns: Dict[str, Any], size: int) -> None:
+        """
+        以整欄方式批次新增交易記錄（供向量化引擎使用）
+
+        Args:
+            columns: 欄位名稱 -> 長度為 size 的序列（NumPy 陣列或 list），未提供的欄位使用 TradeRecord 預設值
+            size: 新增的筆數
+        """
+        if size <= 0:
+            return
+        for name, kind in TRADE_FIELD_KINDS.items():
+            values = columns.get(name)
+            column = self._columns[name]
+            if values is None:
+                default = _DEFAULTS.get(name)
+                if kind == _FLOAT:
+                    column.extend([_to_float(default)] * size)
+                elif kind == _INT:
+                    column.extend([_to_int(default)] * size)
+                else:
+                    column.extend([default] * size)
+                continue
+            if len(values) != size:
+                raise ValueError(f"欄位 {name} 長度 {len(values)} 與筆數 {size} 不符")
+            if kind == _FLOAT:
+                column.frombytes(np.ascontiguousarray(values, dtype=np.float64).tobytes())
+            elif kind == _INT:
+                column.frombytes(np.ascontiguousarray(values, dtype=np.int64).tobytes())
+            else:
+                column.extend(values.tolist() if isinstance(values, np.ndarray) else values)
+        self._size += size
+        self._frame = None
+
+    def clear(self) -> None:
+        self._columns = {name: _new_column(kind) for name, kind in TRADE_FIELD_KINDS.items()}
+        self._size = 0
+        self._frame = None
+
+    def _set(self, index: int, name: str, value: Any) -> None:
+        kind = TRADE_FIELD_KINDS[name]
+        if kind == _FLOAT:
+            value = _to_float(value)
+        elif kind == _INT:
+            value = _to_int(value)
+        self._columns[name][index] = value
+        self._frame = None
+
+    # ===== 欄式存取 =====
+    def column(self, name: str):
+        """取得單一欄位的原始陣列（唯讀使用）"""
+        return self._columns[name]
+
+    def to_frame(self) -> pl.DataFrame:
+        """轉換為 Polars DataFrame（結果會快取直到帳本變動）"""
+        if self._frame is not None:
+            return self._frame
+        series = []
+        for name, kind in TRADE_FIELD_KINDS.items():
+            values = self._columns[name]
+            if kind == _FLOAT:
+                series.append(pl.Series(name, values, dtype=pl.Float64).fill_nan(None))
+            elif kind == _INT:
+                series.append(pl.Series(name, values, dtype=pl.Int64))
+            elif kind == _DATE:
+                series.append(_date_series(name, values))
+            else:
+                series.append(pl.Series(name, [None if v is None else str(v) for v in values], dtype=pl.Utf8))
+        self._frame = pl.DataFrame(series)
+        return self._frame
+
+    def formatted_frame(self, columns: List[str] = None, date_format: Optional[str] = "%Y-%m-%d") -> pl.DataFrame:
+        """
+        取得日期欄位已格式化為字串的 DataFrame（供 JSON/Excel 輸出）
+
+        Args:
+            columns: 要輸出的欄位，None 表示全部
+            date_format: 日期格式，None 表示 ISO 格式；缺值日期輸出為空字串
+        """
+        return format_trade_frame(self.to_frame(), columns, date_format)
+
+    def to_dicts(self, columns: List[str] = None, date_format: Optional[str] = "%Y-%m-%d") -> List[Dict[str, Any]]:
+        """一次性轉換為字典列表（參數同 formatted_frame）"""
+        return self.formatted_frame(columns, date_format).to_dicts()
+
+
+def format_trade_frame(frame: pl.DataFrame, columns: List[str] = None, date_format: Optional[str] = "%Y-%m-%d") -> pl.DataFrame:
+    """將交易 DataFrame 的日期欄位格式化為字串，可用於合併多個帳本後的結果"""
+    if columns is not None:
+        frame = frame.select([name for name in columns if name in frame.columns])
+    date_exprs = [
+        _format_date_expr(name, frame.schema[name], date_format)
+        for name in DATE_FIELDS if name in frame.columns
+    ]
+    if date_exprs:
+        frame = frame.with_columns(date_exprs)
+    return frame
+
+
+def _date_series(name: str, values: List[Any]) -> pl.Series:
+    """日期欄位可能為 date/datetime/字串：純 date 保留為 Date，含時間則轉為 Datetime，無法轉換時保留字串"""
+    has_datetime = False
+    has_date = False
+    for value in values:
+        if value is None:
+            continue
+        if isinstance(value, datetime):
+            has_datetime = True
+        elif isinstance(value, date):
+            has_date = True
+        else:
+            return pl.Series(name, [None if v is None else str(v) for v in values], dtype=pl.Utf8)
+    if has_date and not has_datetime:
+        return pl.Series(name, values, dtype=pl.Date)
+    if has_date:
+        values = [datetime(v.year, v.month, v.day) if isinstance(v, date) and not isinstance(v, datetime) else v
+                  for v in values]
+    return pl.Series(name, values, dtype=pl.Datetime("us"))
+
+
+def _format_date_expr(name: str, dtype, date_format: Optional[str]) -> pl.Expr:
+    if dtype == pl.Utf8:
+        return pl.col(name).fill_null("")
+    if date_format is None:
+        # 與 date/datetime.isoformat() 相同
+        date_format = "%Y-%m-%d" if dtype == pl.Date else "%Y-%m-%dT%H:%M:%S"
+    return pl.col(name).dt.strftime(date_format).fill_null("")
@@ -0,0 +1,239 @@
+# 滾動視窗回測模組
+"""
+Walk-forward / 滾動視窗回測
+
+- 指標欄位在整段期間只計算一次（prepare_indicators），視窗邊界處不必重新暖機
+- 以全體股票的交易日序列切出樣本內（in-sample）與樣本外（out-of-sample）視窗，
+  每檔股票以 searchsorted 換算成列區間，子行程在 memory map 的 IPC 資料上零複製 slice
+- 每個視窗的樣本內、樣本外各為一個行程池任務，所有視窗平行執行
+- 回傳每個視窗的樣本內/樣本外指標，以及將各視窗樣本外權益曲線依序接續後的整體指標
+"""
+
+from concurrent.futures import as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+import polars as pl
+
+from config.trading_config import TradingConfig
+from core.logger import get_logger
+from core.metrics import PerformanceMetrics
+from core.utils import Utils
+from strategies.process_executor import default_worker_count, get_executor, shared_backtest_inputs, _run_stock_batch
+from strategies.parameter_sweep import summarize_results
+
+logger = get_logger("walk_forward.py")
+
+SEGMENTS = ("in_sample", "out_of_sample")
+
+
+def _day_array(series: pl.Series) -> np.ndarray:
+    if series.dtype == pl.Utf8:
+        series = series.str.to_date(strict=False)
+    return series.cast(pl.Date).to_numpy().astype("datetime64[D]")
+
+
+def build_walk_forward_windows(dates: np.ndarray, train_days: int, test_days: int,
+                               step_days: int = 0, anchored: bool = False) -> List[Dict[str, Any]]:
+    """
+    依交易日序列切出滾動視窗
+
+    Args:
+        dates: 排序後不重複的交易日（datetime64[D]）
+        train_days: 樣本內交易日數
+        test_days: 樣本外交易日數
+        step_days: 每次前進的交易日數，0 表示等於 test_days（樣本外區間首尾相接）
+        anchored: True 時樣本內起點固定在第一個交易日（擴張視窗），否則隨視窗滾動
+
+    Returns:
+        List[Dict[str, Any]]: 每個視窗的 train_start / train_end / test_start / test_end（含端點）
+    """
+    step_days = step_days or test_days
+    if train_days <= 0 or test_days <= 0:
+        raise ValueError("樣本內與樣本外交易日數必須大於 0")
+    if step_days < test_days:
+        raise ValueError("視窗前進日數不可小於樣本外交易日數，否則樣本外區間重疊無法接續")
+    windows = []
+    start = 0
+    while start + train_days + test_days <= len(dates):
+        train_start = 0 if anchored else start
+        test_start = start + train_days
+        windows.append({
+            "window": len(windows),
+            "train_start": dates[train_start],
+            "train_end": dates[test_start - 1],
+            "test_start": dates[test_start],
+            "test_end": dates[test_start + test_days - 1]
+        })
+        start += step_days
+    return windows
+
+
+def _stitch_equity_curves(curves: List[List[float]], initial_capital: float) -> np.ndarray:
+    """將同一檔股票各視窗的權益曲線依報酬率接續為單一曲線"""
+    stitched = [np.array([initial_capital], dtype=np.float64)]
+    level = initial_capital
+    for curve in curves:
+        equity = np.asarray(curve or [], dtype=np.float64)
+        if equity.size == 0 or equity[0] <= 0:
+            continue
+        segment = equity / equity[0] * level
+        stitched.append(segment[1:])
+        level = float(segment[-1])
+    return np.concatenate(stitched)
+
+
+class WalkForwardRunner:
+    """滾動視窗回測執行器"""
+
+    def __init__(self, strategy, parameters: Dict[str, Any], train_days: int, test_days: int,
+                 step_days: int = 0, anchored: bool = False, indicators: List[str] = None,
+                 max_workers: int = 0):
+        """
+        Args:
+            strategy: 已編譯的 DynamicStrategy（主行程用於預先計算指標）
+            parameters: 策略參數
+            train_days / test_days / step_days / anchored: 視窗設定，見 build_walk_forward_windows
+            indicators: 預先計算的 generate_indicators 指標名稱
+            max_workers: 子行程數量，0 表示使用 CPU 核心數
+        """
+        self.strategy = strategy
+        self.parameters = parameters
+        self.train_days = train_days
+        self.test_days = test_days
+        self.step_days = step_days
+        self.anchored = anchored
+        self.indicators = list(indicators or [])
+        self.max_workers = max_workers or default_worker_count()
+
+    @classmethod
+    def from_parameters(cls, strategy, parameters: Dict[str, Any]) -> "WalkForwardRunner":
+        """由策略參數（wf_* 與 precompute_indicators）建立執行器"""
+        def value(name: str):
+            configured = parameters.get(name)
+            if configured is None or configured == "":
+                return TradingConfig.get_int_parameter_default(name)
+            return int(configured)
+
+        indicators = [name.strip() for name in str(parameters.get("precompute_indicators") or "").split(",") if name.strip()]
+        return cls(
+            strategy,
+            parameters,
+            train_days=value("wf_train_days"),
+            test_days=value("wf_test_days"),
+            step_days=value("wf_step_days"),
+            anchored=bool(parameters.get("wf_anchored", False)),
+            indicators=indicators,
+            max_workers=int(parameters.get("max_workers") or 0)
+        )
+
+    def _segment_ranges(self, dates: np.ndarray, ranges: List[Tuple[str, int, int]],
+                        start: np.datetime64, end: np.datetime64) -> List[Tuple[str, int, int]]:
+        """將日期區間換算為每檔股票的列區間（各股票的列已依日期排序）"""
+        batch = []
+        for stock_id, offset, length in ranges:
+            stock_dates = dates[offset:offset + length]
+            left = int(np.searchsorted(stock_dates, start, side="left"))
+            right = int(np.searchsorted(stock_dates, end, side="right"))
+            if right > left:
+                batch.append((stock_id, offset + left, right - left))
+        return batch
+
+    def run(self, stock_data: pl.DataFrame, excel_data: Optional[pl.DataFrame], initial_capital: float,
+            progress: Callable[..., None] = None) -> Dict[str, Any]:
+        """
+        執行滾動視窗回測
+
+        Args:
+            stock_data: 全部股票的股價資料
+            excel_data: 策略用的 Excel 資料
+            initial_capital: 初始資金
+            progress: 進度回呼 progress(已完成區段數, total=區段總數, trades=累計交易筆數)，
+                      回呼拋出例外時取消尚未執行的區段並向上拋出
+
+        Returns:
+            Dict[str, Any]: windows（每個視窗的樣本內/樣本外指標）、out_of_sample（接續後的樣本外指標）、
+                            out_of_sample_results（樣本外逐股結果，供合併交易明細）
+        """
+        prepared = self.strategy.prepare_indicators(stock_data, excel_data, self.indicators)
+        prepared, ranges = Utils.stock_row_ranges(prepared)
+        dates = _day_array(prepared["date"])
+        # 視窗以 searchsorted 換算列區間，各股內的列須依日期排序；只有未排序時才整表排序
+        unordered = dates[1:] < dates[:-1]
+        unordered[[offset - 1 for _, offset, _ in ranges[1:]]] = False
+        if unordered.any():
+            prepared = prepared.sort(["stock_id", "date"])
+            dates = _day_array(prepared["date"])
+        windows = build_walk_forward_windows(np.unique(dates), self.train_days, self.test_days,
+                                             self.step_days, self.anchored)
+        if not windows:
+            raise ValueError(
+                f"資料期間不足：至少需要 {self.train_days + self.test_days} 個交易日才能建立一個視窗"
+            )
+
+        segment_results: Dict[Tuple[int, str], List[Dict[str, Any]]] = {}
+        with shared_backtest_inputs(prepared, excel_data) as (data_path, excel_path, ranges):
+            executor = get_executor(self.max_workers)
+            futures = {}
+            for window in windows:
+                bounds = {
+                    "in_sample": (window["train_start"], window["train_end"]),
+                    "out_of_sample": (window["test_start"], window["test_end"])
+                }
+                for segment in SEGMENTS:
+                    batch = self._segment_ranges(dates, ranges, *bounds[segment])
+                    future = executor.submit(_run_stock_batch, data_path, excel_path,
+                                             self.strategy.strategy_code, self.strategy.custom_strategy_name,
+                                             self.parameters, initial_capital, batch)
+                    futures[future] = (window["window"], segment)
+            trades = 0
+            try:
+                for completed, future in enumerate(as_completed(futures), start=1):
+                    key = futures[future]
+                    try:
+                        segment_results[key] = future.result()
+                    except Exception as e:
+                        logger.error("視窗 %s %s 執行失敗: %s", key[0], key[1], e)
+                        segment_results[key] = []
+                    trades += sum(result.get("total_trades", 0) for result in segment_results[key])
+                    if progress is not None:
+                        progress(completed, total=len(futures), trades=trades)
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+        return self._build_result(windows, segment_results, initial_capital)
+
+    def _build_result(self, windows: List[Dict[str, Any]], segment_results: Dict[Tuple[int, str], List[Dict[str, Any]]],
+                      initial_capital: float) -> Dict[str, Any]:
+        window_rows = []
+        out_of_sample_results = []
+        curves_by_stock: Dict[str, List[List[float]]] = {}
+        for window in windows:
+            row = {key: str(value) if key != "window" else value for key, value in window.items()}
+            for segment in SEGMENTS:
+                results = segment_results.get((window["window"], segment), [])
+                row[segment] = summarize_results(results, initial_capital)
+                if segment == "out_of_sample":
+                    out_of_sample_results.extend(results)
+                    for result in results:
+                        # 保留各股曲線的複本，接續時不會與其他股票共用同一份列表
+                        curves_by_stock.setdefault(result.get("stock_id"), []).append(list(result.get("equity_curve") or []))
+            window_rows.append(row)
+
+        # 樣本外整體指標：交易統計以所有樣本外交易計算，回撤與夏普以逐股接續後的權益曲線計算
+        stitched = summarize_results(out_of_sample_results, initial_capital)
+        stitched_curves = [_stitch_equity_curves(curves, initial_capital) for curves in curves_by_stock.values()]
+        drawdowns = [PerformanceMetrics.drawdown(curve, initial_capital) for curve in stitched_curves]
+        returns = [PerformanceMetrics.returns(curve) for curve in stitched_curves]
+        stitched.update({
+            "max_drawdown": max((d["max_drawdown"] for d in drawdowns), default=0.0),
+            "max_drawdown_rate": max((d["max_drawdown_pct"] for d in drawdowns), default=0.0),
+            "sharpe_ratio": PerformanceMetrics.sharpe_ratio(np.concatenate(returns) if returns else []),
+            "stocks": len(curves_by_stock),
+            "windows": len(windows)
+        })
+        return {
+            "windows": window_rows,
+            "out_of_sample": stitched,
+            "out_of_sample_results": out_of_sample_results
+        }
@@ -557,21 +557,19 @@ function displayBacktestResults(results) {
 
 // 載入圖表
 function loadCharts(results) {
-    // 這裡可以整合Chart.js或其他圖表庫
-    // 目前只是顯示佔位符
+    // 權益曲線為降採樣版本（dates/values/total_points/result_key），縮放時由 ChartRenderer 取得區間資料
     const container = $('#charts-container');
+    const equityCurve = results.equity_curve;
     
-    if (results.equity_curve && results.equity_curve.length > 0) {
+    if (equityCurve && equityCurve.values && equityCurve.values.length > 0) {
         const chartHtml = `
             <div class="chart-container">
                 <h6>權益曲線</h6>
-                <div class="text-center text-muted">
-                    <i class="fas fa-chart-line fa-3x mb-3"></i>
-                    <p>圖表功能開發中...</p>
-                </div>
+                <div id="equity-curve-chart"></div>
             </div>
         `;
         container.append(chartHtml);
+        ChartRenderer.renderEquityCurve('equity-curve-chart', equityCurve);
     }
 }
 
@@ -0,0 +1,371 @@
+// 回測圖表前端繪圖
+// 使用 /api/backtest/chart-data 回傳的欄式資料（{序列: {欄位: 值列表}}）以 Plotly 繪圖，
+// 圖表樣式與伺服器端 ChartAPI 產生的圖表一致
+
+const ChartRenderer = (function() {
+    const CONFIG = { responsive: true, displayModeBar: false };
+    const DAY_NAMES = ['星期一', '星期二', '星期三', '星期四', '星期五'];
+
+    // 欄式資料轉為列物件
+    function rows(table) {
+        const columns = Object.keys(table || {});
+        const length = columns.length ? table[columns[0]].length : 0;
+        const result = [];
+        for (let i = 0; i < length; i++) {
+            const row = {};
+            columns.forEach(column => { row[column] = table[column][i]; });
+            result.push(row);
+        }
+        return result;
+    }
+
+    // 月資料樞紐為 年(新到舊) × 月 的矩陣，缺值為 fillValue
+    function pivotMonthly(monthly, field, fillValue) {
+        const records = rows(monthly);
+        const years = [...new Set(records.map(r => r.year))].sort((a, b) => b - a);
+        const months = [...new Set(records.map(r => r.month))].sort((a, b) => a - b);
+        const z = years.map(() => months.map(() => fillValue));
+        records.forEach(r => {
+            const value = r[field];
+            z[years.indexOf(r.year)][months.indexOf(r.month)] = value === null || value === undefined ? fillValue : value;
+        });
+        return { years, months, z };
+    }
+
+    // 以 0 為中點的紅-黃-綠色階
+    function divergingColorscale(z) {
+        const values = z.flat().filter(v => v !== null && isFinite(v));
+        if (!values.length) {
+            return [[0, '#FFEE9C'], [1, 'green']];
+        }
+        const minValue = Math.min(...values);
+        const maxValue = Math.max(...values);
+        if (minValue === maxValue) {
+            return minValue >= 0 ? [[0, '#FFEE9C'], [1, 'green']] : [[0, 'red'], [1, '#FFEE9C']];
+        }
+        const middle = Math.max(0, Math.min(1, (0 - minValue) / (maxValue - minValue)));
+        return [[0, 'red'], [middle, '#FFEE9C'], [1, 'green']];
+    }
+
+    function heatmap(pivot, options) {
+        const trace = {
+            type: 'heatmap',
+            z: pivot.z,
+            x: pivot.months.map(String),
+            y: pivot.years.map(String),
+            colorscale: options.colorscale,
+            showscale: false,
+            text: pivot.z.map(row => row.map(options.format)),
+            texttemplate: '%{text}',
+            textfont: { size: options.fontSize, color: 'black' }
+        };
+        const layout = {
+            title: { text: options.title, font: { size: options.titleSize || 15 }, y: 0.94, x: 0.5, xanchor: 'center', yanchor: 'top' },
+            xaxis: { title: '月' },
+            yaxis: { title: '年' },
+            height: 50 * pivot.years.length + 100,
+            width: 700,
+            margin: options.margin || { t: 60, l: 40, r: 40, b: 40 },
+            plot_bgcolor: 'white',
+            paper_bgcolor: 'white'
+        };
+        return { data: [trace], layout };
+    }
+
+    function countFormat(v) {
+        return v ? String(Math.round(v)) : '0';
+    }
+
+    const BUILDERS = {
+        drawdown_merge(data) {
+            const table = data.drawdown;
+            return {
+                data: [
+                    { type: 'scatter', x: table.date, y: table.cum_profit, mode: 'lines+markers', name: '累積損益',
+                      line: { color: 'blue' }, xaxis: 'x', yaxis: 'y' },
+                    { type: 'bar', x: table.date, y: table.drawdown, name: '最大回落', marker: { color: 'red' },
+                      xaxis: 'x', yaxis: 'y2' }
+                ],
+                layout: {
+                    grid: { rows: 2, columns: 1, subplots: [['xy'], ['xy2']], roworder: 'top to bottom' },
+                    yaxis: { domain: [0.31, 1] },
+                    yaxis2: { domain: [0, 0.29] },
+                    annotations: [
+                        { text: '累積損益', xref: 'paper', yref: 'paper', x: 0.5, y: 1, xanchor: 'center', yanchor: 'bottom', showarrow: false },
+                        { text: '最大回落', xref: 'paper', yref: 'paper', x: 0.5, y: 0.29, xanchor: 'center', yanchor: 'bottom', showarrow: false }
+                    ],
+                    height: 700, title: '組合績效與回落圖', plot_bgcolor: 'white', paper_bgcolor: 'white',
+                    legend: { orientation: 'h', yanchor: 'top', y: 1.02, xanchor: 'center', x: 0.5 },
+                    font: { color: 'black' }, margin: { t: 60, b: 40, l: 40, r: 40 }
+                }
+            };
+        },
+
+        heatmap(data) {
+            const pivot = pivotMonthly(data.monthly, 'profit', null);
+            pivot.z = pivot.z.map(row => row.map(v => v === null ? null : v / 10000));  // 單位：萬元
+            return heatmap(pivot, {
+                title: '月累積平均損益 (萬元)', colorscale: divergingColorscale(pivot.z), fontSize: 14,
+                format: v => v ? v.toFixed(2) : ''
+            });
+        },
+
+        monthly_return_heatmap(data) {
+            const pivot = pivotMonthly(data.monthly, 'return_bp', null);
+            return heatmap(pivot, {
+                title: '月平均收益率 (bp)', colorscale: divergingColorscale(pivot.z), fontSize: 12,
+                format: v => v ? v.toFixed(0) : ''
+            });
+        },
+
+        trading_days_heatmap(data) {
+            return heatmap(pivotMonthly(data.monthly, 'trading_days', 0), {
+                title: '月交易筆數(天)', titleSize: 18, colorscale: 'Greens', fontSize: 16, format: countFormat,
+                margin: { t: 50, l: 80, r: 20, b: 50 }
+            });
+        },
+
+        trading_stocks_heatmap(data) {
+            return heatmap(pivotMonthly(data.monthly, 'trading_stocks', 0), {
+                title: '月交易筆數(隻)', titleSize: 18, colorscale: 'Greens', fontSize: 16, format: countFormat,
+                margin: { t: 50, l: 80, r: 20, b: 50 }
+            });
+        },
+
+        win_rate_heatmap(data) {
+            return heatmap(pivotMonthly(data.monthly, 'win_rate', 0), {
+                title: '月度勝率 (%)', colorscale: 'RdYlGn', fontSize: 13, format: v => `${Math.round(v || 0)}%`,
+                margin: { t: 50, l: 80, r: 20, b: 50 }
+            });
+        },
+
+        yearly_return_heatmap(data) {
+            const years = data.yearly.year;
+            const profits = data.yearly.profit.map(v => v / 10000);  // 單位：萬元
+            return {
+                data: [{ type: 'bar', x: years, y: profits, text: profits.map(v => `${v.toFixed(1)}萬`),
+                         textposition: 'auto', marker: { color: 'green' } }],
+                layout: {
+                    title: { text: '年度總損益 (萬元)', font: { size: 18 }, y: 0.95, x: 0.5, xanchor: 'center', yanchor: 'top' },
+                    xaxis: { title: '年份', tickmode: 'array', ticktext: years, tickvals: years },
+                    yaxis: { title: '損益 (萬元)', gridcolor: 'rgba(211,211,211,0.3)', gridwidth: 1 },
+                    height: 300, width: 100 * years.length + 100,
+                    margin: { t: 60, l: 50, r: 30, b: 40 },
+                    plot_bgcolor: 'white', paper_bgcolor: 'white', showlegend: false,
+                    shapes: [{ type: 'line', xref: 'paper', x0: 0, x1: 1, y0: 0, y1: 0, line: { color: 'gray', width: 1 } }]
+                }
+            };
+        },
+
+        weekday_analysis_charts(data) {
+            const table = data.weekday;
+            const days = table.weekday.map(day => DAY_NAMES[day - 1]);
+            const trades = table.trades;
+            const returns = table.return_bp.map(v => v || 0);
+            const winRates = table.win_rate;
+            const avgWinRate = data.summary.weekday_win_rate[0];
+            const minReturn = Math.min(...returns);
+            const maxReturn = Math.max(...returns);
+            const axis = { showgrid: true, gridcolor: 'lightgray' };
+            return {
+                data: [
+                    { type: 'bar', x: days, y: trades, marker: { color: 'blue' }, name: '交易次數', xaxis: 'x', yaxis: 'y' },
+                    { type: 'bar', x: days, y: returns, marker: { color: returns.map(v => v >= 0 ? 'green' : 'red') },
+                      name: '平均收益 (bp)', text: returns.map(v => `${Math.trunc(v)}bp`), textposition: 'outside',
+                      xaxis: 'x', yaxis: 'y2' },
+                    { type: 'bar', x: days, y: winRates, marker: { color: 'orange' }, name: '勝率 (%)',
+                      text: winRates.map(v => `${v.toFixed(1)}%`), textposition: 'outside', xaxis: 'x', yaxis: 'y3' },
+                    { type: 'scatter', x: days, y: days.map(() => avgWinRate), mode: 'lines',
+                      line: { color: 'red', width: 2, dash: 'dash' }, name: `平均勝率 (${avgWinRate.toFixed(1)}%)`,
+                      xaxis: 'x', yaxis: 'y3' }
+                ],
+                layout: {
+                    grid: { rows: 3, columns: 1, subplots: [['xy'], ['xy2'], ['xy3']], roworder: 'top to bottom' },
+                    xaxis: axis,
+                    yaxis: { ...axis, domain: [0.78, 1], range: [0, Math.max(...trades) * 1.2] },
+                    yaxis2: { ...axis, domain: [0.39, 0.66],
+                              range: minReturn < 0 ? [minReturn * 1.8, maxReturn * 1.3] : [0, maxReturn * 1.3] },
+                    yaxis3: { ...axis, domain: [0, 0.27], range: [0, Math.max(...winRates) * 1.2] },
+                    annotations: [
+                        ['每個星期的交易次數', 1], ['每個星期的平均收益 (bp)', 0.66], ['每個星期的勝率 (%)', 0.27]
+                    ].map(([text, y]) => ({ text, xref: 'paper', yref: 'paper', x: 0.5, y, xanchor: 'center', yanchor: 'bottom', showarrow: false })),
+                    height: 900, width: 500,
+                    title: { text: '按星期分析交易 (工作日)', font: { size: 18 }, y: 0.98, x: 0.5, xanchor: 'center', yanchor: 'top' },
+                    showlegend: true,
+                    legend: { orientation: 'h', yanchor: 'top', y: -0.08, xanchor: 'center', x: 0.5 },
+                    plot_bgcolor: 'white', paper_bgcolor: 'white'
+                }
+            };
+        }
+    };
+
+    // 回落序列已降採樣時，縮放後依可見區間重新取得該區間的資料（區間夠小即為完整解析度）
+    // 有日曆彙總表時以彙總表取代交易記錄（請求內容較小，伺服器不必重新聚合）
+    function enableZoomRefetch(element, chartData, tradeRecords, calendarRollup) {
+        const full = chartData.drawdown;
+        if ((!tradeRecords && !calendarRollup) || !chartData.summary || chartData.summary.days[0] <= full.date.length) {
+            return;
+        }
+        const update = table => Plotly.restyle(element, {
+            x: [table.date, table.date], y: [table.cum_profit, table.drawdown]
+        }, [0, 1]);
+        let requestId = 0;
+        element.on('plotly_relayout', event => {
+            const currentRequest = ++requestId;
+            if (event['xaxis.autorange']) {
+                update(full);
+                return;
+            }
+            const start = event['xaxis.range[0]'] || (event['xaxis.range'] || [])[0];
+            const end = event['xaxis.range[1]'] || (event['xaxis.range'] || [])[1];
+            if (!start || !end) {
+                return;
+            }
+            fetchChartData(calendarRollup ? [] : tradeRecords, {
+                calendar_rollup: calendarRollup || undefined,
+                series: ['drawdown'], start_date: String(start).slice(0, 10), end_date: String(end).slice(0, 10)
+            }).then(data => {
+                // 只套用最後一次縮放的結果
+                if (currentRequest === requestId) {
+                    update(data.drawdown);
+                }
+            }).catch(error => console.error('取得縮放區間資料失敗:', error));
+        });
+    }
+
+    // 權益曲線（回測結果的 equity_curve 為降採樣版本；縮放後以 result_key 向伺服器取得該區間的完整解析度資料）
+    function renderEquityCurve(target, curve) {
+        const element = typeof target === 'string' ? document.getElementById(target) : target;
+        if (!element || !curve || !curve.values || !curve.values.length) {
+            return Promise.resolve(null);
+        }
+        const layout = {
+            title: '權益曲線', height: 400, plot_bgcolor: 'white', paper_bgcolor: 'white',
+            xaxis: { type: 'date' }, yaxis: { title: '權益' },
+            font: { color: 'black' }, margin: { t: 60, b: 40, l: 60, r: 40 }
+        };
+        element.innerHTML = '';
+        return Plotly.newPlot(element, [{ type: 'scatter', x: curve.dates, y: curve.values, mode: 'lines',
+                                          name: '權益', line: { color: 'blue' } }], layout, CONFIG).then(plot => {
+            if (curve.result_key && curve.total_points > curve.values.length) {
+                enableEquityZoomRefetch(plot, curve);
+            }
+            return plot;
+        });
+    }
+
+    function enableEquityZoomRefetch(element, curve) {
+        const update = data => Plotly.restyle(element, { x: [data.dates], y: [data.values] }, [0]);
+        let requestId = 0;
+        element.on('plotly_relayout', event => {
+            const currentRequest = ++requestId;
+            if (event['xaxis.autorange']) {
+                update(curve);
+                return;
+            }
+            const start = event['xaxis.range[0]'] || (event['xaxis.range'] || [])[0];
+            const end = event['xaxis.range[1]'] || (event['xaxis.range'] || [])[1];
+            if (!start || !end) {
+                return;
+            }
+            fetchEquityCurve(curve.result_key, { start_date: String(start).slice(0, 10), end_date: String(end).slice(0, 10) })
+                .then(data => {
+                    // 只套用最後一次縮放的結果
+                    if (currentRequest === requestId) {
+                        update(data);
+                    }
+                }).catch(error => console.error('取得權益曲線區間資料失敗:', error));
+        });
+    }
+
+    // 取得權益曲線的區間資料（params 可指定 start_date、end_date、max_points）
+    function fetchEquityCurve(resultKey, params = {}) {
+        const query = new URLSearchParams(Object.entries(params).filter(([, value]) => value !== undefined && value !== null));
+        return fetch(`/api/backtest/equity-curve/${encodeURIComponent(resultKey)}?${query}`)
+            .then(response => response.json().then(body => {
+                if (!response.ok || !body.success) {
+                    throw new Error(body.detail || body.message || `HTTP ${response.status}`);
+                }
+                return body.equity_curve;
+            }));
+    }
+
+    // 於 target（元素或元素 id）繪製指定類型的圖表
+    // options.tradeRecords / options.calendarRollup：提供時回落圖縮放後向伺服器取得該區間的完整解析度資料
+    function render(target, chartType, chartData, options = {}) {
+        const element = typeof target === 'string' ? document.getElementById(target) : target;
+        const builder = BUILDERS[chartType];
+        if (!element || !builder) {
+            throw new Error(`不支援的圖表類型: ${chartType}`);
+        }
+        const figure = builder(chartData);
+        element.innerHTML = '';
+        return Plotly.newPlot(element, figure.data, figure.layout, CONFIG).then(plot => {
+            if (chartType === 'drawdown_merge') {
+                enableZoomRefetch(plot, chartData, options.tradeRecords, options.calendarRollup);
+            }
+            return plot;
+        });
+    }
+
+    // 取得圖表資料（一次請求取得所有序列；params 可指定 series、max_points、start_date、end_date）
+    function fetchChartData(tradeRecords, params = {}) {
+        return fetch('/api/backtest/chart-data', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ trade_records: tradeRecords, ...params })
+        }).then(response => response.json().then(body => {
+            if (!response.ok || !body.success) {
+                throw new Error(body.detail || body.message || `HTTP ${response.status}`);
+            }
+            return body.chart_data;
+        }));
+    }
+
+    // 插入圖表 HTML，並讓其中的 <script> 執行
+    function insertHtml(element, html) {
+        element.innerHTML = html;
+        element.querySelectorAll('script').forEach(oldScript => {
+            const newScript = document.createElement('script');
+            newScript.textContent = oldScript.textContent;
+            oldScript.parentNode.replaceChild(newScript, oldScript);
+        });
+    }
+
+    // 延遲產生圖表（回測結果的 chart.lazy）的佔位元素
+    function lazyPlaceholder(chart) {
+        return `<div class="lazy-chart" data-chart-key="${chart.chart_key}" data-chart-type="${chart.type}">` +
+               '<p class="text-muted text-center py-5">圖表載入中...</p></div>';
+    }
+
+    // 佔位元素出現在畫面上（圖表區塊開啟）時才向伺服器取得圖表
+    function observeLazyCharts(container) {
+        const elements = container.querySelectorAll('.lazy-chart[data-chart-key]');
+        const load = element => {
+            const url = `/api/backtest/charts/${encodeURIComponent(element.dataset.chartKey)}/${encodeURIComponent(element.dataset.chartType)}`;
+            fetch(url).then(response => response.json().then(body => {
+                if (!response.ok || !body.success) {
+                    throw new Error(body.detail || `HTTP ${response.status}`);
+                }
+                insertHtml(element, body.chart_html);
+            })).catch(error => {
+                element.innerHTML = `<div class="alert alert-warning">圖表載入失敗: ${error.message}</div>`;
+            });
+        };
+        if (!('IntersectionObserver' in window)) {
+            elements.forEach(load);
+            return;
+        }
+        const observer = new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (entry.isIntersecting) {
+                    observer.unobserve(entry.target);
+                    load(entry.target);
+                }
+            });
+        });
+        elements.forEach(element => observer.observe(element));
+    }
+
+    return { CHART_TYPES: Object.keys(BUILDERS), render, renderEquityCurve, fetchChartData, fetchEquityCurve, lazyPlaceholder, observeLazyCharts };
+})();